@@ -1,21 +1,75 @@
 from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
+from .dist_publish_method import DistPublishMethod
+from .workspace_type import WorkspaceType
+from .pull_policy import PullPolicy
+from .profile_mode import ProfileMode
+from .slim_rules import SlimRules, get_slim_rules
+from .size_budgets import SizeBudgets, get_size_budgets
 from .agent_plugin_build_options import AgentPluginBuildOptions
 from .plugin_manifest import (
     get_agent_plugin_manifest,
     get_plugin_manifest_file_path,
 )
+from .build_control import (
+    BuildCancelledError,
+    BuildProgressEvent,
+    BuildStage,
+    BuildStageStatus,
+)
+from .build_result import BuildResult
+from .stage_profiling import StageProfiler
+from .builder_images import BuilderImages, resolve_builder_images
+from .installed_tree_cache import InstalledTreeCache, get_default_cache_dir
+from .docker_endpoint_pool import (
+    DockerEndpoint,
+    DockerEndpointConfig,
+    DockerEndpointError,
+    DockerEndpointPool,
+    DockerHostEndpoint,
+    use_docker_endpoint_pool,
+)
+from .wine_prefix_cache import WinePrefixCache
+from .autodetect_cache import AutodetectCache, AutodetectDecision
+from .lock_file_analysis import detect_common_vendor_dir_from_lock_file
 from .vendor_dir_generation import (
     generate_vendor_directories,
     generate_requirements_file,
+    generate_requirements_file_async,
     generate_common_vendor_dir,
     generate_vendor_dirs,
     generate_windows_vendor_dir,
     should_use_common_vendor_dir,
 )
+from .vendor_dir_slimming import SlimReport, slim_vendor_directories
+from .bytecode_compilation import BytecodeCompilationReport, compile_bytecode
+from .file_transfer import TransferStrategy, copy_file, copy_tree, publish_file
+from .build_workspace import PathLock, create_isolated_build_dir
+from .build_journal import BuildJournal, use_build_journal
+from .wheel_installation import WheelInstallationError, verify_pure_python_wheels
+from .artifact_prefetching import PrefetchError, PrefetchReport, prefetch_artifacts
+from .vendor_bundle_compression import VendorBundleCompression
+from .vendor_dir_bundling import VendorBundleReport, bundle_vendor_directories
 from .plugin_schema_generation import generate_plugin_config_schema
+from .archive_checksums import (
+    ArchiveChecksums,
+    PluginArchiveChecksums,
+    read_plugin_archive_checksums,
+)
+from .archive_inspection import (
+    PluginArchiveInspection,
+    VendoredPackage,
+    inspect_plugin_archive,
+)
+from .archive_size_analysis import (
+    SizeBudgetExceededError,
+    SizeReport,
+    analyze_archive,
+    check_size_budgets,
+)
 from .plugin_archive_generation import (
     create_agent_plugin_archive,
+    create_agent_plugin_archive_async,
     create_source_archive,
     create_plugin_archive,
 )
-from .build_agent_plugin import build_agent_plugin_archive
+from .build_agent_plugin import build_agent_plugin_archive, build_agent_plugin_archive_async
@@ -0,0 +1,55 @@
+import logging
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from .archive_size_analysis import (
+    LARGEST_FILE_COUNT,
+    SizeBudgetExceededError,
+    analyze_archive,
+    check_size_budgets,
+)
+from .size_budgets import get_size_budgets
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> int:
+    parser = ArgumentParser(
+        description="Break down the size of an Agent Plugin archive or of a source archive"
+    )
+    parser.add_argument("archive_path", metavar="ARCHIVE_PATH", type=Path)
+    parser.add_argument(
+        "--size-budgets",
+        dest="size_budgets_path",
+        metavar="SIZE_BUDGETS_PATH",
+        type=Path,
+        default=None,
+        help="Optional path to a YAML file with the size budgets which the archive must fit in",
+    )
+    parser.add_argument(
+        "--largest-files",
+        dest="largest_file_count",
+        type=int,
+        default=LARGEST_FILE_COUNT,
+        help="The number of largest files to list",
+    )
+
+    args = parser.parse_args()
+    # The size report is printed to the standard output, so the log goes to the standard error
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(levelname)s: %(message)s")
+
+    size_report = analyze_archive(args.archive_path, args.largest_file_count)
+    print(size_report.model_dump_json(indent=2))
+
+    if args.size_budgets_path is not None:
+        try:
+            check_size_budgets(size_report, get_size_budgets(args.size_budgets_path))
+        except SizeBudgetExceededError:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
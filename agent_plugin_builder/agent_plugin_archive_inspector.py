@@ -0,0 +1,49 @@
+import logging
+import sys
+import tarfile
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Sequence
+
+import yaml
+
+from .archive_inspection import inspect_plugin_archive
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = ArgumentParser(
+        description="Inspect the manifest, the config schema and the vendored packages of "
+        "Agent Plugin archives, without extracting them",
+    )
+    parser.add_argument("archive_paths", metavar="ARCHIVE_PATH", type=Path, nargs="+")
+    parser.add_argument(
+        "--members",
+        dest="include_source_members",
+        action="store_true",
+        help="List the members of the source archive",
+    )
+
+    args = parser.parse_args(argv)
+    # The inspections are printed to the standard output, so the log goes to the standard error
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(levelname)s: %(message)s")
+
+    # A single archive is printed as a JSON document, and several archives as JSON lines
+    indent = 2 if len(args.archive_paths) == 1 else None
+    exit_code = 0
+    for archive_path in args.archive_paths:
+        try:
+            inspection = inspect_plugin_archive(archive_path, args.include_source_members)
+        except (OSError, ValueError, tarfile.TarError, yaml.YAMLError) as err:
+            logger.error(f"Unable to inspect {archive_path}: {err}")
+            exit_code = 1
+            continue
+
+        print(inspection.model_dump_json(indent=indent, exclude_none=True))
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
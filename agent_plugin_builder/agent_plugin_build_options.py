@@ -4,12 +4,28 @@ from pathlib import Path
 from typing import Annotated
 
 from monkeytypes.base_models import InfectionMonkeyBaseModel
-from pydantic import DirectoryPath, Field, StringConstraints
+from pydantic import DirectoryPath, Field, PositiveInt, StringConstraints
 
+from .dist_publish_method import DistPublishMethod
+from .docker_endpoint_pool import DockerEndpointConfig
 from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
+from .profile_mode import ProfileMode
+from .pull_policy import PullPolicy
+from .size_budgets import SizeBudgets, get_size_budgets
+from .slim_rules import SlimRules, get_slim_rules
+from .vendor_bundle_compression import VendorBundleCompression
+from .workspace_type import WorkspaceType
 
 BUILD = "build"
 DIST = "dist"
+DEFAULT_PREFETCH_CONNECTIONS = 8
+NON_BUILD_OPTION_ARGUMENTS = (
+    "verbosity",
+    "queue_logging",
+    "log_file_format",
+    "json_summary_path",
+    "metrics_file_path",
+)
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +89,298 @@ class AgentPluginBuildOptions(InfectionMonkeyBaseModel):
             default=False,
         ),
     ]
+    slim_rules: Annotated[
+        SlimRules | None,
+        Field(
+            title="The rules to use to slim the vendor directories before archiving.",
+            description="""If set, the dependencies are installed without compiling bytecode,
+            and files matching the rules are removed from the vendor directories. If not set,
+            the vendor directories are archived as they were installed.
+            """,
+            default=None,
+        ),
+    ]
+    precompile_bytecode: Annotated[
+        bool,
+        Field(
+            title="Whether to include bytecode compiled for the agent's Python version.",
+            description="""If set, the plugin code and the vendored dependencies are compiled
+            with unchecked-hash invalidation and the bytecode is included in the source archive,
+            so that the agent does not need to compile them when it first imports them.
+            """,
+            default=False,
+        ),
+    ]
+    vendor_bundle: Annotated[
+        VendorBundleCompression | None,
+        Field(
+            title="How to bundle the zip-safe pure-Python packages of the vendor directories.",
+            description="""Options are:
+              stored: The files are stored in the bundle without compression.
+              deflated: The files are compressed in the bundle.
+
+            If set, the zip-safe pure-Python packages of every vendor directory are bundled
+            into bundle.zip in the vendor directory, which the agent can put on sys.path.
+            Native extensions, packages which are not zip-safe and the package metadata are
+            left as loose files.
+            """,
+            default=None,
+        ),
+    ]
+    size_report: Annotated[
+        bool,
+        Field(
+            title="Whether to write a breakdown of the size of the source archive.",
+            description="""If set, the compressed and uncompressed size of the source archive is
+            broken down by top-level directory, vendor directory, vendored package and file type,
+            and the largest files and the estimated savings of deduplicating and slimming the
+            vendor directories are listed. The report is written to the build directory.
+            """,
+            default=False,
+        ),
+    ]
+    size_budgets: Annotated[
+        SizeBudgets | None,
+        Field(
+            title="The size budgets which the source archive must fit in.",
+            description="""If set, the build fails if the source archive exceeds any of the
+            budgets. Implies size_report.
+            """,
+            default=None,
+        ),
+    ]
+    dist_publish_method: Annotated[
+        DistPublishMethod,
+        Field(
+            title="The method to use to publish the Agent Plugin archive to the dist directory.",
+            description="""Options are:
+              copy: The archive is copied to the dist directory. Default option
+              hardlink: The archive is hard-linked into the dist directory.
+              move: The archive is moved from the build directory to the dist directory.
+
+            Hard-linking and moving are only possible if the build and dist directories are on
+            the same filesystem. Otherwise the archive is copied.
+            """,
+            default=DistPublishMethod.COPY,
+        ),
+    ]
+    workspace: Annotated[
+        WorkspaceType,
+        Field(
+            title="Where to place the intermediate files of the build.",
+            description="""Options are:
+              disk: The plugin is built in the build directory. Default option
+              memory: The plugin is built in a directory on a memory-backed filesystem, and
+                      only the log file, the requirements file and the build reports are kept
+                      in the build directory. The build spills to the build directory if it
+                      does not fit in the available memory.
+            """,
+            default=WorkspaceType.DISK,
+        ),
+    ]
+    isolated_build_dir: Annotated[
+        bool,
+        Field(
+            title="Whether to build the plugin in a unique directory in the build directory.",
+            description="""If set, every build creates a new directory in the build directory,
+            and is built in it, so that builds which use the same build directory run
+            concurrently. After the build succeeds, the staged plugin code, the vendor
+            directories and the archives are removed from the directory, and the log, the
+            requirements files, the reports and the profiles are kept. The directory is kept
+            whole if the build fails. Otherwise the build directory is cleared, and the builds
+            which use it run one after the other.
+            """,
+            default=False,
+        ),
+    ]
+    resume: Annotated[
+        bool,
+        Field(
+            title="Whether to resume the previous build in the build directory.",
+            description="""The build keeps a journal of the steps which it completed, with the
+            fingerprints of their inputs, in the build directory. If set, the steps which the
+            previous build completed with the same inputs, and whose outputs are intact, are not
+            run again, up to the first step which is missing or invalidated. Otherwise the build
+            directory is cleared and the plugin is built from scratch.
+            """,
+            default=False,
+        ),
+    ]
+    force: Annotated[
+        bool,
+        Field(
+            title="Whether to build the plugin even if its archive is up to date.",
+            description="""Every build writes a fingerprint of its inputs next to the plugin
+            archive in the dist directory. Unless set, the build is skipped, and the existing
+            archive is returned, if the fingerprint of the inputs is unchanged and the archive
+            is intact.
+            """,
+            default=False,
+        ),
+    ]
+    pull_policy: Annotated[
+        PullPolicy,
+        Field(
+            title="When to pull the builder images.",
+            description="""Options are:
+              always: The builder images are always pulled.
+              missing: The builder images are pulled if they are not available locally.
+                       Default option
+              never: The builder images are never pulled, and must be available locally.
+
+            Only the builder images which the build needs are pulled, while the requirements
+            file is generated. The builder containers run the images by their digests.
+            """,
+            default=PullPolicy.MISSING,
+        ),
+    ]
+    installed_tree_cache: Annotated[
+        bool,
+        Field(
+            title="Whether to assemble the vendor directories from cached installed packages.",
+            description="""If set, every package is installed into its own tree, which is cached
+            by its wheel filename, hash and target environment. The vendor directories are
+            assembled by hard-linking the cached trees, and only the packages which are missing
+            from the cache are installed in the builder containers.
+            """,
+            default=False,
+        ),
+    ]
+    wine_prefix_cache: Annotated[
+        bool,
+        Field(
+            title="Whether to reuse an initialized Wine prefix in the Windows builder containers.",
+            description="""If set, the Wine prefix which the Windows builder image initializes is
+            kept in the cache directory, keyed by the ID of the image, and every Windows builder
+            container starts from a copy of it, instead of initializing a new prefix. A new
+            prefix is initialized when the image changes, or if the cached prefix is incomplete.
+            """,
+            default=False,
+        ),
+    ]
+    autodetect_cache: Annotated[
+        bool,
+        Field(
+            title="Whether to reuse the autodetected platform dependency packaging method.",
+            description="""If set, the decision whether the dependencies can be packaged in a
+            common vendor directory is cached with the package lists which it was made from,
+            keyed by the content of the requirements file and the digests of the builder
+            images, and later builds with the same inputs reuse it instead of resolving the
+            requirements for Linux and Windows again.
+            """,
+            default=False,
+        ),
+    ]
+    lock_file_autodetect: Annotated[
+        bool,
+        Field(
+            title="Whether to autodetect the platform dependency packaging method from the lock "
+            "file.",
+            description="""If set, the decision whether the dependencies can be packaged in a
+            common vendor directory is made from the exported requirements and the wheels which
+            the Poetry lock file lists for them, without running the builder containers. The
+            builder containers are only run if the lock file is not conclusive, e.g. if a
+            package has no wheels, or if an environment marker can't be evaluated.
+            """,
+            default=True,
+        ),
+    ]
+    speculative_install: Annotated[
+        bool,
+        Field(
+            title="Whether to install the common vendor directory while autodetecting.",
+            description="""If set, and the builder containers autodetect the platform
+            dependency packaging method, the common vendor directory is installed once the Linux
+            requirements are resolved, while the Windows requirements are resolved. It's used
+            as the common vendor directory if the package lists match, and as the Linux vendor
+            directory otherwise.
+            """,
+            default=False,
+        ),
+    ]
+    docker_endpoints: Annotated[
+        tuple[DockerEndpointConfig, ...],
+        Field(
+            title="The Docker endpoints which run the builder containers.",
+            description="""If set, every builder container is placed on the least loaded
+            healthy endpoint which has free capacity, and is run on another endpoint if the
+            endpoint fails. The build directory is copied into and out of the containers on
+            remote endpoints. If not set, the builder containers run on the Docker daemon of
+            the environment.
+            """,
+            default=(),
+        ),
+    ]
+    profile: Annotated[
+        ProfileMode | None,
+        Field(
+            title="What to profile in the build stages which run on the host.",
+            description="""Options are:
+              cpu: The stages are profiled with cProfile.
+              memory: The allocations of the stages are traced with tracemalloc.
+
+            If set, a profile of every stage is written to the build directory, and its top
+            entries are logged.
+            """,
+            default=None,
+        ),
+    ]
+    cache_dir_path: Annotated[
+        Path | None,
+        Field(
+            title="The path to the cache directory.",
+            description="""If not set, $XDG_CACHE_HOME/agent_plugin_builder is used, or
+            ~/.cache/agent_plugin_builder if $XDG_CACHE_HOME is not set.
+            """,
+            default=None,
+        ),
+    ]
+    wheelhouse_path: Annotated[
+        Path | None,
+        Field(
+            title="The path to a directory of wheels to install the pure-Python packages from.",
+            description="""If set, the required packages which pip would install from
+            pure-Python wheels, and whose wheels are in the directory and match their hashes in
+            the lock file, are installed into the vendor directories on the host. Only the other
+            packages are installed in the builder containers, and the containers are not run if
+            no packages remain.
+            """,
+            default=None,
+        ),
+    ]
+    prefetch: Annotated[
+        bool,
+        Field(
+            title="Whether to prefetch the artifacts of the requirements on the host.",
+            description="""If set, the wheels and source distributions which pip would install
+            the requirements from on every target platform are downloaded concurrently into
+            the wheelhouse before the builder containers run, and are verified against their
+            hashes in the lock file while they are downloaded. The builder containers find the
+            prefetched artifacts with pip's --find-links. If no wheelhouse is set, the
+            wheelhouse in the cache directory is used.
+            """,
+            default=False,
+        ),
+    ]
+    index_url: Annotated[
+        str | None,
+        Field(
+            title="The base URL of the package index which the artifacts are prefetched from.",
+            description="""The URL of a simple repository API, or a file URL of a local
+            directory with the same layout. It replaces the index URL of the requirements
+            file, and the extra index URLs of the requirements file are searched after it. If
+            not set, the index URL of the requirements file is used, or PyPI.
+            """,
+            default=None,
+        ),
+    ]
+    prefetch_connections: Annotated[
+        PositiveInt,
+        Field(
+            title="The maximum number of concurrent connections to every host when prefetching.",
+            default=DEFAULT_PREFETCH_CONNECTIONS,
+        ),
+    ]
 
 
 def parse_agent_plugin_build_options(args: Namespace) -> AgentPluginBuildOptions:
@@ -82,10 +390,22 @@ def parse_agent_plugin_build_options(args: Namespace) -> AgentPluginBuildOptions
     :param args: The arguments passed to the agent plugin builder.
     :return: AgentPluginBuildOptions.
     """
-    arguments_dict = vars(args)
+    arguments_dict = dict(vars(args))
 
     arguments_dict["verify_hashes"] = arguments_dict["verify"]
     del arguments_dict["verify"]
-    del arguments_dict["verbosity"]
+
+    slim = arguments_dict.pop("slim", False)
+    slim_rules_path = arguments_dict.pop("slim_rules_path", None)
+    if slim or slim_rules_path is not None:
+        arguments_dict["slim_rules"] = get_slim_rules(slim_rules_path)
+    size_budgets_path = arguments_dict.pop("size_budgets_path", None)
+    if size_budgets_path is not None:
+        arguments_dict["size_budgets"] = get_size_budgets(size_budgets_path)
+        arguments_dict["size_report"] = True
+    if arguments_dict.get("docker_endpoints") is None:
+        arguments_dict.pop("docker_endpoints", None)
+    for argument in NON_BUILD_OPTION_ARGUMENTS:
+        arguments_dict.pop(argument, None)
 
     return AgentPluginBuildOptions(**arguments_dict)
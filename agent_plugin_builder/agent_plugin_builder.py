@@ -1,42 +1,113 @@
 import logging
-from argparse import ArgumentParser
+import sys
+from argparse import ArgumentParser, Namespace
 from pathlib import Path
+from typing import TextIO
 
 from monkeytypes import AgentPluginManifest
 
 from .agent_plugin_build_options import SourceDirName, parse_agent_plugin_build_options
-from .agent_plugin_builder_arguments import ARGUMENTS, CustomArgumentsFormatter
+from .agent_plugin_builder_arguments import ARGUMENTS, JSON_SUMMARY_STDOUT, CustomArgumentsFormatter
 from .build_agent_plugin import build_agent_plugin_archive
+from .build_control import BuildControl, BuildStatistics, use_build_control
+from .build_metrics import get_build_metrics, write_build_metrics
+from .build_result import BuildResult
 from .plugin_manifest import get_agent_plugin_manifest
-from .setup_build_plugin_logging import add_file_handler, reset_logger, setup_logging
+from .setup_build_plugin_logging import (
+    add_file_handler,
+    reset_logger,
+    setup_logging,
+    shutdown_logging,
+)
 
 logger = logging.getLogger(__name__)
 
 
-def main():
+def main() -> int:
     parser = ArgumentParser(description="Build plugin", formatter_class=CustomArgumentsFormatter)
     for argument in ARGUMENTS:
         parser.add_argument(*argument["name"], **argument["kwargs"])
 
     args = parser.parse_args()
-    _setup_logging(args.verbosity)
+    # The console log is kept out of a JSON summary on the standard output
+    _setup_logging(
+        args.verbosity,
+        args.queue_logging,
+        sys.stderr if args.json_summary_path == JSON_SUMMARY_STDOUT else sys.stdout,
+    )
+    try:
+        return _build_agent_plugin(args)
+    finally:
+        shutdown_logging()
+
+
+def _build_agent_plugin(args: Namespace) -> int:
     _log_arguments(args)
+    log_file_format = args.log_file_format
 
     agent_plugin_manifest = get_agent_plugin_manifest(args.plugin_dir_path)
     source_dir_name = _get_source_dir_name(args.source_dir_name, agent_plugin_manifest)
     args.source_dir_name = source_dir_name
 
+    json_summary_path = args.json_summary_path
+    metrics_file_path = args.metrics_file_path
+
     _create_build_dirs(Path(args.build_dir_path), Path(args.dist_dir_path))
     agent_plugin_build_options = parse_agent_plugin_build_options(args)
+    build_control = BuildControl()
+    build_result = None
     try:
-        build_agent_plugin_archive(
-            agent_plugin_build_options,
-            agent_plugin_manifest,
-            on_build_dir_created=lambda dir: add_file_handler(dir),
-        )
+        with use_build_control(build_control):
+            build_result = build_agent_plugin_archive(
+                agent_plugin_build_options,
+                agent_plugin_manifest,
+                on_build_dir_created=lambda dir: add_file_handler(dir, log_file_format),
+            )
     except Exception as e:
         logger.error(f"Error building plugin: {e}", exc_info=True)
 
+    if metrics_file_path is not None:
+        _write_build_metrics(
+            metrics_file_path, agent_plugin_manifest, build_control.statistics, build_result
+        )
+
+    if build_result is None:
+        return 1
+
+    logger.info(
+        f"{'Up-to-date' if build_result.up_to_date else 'Built'} plugin archive: "
+        f"{build_result.plugin_archive_path} ({build_result.plugin_archive_size} bytes)"
+    )
+    if json_summary_path is not None:
+        _write_json_summary(build_result, json_summary_path)
+
+    return 0
+
+
+def _write_build_metrics(
+    metrics_file_path: Path,
+    agent_plugin_manifest: AgentPluginManifest,
+    build_statistics: BuildStatistics,
+    build_result: BuildResult | None,
+):
+    try:
+        write_build_metrics(
+            metrics_file_path,
+            get_build_metrics(agent_plugin_manifest, build_statistics, build_result),
+        )
+    except OSError as err:
+        logger.warning(f"Unable to write build metrics to {metrics_file_path}: {err}")
+
+
+def _write_json_summary(build_result: BuildResult, json_summary_path: Path):
+    json_summary = build_result.model_dump_json(indent=2)
+    if json_summary_path == JSON_SUMMARY_STDOUT:
+        print(json_summary)
+        return
+
+    logger.info(f"Writing build summary: {json_summary_path}")
+    json_summary_path.write_text(json_summary + "\n")
+
 
 def _create_build_dirs(build_dir_path: Path, dist_dir_path: Path):
     if not dist_dir_path.exists():
@@ -53,9 +124,9 @@ def _log_arguments(args):
     logger.info(f"Agent Plugin Builder started with arguments: {arg_string}")
 
 
-def _setup_logging(verbosity):
+def _setup_logging(verbosity: int, queue_logging: bool, console_stream: TextIO):
     reset_logger()
-    setup_logging(verbosity)
+    setup_logging(verbosity, queue_logging, console_stream)
 
 
 def _get_source_dir_name(
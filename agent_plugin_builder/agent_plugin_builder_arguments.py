@@ -1,14 +1,32 @@
 from argparse import ArgumentDefaultsHelpFormatter, BooleanOptionalAction, RawTextHelpFormatter
+from enum import Enum
 from pathlib import Path
 from typing import Any
 
-from .agent_plugin_build_options import BUILD, DIST
+from .agent_plugin_build_options import BUILD, DEFAULT_PREFETCH_CONNECTIONS, DIST
+from .dist_publish_method import DistPublishMethod
+from .docker_endpoint_pool import parse_docker_endpoint_config
 from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
+from .profile_mode import ProfileMode
+from .pull_policy import PullPolicy
+from .setup_build_plugin_logging import LogFileFormat
+from .vendor_bundle_compression import VendorBundleCompression
+from .workspace_type import WorkspaceType
 
 SOURCE_DIR_METAVAR = "SOURCE_DIR_NAME"
 PLATFORM_DEPENDENCIES_METAVAR = "PLATFORM_DEPENDENCIES"
 HASHES_METAVAR = "HASHES"
+DIST_PUBLISH_METHOD_METAVAR = "DIST_PUBLISH_METHOD"
+WORKSPACE_METAVAR = "WORKSPACE"
+PULL_POLICY_METAVAR = "PULL_POLICY"
+PROFILE_METAVAR = "PROFILE"
+VENDOR_BUNDLE_METAVAR = "VENDOR_BUNDLE"
 VERBOSITY_DEST = "verbosity"
+QUEUE_LOGGING_DEST = "queue_logging"
+LOG_FILE_FORMAT_DEST = "log_file_format"
+JSON_SUMMARY_DEST = "json_summary_path"
+JSON_SUMMARY_STDOUT = Path("-")
+METRICS_FILE_DEST = "metrics_file_path"
 
 
 class CustomArgumentsFormatter(ArgumentDefaultsHelpFormatter, RawTextHelpFormatter):
@@ -24,6 +42,8 @@ class CustomArgumentsFormatter(ArgumentDefaultsHelpFormatter, RawTextHelpFormatt
             default_str = action.default.value
         elif action.metavar == HASHES_METAVAR:
             default_str = "Verify dependencies integrity"
+        elif isinstance(default, Enum):
+            default_str = default.value
         else:
             if action.dest == VERBOSITY_DEST:
                 default_str = "INFO"
@@ -108,6 +128,403 @@ Options:
             "default": True,
         },
     },
+    {
+        "name": ["--slim"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Slim the vendor directories before archiving. Dependencies are installed
+without compiling bytecode, debug symbols are stripped from Linux shared objects, and test
+suites, docs, type stubs and RECORD files are removed from the vendored packages.
+""",
+        },
+    },
+    {
+        "name": ["--slim-rules"],
+        "kwargs": {
+            "dest": "slim_rules_path",
+            "metavar": "SLIM_RULES_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Optional path to a YAML file with the rules to use to slim the vendor
+directories. Implies --slim.
+
+Rules:
+    remove_patterns: List of patterns of the vendored files and directories to remove.
+    strip_shared_objects: Whether to strip debug symbols from Linux shared objects.
+    compile_bytecode: Whether pip should compile bytecode while installing the dependencies.
+""",
+        },
+    },
+    {
+        "name": ["--precompile-bytecode"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Include bytecode compiled for the agent's Python version in the source
+archive, so that the agent does not need to compile the plugin and its dependencies when it
+first imports them. The bytecode uses unchecked-hash invalidation.
+""",
+        },
+    },
+    {
+        "name": ["--vendor-bundle"],
+        "kwargs": {
+            "metavar": VENDOR_BUNDLE_METAVAR,
+            "type": VendorBundleCompression,
+            "default": None,
+            "help": """Bundle the zip-safe pure-Python packages of every vendor directory into
+bundle.zip in the vendor directory, which the agent can put on sys.path, so that the agent
+extracts fewer files. Packages with native extensions, packages which are marked as not zip-safe
+and packages which read data files by the path of their modules are left as loose files,
+together with the metadata of all the packages. A report of the bundled packages and of the
+reduction of the number of files is written to the build directory.
+
+Options:
+    stored: The files are stored in the bundle without compression.
+    deflated: The files are compressed in the bundle.
+""",
+        },
+    },
+    {
+        "name": ["--size-report"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Write a breakdown of the size of the source archive to the build directory.
+The compressed and uncompressed bytes are broken down by top-level directory, vendor directory,
+vendored package and file type, and the largest files and the estimated savings of deduplicating
+and slimming the vendor directories are listed.
+""",
+        },
+    },
+    {
+        "name": ["--size-budgets"],
+        "kwargs": {
+            "dest": "size_budgets_path",
+            "metavar": "SIZE_BUDGETS_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Optional path to a YAML file with the size budgets which the source archive
+must fit in. The build fails if any of the budgets is exceeded. Implies --size-report.
+
+Budgets:
+    max_compressed_bytes: The maximum size of the source archive.
+    max_uncompressed_bytes: The maximum size of the contents of the source archive.
+    max_vendor_dir_bytes: The maximum size of the contents of each vendor directory.
+    max_package_bytes: The maximum size of the contents of each vendored package.
+""",
+        },
+    },
+    {
+        "name": ["--dist-publish-method"],
+        "kwargs": {
+            "metavar": DIST_PUBLISH_METHOD_METAVAR,
+            "type": DistPublishMethod,
+            "default": DistPublishMethod.COPY,
+            "help": """The method to use to publish the Agent Plugin archive to the dist directory.
+
+Options:
+    copy: The archive is copied to the dist directory. Reflinks are used if the filesystem
+            supports them.
+    hardlink: The archive is hard-linked into the dist directory.
+    move: The archive is moved from the build directory to the dist directory.
+
+Hard-linking and moving fall back to copying if the build and dist directories are not on the
+same filesystem.
+""",
+        },
+    },
+    {
+        "name": ["--workspace"],
+        "kwargs": {
+            "metavar": WORKSPACE_METAVAR,
+            "type": WorkspaceType,
+            "default": WorkspaceType.DISK,
+            "help": """Where to place the intermediate files of the build.
+
+Options:
+    disk: The plugin is built in the build directory.
+    memory: The plugin is built in a directory on a memory-backed filesystem (/dev/shm), and
+            only the log file, the requirements file and the build reports are kept in the
+            build directory. The build spills to the build directory if it is estimated to
+            not fit in the available memory, or if it runs out of space.
+""",
+        },
+    },
+    {
+        "name": ["--isolated-build-dir"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Build the plugin in a new, unique directory in the build directory, so that
+builds which use the same build directory run concurrently. After the build succeeds, the staged
+plugin code, the vendor directories and the archives are removed from the directory, and the log,
+the requirements files, the reports and the profiles are kept. The directory is kept whole if the
+build fails. Otherwise the build directory is cleared, and the builds which use it run one after
+the other.
+""",
+        },
+    },
+    {
+        "name": ["--resume"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Resume the previous build in the build directory. The build keeps a journal
+of the steps which it completed, with the fingerprints of their inputs, in the build directory:
+the staging of the plugin code, the generation of the requirements file, the autodetection of
+the platform dependency packaging method and the installation of every vendor directory. The
+steps which the previous build completed with the same inputs, and whose outputs are intact,
+are not run again, up to the first step which is missing or invalidated. Builds in the memory
+workspace or in isolated build directories can't be resumed.
+""",
+        },
+    },
+    {
+        "name": ["--force"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Build the plugin even if its archive in the dist directory is up to date.
+Every build writes a fingerprint of its inputs next to the archive: the plugin code, the lock
+file, the manifest, the build options, the digests of the builder images and the version of the
+builder. Unless set, the build exits with the existing archive if the fingerprint matches and
+the archive is intact.
+""",
+        },
+    },
+    {
+        "name": ["--pull-policy"],
+        "kwargs": {
+            "metavar": PULL_POLICY_METAVAR,
+            "type": PullPolicy,
+            "default": PullPolicy.MISSING,
+            "help": """When to pull the builder images. Only the images which the build needs are
+pulled, while the requirements file is generated, and the builder containers run the images by
+their digests.
+
+Options:
+    always: The builder images are always pulled.
+    missing: The builder images are pulled if they are not available locally.
+    never: The builder images are never pulled, and must be available locally.
+""",
+        },
+    },
+    {
+        "name": ["--installed-tree-cache"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Install every package into its own tree, and cache the trees by their wheel
+filename, hash and target environment. The vendor directories are assembled by hard-linking the
+cached trees, and only the packages which are missing from the cache are installed in the
+builder containers.
+""",
+        },
+    },
+    {
+        "name": ["--wine-prefix-cache"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Keep the Wine prefix which the Windows builder image initializes in the cache
+directory, keyed by the ID of the image, and start every Windows builder container from a copy
+of it, instead of initializing a new prefix. A new prefix is initialized when the image changes.
+""",
+        },
+    },
+    {
+        "name": ["--autodetect-cache"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Cache the decision whether the dependencies can be packaged in a common
+vendor directory, keyed by the content of the requirements file and the digests of the builder
+images, and reuse it instead of resolving the requirements for Linux and Windows again. The
+cached decisions can be listed and invalidated with the autodetect_cache command.
+""",
+        },
+    },
+    {
+        "name": ["--lock-file-autodetect"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": True,
+            "help": """Decide whether the dependencies can be packaged in a common vendor directory
+from the exported requirements and the wheels which the Poetry lock file lists for them, without
+running the builder containers. The builder containers are only run if the lock file is not
+conclusive, e.g. if a package has no wheels, or if an environment marker can't be evaluated.
+(Default: enabled)
+""",
+        },
+    },
+    {
+        "name": ["--speculative-install"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """When the builder containers autodetect the platform dependency packaging
+method, install the common vendor directory as soon as the Linux requirements are resolved, while
+the Windows requirements are resolved. The installed directory is used as the common vendor
+directory if the package lists match, and as the Linux vendor directory otherwise.
+""",
+        },
+    },
+    {
+        "name": ["--docker-endpoint"],
+        "kwargs": {
+            "dest": "docker_endpoints",
+            "metavar": "HOST[=CAPACITY]",
+            "type": parse_docker_endpoint_config,
+            "action": "append",
+            "default": None,
+            "help": """A Docker endpoint to run the builder containers on, given as a DOCKER_HOST
+URL or the name of a Docker context, optionally followed by the number of builder containers
+which it runs concurrently (Default capacity: 1). Can be given more than once. Every builder
+container is placed on the least loaded healthy endpoint, and is run on another endpoint if the
+endpoint fails. The build directory is copied into and out of the containers on remote
+endpoints. If not given, the builder containers run on the Docker daemon of the environment.
+""",
+        },
+    },
+    {
+        "name": ["--profile"],
+        "kwargs": {
+            "metavar": PROFILE_METAVAR,
+            "type": ProfileMode,
+            "default": None,
+            "help": """Profile the build stages which run on the host: staging the plugin code,
+generating the config schema, bundling the vendor directories, creating, analyzing and
+publishing the archives. A profile of every
+stage is written to the build directory, as profile_<stage>.pstats or
+profile_<stage>.snapshot, and its top entries are logged.
+
+Options:
+    cpu: The stages are profiled with cProfile.
+    memory: The allocations of the stages are traced with tracemalloc.
+""",
+        },
+    },
+    {
+        "name": ["--cache-dir"],
+        "kwargs": {
+            "dest": "cache_dir_path",
+            "metavar": "CACHE_DIR_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Optional path to the cache directory.
+(Default: $XDG_CACHE_HOME/agent_plugin_builder or ~/.cache/agent_plugin_builder)
+""",
+        },
+    },
+    {
+        "name": ["--wheelhouse"],
+        "kwargs": {
+            "dest": "wheelhouse_path",
+            "metavar": "WHEELHOUSE_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Optional path to a directory of wheels. The required packages which pip
+would install from pure-Python wheels, and whose wheels are in the directory and match their
+hashes in the lock file, are installed into the vendor directories on the host, in parallel.
+Only platform-specific wheels and source distributions are installed in the builder containers.
+""",
+        },
+    },
+    {
+        "name": ["--prefetch"],
+        "kwargs": {
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Download the wheels and source distributions which pip would install the
+requirements from on every target platform into the wheelhouse on the host, concurrently, before
+the builder containers run. Every artifact is verified against its hash in the lock file while
+it is downloaded, and the builder containers find the prefetched artifacts with pip's
+--find-links. If --wheelhouse is not set, the wheelhouse in the cache directory is used.
+""",
+        },
+    },
+    {
+        "name": ["--index-url"],
+        "kwargs": {
+            "metavar": "INDEX_URL",
+            "default": None,
+            "help": """Optional base URL of the simple repository API which the artifacts are
+prefetched from, or a file URL of a local directory with the same layout. It replaces the index
+URL of the requirements file.
+(Default: The index URL of the requirements file, or https://pypi.org/simple/)
+""",
+        },
+    },
+    {
+        "name": ["--prefetch-connections"],
+        "kwargs": {
+            "metavar": "N",
+            "type": int,
+            "default": DEFAULT_PREFETCH_CONNECTIONS,
+            "help": """The maximum number of concurrent connections to every host when
+prefetching.
+""",
+        },
+    },
+    {
+        "name": ["--json-summary"],
+        "kwargs": {
+            "dest": JSON_SUMMARY_DEST,
+            "metavar": "JSON_SUMMARY_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Write a JSON summary of the build to the given path, or to the
+standard output if the path is "-". The console log is written to the standard error instead,
+so that the standard output only contains the summary. The summary contains the path and the
+size of the Agent Plugin archive, the size of the source archive and of every vendor directory,
+the packaging method which was used, the duration of every build stage, the number of builder
+containers which were run, the installed tree cache hits and misses, and the checksums of the
+archive.
+""",
+        },
+    },
+    {
+        "name": ["--metrics-file"],
+        "kwargs": {
+            "dest": METRICS_FILE_DEST,
+            "metavar": "METRICS_FILE_PATH",
+            "type": Path,
+            "default": None,
+            "help": """Optional path to a metrics file for the node exporter textfile collector. The
+metrics of the build are merged into the file, which is replaced atomically. The file contains
+histograms of the build stage and builder container durations, the archive sizes, the number of
+vendored files, and the number of successful and failed builds, labeled by the plugin name and
+type.
+""",
+        },
+    },
+    {
+        "name": ["--queue-logging"],
+        "kwargs": {
+            "dest": QUEUE_LOGGING_DEST,
+            "action": BooleanOptionalAction,
+            "default": False,
+            "help": """Hand log records to a background thread which writes them in batches, so
+that high-volume command and container output does not block the build.
+""",
+        },
+    },
+    {
+        "name": ["--log-file-format"],
+        "kwargs": {
+            "dest": LOG_FILE_FORMAT_DEST,
+            "type": LogFileFormat,
+            "default": LogFileFormat.TEXT,
+            "help": """Format of the log file written to the build directory.
+
+Options:
+    text: Human readable log lines.
+    jsonl: One JSON object per log record.
+""",
+        },
+    },
     {
         "name": ["-v", "--verbose"],
         "kwargs": {
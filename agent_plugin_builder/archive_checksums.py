@@ -0,0 +1,158 @@
+import hashlib
+import os
+import tarfile
+from pathlib import Path
+from typing import BinaryIO, Callable
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+CHECKSUMS_SUFFIX = ".checksums.json"
+
+TarFilter = Callable[[tarfile.TarInfo], tarfile.TarInfo | None]
+
+
+class ArchiveChecksums(InfectionMonkeyBaseModel):
+    archive_name: str
+    sha256: str
+    members: dict[str, str]
+
+
+class PluginArchiveChecksums(InfectionMonkeyBaseModel):
+    plugin_archive: ArchiveChecksums
+    source_archive: ArchiveChecksums | None = None
+
+
+class HashingWriter:
+    """
+    A write-only file object which computes the SHA-256 digest of the data written through it
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+
+    @property
+    def name(self) -> str:
+        return self._fileobj.name
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        return self._fileobj.write(data)
+
+    def tell(self) -> int:
+        return self._fileobj.tell()
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+class HashingReader:
+    """
+    A read-only file object which computes the SHA-256 digest of the data read through it
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self._hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fileobj.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def add_to_archive(
+    tar: tarfile.TarFile,
+    path: Path,
+    arcname: str,
+    member_digests: dict[str, str],
+    filter: TarFilter | None = None,
+):
+    """
+    Add a file or a directory tree to a tar archive, the same way TarFile.add() does, while
+    computing the SHA-256 digest of every regular file as it is written to the archive.
+
+    :param tar: The archive to add the file to.
+    :param path: Path to the file or directory to add.
+    :param arcname: Name of the file in the archive.
+    :param member_digests: A dictionary which will be updated with the digests of the added
+        regular files, keyed by their names in the archive.
+    :param filter: A function which receives the TarInfo of every file and returns a changed
+        TarInfo, or None to exclude the file (and its children) from the archive.
+    """
+    tarinfo = tar.gettarinfo(str(path), arcname)
+    if tarinfo is None:
+        return
+
+    if filter is not None:
+        filtered_tarinfo = filter(tarinfo)
+        if filtered_tarinfo is None:
+            return
+        tarinfo = filtered_tarinfo
+
+    if tarinfo.isreg():
+        with path.open("rb") as f:
+            reader = HashingReader(f)
+            tar.addfile(tarinfo, reader)  # type: ignore [arg-type]
+        member_digests[tarinfo.name] = reader.hexdigest()
+    elif tarinfo.isdir():
+        tar.addfile(tarinfo)
+        for child_name in sorted(os.listdir(path)):
+            add_to_archive(
+                tar, path / child_name, f"{arcname}/{child_name}", member_digests, filter
+            )
+    else:
+        tar.addfile(tarinfo)
+
+
+def get_checksums_file_path(archive_path: Path) -> Path:
+    return archive_path.with_name(f"{archive_path.name}{CHECKSUMS_SUFFIX}")
+
+
+def write_checksums_file(
+    archive_path: Path, checksums: ArchiveChecksums | PluginArchiveChecksums
+) -> Path:
+    """
+    Write the checksums of an archive to a sidecar file next to the archive.
+
+    :param archive_path: Path to the archive.
+    :param checksums: The checksums of the archive.
+    :return: Path to the checksums file.
+    """
+    checksums_file_path = get_checksums_file_path(archive_path)
+    checksums_file_path.write_text(checksums.model_dump_json(indent=2))
+
+    return checksums_file_path
+
+
+def read_archive_checksums(archive_path: Path) -> ArchiveChecksums | None:
+    """
+    Read the checksums of an archive from its sidecar file.
+
+    :param archive_path: Path to the archive.
+    :return: The checksums of the archive, or None if the archive has no checksums file.
+    """
+    checksums_file_path = get_checksums_file_path(archive_path)
+    if not checksums_file_path.exists():
+        return None
+
+    return ArchiveChecksums.from_json(checksums_file_path.read_text())
+
+
+def read_plugin_archive_checksums(plugin_archive_path: Path) -> PluginArchiveChecksums:
+    """
+    Read the checksums of an Agent Plugin archive from its sidecar file.
+
+    :param plugin_archive_path: Path to the Agent Plugin archive.
+    :return: The checksums of the Agent Plugin archive.
+    :raises FileNotFoundError: If the checksums file does not exist.
+    """
+    return PluginArchiveChecksums.from_json(
+        get_checksums_file_path(plugin_archive_path).read_text()
+    )
@@ -0,0 +1,170 @@
+import io
+import json
+import logging
+import mmap
+import re
+import tarfile
+from pathlib import Path, PurePosixPath
+from typing import Any, Final
+
+import yaml
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .plugin_manifest import MANIFEST
+from .plugin_schema_generation import CONFIG_SCHEMA
+from .vendor_dir_slimming import VENDOR_DIR_NAMES
+
+logger = logging.getLogger(__name__)
+
+SOURCE_ARCHIVE_NAME: Final = "source.tar.gz"
+MANIFEST_MEMBER_NAMES: Final = (f"{MANIFEST}.yaml", f"{MANIFEST}.yml")
+DIST_INFO_DIR_PATTERN: Final = re.compile(r"^(?P<name>[^-]+)-(?P<version>[^-]+)\.dist-info$")
+
+
+class VendoredPackage(InfectionMonkeyBaseModel):
+    name: str
+    version: str
+    vendor_dir: str
+
+
+class PluginArchiveInspection(InfectionMonkeyBaseModel):
+    archive_name: str
+    archive_bytes: int
+    manifest: dict[str, Any]
+    config_schema: dict[str, Any] | None
+    source_archive_bytes: int
+    source_uncompressed_bytes: int
+    source_file_count: int
+    vendor_dirs: tuple[str, ...]
+    packages: tuple[VendoredPackage, ...]
+    source_members: tuple[str, ...] | None = None
+
+
+def inspect_plugin_archive(
+    archive_path: Path, include_source_members: bool = False
+) -> PluginArchiveInspection:
+    """
+    Inspect the manifest, the config schema and the vendored packages of an Agent Plugin archive.
+
+    The archive is memory-mapped, and the manifest and the config schema are read in place. The
+    source archive is decompressed as a stream, only to list its members, without extracting
+    them.
+
+    :param archive_path: Path to the Agent Plugin archive.
+    :param include_source_members: Whether to list the members of the source archive.
+    :return: The inspection of the archive.
+    :raises tarfile.TarError: If the archive is not a valid Agent Plugin archive.
+    :raises yaml.YAMLError: If the manifest is not valid YAML.
+    :raises ValueError: If the config schema is not valid JSON.
+    """
+    with archive_path.open("rb") as f:
+        archive_bytes = archive_path.stat().st_size
+        if archive_bytes == 0:
+            raise tarfile.TarError(f"{archive_path} is empty")
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_archive:
+            return _inspect_mapped_archive(
+                mapped_archive, archive_path.name, archive_bytes, include_source_members
+            )
+
+
+def _inspect_mapped_archive(
+    mapped_archive: mmap.mmap,
+    archive_name: str,
+    archive_bytes: int,
+    include_source_members: bool,
+) -> PluginArchiveInspection:
+    members = _get_member_locations(mapped_archive)
+    manifest_member_name = next((name for name in MANIFEST_MEMBER_NAMES if name in members), None)
+    if manifest_member_name is None:
+        raise tarfile.TarError(f"{archive_name} has no manifest")
+    if SOURCE_ARCHIVE_NAME not in members:
+        raise tarfile.TarError(f"{archive_name} has no {SOURCE_ARCHIVE_NAME}")
+
+    manifest = yaml.safe_load(_read_member(mapped_archive, members[manifest_member_name]))
+    config_schema = None
+    if CONFIG_SCHEMA in members:
+        config_schema = json.loads(_read_member(mapped_archive, members[CONFIG_SCHEMA]))
+
+    source_offset, source_archive_bytes = members[SOURCE_ARCHIVE_NAME]
+    source_uncompressed_bytes = 0
+    source_file_count = 0
+    source_members = []
+    vendor_dir_entries = set()
+    source_archive = _MappedMemberReader(mapped_archive, source_offset, source_archive_bytes)
+    with tarfile.open(fileobj=io.BufferedReader(source_archive), mode="r|gz") as source_tar:
+        for member in source_tar:
+            if include_source_members:
+                source_members.append(member.name)
+            if member.isfile():
+                source_uncompressed_bytes += member.size
+                source_file_count += 1
+
+            path = PurePosixPath(member.name)
+            if path.parts and path.parts[0] in VENDOR_DIR_NAMES:
+                vendor_dir_entries.add(path.parts[:2])
+
+    packages = [
+        package for package in map(_get_vendored_package, vendor_dir_entries) if package is not None
+    ]
+
+    return PluginArchiveInspection(
+        archive_name=archive_name,
+        archive_bytes=archive_bytes,
+        manifest=manifest,
+        config_schema=config_schema,
+        source_archive_bytes=source_archive_bytes,
+        source_uncompressed_bytes=source_uncompressed_bytes,
+        source_file_count=source_file_count,
+        vendor_dirs=tuple(sorted({entry[0] for entry in vendor_dir_entries})),
+        packages=tuple(
+            sorted(packages, key=lambda package: (package.vendor_dir, package.name.lower()))
+        ),
+        source_members=tuple(source_members) if include_source_members else None,
+    )
+
+
+def _get_member_locations(mapped_archive: mmap.mmap) -> dict[str, tuple[int, int]]:
+    # Only the headers are read, the offsets of the members' data are used to read them in place
+    with tarfile.open(fileobj=mapped_archive, mode="r:") as tar:  # type: ignore [arg-type]
+        return {member.name: (member.offset_data, member.size) for member in tar if member.isfile()}
+
+
+def _read_member(mapped_archive: mmap.mmap, location: tuple[int, int]) -> bytes:
+    offset, size = location
+    return mapped_archive[offset : offset + size]
+
+
+def _get_vendored_package(vendor_dir_entry: tuple[str, ...]) -> VendoredPackage | None:
+    # The dist-info directory of every package is at the top of its vendor directory
+    if len(vendor_dir_entry) < 2:
+        return None
+
+    match = DIST_INFO_DIR_PATTERN.match(vendor_dir_entry[1])
+    if match is None:
+        return None
+
+    return VendoredPackage(
+        name=match.group("name"), version=match.group("version"), vendor_dir=vendor_dir_entry[0]
+    )
+
+
+class _MappedMemberReader(io.RawIOBase):
+    """
+    Reads the data of an archive member from the memory-mapped archive
+    """
+
+    def __init__(self, mapped_archive: mmap.mmap, offset: int, size: int):
+        self._mapped_archive = mapped_archive
+        self._position = offset
+        self._end = offset + size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        size = min(len(buffer), self._end - self._position)
+        buffer[:size] = self._mapped_archive[self._position : self._position + size]
+        self._position += size
+
+        return size
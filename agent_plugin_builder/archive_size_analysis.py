@@ -0,0 +1,319 @@
+import hashlib
+import json
+import logging
+import re
+import tarfile
+import zlib
+from collections import defaultdict
+from pathlib import Path, PurePosixPath
+from typing import IO, Final
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .size_budgets import SizeBudgets
+from .slim_rules import DEFAULT_SLIM_REMOVE_PATTERNS
+from .vendor_dir_slimming import VENDOR_DIR_NAMES
+
+logger = logging.getLogger(__name__)
+
+SIZE_REPORT_FILE: Final = "size_report.json"
+SOURCE_ARCHIVE_NAME: Final = "source.tar.gz"
+LARGEST_FILE_COUNT: Final = 20
+# The contents are compressed file by file to estimate how much each file contributes to the
+# compressed archive. A lower level than the archive's is used, since only the ratios matter.
+ESTIMATE_COMPRESSION_LEVEL: Final = 6
+READ_CHUNK_SIZE: Final = 1024 * 1024
+NO_FILE_TYPE: Final = "(none)"
+DEDUP_SAVINGS: Final = "dedup"
+SLIM_SAVINGS: Final = "slim"
+DIST_INFO_PATTERN: Final = re.compile(r"^(?P<name>.+?)-[^-]+\.(dist-info|egg-info|data)$")
+
+
+class SizeBudgetExceededError(Exception):
+    """Raised when an archive exceeds its size budgets."""
+
+    pass
+
+
+class SizeBreakdown(InfectionMonkeyBaseModel):
+    uncompressed_bytes: int = 0
+    compressed_bytes: int = 0
+    file_count: int = 0
+
+
+class ArchivedFile(InfectionMonkeyBaseModel):
+    path: str
+    uncompressed_bytes: int
+    compressed_bytes: int
+
+
+class SizeReport(InfectionMonkeyBaseModel):
+    archive_name: str
+    compressed_bytes: int
+    uncompressed_bytes: int
+    top_level_entries: dict[str, SizeBreakdown]
+    vendor_dirs: dict[str, SizeBreakdown]
+    packages: dict[str, SizeBreakdown]
+    file_types: dict[str, SizeBreakdown]
+    largest_files: tuple[ArchivedFile, ...]
+    estimated_savings: dict[str, SizeBreakdown]
+
+
+class _AnalyzedFile(InfectionMonkeyBaseModel):
+    path: PurePosixPath
+    uncompressed_bytes: int
+    estimated_compressed_bytes: int
+    sha256: str
+
+
+def analyze_archive(archive_path: Path, largest_file_count: int = LARGEST_FILE_COUNT) -> SizeReport:
+    """
+    Break down the size of a source archive, or of the source archive of an Agent Plugin archive.
+
+    The compressed size of every file is estimated by compressing it on its own, and scaling the
+    estimates to the size of the archive.
+
+    :param archive_path: Path to a source archive, or to an Agent Plugin archive.
+    :param largest_file_count: The number of largest files to list.
+    :return: The size report of the source archive.
+    :raises tarfile.TarError: If the archive is not a valid source or Agent Plugin archive.
+    """
+    if archive_path.name.endswith(".tar.gz"):
+        with archive_path.open("rb") as f:
+            return _analyze_source_archive(
+                f, archive_path.name, archive_path.stat().st_size, largest_file_count
+            )
+
+    with tarfile.open(archive_path, "r") as plugin_archive:
+        source_archive_info = plugin_archive.getmember(SOURCE_ARCHIVE_NAME)
+        source_archive = plugin_archive.extractfile(source_archive_info)
+        if source_archive is None:
+            raise tarfile.TarError(f"{SOURCE_ARCHIVE_NAME} is not a file in {archive_path}")
+
+        return _analyze_source_archive(
+            source_archive, SOURCE_ARCHIVE_NAME, source_archive_info.size, largest_file_count
+        )
+
+
+def analyze_source_archive(
+    build_dir_path: Path, source_archive_path: Path, size_budgets: SizeBudgets | None = None
+) -> SizeReport:
+    """
+    Break down the size of the source archive, write the size report to the build directory,
+    and enforce the size budgets.
+
+    :param build_dir_path: Path to the build directory.
+    :param source_archive_path: Path to the source archive.
+    :param size_budgets: The size budgets to enforce.
+    :return: The size report of the source archive.
+    :raises SizeBudgetExceededError: If the source archive exceeds its size budgets.
+    """
+    logger.info(f"Analyzing the size of the source archive: {source_archive_path}")
+    size_report = analyze_archive(source_archive_path)
+    _log_size_report(size_report)
+
+    with (build_dir_path / SIZE_REPORT_FILE).open("w") as f:
+        json.dump(size_report.to_json_dict(), f, indent=2)
+
+    if size_budgets is not None:
+        check_size_budgets(size_report, size_budgets)
+
+    return size_report
+
+
+def check_size_budgets(size_report: SizeReport, size_budgets: SizeBudgets):
+    """
+    Check that an archive fits in its size budgets.
+
+    :param size_report: The size report of the archive.
+    :param size_budgets: The size budgets.
+    :raises SizeBudgetExceededError: If the archive exceeds any of its size budgets.
+    """
+    violations = []
+    if _exceeds(size_report.compressed_bytes, size_budgets.max_compressed_bytes):
+        violations.append(
+            f"the archive is {size_report.compressed_bytes} bytes, "
+            f"over the budget of {size_budgets.max_compressed_bytes} bytes"
+        )
+    if _exceeds(size_report.uncompressed_bytes, size_budgets.max_uncompressed_bytes):
+        violations.append(
+            f"the archive contents are {size_report.uncompressed_bytes} bytes, "
+            f"over the budget of {size_budgets.max_uncompressed_bytes} bytes"
+        )
+    for name, max_bytes, breakdowns in (
+        ("vendor directory", size_budgets.max_vendor_dir_bytes, size_report.vendor_dirs),
+        ("package", size_budgets.max_package_bytes, size_report.packages),
+    ):
+        for key, breakdown in breakdowns.items():
+            if _exceeds(breakdown.uncompressed_bytes, max_bytes):
+                violations.append(
+                    f"{name} {key} is {breakdown.uncompressed_bytes} bytes, "
+                    f"over the budget of {max_bytes} bytes"
+                )
+
+    if violations:
+        for violation in violations:
+            logger.error(f"Size budget exceeded: {violation}")
+        raise SizeBudgetExceededError(f"Size budgets exceeded: {'; '.join(violations)}")
+
+
+def _exceeds(size: int, max_size: int | None) -> bool:
+    return max_size is not None and size > max_size
+
+
+def _analyze_source_archive(
+    source_archive: IO[bytes], archive_name: str, compressed_bytes: int, largest_file_count: int
+) -> SizeReport:
+    analyzed_files = []
+    with tarfile.open(fileobj=source_archive, mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+
+            f = tar.extractfile(member)
+            if f is not None:
+                analyzed_files.append(_analyze_file(PurePosixPath(member.name), f))
+
+    # Attribute the size of the archive, including its headers, to the files
+    total_estimated_bytes = sum(file.estimated_compressed_bytes for file in analyzed_files)
+    scale = compressed_bytes / total_estimated_bytes if total_estimated_bytes else 0.0
+    compressed_sizes = {
+        file.path: round(file.estimated_compressed_bytes * scale) for file in analyzed_files
+    }
+
+    breakdowns: dict[str, dict[str, SizeBreakdown]] = defaultdict(dict)
+    for file in analyzed_files:
+        for breakdown_name, key in _get_breakdown_keys(file.path):
+            breakdown = breakdowns[breakdown_name].get(key, SizeBreakdown())
+            breakdowns[breakdown_name][key] = _add_to_breakdown(
+                breakdown, file.uncompressed_bytes, compressed_sizes[file.path]
+            )
+
+    largest_files = sorted(analyzed_files, key=lambda file: -file.uncompressed_bytes)
+    return SizeReport(
+        archive_name=archive_name,
+        compressed_bytes=compressed_bytes,
+        uncompressed_bytes=sum(file.uncompressed_bytes for file in analyzed_files),
+        top_level_entries=_sort_breakdowns(breakdowns["top_level_entries"]),
+        vendor_dirs=_sort_breakdowns(breakdowns["vendor_dirs"]),
+        packages=_sort_breakdowns(breakdowns["packages"]),
+        file_types=_sort_breakdowns(breakdowns["file_types"]),
+        largest_files=tuple(
+            ArchivedFile(
+                path=str(file.path),
+                uncompressed_bytes=file.uncompressed_bytes,
+                compressed_bytes=compressed_sizes[file.path],
+            )
+            for file in largest_files[:largest_file_count]
+        ),
+        estimated_savings=_estimate_savings(analyzed_files, compressed_sizes),
+    )
+
+
+def _analyze_file(path: PurePosixPath, f: IO[bytes]) -> _AnalyzedFile:
+    compressor = zlib.compressobj(ESTIMATE_COMPRESSION_LEVEL)
+    file_hash = hashlib.sha256()
+    uncompressed_bytes = 0
+    estimated_compressed_bytes = 0
+    while chunk := f.read(READ_CHUNK_SIZE):
+        file_hash.update(chunk)
+        uncompressed_bytes += len(chunk)
+        estimated_compressed_bytes += len(compressor.compress(chunk))
+    estimated_compressed_bytes += len(compressor.flush())
+
+    return _AnalyzedFile(
+        path=path,
+        uncompressed_bytes=uncompressed_bytes,
+        estimated_compressed_bytes=estimated_compressed_bytes,
+        sha256=file_hash.hexdigest(),
+    )
+
+
+def _get_breakdown_keys(path: PurePosixPath) -> list[tuple[str, str]]:
+    breakdown_keys = [
+        ("top_level_entries", path.parts[0]),
+        ("file_types", path.suffix or NO_FILE_TYPE),
+    ]
+    if path.parts[0] in VENDOR_DIR_NAMES:
+        breakdown_keys.append(("vendor_dirs", path.parts[0]))
+        if len(path.parts) > 1:
+            breakdown_keys.append(
+                ("packages", f"{path.parts[0]}/{_get_package_name(path.parts[1])}")
+            )
+
+    return breakdown_keys
+
+
+def _get_package_name(vendored_entry_name: str) -> str:
+    """
+    Get the name of the package which a top-level entry of a vendor directory belongs to, so that
+    the metadata of a distribution is counted with its import package, where their names match.
+    """
+    match = DIST_INFO_PATTERN.match(vendored_entry_name)
+    if match is not None:
+        return match.group("name").lower().replace("-", "_")
+
+    return vendored_entry_name.split(".")[0].lower()
+
+
+def _add_to_breakdown(
+    breakdown: SizeBreakdown, uncompressed_bytes: int, compressed_bytes: int
+) -> SizeBreakdown:
+    return SizeBreakdown(
+        uncompressed_bytes=breakdown.uncompressed_bytes + uncompressed_bytes,
+        compressed_bytes=breakdown.compressed_bytes + compressed_bytes,
+        file_count=breakdown.file_count + 1,
+    )
+
+
+def _sort_breakdowns(breakdowns: dict[str, SizeBreakdown]) -> dict[str, SizeBreakdown]:
+    return dict(sorted(breakdowns.items(), key=lambda item: -item[1].uncompressed_bytes))
+
+
+def _estimate_savings(
+    analyzed_files: list[_AnalyzedFile], compressed_sizes: dict[PurePosixPath, int]
+) -> dict[str, SizeBreakdown]:
+    dedup_savings = SizeBreakdown()
+    slim_savings = SizeBreakdown()
+    seen_digests = set()
+    for file in analyzed_files:
+        if file.uncompressed_bytes > 0 and file.sha256 in seen_digests:
+            dedup_savings = _add_to_breakdown(
+                dedup_savings, file.uncompressed_bytes, compressed_sizes[file.path]
+            )
+        seen_digests.add(file.sha256)
+
+        if file.path.parts[0] in VENDOR_DIR_NAMES and _matches_slim_patterns(file.path):
+            slim_savings = _add_to_breakdown(
+                slim_savings, file.uncompressed_bytes, compressed_sizes[file.path]
+            )
+
+    return {DEDUP_SAVINGS: dedup_savings, SLIM_SAVINGS: slim_savings}
+
+
+def _matches_slim_patterns(path: PurePosixPath) -> bool:
+    relative_path = PurePosixPath(*path.parts[1:])
+    # A file is removed if it, or any of its parent directories, matches a pattern
+    candidate_paths = [relative_path, *list(relative_path.parents)[:-1]]
+
+    return any(
+        candidate_path.match(pattern)
+        for candidate_path in candidate_paths
+        for pattern in DEFAULT_SLIM_REMOVE_PATTERNS
+    )
+
+
+def _log_size_report(size_report: SizeReport):
+    logger.info(
+        f"Source archive: {size_report.compressed_bytes} bytes compressed, "
+        f"{size_report.uncompressed_bytes} bytes uncompressed"
+    )
+    for name, breakdown in size_report.top_level_entries.items():
+        logger.info(
+            f"  {name}: {breakdown.uncompressed_bytes} bytes uncompressed, "
+            f"~{breakdown.compressed_bytes} bytes compressed, {breakdown.file_count} files"
+        )
+    for name, savings in size_report.estimated_savings.items():
+        logger.info(f"Estimated {name} savings: ~{savings.compressed_bytes} bytes compressed")
+    for file in size_report.largest_files:
+        logger.debug(f"Large file: {file.path}: {file.uncompressed_bytes} bytes")
@@ -0,0 +1,388 @@
+import hashlib
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Final, Iterable, Iterator, Sequence
+from urllib.parse import unquote, urldefrag, urljoin, urlsplit
+from urllib.request import url2pathname
+
+import requests
+from monkeytypes import OperatingSystem
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from packaging.utils import NormalizedName
+from requests.adapters import HTTPAdapter
+
+from .agent_plugin_build_options import DEFAULT_PREFETCH_CONNECTIONS, AgentPluginBuildOptions
+from .file_transfer import get_temporary_path, link_file
+from .installed_tree_cache import get_default_cache_dir
+from .lock_file_analysis import LockedFile, select_locked_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_URL: Final = "https://pypi.org/simple/"
+WHEELHOUSE_DIR: Final = "wheelhouse"
+# The prefetched artifacts are linked into the build directory, which the builder containers
+# mount, and pip finds them there with PIP_FIND_LINKS
+BUILD_WHEELHOUSE_DIR: Final = ".wheelhouse"
+CONTAINER_WHEELHOUSE_PATH: Final = f"/plugin/{BUILD_WHEELHOUSE_DIR}"
+INDEX_URL_OPTIONS: Final = ("--index-url", "-i")
+EXTRA_INDEX_URL_OPTION: Final = "--extra-index-url"
+INDEX_PAGE_FILE: Final = "index.html"
+CHUNK_SIZE: Final = 1024 * 1024
+CONNECTION_TIMEOUT_SECONDS: Final = 60
+MAX_REDIRECTS: Final = 5
+USER_AGENT: Final = "agent-plugin-builder"
+
+
+class PrefetchError(Exception):
+    """Raised when a prefetched artifact doesn't match its hash in the lock file."""
+
+    pass
+
+
+class PrefetchReport(InfectionMonkeyBaseModel):
+    downloaded: tuple[str, ...] = ()
+    reused: tuple[str, ...] = ()
+    missing: tuple[str, ...] = ()
+    downloaded_bytes: int = 0
+
+
+def get_wheelhouse_path(agent_plugin_build_options: AgentPluginBuildOptions) -> Path | None:
+    """
+    Get the wheelhouse of a build.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :return: Path to the wheelhouse which was set in the options, the wheelhouse in the cache
+        directory if the artifacts are prefetched, or None if the build has no wheelhouse.
+    """
+    if agent_plugin_build_options.wheelhouse_path is not None:
+        return agent_plugin_build_options.wheelhouse_path
+    if not agent_plugin_build_options.prefetch:
+        return None
+
+    cache_dir_path = agent_plugin_build_options.cache_dir_path or get_default_cache_dir()
+    return cache_dir_path / WHEELHOUSE_DIR
+
+
+def prefetch_artifacts(
+    build_dir_path: Path,
+    operating_systems: Iterable[OperatingSystem],
+    wheelhouse_path: Path,
+    index_url: str | None = None,
+    max_connections: int = DEFAULT_PREFETCH_CONNECTIONS,
+) -> PrefetchReport:
+    """
+    Download the artifacts which pip would install the required packages from into a
+    wheelhouse, and link them into the build directory for the builder containers.
+
+    The artifacts of every operating system are selected from the Poetry lock file, like in
+    `select_locked_files`. Their URLs are found in the simple repository API pages of the
+    index, and they are downloaded concurrently over a bounded pool of persistent connections.
+    Every artifact is hashed while it's streamed to the wheelhouse, and artifacts which are
+    already in the wheelhouse are reused if they match their hashes in the lock file.
+    Artifacts which can't be found or downloaded are left to pip in the builder containers.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file and the Poetry lock file.
+    :param operating_systems: The operating systems which the packages are installed for.
+    :param wheelhouse_path: Path to the directory which the artifacts are downloaded into.
+    :param index_url: The base URL of the package index, which replaces the index URL of the
+        requirements file. The extra index URLs of the requirements file are searched after it.
+        If None, the index URL of the requirements file or PyPI is used.
+    :param max_connections: The maximum number of concurrent connections to every host.
+    :return: A report of the downloaded, the reused and the missing artifacts.
+    :raises PrefetchError: If a downloaded artifact doesn't match its hash in the lock file.
+    """
+    locked_files = _select_locked_files(build_dir_path, operating_systems)
+    index_urls = get_index_urls(build_dir_path, index_url)
+    logger.info(
+        f"Prefetching {len(locked_files)} artifacts from {', '.join(index_urls)} with up to "
+        f"{max_connections} connections"
+    )
+    wheelhouse_path.mkdir(parents=True, exist_ok=True)
+
+    session = _create_session(max_connections)
+    try:
+        with ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="artifact-prefetching"
+        ) as executor:
+            reused = [
+                locked_file
+                for locked_file, is_cached in zip(
+                    locked_files,
+                    executor.map(lambda f: _is_cached(f, wheelhouse_path), locked_files),
+                )
+                if is_cached
+            ]
+            reused_filenames = {locked_file.filename for locked_file in reused}
+            downloads = [
+                locked_file
+                for locked_file in locked_files
+                if locked_file.filename not in reused_filenames
+            ]
+            artifact_urls = _find_artifact_urls(session, executor, index_urls, downloads)
+            downloaded_sizes = list(
+                executor.map(
+                    lambda locked_file: _download(
+                        session,
+                        locked_file,
+                        artifact_urls.get(locked_file.filename),
+                        wheelhouse_path,
+                    ),
+                    downloads,
+                )
+            )
+    finally:
+        session.close()
+
+    downloaded = [
+        locked_file for locked_file, size in zip(downloads, downloaded_sizes) if size is not None
+    ]
+    _link_wheelhouse(build_dir_path, wheelhouse_path, [*reused, *downloaded])
+    report = PrefetchReport(
+        downloaded=tuple(locked_file.filename for locked_file in downloaded),
+        reused=tuple(locked_file.filename for locked_file in reused),
+        missing=tuple(
+            locked_file.filename
+            for locked_file, size in zip(downloads, downloaded_sizes)
+            if size is None
+        ),
+        downloaded_bytes=sum(size for size in downloaded_sizes if size is not None),
+    )
+    logger.info(
+        f"Prefetched {len(report.downloaded)} artifacts ({report.downloaded_bytes} bytes), "
+        f"reused {len(report.reused)} from the wheelhouse, {len(report.missing)} are left to pip"
+    )
+
+    return report
+
+
+def get_index_urls(build_dir_path: Path, index_url: str | None = None) -> list[str]:
+    """
+    Get the URLs of the package indexes which the requirements are installed from.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file.
+    :param index_url: The base URL of the package index, which replaces the index URL of the
+        requirements file.
+    :return: The index URL, followed by the extra index URLs of the requirements file.
+    """
+    requirements_index_url = None
+    extra_index_urls = []
+    for line in (build_dir_path / "requirements.txt").read_text().splitlines():
+        option, _, value = line.strip().replace("=", " ", 1).partition(" ")
+        if option in INDEX_URL_OPTIONS:
+            requirements_index_url = value.strip()
+        elif option == EXTRA_INDEX_URL_OPTION:
+            extra_index_urls.append(value.strip())
+
+    return [index_url or requirements_index_url or DEFAULT_INDEX_URL, *extra_index_urls]
+
+
+def _select_locked_files(
+    build_dir_path: Path, operating_systems: Iterable[OperatingSystem]
+) -> list[LockedFile]:
+    locked_files: dict[str, LockedFile] = {}
+    for operating_system in operating_systems:
+        for locked_file in select_locked_files(build_dir_path, operating_system):
+            locked_files.setdefault(locked_file.filename, locked_file)
+
+    return list(locked_files.values())
+
+
+def _is_cached(locked_file: LockedFile, wheelhouse_path: Path) -> bool:
+    try:
+        with (wheelhouse_path / locked_file.filename).open("rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest() == locked_file.sha256
+    except FileNotFoundError:
+        return False
+
+
+def _create_session(max_connections: int) -> requests.Session:
+    # The session uses the proxies and the credentials of the environment, and sends the user
+    # info of a URL with basic authentication. Every host gets a pool of persistent connections.
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.max_redirects = MAX_REDIRECTS
+    adapter = HTTPAdapter(pool_maxsize=max_connections, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def _find_artifact_urls(
+    session: requests.Session,
+    executor: ThreadPoolExecutor,
+    index_urls: Sequence[str],
+    locked_files: Sequence[LockedFile],
+) -> dict[str, str]:
+    filenames: dict[NormalizedName, set[str]] = {}
+    for locked_file in locked_files:
+        filenames.setdefault(locked_file.name, set()).add(locked_file.filename)
+
+    artifact_urls: dict[str, str] = {}
+    for project_urls in executor.map(
+        lambda name: _find_project_artifact_urls(session, index_urls, name, filenames[name]),
+        filenames,
+    ):
+        artifact_urls.update(project_urls)
+
+    return artifact_urls
+
+
+def _find_project_artifact_urls(
+    session: requests.Session,
+    index_urls: Sequence[str],
+    name: NormalizedName,
+    filenames: set[str],
+) -> dict[str, str]:
+    artifact_urls: dict[str, str] = {}
+    for index_url in index_urls:
+        page_url = urljoin(index_url.rstrip("/") + "/", f"{name}/")
+        try:
+            with _open_url(session, page_url) as response:
+                if response is None:
+                    continue
+                page = b"".join(response.chunks).decode(errors="replace")
+        except OSError as err:
+            logger.warning(f"Unable to get the index page of {name} from {page_url}: {err}")
+            continue
+
+        links = _parse_links(page, response.url)
+        for filename in filenames - artifact_urls.keys():
+            if filename in links:
+                artifact_urls[filename] = links[filename]
+        if artifact_urls.keys() == filenames:
+            break
+
+    return artifact_urls
+
+
+def _parse_links(page: str, page_url: str) -> dict[str, str]:
+    link_parser = _LinkParser(page_url)
+    link_parser.feed(page)
+    link_parser.close()
+
+    return link_parser.links
+
+
+def _download(
+    session: requests.Session,
+    locked_file: LockedFile,
+    url: str | None,
+    wheelhouse_path: Path,
+) -> int | None:
+    if url is None:
+        logger.warning(f"Artifact {locked_file.filename} was not found in the package indexes")
+        return None
+
+    file_path = wheelhouse_path / locked_file.filename
+    temporary_file_path = get_temporary_path(file_path)
+    try:
+        with _open_url(session, url) as response:
+            if response is None:
+                logger.warning(f"Artifact {locked_file.filename} was not found at {url}")
+                return None
+
+            file_hash = hashlib.sha256()
+            size = 0
+            with temporary_file_path.open("wb") as f:
+                for chunk in response.chunks:
+                    file_hash.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+        if file_hash.hexdigest() != locked_file.sha256:
+            raise PrefetchError(
+                f"Artifact {locked_file.filename} from {url} doesn't match its hash in the "
+                "lock file"
+            )
+        os.replace(temporary_file_path, file_path)
+    except OSError as err:
+        logger.warning(f"Unable to download {locked_file.filename} from {url}: {err}")
+        return None
+    finally:
+        temporary_file_path.unlink(missing_ok=True)
+
+    logger.debug(f"Downloaded {locked_file.filename} ({size} bytes)")
+    return size
+
+
+def _link_wheelhouse(build_dir_path: Path, wheelhouse_path: Path, locked_files: list[LockedFile]):
+    build_wheelhouse_path = build_dir_path / BUILD_WHEELHOUSE_DIR
+    shutil.rmtree(build_wheelhouse_path, ignore_errors=True)
+    if not locked_files:
+        return
+
+    build_wheelhouse_path.mkdir()
+    for locked_file in locked_files:
+        link_file(
+            wheelhouse_path / locked_file.filename, build_wheelhouse_path / locked_file.filename
+        )
+
+
+class _LinkParser(HTMLParser):
+    """
+    Collects the URLs of the artifacts which a simple repository API page links to
+    """
+
+    def __init__(self, page_url: str):
+        super().__init__()
+        self._page_url = page_url
+        self.links: dict[str, str] = {}
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        href = dict(attrs).get("href")
+        if tag != "a" or not href:
+            return
+
+        url = urldefrag(urljoin(self._page_url, href)).url
+        filename = unquote(urlsplit(url).path.rsplit("/", 1)[-1])
+        self.links.setdefault(filename, url)
+
+
+class _Response:
+    def __init__(self, url: str, chunks: Iterator[bytes]):
+        self.url = url
+        self.chunks = chunks
+
+
+@contextmanager
+def _open_url(session: requests.Session, url: str) -> Iterator[_Response | None]:
+    # Yields the response, whose chunks must be read while it's open, or None if the URL was
+    # not found. Local indexes are read from file URLs. Raises a requests.RequestException, which
+    # is an OSError, if the server returned an error.
+    if urlsplit(url).scheme == "file":
+        with _open_file(url) as response:
+            yield response
+        return
+
+    with session.get(url, stream=True, timeout=CONNECTION_TIMEOUT_SECONDS) as response:
+        if response.status_code == 404:
+            yield None
+            return
+
+        response.raise_for_status()
+        yield _Response(response.url, response.iter_content(CHUNK_SIZE))
+
+
+@contextmanager
+def _open_file(url: str) -> Iterator[_Response | None]:
+    path = Path(url2pathname(urlsplit(url).path))
+    if path.is_dir():
+        path = path / INDEX_PAGE_FILE
+
+    try:
+        f = path.open("rb")
+    except FileNotFoundError:
+        yield None
+        return
+
+    with f:
+        yield _Response(url, iter(partial(f.read, CHUNK_SIZE), b""))
@@ -0,0 +1,201 @@
+import hashlib
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Final, Sequence
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .builder_images import BuilderImages
+from .file_transfer import get_temporary_path
+
+logger = logging.getLogger(__name__)
+
+AUTODETECT_DIR: Final = "autodetect"
+AUTODETECT_DECISION_FILE: Final = "decision.json"
+AUTODETECT_KEY_LENGTH: Final = 32
+
+
+class AutodetectDecision(InfectionMonkeyBaseModel):
+    key: str
+    requirements_sha256: str
+    builder_images: BuilderImages
+    common_vendor_dir_possible: bool
+    created_at: datetime
+
+
+def get_autodetect_key(requirements_file_path: Path, builder_images: BuilderImages) -> str | None:
+    """
+    Get the key of the autodetect decision for a requirements file and builder images.
+
+    :param requirements_file_path: Path to the requirements file.
+    :param builder_images: The builder images which make the decision.
+    :return: The key of the decision, or None if the builder images are not pinned to their
+        digests, since the decision can't be reused if the images can change.
+    """
+    if not all(_is_pinned(image) for image in (builder_images.linux, builder_images.windows)):
+        return None
+
+    key_hash = hashlib.sha256()
+    for part in (
+        _get_sha256(requirements_file_path),
+        builder_images.linux,
+        builder_images.windows,
+    ):
+        key_hash.update(part.encode())
+        key_hash.update(b"\0")
+
+    return key_hash.hexdigest()[:AUTODETECT_KEY_LENGTH]
+
+
+def _is_pinned(image: str) -> bool:
+    return "@sha256:" in image or image.startswith("sha256:")
+
+
+def _get_sha256(file_path: Path) -> str:
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+
+class AutodetectCache:
+    """
+    A cache of the decisions whether a plugin's requirements can share a common vendor
+    directory, keyed by the content of the requirements file and the builder image digests
+
+    The package lists which the decision was made from are stored with the decision.
+    """
+
+    def __init__(self, cache_dir_path: Path):
+        self._decisions_dir_path = cache_dir_path / AUTODETECT_DIR
+
+    def get(self, key: str) -> AutodetectDecision | None:
+        """
+        Get a cached decision.
+
+        :param key: The key of the decision.
+        :return: The decision, or None if it is not in the cache or can't be read.
+        """
+        decision_file_path = self._decisions_dir_path / key / AUTODETECT_DECISION_FILE
+        try:
+            return AutodetectDecision.model_validate_json(decision_file_path.read_text())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring invalid autodetect decision {key}: {err}")
+            return None
+
+    def restore_package_lists(self, key: str, build_dir_path: Path):
+        """
+        Copy the package lists which a cached decision was made from to the build directory.
+
+        :param key: The key of the decision.
+        :param build_dir_path: Path to the build directory.
+        """
+        for package_list_file_path in (self._decisions_dir_path / key).iterdir():
+            if package_list_file_path.name != AUTODETECT_DECISION_FILE:
+                shutil.copy2(package_list_file_path, build_dir_path / package_list_file_path.name)
+
+    def store(
+        self,
+        key: str,
+        requirements_file_path: Path,
+        builder_images: BuilderImages,
+        common_vendor_dir_possible: bool,
+        package_list_file_paths: Sequence[Path],
+    ) -> AutodetectDecision:
+        """
+        Store a decision, together with the package lists which it was made from.
+
+        :param key: The key of the decision.
+        :param requirements_file_path: Path to the requirements file.
+        :param builder_images: The builder images which made the decision.
+        :param common_vendor_dir_possible: Whether a common vendor directory is possible.
+        :param package_list_file_paths: Paths to the package lists.
+        :return: The stored decision.
+        """
+        decision = AutodetectDecision(
+            key=key,
+            requirements_sha256=_get_sha256(requirements_file_path),
+            builder_images=builder_images,
+            common_vendor_dir_possible=common_vendor_dir_possible,
+            created_at=datetime.now(timezone.utc),
+        )
+        decision_dir_path = self._decisions_dir_path / key
+        decision_dir_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_dir_path = get_temporary_path(decision_dir_path)
+        shutil.rmtree(temporary_dir_path, ignore_errors=True)
+        temporary_dir_path.mkdir()
+        try:
+            for package_list_file_path in package_list_file_paths:
+                shutil.copy2(
+                    package_list_file_path, temporary_dir_path / package_list_file_path.name
+                )
+            (temporary_dir_path / AUTODETECT_DECISION_FILE).write_text(
+                decision.model_dump_json(indent=2)
+            )
+
+            # Replace a decision which could not be read, if any
+            shutil.rmtree(decision_dir_path, ignore_errors=True)
+            os.rename(temporary_dir_path, decision_dir_path)
+        except OSError:
+            # Another build stored the same decision first
+            logger.debug(f"Unable to store autodetect decision: {key}")
+        finally:
+            shutil.rmtree(temporary_dir_path, ignore_errors=True)
+
+        return decision
+
+    def get_decisions(self) -> list[AutodetectDecision]:
+        """
+        List the cached decisions, from the newest to the oldest.
+
+        :return: The cached decisions.
+        """
+        if not self._decisions_dir_path.is_dir():
+            return []
+
+        decisions = [
+            self.get(path.name)
+            for path in self._decisions_dir_path.iterdir()
+            if path.is_dir() and not path.name.startswith(".")
+        ]
+        return sorted(
+            (decision for decision in decisions if decision is not None),
+            key=lambda decision: decision.created_at,
+            reverse=True,
+        )
+
+    def invalidate(self, key: str) -> bool:
+        """
+        Remove a decision from the cache.
+
+        :param key: The key of the decision.
+        :return: Whether the decision was in the cache.
+        """
+        decision_dir_path = self._decisions_dir_path / key
+        if not decision_dir_path.is_dir():
+            return False
+
+        shutil.rmtree(decision_dir_path)
+        return True
+
+    def clear(self) -> int:
+        """
+        Remove all the decisions from the cache.
+
+        :return: The number of decisions which were removed.
+        """
+        if not self._decisions_dir_path.is_dir():
+            return 0
+
+        # Decisions which are being stored by other builds are left alone
+        decision_dir_paths = [
+            path
+            for path in self._decisions_dir_path.iterdir()
+            if path.is_dir() and not path.name.startswith(".")
+        ]
+        for decision_dir_path in decision_dir_paths:
+            shutil.rmtree(decision_dir_path, ignore_errors=True)
+
+        return len(decision_dir_paths)
@@ -0,0 +1,61 @@
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from .autodetect_cache import AutodetectCache
+from .installed_tree_cache import get_default_cache_dir
+
+LIST_COMMAND = "list"
+SHOW_COMMAND = "show"
+INVALIDATE_COMMAND = "invalidate"
+CLEAR_COMMAND = "clear"
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Inspect and invalidate the autodetect decision cache")
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir_path",
+        metavar="CACHE_DIR_PATH",
+        type=Path,
+        default=None,
+        help="Optional path to the cache directory",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(LIST_COMMAND, help="List the cached decisions")
+    show_parser = subparsers.add_parser(SHOW_COMMAND, help="Show a cached decision")
+    show_parser.add_argument("key", metavar="KEY")
+    invalidate_parser = subparsers.add_parser(INVALIDATE_COMMAND, help="Remove cached decisions")
+    invalidate_parser.add_argument("keys", metavar="KEY", nargs="+")
+    subparsers.add_parser(CLEAR_COMMAND, help="Remove all the cached decisions")
+
+    args = parser.parse_args()
+    autodetect_cache = AutodetectCache(args.cache_dir_path or get_default_cache_dir())
+
+    if args.command == LIST_COMMAND:
+        for decision in autodetect_cache.get_decisions():
+            print(
+                f"{decision.key}  {decision.created_at.isoformat(timespec='seconds')}  "
+                f"common_vendor_dir_possible={decision.common_vendor_dir_possible}  "
+                f"requirements={decision.requirements_sha256[:12]}"
+            )
+    elif args.command == SHOW_COMMAND:
+        cached_decision = autodetect_cache.get(args.key)
+        if cached_decision is None:
+            print(f"Decision not found: {args.key}", file=sys.stderr)
+            return 1
+        print(cached_decision.model_dump_json(indent=2))
+    elif args.command == INVALIDATE_COMMAND:
+        missing_keys = [key for key in args.keys if not autodetect_cache.invalidate(key)]
+        for key in missing_keys:
+            print(f"Decision not found: {key}", file=sys.stderr)
+        if missing_keys:
+            return 1
+    else:
+        print(f"Removed {autodetect_cache.clear()} decisions")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
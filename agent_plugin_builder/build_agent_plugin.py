@@ -1,14 +1,54 @@
+import asyncio
 import logging
 import shutil
+from functools import partial
 from pathlib import Path
 from pprint import pformat
 from typing import Callable
 
 from monkeytypes import AgentPluginManifest
 
-from agent_plugin_builder.plugin_archive_generation import create_agent_plugin_archive
+from agent_plugin_builder.plugin_archive_generation import (
+    create_agent_plugin_archive,
+    create_agent_plugin_archive_async,
+)
 
 from .agent_plugin_build_options import AgentPluginBuildOptions
+from .build_control import (
+    AsyncBuildStep,
+    BuildControl,
+    BuildProgressEvent,
+    BuildStage,
+    BuildSteps,
+    ProgressCallback,
+    build_stage,
+    ensure_build_control,
+    run_build_steps,
+    run_build_steps_async,
+    use_build_control,
+)
+from .build_fingerprint import (
+    find_up_to_date_build,
+    get_inputs_fingerprint,
+    write_build_fingerprint,
+)
+from .build_journal import BuildJournal, get_fingerprint, start_journal_step, use_build_journal
+from .build_result import BuildResult
+from .build_workspace import (
+    create_isolated_build_dir,
+    get_build_dir_lock,
+    remove_build_intermediates,
+)
+from .file_transfer import copy_tree, format_transfer_strategies
+from .memory_workspace import (
+    create_memory_workspace,
+    estimate_workspace_size,
+    is_out_of_space,
+    preserve_workspace_files,
+    remove_memory_workspace,
+)
+from .stage_profiling import get_stage_profile
+from .workspace_type import WorkspaceType
 
 logger = logging.getLogger(__name__)
 
@@ -17,56 +57,349 @@ def build_agent_plugin_archive(
     agent_plugin_build_options: AgentPluginBuildOptions,
     agent_plugin_manifest: AgentPluginManifest,
     on_build_dir_created: Callable[[Path], None] | None = None,
-):
+) -> BuildResult:
     """
     Build the agent plugin by copying the plugin code to the build directory and generating the
     Agent Plugin archive.
 
+    If the memory workspace is selected, the plugin is built in a directory on a memory-backed
+    filesystem, and only the log file, the requirements file and the build reports are kept in
+    the build directory. The build spills to the build directory if the workspace is estimated
+    to not fit in the available memory, or if it runs out of space.
+
+    The build keeps a journal of the steps which it completed in the build directory. If resume
+    is selected, the steps which the journal of the previous build completed with the same
+    inputs are not run again, up to the first step which is missing or invalidated.
+
+    The build holds a lock on the build directory, so that concurrent builds which use the same
+    build directory run one after the other. If an isolated build directory is selected, the
+    plugin is built in a new, unique directory in the build directory instead, and builds which
+    use the same build directory run concurrently. The intermediate files of the build are
+    removed from the isolated build directory after the build succeeds, and its log and reports
+    are kept. The isolated build directory is kept whole if the build fails.
+
+    Every build writes a fingerprint of its inputs next to the Agent Plugin archive in the dist
+    directory: the plugin code, the lock file, the manifest, the build options, the digests of
+    the builder images and the version of the builder. Unless force is selected, the build is
+    skipped, and the existing archive is returned, if the fingerprint is unchanged and the
+    archive is intact.
+
     :param agent_plugin_build_options: Agent Plugin build options.
     :param agent_plugin_manifest: Agent Plugin manifest.
     :param on_build_dir_created: Callback function to be called after the build directory is
         created. The function will be called with the build directory path as an argument.
+    :return: The result of the build.
     :raises FileNotFoundError: If the plugin path does not exist.
     :raises shutil.Error: If there is an error preparing the build directory.
     """
+    _check_plugin_dir_path(agent_plugin_build_options.plugin_dir_path)
+    _check_resume(agent_plugin_build_options)
 
-    if not agent_plugin_build_options.plugin_dir_path.exists():
-        logger.error(f"Plugin path {agent_plugin_build_options.plugin_dir_path} does not exist")
-        raise FileNotFoundError(
-            f"Plugin path {agent_plugin_build_options.plugin_dir_path} does not exist"
+    with ensure_build_control() as build_control:
+        return run_build_steps(
+            _get_build_steps(
+                agent_plugin_build_options,
+                agent_plugin_manifest,
+                on_build_dir_created,
+                build_control,
+            )
         )
 
-    if agent_plugin_build_options.build_dir_path.exists():
+
+def _get_build_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    on_build_dir_created: Callable[[Path], None] | None,
+    build_control: BuildControl,
+) -> BuildSteps[BuildResult]:
+    inputs_fingerprint = yield partial(
+        get_inputs_fingerprint, agent_plugin_build_options, agent_plugin_manifest
+    )
+    if not agent_plugin_build_options.force:
+        up_to_date_build_result = yield partial(
+            find_up_to_date_build,
+            agent_plugin_build_options,
+            agent_plugin_manifest,
+            inputs_fingerprint,
+        )
+        if up_to_date_build_result is not None:
+            return up_to_date_build_result
+
+    build_dir_lock = get_build_dir_lock(
+        agent_plugin_build_options.build_dir_path, agent_plugin_build_options.isolated_build_dir
+    )
+    yield AsyncBuildStep(build_dir_lock.acquire, build_dir_lock.acquire_async)
+    try:
+        isolated_build_options = _isolate_build_dir(agent_plugin_build_options)
+        if build_control.profile_stage is None:
+            build_control.profile_stage = get_stage_profile(
+                isolated_build_options.profile, isolated_build_options.build_dir_path
+            )
+        build_result = yield from _get_workspace_build_steps(
+            isolated_build_options, agent_plugin_manifest, on_build_dir_created
+        )
+        if isolated_build_options.isolated_build_dir:
+            yield partial(remove_build_intermediates, isolated_build_options.build_dir_path)
+    finally:
+        build_dir_lock.release()
+
+    yield partial(write_build_fingerprint, build_result, inputs_fingerprint)
+    return build_result
+
+
+def _check_resume(agent_plugin_build_options: AgentPluginBuildOptions):
+    if not agent_plugin_build_options.resume:
+        return
+
+    if agent_plugin_build_options.isolated_build_dir:
+        logger.warning(
+            "Builds in isolated build directories can't be resumed, building from scratch"
+        )
+    elif agent_plugin_build_options.workspace == WorkspaceType.MEMORY:
+        logger.warning("Builds in the memory workspace can't be resumed, building from scratch")
+
+
+def _check_plugin_dir_path(plugin_dir_path: Path):
+    if not plugin_dir_path.exists():
+        logger.error(f"Plugin path {plugin_dir_path} does not exist")
+        raise FileNotFoundError(f"Plugin path {plugin_dir_path} does not exist")
+
+
+def _isolate_build_dir(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> AgentPluginBuildOptions:
+    if not agent_plugin_build_options.isolated_build_dir:
+        return agent_plugin_build_options
+
+    return agent_plugin_build_options.model_copy(
+        update={
+            "build_dir_path": create_isolated_build_dir(agent_plugin_build_options.build_dir_path)
+        }
+    )
+
+
+def _get_workspace_build_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    on_build_dir_created: Callable[[Path], None] | None,
+) -> BuildSteps[BuildResult]:
+    if agent_plugin_build_options.workspace == WorkspaceType.MEMORY:
+        yield partial(_clear_build_dir, agent_plugin_build_options.build_dir_path)
+        agent_plugin_build_options.build_dir_path.mkdir(parents=True, exist_ok=True)
+        if on_build_dir_created:
+            on_build_dir_created(agent_plugin_build_options.build_dir_path)
+
+        return (
+            yield from _get_memory_workspace_build_steps(
+                agent_plugin_build_options, agent_plugin_manifest
+            )
+        )
+
+    with use_build_journal(_get_build_journal(agent_plugin_build_options)):
+        yield partial(_stage_plugin_code, agent_plugin_build_options)
+
+        if on_build_dir_created:
+            on_build_dir_created(agent_plugin_build_options.build_dir_path)
+
+        logger.debug(f"Using build options: {pformat(agent_plugin_build_options.model_dump())}")
+        return (
+            yield _create_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+        )
+
+
+def _create_agent_plugin_archive(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> AsyncBuildStep[BuildResult]:
+    return AsyncBuildStep(
+        partial(create_agent_plugin_archive, agent_plugin_build_options, agent_plugin_manifest),
+        partial(
+            create_agent_plugin_archive_async, agent_plugin_build_options, agent_plugin_manifest
+        ),
+    )
+
+
+def _get_build_journal(agent_plugin_build_options: AgentPluginBuildOptions) -> BuildJournal:
+    return BuildJournal(
+        agent_plugin_build_options.build_dir_path, resume=agent_plugin_build_options.resume
+    )
+
+
+def _stage_plugin_code(agent_plugin_build_options: AgentPluginBuildOptions):
+    # The plugin code is staged again, in a cleared build directory, unless the build resumes
+    # from a journal which staged the same plugin code
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    journal_step = start_journal_step(
+        BuildStage.STAGE_PLUGIN_CODE.value,
+        inputs=[
+            get_fingerprint(
+                agent_plugin_build_options.plugin_dir_path,
+                exclude=[build_dir_path, agent_plugin_build_options.dist_dir_path],
+            )
+        ],
+        outputs=[build_dir_path / agent_plugin_build_options.source_dir_name],
+    )
+    if journal_step.resumed:
+        return
+
+    _clear_build_dir(build_dir_path)
+    _copy_plugin_code_to_build_dir(agent_plugin_build_options.plugin_dir_path, build_dir_path)
+    journal_step.complete()
+
+
+def _clear_build_dir(build_dir_path: Path):
+    if build_dir_path.exists():
         try:
-            logger.info(f"Clearing build directory: {agent_plugin_build_options.build_dir_path}")
-            shutil.rmtree(agent_plugin_build_options.build_dir_path)
+            logger.info(f"Clearing build directory: {build_dir_path}")
+            shutil.rmtree(build_dir_path)
         except shutil.Error as err:
-            logger.error(
-                f"Unable to clear build directory: {agent_plugin_build_options.build_dir_path}"
-            )
+            logger.error(f"Unable to clear build directory: {build_dir_path}")
             raise err
 
+
+def _copy_plugin_code_to_build_dir(plugin_dir_path: Path, build_dir_path: Path):
     try:
         logger.info(
-            "Copying plugin code to build directory: "
-            f"{agent_plugin_build_options.plugin_dir_path} -> "
-            f"{agent_plugin_build_options.build_dir_path}"
-        )
-        shutil.copytree(
-            agent_plugin_build_options.plugin_dir_path,
-            agent_plugin_build_options.build_dir_path,
-            dirs_exist_ok=True,
+            f"Copying plugin code to build directory: {plugin_dir_path} -> {build_dir_path}"
         )
+        with build_stage(BuildStage.STAGE_PLUGIN_CODE):
+            transfer_strategies = copy_tree(
+                plugin_dir_path,
+                build_dir_path,
+                ignore=_ignore_build_dir(plugin_dir_path, build_dir_path),
+            )
     except shutil.Error as err:
         logger.error(
-            "Unable to copy plugin code to build directory: "
-            f"{agent_plugin_build_options.plugin_dir_path} -> "
-            f"{agent_plugin_build_options.build_dir_path}"
+            f"Unable to copy plugin code to build directory: {plugin_dir_path} -> {build_dir_path}"
         )
         raise err
 
-    if on_build_dir_created:
-        on_build_dir_created(agent_plugin_build_options.build_dir_path)
+    logger.debug(
+        f"Copied plugin code to build directory: {format_transfer_strategies(transfer_strategies)}"
+    )
+
+
+def _ignore_build_dir(
+    plugin_dir_path: Path, build_dir_path: Path
+) -> Callable[[str, list[str]], list[str]] | None:
+    # An isolated build directory exists in the build directory, which may be in the plugin
+    # directory, while the plugin code is copied into it
+    build_dir_path = build_dir_path.resolve()
+    if not build_dir_path.is_relative_to(plugin_dir_path.resolve()):
+        return None
+
+    def ignore(dir_path: str, names: list[str]) -> list[str]:
+        return [
+            name for name in names if build_dir_path.is_relative_to(Path(dir_path, name).resolve())
+        ]
+
+    return ignore
+
+
+def _get_memory_workspace_build_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> BuildSteps[BuildResult]:
+    workspace_size = yield partial(
+        estimate_workspace_size, agent_plugin_build_options.plugin_dir_path
+    )
+    workspace_path = create_memory_workspace(workspace_size)
+    if workspace_path is None:
+        logger.warning(f"Spilling the build to disk: {agent_plugin_build_options.build_dir_path}")
+        return (
+            yield from _get_build_dir_build_steps(agent_plugin_build_options, agent_plugin_manifest)
+        )
+
+    workspace_build_options = agent_plugin_build_options.model_copy(
+        update={"build_dir_path": workspace_path}
+    )
+    try:
+        build_result = yield from _get_build_dir_build_steps(
+            workspace_build_options, agent_plugin_manifest
+        )
+        yield partial(
+            preserve_workspace_files, workspace_path, agent_plugin_build_options.build_dir_path
+        )
+
+        return build_result
+    except Exception as err:
+        if not is_out_of_space(err, workspace_path):
+            raise err
+
+        logger.warning(
+            "The memory workspace ran out of space, spilling the build to disk: "
+            f"{agent_plugin_build_options.build_dir_path}"
+        )
+    finally:
+        # The workspace is removed in the current thread, so that it's removed even if the
+        # asynchronous build is cancelled
+        remove_memory_workspace(workspace_path)
+
+    return (
+        yield from _get_build_dir_build_steps(agent_plugin_build_options, agent_plugin_manifest)
+    )
+
+
+def _get_build_dir_build_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> BuildSteps[BuildResult]:
+    yield partial(
+        _copy_plugin_code_to_build_dir,
+        agent_plugin_build_options.plugin_dir_path,
+        agent_plugin_build_options.build_dir_path,
+    )
 
     logger.debug(f"Using build options: {pformat(agent_plugin_build_options.model_dump())}")
-    create_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+    return (yield _create_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest))
+
+
+async def build_agent_plugin_archive_async(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    on_build_dir_created: Callable[[Path], None] | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> BuildResult:
+    """
+    Build the agent plugin without blocking the event loop.
+
+    The requirements file is generated by an asyncio subprocess. The steps which use the Docker
+    client, copy files or compress archives run in worker threads. If the coroutine is
+    cancelled, the running builder containers are killed, and the build stops before its next
+    stage. The build is skipped, the same way the synchronous build is, if the Agent Plugin
+    archive in the dist directory is up to date.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :param on_build_dir_created: Callback function to be called after the build directory is
+        created. The function will be called with the build directory path as an argument.
+    :param on_progress: Callback function to be called, in the event loop, when a build stage
+        starts, finishes or fails.
+    :return: The result of the build.
+    :raises FileNotFoundError: If the plugin path does not exist.
+    :raises shutil.Error: If there is an error preparing the build directory.
+    """
+    _check_plugin_dir_path(agent_plugin_build_options.plugin_dir_path)
+    _check_resume(agent_plugin_build_options)
+
+    build_control = BuildControl(
+        on_progress=None if on_progress is None else _call_in_event_loop(on_progress)
+    )
+    with use_build_control(build_control):
+        return await run_build_steps_async(
+            _get_build_steps(
+                agent_plugin_build_options,
+                agent_plugin_manifest,
+                on_build_dir_created,
+                build_control,
+            )
+        )
+
+
+def _call_in_event_loop(on_progress: ProgressCallback) -> ProgressCallback:
+    loop = asyncio.get_running_loop()
+
+    def report_progress(event: BuildProgressEvent):
+        loop.call_soon_threadsafe(on_progress, event)
+
+    return report_progress
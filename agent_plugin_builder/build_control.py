@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import AbstractContextManager, contextmanager, nullcontext, suppress
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Awaitable, Callable, Final, Generator, Generic, Iterator, TypeVar
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class BuildCancelledError(Exception):
+    """Raised when a build is cancelled."""
+
+    pass
+
+
+class BuildStage(Enum):
+    STAGE_PLUGIN_CODE = "stage_plugin_code"
+    RESOLVE_BUILDER_IMAGES = "resolve_builder_images"
+    GENERATE_REQUIREMENTS_FILE = "generate_requirements_file"
+    PREFETCH_ARTIFACTS = "prefetch_artifacts"
+    INSTALL_VENDOR_DIRECTORIES = "install_vendor_directories"
+    SLIM_VENDOR_DIRECTORIES = "slim_vendor_directories"
+    GENERATE_CONFIG_SCHEMA = "generate_config_schema"
+    COMPILE_BYTECODE = "compile_bytecode"
+    BUNDLE_VENDOR_DIRECTORIES = "bundle_vendor_directories"
+    CREATE_SOURCE_ARCHIVE = "create_source_archive"
+    ANALYZE_SOURCE_ARCHIVE = "analyze_source_archive"
+    CREATE_PLUGIN_ARCHIVE = "create_plugin_archive"
+    PUBLISH_PLUGIN_ARCHIVE = "publish_plugin_archive"
+
+
+class BuildStageStatus(Enum):
+    STARTED = "started"
+    FINISHED = "finished"
+    FAILED = "failed"
+
+
+class BuildProgressEvent(InfectionMonkeyBaseModel):
+    stage: BuildStage
+    status: BuildStageStatus
+    elapsed_seconds: float | None = None
+
+
+ProgressCallback = Callable[[BuildProgressEvent], None]
+StageProfile = Callable[[BuildStage], AbstractContextManager[None]]
+
+CACHE_HITS: Final = "cache_hits"
+CACHE_MISSES: Final = "cache_misses"
+
+
+class BuildStatistics:
+    """
+    Collects the statistics of a build from the threads which run its steps
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_durations: dict[BuildStage, float] = {}
+        self._container_durations: dict[str, list[float]] = {}
+        self._counters: Counter[str] = Counter()
+
+    @property
+    def stage_durations(self) -> dict[BuildStage, float]:
+        with self._lock:
+            return dict(self._stage_durations)
+
+    @property
+    def container_durations(self) -> dict[str, list[float]]:
+        """
+        The durations of the builder containers which were run, in seconds, by their image
+        """
+        with self._lock:
+            return {
+                image: list(durations) for image, durations in self._container_durations.items()
+            }
+
+    @property
+    def containers_run(self) -> int:
+        with self._lock:
+            return sum(len(durations) for durations in self._container_durations.values())
+
+    @property
+    def cache_hits(self) -> int:
+        return self._counters[CACHE_HITS]
+
+    @property
+    def cache_misses(self) -> int:
+        return self._counters[CACHE_MISSES]
+
+    def record_stage_duration(self, stage: BuildStage, seconds: float):
+        """
+        Record the duration of a build stage. The durations of repeated stages are summed.
+
+        :param stage: The build stage.
+        :param seconds: The duration of the stage, in seconds.
+        """
+        with self._lock:
+            self._stage_durations[stage] = self._stage_durations.get(stage, 0.0) + seconds
+
+    def record_container_run(self, image: str, seconds: float):
+        """
+        Record a run of a builder container.
+
+        :param image: The image of the container.
+        :param seconds: The duration of the run, in seconds.
+        """
+        with self._lock:
+            self._container_durations.setdefault(image, []).append(seconds)
+
+    def record_cache_lookups(self, hits: int, misses: int):
+        with self._lock:
+            self._counters[CACHE_HITS] += hits
+            self._counters[CACHE_MISSES] += misses
+
+
+class BuildControl:
+    """
+    Reports the progress of a build, collects its statistics, and cancels it
+
+    The build control of the current build is kept in a context variable, so that every step of
+    the build, including the steps which run in worker threads, can report its progress and
+    check whether the build was cancelled. The builder containers which are running when the
+    build is cancelled are killed.
+    """
+
+    def __init__(
+        self, on_progress: ProgressCallback | None = None, profile_stage: StageProfile | None = None
+    ):
+        self._on_progress = on_progress
+        self.profile_stage = profile_stage
+        self.statistics = BuildStatistics()
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._containers: set[Any] = set()
+
+    def report_progress(self, event: BuildProgressEvent):
+        if self._on_progress is None:
+            return
+
+        try:
+            self._on_progress(event)
+        except Exception as err:
+            logger.warning(f"Build progress callback failed: {err}")
+
+    def raise_if_cancelled(self):
+        """
+        :raises BuildCancelledError: If the build was cancelled.
+        """
+        if self._cancelled:
+            raise BuildCancelledError("The build was cancelled")
+
+    def cancel(self):
+        """
+        Cancel the build, and kill its running builder containers.
+        """
+        with self._lock:
+            self._cancelled = True
+            containers = list(self._containers)
+
+        for container in containers:
+            _kill_container(container)
+
+    def register_container(self, container: Any):
+        """
+        Register a running builder container, so that it's killed if the build is cancelled.
+
+        :param container: The builder container.
+        :raises BuildCancelledError: If the build was already cancelled. The container is
+            killed.
+        """
+        with self._lock:
+            if not self._cancelled:
+                self._containers.add(container)
+                return
+
+        _kill_container(container)
+        self.raise_if_cancelled()
+
+    def unregister_container(self, container: Any):
+        with self._lock:
+            self._containers.discard(container)
+
+
+def _kill_container(container: Any):
+    try:
+        logger.info(f"Killing builder container: {container.short_id}")
+        container.kill()
+    except Exception as err:
+        logger.debug(f"Unable to kill builder container {container.short_id}: {err}")
+
+
+_build_control: ContextVar[BuildControl | None] = ContextVar("build_control", default=None)
+
+
+def get_build_control() -> BuildControl | None:
+    """
+    :return: The build control of the current build, or None if it has none.
+    """
+    return _build_control.get()
+
+
+@contextmanager
+def use_build_control(build_control: BuildControl) -> Iterator[BuildControl]:
+    """
+    Set the build control of the builds which run in the current context.
+
+    :param build_control: The build control.
+    """
+    token = _build_control.set(build_control)
+    try:
+        yield build_control
+    finally:
+        _build_control.reset(token)
+
+
+@contextmanager
+def ensure_build_control() -> Iterator[BuildControl]:
+    """
+    Use the build control of the current build, or a new build control if it has none.
+    """
+    build_control = get_build_control()
+    if build_control is not None:
+        yield build_control
+        return
+
+    with use_build_control(BuildControl()) as build_control:
+        yield build_control
+
+
+@contextmanager
+def build_stage(stage: BuildStage) -> Iterator[None]:
+    """
+    Report the start and the end of a build stage to the build control of the current build, and
+    record the duration of the stage in the build statistics. The stage is profiled if the build
+    control profiles stages.
+
+    :param stage: The build stage.
+    :raises BuildCancelledError: If the build was cancelled before the stage started.
+    """
+    build_control = get_build_control()
+    if build_control is None:
+        yield
+        return
+
+    build_control.raise_if_cancelled()
+    build_control.report_progress(BuildProgressEvent(stage=stage, status=BuildStageStatus.STARTED))
+    stage_profile = (
+        nullcontext() if build_control.profile_stage is None else build_control.profile_stage(stage)
+    )
+    start = time.monotonic()
+    try:
+        with stage_profile:
+            yield
+    except BaseException:
+        build_control.report_progress(
+            BuildProgressEvent(
+                stage=stage,
+                status=BuildStageStatus.FAILED,
+                elapsed_seconds=time.monotonic() - start,
+            )
+        )
+        raise
+
+    elapsed_seconds = time.monotonic() - start
+    build_control.statistics.record_stage_duration(stage, elapsed_seconds)
+    build_control.report_progress(
+        BuildProgressEvent(
+            stage=stage, status=BuildStageStatus.FINISHED, elapsed_seconds=elapsed_seconds
+        )
+    )
+
+
+async def run_in_thread(func: Callable[..., T], /, *args: Any) -> T:
+    """
+    Run a blocking build step in a worker thread, in the context of the current build.
+
+    If the coroutine is cancelled, the build is cancelled, and the step is waited for, so that
+    it doesn't outlive the build.
+
+    :param func: The build step.
+    :param args: The arguments of the build step.
+    :return: The result of the build step.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        _cancel_build()
+
+        with suppress(Exception):
+            await future
+        raise
+
+
+def _cancel_build():
+    build_control = get_build_control()
+    if build_control is not None:
+        build_control.cancel()
+
+
+class AsyncBuildStep(Generic[T]):
+    """
+    A build step which the asynchronous build awaits in the event loop, instead of running it in
+    a worker thread
+    """
+
+    def __init__(self, run: Callable[[], T], run_async: Callable[[], Awaitable[T]]):
+        self._run = run
+        self.run_async = run_async
+
+    def __call__(self) -> T:
+        return self._run()
+
+
+# The steps of a build are yielded by a generator, which is sent the result of each step, or
+# thrown the exception which the step raised, so that the synchronous and the asynchronous
+# builds run the same steps
+BuildSteps = Generator[Callable[[], Any], Any, T]
+
+
+def run_build_steps(build_steps: BuildSteps[T]) -> T:
+    """
+    Run the steps of a build in the current thread.
+
+    :param build_steps: The steps of the build.
+    :return: The result of the build.
+    """
+    resume: Callable[[Any], Callable[[], Any]] = build_steps.send
+    step_outcome: Any = None
+    while True:
+        try:
+            build_step = resume(step_outcome)
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            step_outcome, resume = build_step(), build_steps.send
+        except BaseException as err:
+            step_outcome, resume = err, build_steps.throw
+
+
+async def run_build_steps_async(build_steps: BuildSteps[T]) -> T:
+    """
+    Run the steps of a build without blocking the event loop.
+
+    Every step runs in a worker thread, unless it's an asynchronous build step. If the coroutine
+    is cancelled, the build is cancelled, and the cancellation is thrown into the build steps.
+
+    :param build_steps: The steps of the build.
+    :return: The result of the build.
+    """
+    resume: Callable[[Any], Callable[[], Any]] = build_steps.send
+    step_outcome: Any = None
+    while True:
+        try:
+            build_step = resume(step_outcome)
+        except StopIteration as stop:
+            return stop.value
+
+        try:
+            if isinstance(build_step, AsyncBuildStep):
+                step_outcome = await build_step.run_async()
+            else:
+                step_outcome = await run_in_thread(build_step)
+            resume = build_steps.send
+        except BaseException as err:
+            if isinstance(err, asyncio.CancelledError):
+                _cancel_build()
+            step_outcome, resume = err, build_steps.throw
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+from importlib.metadata import PackageNotFoundError, version
+from pathlib import Path
+from typing import Final, Sequence
+
+from monkeytypes import AgentPluginManifest
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .agent_plugin_build_options import AgentPluginBuildOptions
+from .build_control import ensure_build_control
+from .build_result import BuildResult
+from .build_workspace import PathLock, get_lock_file_path
+from .builder_images import BuilderImages
+from .plugin_archive_generation import EXCLUDE_SOURCE_FILES, get_plugin_archive_name
+from .vendor_dir_generation import resolve_builder_images_for_build
+
+logger = logging.getLogger(__name__)
+
+BUILD_FINGERPRINT_SUFFIX: Final = ".fingerprint.json"
+BUILDER_PACKAGE: Final = "agent-plugin-builder"
+# The options which change how the plugin is built, but not the archive which it's built into
+UNFINGERPRINTED_OPTIONS: Final = frozenset(
+    {
+        "plugin_dir_path",
+        "build_dir_path",
+        "dist_dir_path",
+        "dist_publish_method",
+        "workspace",
+        "isolated_build_dir",
+        "resume",
+        "force",
+        "pull_policy",
+        "installed_tree_cache",
+        "wine_prefix_cache",
+        "autodetect_cache",
+        "speculative_install",
+        "docker_endpoints",
+        "profile",
+        "cache_dir_path",
+        "wheelhouse_path",
+        "prefetch",
+        "prefetch_connections",
+    }
+)
+
+
+class BuildFingerprint(InfectionMonkeyBaseModel):
+    inputs: str
+    builder_images: BuilderImages
+    build_result: BuildResult
+
+
+def get_build_fingerprint_file_path(plugin_archive_path: Path) -> Path:
+    return plugin_archive_path.with_name(f"{plugin_archive_path.name}{BUILD_FINGERPRINT_SUFFIX}")
+
+
+def get_inputs_fingerprint(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> str:
+    """
+    Get the fingerprint of the inputs of a build, other than the builder images.
+
+    The plugin code, including the lock file, is fingerprinted by the contents of its files,
+    so that a fresh checkout of an unchanged plugin has the same fingerprint. The build and the
+    dist directories, and the files which aren't added to the source archive, are not
+    fingerprinted.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The fingerprint.
+    """
+    plugin_code_fingerprint = _get_tree_fingerprint(
+        agent_plugin_build_options.plugin_dir_path,
+        exclude=[
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.dist_dir_path,
+        ],
+    )
+    build_options = agent_plugin_build_options.model_dump(
+        mode="json", exclude=set(UNFINGERPRINTED_OPTIONS)
+    )
+
+    fingerprint_hash = hashlib.sha256()
+    for fingerprint_input in (
+        plugin_code_fingerprint,
+        json.dumps(agent_plugin_manifest.model_dump(mode="json"), sort_keys=True),
+        json.dumps(build_options, sort_keys=True),
+        _get_builder_version(),
+    ):
+        fingerprint_hash.update(fingerprint_input.encode())
+        fingerprint_hash.update(b"\0")
+
+    return fingerprint_hash.hexdigest()
+
+
+def _get_tree_fingerprint(dir_path: Path, exclude: Sequence[Path] = ()) -> str:
+    # The lock files of the excluded directories are next to them
+    excluded_paths = {
+        path.resolve()
+        for excluded_path in exclude
+        for path in (excluded_path, get_lock_file_path(excluded_path))
+    }
+    tree_hash = hashlib.sha256()
+    for walked_dir_path, dir_names, file_names in os.walk(dir_path):
+        dir_names[:] = sorted(
+            name
+            for name in dir_names
+            if name not in EXCLUDE_SOURCE_FILES
+            and Path(walked_dir_path, name).resolve() not in excluded_paths
+        )
+        for file_name in sorted(file_names):
+            file_path = Path(walked_dir_path, file_name)
+            if (
+                file_name in EXCLUDE_SOURCE_FILES
+                or file_path.resolve() in excluded_paths
+                or not file_path.is_file()
+            ):
+                continue
+
+            with file_path.open("rb") as f:
+                file_digest = hashlib.file_digest(f, "sha256").hexdigest()
+            tree_hash.update(f"{file_path.relative_to(dir_path).as_posix()}:{file_digest}".encode())
+            tree_hash.update(b"\0")
+
+    return tree_hash.hexdigest()
+
+
+def _get_builder_version() -> str:
+    try:
+        return version(BUILDER_PACKAGE)
+    except PackageNotFoundError:
+        # The builder runs from a source tree, whose code may change without its version
+        return _get_tree_fingerprint(Path(__file__).parent)
+
+
+def find_up_to_date_build(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    inputs_fingerprint: str,
+) -> BuildResult | None:
+    """
+    Find the plugin archive in the dist directory, if it was built from the same inputs.
+
+    The builder images are only resolved if the fingerprint of the other inputs matches, and the
+    archive matches its checksum.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :param inputs_fingerprint: The fingerprint of the inputs of the build, other than the
+        builder images.
+    :return: The result of the build of the up-to-date archive, or None if the plugin must be
+        built.
+    """
+    plugin_archive_path = agent_plugin_build_options.dist_dir_path / get_plugin_archive_name(
+        agent_plugin_manifest
+    )
+    if not get_build_fingerprint_file_path(plugin_archive_path).exists():
+        return None
+
+    with PathLock(plugin_archive_path, shared=True):
+        build_fingerprint = _read_build_fingerprint(plugin_archive_path)
+        if build_fingerprint is None or build_fingerprint.inputs != inputs_fingerprint:
+            return None
+        if not _is_intact(plugin_archive_path, build_fingerprint.build_result):
+            logger.info(f"The plugin archive was changed since it was built: {plugin_archive_path}")
+            return None
+
+    if build_fingerprint.builder_images != resolve_builder_images_for_build(
+        agent_plugin_build_options, agent_plugin_manifest
+    ):
+        logger.info("The builder images were changed since the plugin archive was built")
+        return None
+
+    logger.info(f"The plugin archive is up to date, skipping the build: {plugin_archive_path}")
+    with ensure_build_control() as build_control:
+        return build_fingerprint.build_result.model_copy(
+            update={
+                "plugin_archive_path": plugin_archive_path,
+                "stage_durations": build_control.statistics.stage_durations,
+                "containers_run": 0,
+                "installed_tree_cache_hits": 0,
+                "installed_tree_cache_misses": 0,
+                "resumed_steps": (),
+                "up_to_date": True,
+            }
+        )
+
+
+def _read_build_fingerprint(plugin_archive_path: Path) -> BuildFingerprint | None:
+    build_fingerprint_file_path = get_build_fingerprint_file_path(plugin_archive_path)
+    if not (plugin_archive_path.is_file() and build_fingerprint_file_path.is_file()):
+        return None
+
+    try:
+        return BuildFingerprint.model_validate_json(build_fingerprint_file_path.read_text())
+    except (OSError, ValueError) as err:
+        logger.warning(f"Ignoring invalid build fingerprint {build_fingerprint_file_path}: {err}")
+        return None
+
+
+def _is_intact(plugin_archive_path: Path, build_result: BuildResult) -> bool:
+    with plugin_archive_path.open("rb") as f:
+        plugin_archive_digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+    return plugin_archive_digest == build_result.checksums.plugin_archive.sha256
+
+
+def write_build_fingerprint(build_result: BuildResult, inputs_fingerprint: str):
+    """
+    Write the fingerprint of the inputs of a build next to the plugin archive which it built.
+
+    :param build_result: The result of the build.
+    :param inputs_fingerprint: The fingerprint of the inputs of the build, other than the
+        builder images.
+    """
+    if build_result.builder_images is None:
+        return
+
+    build_fingerprint = BuildFingerprint(
+        inputs=inputs_fingerprint,
+        builder_images=build_result.builder_images,
+        build_result=build_result,
+    )
+    with PathLock(build_result.plugin_archive_path):
+        get_build_fingerprint_file_path(build_result.plugin_archive_path).write_text(
+            build_fingerprint.model_dump_json(indent=2)
+        )
@@ -0,0 +1,340 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Final, Iterator, Sequence
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from pydantic import ValidationError
+
+from .file_transfer import get_temporary_path
+
+logger = logging.getLogger(__name__)
+
+BUILD_JOURNAL_FILE: Final = "build-journal.json"
+# Directories are only checked to exist, since later steps modify them in place
+DIRECTORY_OUTPUT: Final = "directory"
+
+JournalInput = str | Path
+
+
+class JournalEntry(InfectionMonkeyBaseModel):
+    step: str
+    fingerprint: str
+    outputs: dict[str, str]
+    result: Any = None
+    completed_at: datetime
+
+
+class BuildJournalData(InfectionMonkeyBaseModel):
+    entries: tuple[JournalEntry, ...] = ()
+
+
+class JournalStep:
+    """
+    A step of a build, which is either resumed from the journal or run
+    """
+
+    def __init__(
+        self,
+        journal: "BuildJournal | None",
+        step: str,
+        fingerprint: str,
+        outputs: Sequence[Path],
+        resumed_entry: JournalEntry | None = None,
+    ):
+        self.step = step
+        self.fingerprint = fingerprint
+        self.outputs = tuple(outputs)
+        self._journal = journal
+        self._resumed_entry = resumed_entry
+
+    @property
+    def resumed(self) -> bool:
+        """
+        Whether the step was completed by a previous run of the build, and must not run again
+        """
+        return self._resumed_entry is not None
+
+    @property
+    def result(self) -> Any:
+        """
+        The result which the step was completed with by the previous run of the build
+        """
+        return None if self._resumed_entry is None else self._resumed_entry.result
+
+    def complete(self, result: Any = None):
+        """
+        Record that the step was completed.
+
+        :param result: A JSON-serializable result of the step, which is returned to a resumed
+            build instead of running the step again.
+        """
+        if self._journal is not None:
+            self._journal.record(self, result)
+
+
+class BuildJournal:
+    """
+    A journal of the completed steps of a build, which is kept in the build directory
+
+    Every step is recorded with a fingerprint of its inputs, and of the outputs which it left in
+    the build directory. The fingerprint of a step includes the fingerprint of the step before
+    it, so that a step which is invalidated invalidates every step after it.
+
+    A resumed build skips the steps which the journal of the previous build recorded with the
+    same fingerprints and the same outputs, up to the first step which is missing or invalidated.
+    The outputs of that step and of the steps after it are removed, and the build runs them
+    again.
+    """
+
+    def __init__(self, build_dir_path: Path, resume: bool = False):
+        self._build_dir_path = build_dir_path
+        self._file_path = build_dir_path / BUILD_JOURNAL_FILE
+        self._previous_entries = self._load() if resume else []
+        self._resuming = resume
+        self._entries: list[JournalEntry] = []
+        self._resumed_steps: list[str] = []
+        self._lock = threading.Lock()
+
+    @property
+    def resumed_steps(self) -> list[str]:
+        """
+        The steps which were resumed from the previous build
+        """
+        with self._lock:
+            return list(self._resumed_steps)
+
+    def start_step(
+        self, step: str, inputs: Sequence[JournalInput] = (), outputs: Sequence[Path] = ()
+    ) -> JournalStep:
+        """
+        Start a step, and check whether it can be resumed from the previous build.
+
+        :param step: The name of the step.
+        :param inputs: Strings and paths of files and directories which the outputs of the
+            step depend on.
+        :param outputs: Paths of the files and directories which the step creates.
+        :return: The step. If it wasn't resumed, its outputs were removed, and it must be
+            completed once it has run.
+        """
+        with self._lock:
+            previous_fingerprint = self._entries[-1].fingerprint if self._entries else ""
+            fingerprint = get_fingerprint(previous_fingerprint, step, *inputs)
+            position = len(self._entries)
+            if self._resuming:
+                previous_entry = (
+                    self._previous_entries[position]
+                    if position < len(self._previous_entries)
+                    else None
+                )
+                if previous_entry is not None and self._is_resumable(
+                    previous_entry, step, fingerprint, outputs
+                ):
+                    logger.info(f"Resuming completed build step: {step}")
+                    self._entries.append(previous_entry)
+                    self._resumed_steps.append(step)
+                    return JournalStep(self, step, fingerprint, outputs, previous_entry)
+
+                self._invalidate(position)
+
+        _remove_outputs(outputs)
+        return JournalStep(self, step, fingerprint, outputs)
+
+    def record(self, journal_step: JournalStep, result: Any = None):
+        """
+        Record a completed step, and write the journal.
+
+        :param journal_step: The completed step.
+        :param result: A JSON-serializable result of the step.
+        """
+        entry = JournalEntry(
+            step=journal_step.step,
+            fingerprint=journal_step.fingerprint,
+            outputs={
+                self._get_output_name(output): fingerprint
+                for output in journal_step.outputs
+                if (fingerprint := _get_output_fingerprint(output)) is not None
+            },
+            result=result,
+            completed_at=datetime.now(timezone.utc),
+        )
+        with self._lock:
+            self._entries.append(entry)
+            self._write()
+
+    def _invalidate(self, position: int):
+        invalidated_entries = self._previous_entries[position:]
+        if invalidated_entries:
+            logger.info(
+                f"Build step {invalidated_entries[0].step} was invalidated, running it and "
+                "the steps after it again"
+            )
+
+        for entry in invalidated_entries:
+            _remove_outputs([self._build_dir_path / output for output in entry.outputs])
+
+        self._resuming = False
+        self._previous_entries = []
+        self._write()
+
+    def _load(self) -> list[JournalEntry]:
+        try:
+            journal_data = BuildJournalData.model_validate_json(self._file_path.read_text())
+        except FileNotFoundError:
+            logger.info(f"No build journal to resume from: {self._file_path}")
+            return []
+        except (OSError, ValidationError) as err:
+            logger.warning(f"Unable to read the build journal {self._file_path}: {err}")
+            return []
+
+        return list(journal_data.entries)
+
+    def _write(self):
+        temporary_file_path = get_temporary_path(self._file_path)
+        try:
+            temporary_file_path.write_text(
+                BuildJournalData(entries=tuple(self._entries)).model_dump_json(indent=2)
+            )
+            os.replace(temporary_file_path, self._file_path)
+        except OSError as err:
+            logger.warning(f"Unable to write the build journal {self._file_path}: {err}")
+            temporary_file_path.unlink(missing_ok=True)
+
+    def _is_resumable(
+        self, entry: JournalEntry, step: str, fingerprint: str, outputs: Sequence[Path]
+    ) -> bool:
+        if entry.step != step or entry.fingerprint != fingerprint:
+            return False
+
+        # Every output must have been created, and must not have changed since
+        if set(entry.outputs) != {self._get_output_name(output) for output in outputs}:
+            return False
+
+        return all(
+            _get_output_fingerprint(self._build_dir_path / output) == output_fingerprint
+            for output, output_fingerprint in entry.outputs.items()
+        )
+
+    def _get_output_name(self, output: Path) -> str:
+        return output.relative_to(self._build_dir_path).as_posix()
+
+
+def get_fingerprint(*inputs: JournalInput, exclude: Sequence[Path] = ()) -> str:
+    """
+    Get the fingerprint of the inputs of a build step.
+
+    Files are fingerprinted by their contents. Directories are fingerprinted by the paths, the
+    sizes and the modification times of their files, so that large trees are not read.
+
+    :param inputs: Strings, and paths of files and directories.
+    :param exclude: Paths in the directories which are not fingerprinted, together with the
+        directories which contain them.
+    :return: The fingerprint.
+    """
+    fingerprint_hash = hashlib.sha256()
+    for journal_input in inputs:
+        if isinstance(journal_input, Path):
+            fingerprint_hash.update(_get_path_fingerprint(journal_input, exclude).encode())
+        else:
+            fingerprint_hash.update(journal_input.encode())
+        fingerprint_hash.update(b"\0")
+
+    return fingerprint_hash.hexdigest()
+
+
+def _get_path_fingerprint(path: Path, exclude: Sequence[Path]) -> str:
+    if path.is_file():
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    if not path.is_dir():
+        return "missing"
+
+    excluded_paths = [excluded_path.resolve() for excluded_path in exclude]
+    tree_hash = hashlib.sha256()
+    for dir_path, dir_names, file_names in os.walk(path):
+        dir_names[:] = sorted(
+            name for name in dir_names if not _is_excluded(Path(dir_path, name), excluded_paths)
+        )
+        for file_name in sorted(file_names):
+            file_path = Path(dir_path, file_name)
+            file_stat = file_path.lstat()
+            file_fingerprint = (
+                f"{file_path.relative_to(path)}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+            )
+            tree_hash.update(file_fingerprint.encode())
+            tree_hash.update(b"\0")
+
+    return tree_hash.hexdigest()
+
+
+def _is_excluded(dir_path: Path, excluded_paths: Sequence[Path]) -> bool:
+    # Directories which contain an excluded path, like a build directory in the plugin
+    # directory, are excluded with it
+    dir_path = dir_path.resolve()
+    return any(excluded_path.is_relative_to(dir_path) for excluded_path in excluded_paths)
+
+
+def _get_output_fingerprint(output: Path) -> str | None:
+    if output.is_dir():
+        return DIRECTORY_OUTPUT
+    if output.is_file():
+        return hashlib.sha256(output.read_bytes()).hexdigest()
+
+    return None
+
+
+def _remove_outputs(outputs: Sequence[Path]):
+    for output in outputs:
+        if output.is_dir() and not output.is_symlink():
+            shutil.rmtree(output)
+        else:
+            output.unlink(missing_ok=True)
+
+
+_build_journal: ContextVar[BuildJournal | None] = ContextVar("build_journal", default=None)
+
+
+def get_build_journal() -> BuildJournal | None:
+    """
+    :return: The journal of the current build, or None if the build isn't journaled.
+    """
+    return _build_journal.get()
+
+
+@contextmanager
+def use_build_journal(build_journal: BuildJournal | None) -> Iterator[BuildJournal | None]:
+    """
+    Set the journal of the build which runs in the current context.
+
+    :param build_journal: The journal of the build, or None if the steps which run in the
+        current context must not be journaled.
+    """
+    token = _build_journal.set(build_journal)
+    try:
+        yield build_journal
+    finally:
+        _build_journal.reset(token)
+
+
+def start_journal_step(
+    step: str, inputs: Sequence[JournalInput] = (), outputs: Sequence[Path] = ()
+) -> JournalStep:
+    """
+    Start a step in the journal of the current build, if any.
+
+    :param step: The name of the step.
+    :param inputs: Strings and paths of files and directories which the outputs of the step
+        depend on.
+    :param outputs: Paths of the files and directories which the step creates.
+    :return: The step. If the build isn't journaled, the step is never resumed.
+    """
+    build_journal = get_build_journal()
+    if build_journal is None:
+        return JournalStep(None, step, "", outputs)
+
+    return build_journal.start_step(step, inputs, outputs)
@@ -0,0 +1,310 @@
+import fcntl
+import logging
+import math
+import os
+import re
+from collections import defaultdict
+from enum import Enum
+from pathlib import Path
+from typing import Final, Iterable, Mapping
+
+from docker.utils import parse_repository_tag
+from monkeytypes import AgentPluginManifest
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .build_control import BuildStatistics
+from .build_result import BuildResult
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE_LOCK_SUFFIX: Final = ".lock"
+DURATION_BUCKETS: Final = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+SAMPLE_PATTERN: Final = re.compile(
+    r"^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)$"
+)
+# Builder images which were built locally are pinned by their IDs, and have no repository
+LOCAL_IMAGE_LABEL: Final = "local"
+IMAGE_ID_PREFIX: Final = "sha256:"
+LABEL_PATTERN: Final = re.compile(r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"')
+
+Labels = tuple[tuple[str, str], ...]
+SampleKey = tuple[str, Labels]
+
+
+class MetricType(Enum):
+    COUNTER = "counter"
+    GAUGE = "gauge"
+    HISTOGRAM = "histogram"
+
+
+class MetricFamily(InfectionMonkeyBaseModel):
+    name: str
+    metric_type: MetricType
+    help: str
+
+    @property
+    def sample_suffixes(self) -> tuple[str, ...]:
+        if self.metric_type == MetricType.HISTOGRAM:
+            return ("_bucket", "_sum", "_count")
+
+        return ("",)
+
+
+BUILDS: Final = MetricFamily(
+    name="agent_plugin_builder_builds_total",
+    metric_type=MetricType.COUNTER,
+    help="Number of Agent Plugin builds, by result.",
+)
+STAGE_DURATION: Final = MetricFamily(
+    name="agent_plugin_builder_stage_duration_seconds",
+    metric_type=MetricType.HISTOGRAM,
+    help="Duration of the build stages.",
+)
+ARCHIVE_BYTES: Final = MetricFamily(
+    name="agent_plugin_builder_archive_bytes",
+    metric_type=MetricType.GAUGE,
+    help="Size of the archives of the last successful build.",
+)
+VENDORED_FILES: Final = MetricFamily(
+    name="agent_plugin_builder_vendored_files",
+    metric_type=MetricType.GAUGE,
+    help="Number of files in the vendor directories of the last successful build.",
+)
+CONTAINER_DURATION: Final = MetricFamily(
+    name="agent_plugin_builder_container_duration_seconds",
+    metric_type=MetricType.HISTOGRAM,
+    help="Duration of the builder container runs, by image repository.",
+)
+METRIC_FAMILIES: Final = (BUILDS, STAGE_DURATION, ARCHIVE_BYTES, VENDORED_FILES, CONTAINER_DURATION)
+
+
+class BuildMetrics:
+    """
+    The metrics of Agent Plugin builds
+
+    Counters and histograms accumulate across builds, while gauges hold the values of the last
+    build which set them.
+    """
+
+    def __init__(self):
+        self._samples: dict[str, dict[SampleKey, float]] = defaultdict(dict)
+
+    def inc(self, family: MetricFamily, labels: Mapping[str, str], value: float = 1.0):
+        key = (family.name, _get_labels(labels))
+        self._samples[family.name][key] = self._samples[family.name].get(key, 0.0) + float(value)
+
+    def set(self, family: MetricFamily, labels: Mapping[str, str], value: float):
+        self._samples[family.name][(family.name, _get_labels(labels))] = float(value)
+
+    def observe(
+        self,
+        family: MetricFamily,
+        labels: Mapping[str, str],
+        value: float,
+        buckets: Iterable[float] = DURATION_BUCKETS,
+    ):
+        for upper_bound in [*buckets, math.inf]:
+            bucket_labels = {**labels, "le": _format_value(upper_bound)}
+            key = (f"{family.name}_bucket", _get_labels(bucket_labels))
+            self._samples[family.name][key] = self._samples[family.name].get(key, 0.0) + (
+                1.0 if value <= upper_bound else 0.0
+            )
+
+        for suffix, increment in (("_sum", value), ("_count", 1.0)):
+            key = (f"{family.name}{suffix}", _get_labels(labels))
+            self._samples[family.name][key] = self._samples[family.name].get(key, 0.0) + increment
+
+    def merge(self, other: "BuildMetrics"):
+        """
+        Merge the metrics of another build into these metrics.
+
+        :param other: The metrics to merge.
+        """
+        for family in METRIC_FAMILIES:
+            for key, value in other._samples.get(family.name, {}).items():
+                if family.metric_type == MetricType.GAUGE:
+                    self._samples[family.name][key] = value
+                else:
+                    self._samples[family.name][key] = (
+                        self._samples[family.name].get(key, 0.0) + value
+                    )
+
+    def format(self) -> str:
+        """
+        Format the metrics in the Prometheus text exposition format, which the node exporter
+        textfile collector reads.
+
+        :return: The formatted metrics.
+        """
+        lines = []
+        for family in METRIC_FAMILIES:
+            samples = self._samples.get(family.name)
+            if not samples:
+                continue
+
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.metric_type.value}")
+            for (sample_name, labels), value in sorted(samples.items(), key=_sample_sort_key):
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def parse(cls, text: str) -> "BuildMetrics":
+        """
+        Parse metrics which were formatted by `BuildMetrics.format()`.
+
+        Samples of unknown metric families are dropped.
+
+        :param text: The formatted metrics.
+        :return: The parsed metrics.
+        """
+        build_metrics = cls()
+        for line in text.splitlines():
+            match = SAMPLE_PATTERN.match(line.strip())
+            if line.startswith("#") or match is None:
+                continue
+
+            family = _get_metric_family(match.group("name"))
+            if family is None:
+                continue
+
+            labels = tuple(
+                (label.group("name"), _unescape_label_value(label.group("value")))
+                for label in LABEL_PATTERN.finditer(match.group("labels") or "")
+            )
+            build_metrics._samples[family.name][(match.group("name"), labels)] = float(
+                match.group("value")
+            )
+
+        return build_metrics
+
+
+def get_build_metrics(
+    agent_plugin_manifest: AgentPluginManifest,
+    build_statistics: BuildStatistics,
+    build_result: BuildResult | None,
+) -> BuildMetrics:
+    """
+    Get the metrics of a build.
+
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :param build_statistics: The statistics of the build.
+    :param build_result: The result of the build, or None if the build failed.
+    :return: The metrics of the build.
+    """
+    plugin_labels = {
+        "plugin_name": agent_plugin_manifest.name,
+        "plugin_type": agent_plugin_manifest.plugin_type.value,
+    }
+    build_metrics = BuildMetrics()
+    build_metrics.inc(
+        BUILDS, {**plugin_labels, "result": "failure" if build_result is None else "success"}
+    )
+    for stage, seconds in build_statistics.stage_durations.items():
+        build_metrics.observe(STAGE_DURATION, {**plugin_labels, "stage": stage.value}, seconds)
+    for image, durations in build_statistics.container_durations.items():
+        for seconds in durations:
+            build_metrics.observe(
+                CONTAINER_DURATION, {**plugin_labels, "image": _get_image_label(image)}, seconds
+            )
+
+    if build_result is not None:
+        build_metrics.set(
+            ARCHIVE_BYTES, {**plugin_labels, "archive": "plugin"}, build_result.plugin_archive_size
+        )
+        build_metrics.set(
+            ARCHIVE_BYTES, {**plugin_labels, "archive": "source"}, build_result.source_archive_size
+        )
+        for vendor_dir_name, file_count in build_result.vendor_file_counts.items():
+            build_metrics.set(
+                VENDORED_FILES, {**plugin_labels, "vendor_dir": vendor_dir_name}, file_count
+            )
+
+    return build_metrics
+
+
+def _get_image_label(image: str) -> str:
+    # The digest or the tag of the image isn't in the label, so that an update of a builder image
+    # doesn't add a series
+    if image.startswith(IMAGE_ID_PREFIX):
+        return LOCAL_IMAGE_LABEL
+
+    repository, _ = parse_repository_tag(image)
+    return repository
+
+
+def write_build_metrics(metrics_file_path: Path, build_metrics: BuildMetrics):
+    """
+    Merge the metrics of a build into a metrics file.
+
+    The metrics file is locked while the metrics are merged, so that concurrent builds don't lose
+    each other's metrics, and it is replaced atomically, so that it is never read while it's
+    partially written.
+
+    :param metrics_file_path: Path to the metrics file.
+    :param build_metrics: The metrics of the build.
+    """
+    metrics_file_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file_path = metrics_file_path.with_name(metrics_file_path.name + METRICS_FILE_LOCK_SUFFIX)
+    with lock_file_path.open("a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            merged_metrics = BuildMetrics()
+            if metrics_file_path.exists():
+                merged_metrics = BuildMetrics.parse(metrics_file_path.read_text())
+            merged_metrics.merge(build_metrics)
+
+            temporary_file_path = metrics_file_path.with_name(
+                f".{metrics_file_path.name}.{os.getpid()}.tmp"
+            )
+            temporary_file_path.write_text(merged_metrics.format())
+            os.replace(temporary_file_path, metrics_file_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    logger.info(f"Wrote build metrics: {metrics_file_path}")
+
+
+def _get_metric_family(sample_name: str) -> MetricFamily | None:
+    for family in METRIC_FAMILIES:
+        if sample_name in (f"{family.name}{suffix}" for suffix in family.sample_suffixes):
+            return family
+
+    return None
+
+
+def _get_labels(labels: Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items(), key=lambda label: (label[0] == "le", label[0])))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _unescape_label_value(value: str) -> str:
+    return re.sub(r"\\(.)", lambda match: "\n" if match.group(1) == "n" else match.group(1), value)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+
+def _sample_sort_key(sample: tuple[SampleKey, float]) -> tuple:
+    (sample_name, labels), _ = sample
+    label_names = tuple((name, value) for name, value in labels if name != "le")
+    upper_bound = next((float(value) for name, value in labels if name == "le"), 0.0)
+
+    return (label_names, sample_name, upper_bound)
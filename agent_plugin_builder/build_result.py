@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .archive_checksums import PluginArchiveChecksums
+from .build_control import BuildStage
+from .builder_images import BuilderImages
+from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
+
+
+class BuildResult(InfectionMonkeyBaseModel):
+    plugin_archive_path: Path
+    plugin_archive_size: int
+    source_archive_size: int
+    # Autodetect is resolved to the method which it chose
+    platform_dependencies: PlatformDependencyPackagingMethod
+    vendor_dir_sizes: dict[str, int]
+    vendor_file_counts: dict[str, int]
+    stage_durations: dict[BuildStage, float]
+    checksums: PluginArchiveChecksums
+    containers_run: int = 0
+    installed_tree_cache_hits: int = 0
+    installed_tree_cache_misses: int = 0
+    # The build steps which were resumed from the journal of the previous build
+    resumed_steps: tuple[str, ...] = ()
+    # The builder images which the build used, pinned to their digests
+    builder_images: BuilderImages | None = None
+    # The build was skipped, and the archive in the dist directory was reused, since the inputs
+    # of the build hadn't changed since it was built
+    up_to_date: bool = False
+
+
+def get_directory_usage(dir_path: Path) -> tuple[int, int]:
+    """
+    Get the total size and the number of the files in a directory.
+
+    :param dir_path: Path to the directory.
+    :return: The total size of the files in the directory, in bytes, and the number of files.
+    """
+    file_sizes = [
+        path.lstat().st_size for path in dir_path.rglob("*") if path.is_file() or path.is_symlink()
+    ]
+
+    return sum(file_sizes), len(file_sizes)
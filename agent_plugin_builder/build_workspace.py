@@ -0,0 +1,163 @@
+import asyncio
+import fcntl
+import logging
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import IO, Final
+
+from .memory_workspace import PRESERVED_WORKSPACE_FILE_PATTERNS
+from .stage_profiling import PROFILE_FILE_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+ISOLATED_BUILD_DIR_PREFIX: Final = "build-"
+LOCK_POLL_INTERVAL: Final = 0.1
+KEPT_BUILD_FILE_PATTERNS: Final = (
+    *PRESERVED_WORKSPACE_FILE_PATTERNS,
+    "*.log",
+    "*.log.*",
+    *(f"*{suffix}" for suffix in PROFILE_FILE_SUFFIXES.values()),
+)
+
+
+class PathLock:
+    """
+    A lock of a path, which is shared by the builds of every process on the host
+
+    The lock is held on a lock file next to the path, so that the path itself can be removed and
+    recreated while the lock is held. An exclusive lock waits for every other lock of the path to
+    be released. A shared lock only waits for an exclusive lock.
+    """
+
+    def __init__(self, path: Path, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._lock_file_path = get_lock_file_path(path)
+        self._lock_file: IO | None = None
+
+    def acquire(self):
+        """
+        Acquire the lock, and wait for another build to release it if needed.
+        """
+        lock_file = self._open_lock_file()
+        try:
+            if not self._try_lock(lock_file):
+                logger.info(f"Waiting for another build to release {self.path}")
+                fcntl.flock(lock_file, self._operation)
+        except BaseException:
+            lock_file.close()
+            raise
+
+        self._lock_file = lock_file
+
+    async def acquire_async(self):
+        """
+        Acquire the lock, and wait for another build to release it if needed.
+
+        The lock is polled while another build holds it, so that the wait doesn't hold a worker
+        thread, which the build that holds the lock may need.
+        """
+        lock_file = self._open_lock_file()
+        try:
+            if not self._try_lock(lock_file):
+                logger.info(f"Waiting for another build to release {self.path}")
+                while not self._try_lock(lock_file):
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+        except BaseException:
+            lock_file.close()
+            raise
+
+        self._lock_file = lock_file
+
+    @property
+    def _operation(self) -> int:
+        return fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+
+    def _open_lock_file(self) -> IO:
+        self._lock_file_path.parent.mkdir(parents=True, exist_ok=True)
+        return self._lock_file_path.open("a")
+
+    def _try_lock(self, lock_file: IO) -> bool:
+        try:
+            fcntl.flock(lock_file, self._operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+
+        return True
+
+    def release(self):
+        """
+        Release the lock, if it is held.
+        """
+        if self._lock_file is None:
+            return
+
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def __enter__(self) -> "PathLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+
+def get_lock_file_path(path: Path) -> Path:
+    """
+    Get the path to the file which the locks of a path are held on.
+
+    :param path: The locked path.
+    :return: Path to the lock file, next to the locked path.
+    """
+    return path.with_name(f".{path.name}.lock")
+
+
+def get_build_dir_lock(build_dir_path: Path, isolated: bool) -> PathLock:
+    """
+    Get the lock which a build holds on its build directory.
+
+    A build which uses the build directory itself holds an exclusive lock, since it clears the
+    directory. Builds in isolated build directories share the lock, so that they run
+    concurrently, but not while the build directory is cleared.
+
+    :param build_dir_path: Path to the build directory.
+    :param isolated: Whether the build runs in an isolated build directory.
+    :return: The lock of the build directory.
+    """
+    return PathLock(build_dir_path, shared=isolated)
+
+
+def create_isolated_build_dir(build_dir_path: Path) -> Path:
+    """
+    Create a unique directory for a single build in the build directory.
+
+    :param build_dir_path: Path to the build directory.
+    :return: Path to the isolated build directory.
+    """
+    build_dir_path.mkdir(parents=True, exist_ok=True)
+    prefix = f"{ISOLATED_BUILD_DIR_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-"
+    isolated_build_dir_path = Path(tempfile.mkdtemp(prefix=prefix, dir=build_dir_path))
+    logger.info(f"Created isolated build directory: {isolated_build_dir_path}")
+
+    return isolated_build_dir_path
+
+
+def remove_build_intermediates(isolated_build_dir_path: Path):
+    """
+    Remove the intermediate files of a build which succeeded from its isolated build directory.
+
+    The staged plugin code, the vendor directories and the archives are removed. The log files,
+    the requirements files, the build reports and the profiles of the stages are kept.
+
+    :param isolated_build_dir_path: Path to the isolated build directory.
+    """
+    logger.info(f"Removing the intermediate files of the build: {isolated_build_dir_path}")
+    for path in isolated_build_dir_path.iterdir():
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path, ignore_errors=True)
+        elif not any(path.match(pattern) for pattern in KEPT_BUILD_FILE_PATTERNS):
+            path.unlink(missing_ok=True)
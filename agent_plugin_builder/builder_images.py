@@ -0,0 +1,113 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Final, Iterable
+
+from docker.client import DockerClient
+from docker.errors import ImageNotFound
+from docker.utils import parse_repository_tag
+from monkeytypes import OperatingSystem
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from pydantic import Field
+
+import docker
+
+from .pull_policy import PullPolicy
+
+logger = logging.getLogger(__name__)
+
+LINUX_PLUGIN_BUILDER_IMAGE: Final = "infectionmonkey/agent-builder:latest"
+WINDOWS_PLUGIN_BUILDER_IMAGE: Final = "infectionmonkey/plugin-builder:latest"
+
+
+class BuilderImages(InfectionMonkeyBaseModel):
+    linux: Annotated[
+        str,
+        Field(title="The image of the Linux builder container."),
+    ] = LINUX_PLUGIN_BUILDER_IMAGE
+    windows: Annotated[
+        str,
+        Field(title="The image of the Windows (Wine) builder container."),
+    ] = WINDOWS_PLUGIN_BUILDER_IMAGE
+
+
+DEFAULT_BUILDER_IMAGES: Final = BuilderImages()
+
+
+def resolve_builder_images(
+    operating_systems: Iterable[OperatingSystem], pull_policy: PullPolicy = PullPolicy.MISSING
+) -> BuilderImages:
+    """
+    Make the builder images for the given operating systems available, and pin them to the
+    digests which they resolve to.
+
+    The images are resolved in parallel. Images for other operating systems are left unpinned.
+
+    :param operating_systems: The operating systems whose builder images are needed.
+    :param pull_policy: When to pull the builder images.
+    :return: The builder images, pinned to their digests.
+    :raises docker.errors.ImageNotFound: If the pull policy is "never" and an image is not
+        available locally.
+    :raises docker.errors.APIError: If an image fails to be pulled or inspected.
+    """
+    images = {}
+    if OperatingSystem.LINUX in operating_systems:
+        images["linux"] = DEFAULT_BUILDER_IMAGES.linux
+    if OperatingSystem.WINDOWS in operating_systems:
+        images["windows"] = DEFAULT_BUILDER_IMAGES.windows
+
+    if not images:
+        return DEFAULT_BUILDER_IMAGES
+
+    client = docker.from_env()  # type: ignore [attr-defined]
+    with ThreadPoolExecutor(
+        max_workers=len(images), thread_name_prefix="resolve-builder-image"
+    ) as executor:
+        futures = {
+            key: executor.submit(_resolve_builder_image, client, image, pull_policy)
+            for key, image in images.items()
+        }
+        return DEFAULT_BUILDER_IMAGES.model_copy(
+            update={key: future.result() for key, future in futures.items()}
+        )
+
+
+def _resolve_builder_image(client: DockerClient, image_name: str, pull_policy: PullPolicy) -> str:
+    if pull_policy == PullPolicy.ALWAYS:
+        image = _pull_image(client, image_name)
+    else:
+        try:
+            image = client.images.get(image_name)
+        except ImageNotFound as err:
+            if pull_policy == PullPolicy.NEVER:
+                logger.error(f"Builder image {image_name} is not available and won't be pulled")
+                raise err
+
+            image = _pull_image(client, image_name)
+
+    pinned_image_name = _get_pinned_image_name(image_name, image.attrs)
+    logger.info(f"Using builder image: {pinned_image_name}")
+
+    return pinned_image_name
+
+
+def _pull_image(client: DockerClient, image_name: str):
+    logger.info(f"Pulling builder image: {image_name}")
+    repository, tag = parse_repository_tag(image_name)
+
+    return client.images.pull(repository, tag=tag)
+
+
+def _get_pinned_image_name(image_name: str, image_attrs: dict) -> str:
+    repository, _ = parse_repository_tag(image_name)
+    for repo_digest in image_attrs.get("RepoDigests") or []:
+        digest_repository, digest = repo_digest.split("@", 1)
+        if _normalize_repository(digest_repository) == _normalize_repository(repository):
+            return f"{repository}@{digest}"
+
+    # The image was built locally and has never been pushed or pulled, so it can only be
+    # pinned by its ID
+    return image_attrs["Id"]
+
+
+def _normalize_repository(repository: str) -> str:
+    return repository.removeprefix("docker.io/").removeprefix("library/")
@@ -0,0 +1,160 @@
+import json
+import logging
+import shutil
+import subprocess
+import sys
+import zlib
+from pathlib import Path
+from shlex import quote
+from typing import Final
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .agent_plugin_build_options import SourceDirName
+from .builder_images import DEFAULT_BUILDER_IMAGES, BuilderImages
+from .vendor_dir_generation import CommandRunError, run_command_in_linux_builder_container
+
+logger = logging.getLogger(__name__)
+
+AGENT_PYTHON_VERSION: Final = (3, 11)
+BYTECODE_CACHE_DIR: Final = "__pycache__"
+BYTECODE_REPORT_FILE: Final = "bytecode_report.json"
+ARCHIVE_COMPRESSION_LEVEL: Final = 9
+# The script compiles the directory given as its first argument and prints a JSON summary. The
+# CPU time of the worker processes is measured, since it is the time that the agent would spend
+# compiling the same modules when it first imports them.
+COMPILE_BYTECODE_SCRIPT: Final = """
+import compileall, json, os, py_compile, sys
+start = os.times()
+success = compileall.compile_dir(
+    sys.argv[1],
+    quiet=1,
+    force=True,
+    workers=0,
+    invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+)
+end = os.times()
+cpu_seconds = sum(end[:4]) - sum(start[:4])
+print(json.dumps({
+    "python_version": list(sys.version_info[:2]),
+    "success": success,
+    "compile_seconds": cpu_seconds,
+}))
+"""
+
+
+class BytecodeCompilationReport(InfectionMonkeyBaseModel):
+    module_count: int
+    bytecode_bytes: int
+    compressed_bytecode_bytes: int
+    compile_seconds: float
+
+
+def compile_bytecode(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+) -> BytecodeCompilationReport:
+    """
+    Compile the plugin code and the vendored dependencies for the agent's Python version.
+
+    The modules are compiled with unchecked-hash invalidation, so that the agent uses the
+    bytecode regardless of the modification times of the extracted files. Any existing bytecode
+    is removed first. If the host's Python version differs from the agent's, the modules are
+    compiled in the Linux builder container.
+
+    :param build_dir_path: Path to the build directory.
+    :param source_dir_name: Name of the plugin source directory.
+    :param builder_images: The builder images to use.
+    :return: A report of the size of the bytecode and the time it took to compile.
+    :raises CommandRunError: If the bytecode compilation fails to run.
+    :raises ValueError: If the bytecode was compiled for a different Python version than the
+        agent's.
+    """
+    source_dir_path = build_dir_path / source_dir_name
+    _remove_bytecode(source_dir_path)
+
+    logger.info(
+        f"Compiling bytecode for Python {'.'.join(map(str, AGENT_PYTHON_VERSION))}: "
+        f"{source_dir_path}"
+    )
+    if tuple(sys.version_info[:2]) == AGENT_PYTHON_VERSION:
+        output = _compile_bytecode_on_host(build_dir_path, source_dir_name)
+    else:
+        output = run_command_in_linux_builder_container(
+            build_dir_path,
+            f"python -c {quote(COMPILE_BYTECODE_SCRIPT)} {quote(source_dir_name)}",
+            "Bytecode Compilation",
+            builder_images,
+        )
+
+    compilation_result = json.loads(output.strip().splitlines()[-1])
+    if tuple(compilation_result["python_version"]) != AGENT_PYTHON_VERSION:
+        _remove_bytecode(source_dir_path)
+        raise ValueError(
+            f"Bytecode was compiled for Python {compilation_result['python_version']}, "
+            f"but the agent runs Python {AGENT_PYTHON_VERSION}"
+        )
+    if not compilation_result["success"]:
+        logger.warning("Some modules could not be compiled and will be compiled by the agent")
+
+    report = _get_bytecode_compilation_report(
+        source_dir_path, compilation_result["compile_seconds"]
+    )
+    _write_bytecode_report(build_dir_path, report)
+
+    return report
+
+
+def _remove_bytecode(source_dir_path: Path):
+    for bytecode_cache_dir in list(source_dir_path.rglob(BYTECODE_CACHE_DIR)):
+        if bytecode_cache_dir.is_dir():
+            shutil.rmtree(bytecode_cache_dir)
+
+
+def _compile_bytecode_on_host(build_dir_path: Path, source_dir_name: SourceDirName) -> str:
+    process = subprocess.run(
+        [sys.executable, "-c", COMPILE_BYTECODE_SCRIPT, source_dir_name],
+        cwd=str(build_dir_path),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    output = process.stdout.decode("utf-8")
+    logger.debug(f"Bytecode compilation output: {output}")
+    if process.returncode != 0:
+        logger.error("Bytecode compilation failed")
+        raise CommandRunError("Bytecode compilation failed")
+
+    return output
+
+
+def _get_bytecode_compilation_report(
+    source_dir_path: Path, compile_seconds: float
+) -> BytecodeCompilationReport:
+    module_count = 0
+    bytecode_bytes = 0
+    compressed_bytecode_bytes = 0
+    for bytecode_file_path in source_dir_path.rglob(f"{BYTECODE_CACHE_DIR}/*.pyc"):
+        bytecode = bytecode_file_path.read_bytes()
+        module_count += 1
+        bytecode_bytes += len(bytecode)
+        compressed_bytecode_bytes += len(zlib.compress(bytecode, ARCHIVE_COMPRESSION_LEVEL))
+
+    return BytecodeCompilationReport(
+        module_count=module_count,
+        bytecode_bytes=bytecode_bytes,
+        compressed_bytecode_bytes=compressed_bytecode_bytes,
+        compile_seconds=compile_seconds,
+    )
+
+
+def _write_bytecode_report(build_dir_path: Path, report: BytecodeCompilationReport):
+    logger.info(
+        f"Precompiled {report.module_count} modules: adds approximately "
+        f"{report.compressed_bytecode_bytes} bytes to the source archive "
+        f"({report.bytecode_bytes} bytes uncompressed), and saves approximately "
+        f"{report.compile_seconds:.2f} seconds of CPU time when the agent first imports them"
+    )
+
+    with (build_dir_path / BYTECODE_REPORT_FILE).open("w") as f:
+        json.dump(report.to_json_dict(), f, indent=2)
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class DistPublishMethod(Enum):
+    COPY = "copy"
+    HARDLINK = "hardlink"
+    MOVE = "move"
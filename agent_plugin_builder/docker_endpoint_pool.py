@@ -0,0 +1,398 @@
+import logging
+import tarfile
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getgid, getuid
+from pathlib import Path, PurePosixPath
+from typing import Any, Final, Iterator, Sequence
+
+from docker.context import ContextAPI
+from docker.errors import APIError, ContainerError, DockerException
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from pydantic import PositiveInt
+
+import docker
+
+from .build_control import get_build_control
+
+logger = logging.getLogger(__name__)
+
+
+class DockerEndpointError(Exception):
+    """Raised when no Docker endpoint is available to run a builder container."""
+
+    pass
+
+
+BUILDER_CONTAINER_LABEL: Final = "agent_plugin_builder"
+LOCAL_DOCKER_HOST_SCHEMES: Final = ("unix://", "npipe://")
+# An unhealthy endpoint is not used again until this time has passed
+UNHEALTHY_ENDPOINT_COOLDOWN: Final = 60.0
+PLACEMENT_WAIT_INTERVAL: Final = 1.0
+
+
+class DockerEndpointConfig(InfectionMonkeyBaseModel):
+    host: str
+    capacity: PositiveInt = 1
+
+
+def parse_docker_endpoint_config(docker_endpoint: str) -> DockerEndpointConfig:
+    """
+    Parse a Docker endpoint given as HOST[=CAPACITY].
+
+    :param docker_endpoint: A DOCKER_HOST URL or the name of a Docker context, optionally
+        followed by the number of builder containers which the endpoint runs concurrently.
+    :return: The configuration of the Docker endpoint.
+    :raises ValueError: If the endpoint is invalid.
+    """
+    host, separator, capacity = docker_endpoint.rpartition("=")
+    if not separator or not capacity.isdigit():
+        return DockerEndpointConfig(host=docker_endpoint)
+
+    return DockerEndpointConfig(host=host, capacity=int(capacity))
+
+
+class DockerEndpoint:
+    """
+    A Docker daemon which runs builder containers
+
+    Builder containers on a local endpoint bind-mount the build directory. The build directory
+    is copied into the builder containers on a remote endpoint, and copied back after they exit.
+    """
+
+    def __init__(self, name: str, capacity: int = 1, is_local: bool = True):
+        self.name = name
+        self.capacity = capacity
+        self.is_local = is_local
+        self._client: Any = None
+        self._client_lock = threading.Lock()
+
+    def get_client(self) -> Any:
+        """
+        Get the Docker client of the endpoint, which is shared by the builder containers and
+        the load polls on the endpoint.
+
+        :return: The Docker client of the endpoint.
+        :raises DockerException: If the endpoint is unreachable.
+        """
+        with self._client_lock:
+            if self._client is None:
+                self._client = self.create_client()
+
+            return self._client
+
+    def close_client(self):
+        """
+        Close the Docker client of the endpoint, if any. A new client is created when the
+        endpoint is used again.
+        """
+        with self._client_lock:
+            client, self._client = self._client, None
+
+        if client is not None:
+            client.close()
+
+    def create_client(self) -> Any:
+        """
+        :return: A new Docker client of the endpoint.
+        :raises DockerException: If the endpoint is unreachable.
+        """
+        return docker.from_env()  # type: ignore [attr-defined]
+
+
+class DockerHostEndpoint(DockerEndpoint):
+    """
+    A Docker daemon which is reached by a DOCKER_HOST URL, or by a Docker context
+    """
+
+    def __init__(self, host: str, capacity: int = 1):
+        super().__init__(host, capacity, is_local=_is_local_docker_host(self._get_url(host)))
+
+    def create_client(self) -> Any:
+        if "://" in self.name:
+            return docker.DockerClient(base_url=self.name)  # type: ignore [attr-defined]
+
+        context = ContextAPI.get_context(self.name)
+        if context is None:
+            raise DockerException(f"Docker context {self.name} does not exist")
+
+        return docker.DockerClient(  # type: ignore [attr-defined]
+            base_url=context.Host, tls=context.TLSConfig
+        )
+
+    @staticmethod
+    def _get_url(host: str) -> str:
+        if "://" in host:
+            return host
+
+        try:
+            context = ContextAPI.get_context(host)
+        except DockerException:
+            context = None
+
+        return "" if context is None else context.Host
+
+
+def _is_local_docker_host(url: str) -> bool:
+    return url.startswith(LOCAL_DOCKER_HOST_SCHEMES)
+
+
+def is_endpoint_failure(err: Exception) -> bool:
+    """
+    Check whether an error was caused by an unreachable Docker endpoint, rather than by the
+    builder container or by the daemon's response.
+
+    :param err: The error.
+    :return: Whether the endpoint failed.
+    """
+    return isinstance(err, (OSError, DockerException)) and not isinstance(
+        err, (APIError, ContainerError)
+    )
+
+
+class DockerEndpointPool:
+    """
+    A pool of Docker endpoints which the builder containers are placed on
+
+    Every container is placed on the healthy endpoint with the lowest load relative to its
+    capacity. The load of an endpoint is the number of running builder containers on it,
+    including the containers of other builds. If every endpoint is at capacity, the placement
+    waits for a container to exit. An endpoint which fails is not used again for a while.
+    """
+
+    def __init__(self, endpoints: Sequence[DockerEndpoint]):
+        if not endpoints:
+            raise ValueError("A Docker endpoint pool needs at least one endpoint")
+
+        self._endpoints = list(endpoints)
+        self._condition = threading.Condition()
+        self._containers: Counter[str] = Counter()
+        self._unhealthy_until: dict[str, float] = {}
+
+    @property
+    def endpoints(self) -> list[DockerEndpoint]:
+        return list(self._endpoints)
+
+    @contextmanager
+    def acquire(self, exclude: Sequence[DockerEndpoint] = ()) -> Iterator[DockerEndpoint]:
+        """
+        Reserve a slot for a builder container on the least loaded healthy endpoint.
+
+        :param exclude: Endpoints which must not be used, e.g. because they already failed
+            to run the container.
+        :raises DockerEndpointError: If no healthy endpoint is available.
+        :raises BuildCancelledError: If the build was cancelled while waiting for a slot.
+        """
+        endpoint = self._place(exclude)
+        try:
+            yield endpoint
+        finally:
+            with self._condition:
+                self._containers[endpoint.name] -= 1
+                self._condition.notify_all()
+
+    def mark_unhealthy(self, endpoint: DockerEndpoint):
+        """
+        Stop placing containers on an endpoint for a while.
+
+        :param endpoint: The endpoint which failed.
+        """
+        logger.warning(f"Docker endpoint {endpoint.name} is unhealthy")
+        # The connections of a failed endpoint may be broken, so it gets a new client
+        endpoint.close_client()
+        with self._condition:
+            self._unhealthy_until[endpoint.name] = time.monotonic() + UNHEALTHY_ENDPOINT_COOLDOWN
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Close the Docker clients of the endpoints.
+        """
+        for endpoint in self._endpoints:
+            endpoint.close_client()
+
+    def _place(self, exclude: Sequence[DockerEndpoint]) -> DockerEndpoint:
+        build_control = get_build_control()
+        excluded_names = {endpoint.name for endpoint in exclude}
+        while True:
+            if build_control is not None:
+                build_control.raise_if_cancelled()
+
+            loads = {
+                endpoint.name: self._get_load(endpoint)
+                for endpoint in self._endpoints
+                if endpoint.name not in excluded_names and self._is_healthy(endpoint)
+            }
+            with self._condition:
+                available_endpoints = []
+                for endpoint in self._endpoints:
+                    load = loads.get(endpoint.name)
+                    if load is None:
+                        continue
+
+                    load = max(load, self._containers[endpoint.name])
+                    if load < endpoint.capacity:
+                        available_endpoints.append((load / endpoint.capacity, endpoint))
+
+                if available_endpoints:
+                    _, endpoint = min(available_endpoints, key=lambda item: item[0])
+                    self._containers[endpoint.name] += 1
+                    logger.debug(f"Placing builder container on Docker endpoint {endpoint.name}")
+                    return endpoint
+
+                if not any(load is not None for load in loads.values()):
+                    raise DockerEndpointError("No healthy Docker endpoint is available")
+
+                self._condition.wait(PLACEMENT_WAIT_INTERVAL)
+
+    def _is_healthy(self, endpoint: DockerEndpoint) -> bool:
+        with self._condition:
+            return self._unhealthy_until.get(endpoint.name, 0.0) <= time.monotonic()
+
+    def _get_load(self, endpoint: DockerEndpoint) -> int | None:
+        try:
+            containers = endpoint.get_client().containers.list(
+                filters={"label": BUILDER_CONTAINER_LABEL, "status": "running"}
+            )
+        except Exception as err:
+            if not is_endpoint_failure(err):
+                raise
+
+            logger.debug(f"Unable to reach Docker endpoint {endpoint.name}: {err}")
+            self.mark_unhealthy(endpoint)
+            return None
+
+        return len(containers)
+
+
+def get_docker_endpoint_pool_from_configs(
+    docker_endpoint_configs: Sequence[DockerEndpointConfig],
+) -> DockerEndpointPool:
+    """
+    :param docker_endpoint_configs: The configurations of the Docker endpoints.
+    :return: A pool of the Docker endpoints.
+    """
+    return DockerEndpointPool(
+        [DockerHostEndpoint(config.host, config.capacity) for config in docker_endpoint_configs]
+    )
+
+
+_docker_endpoint_pool: ContextVar[DockerEndpointPool | None] = ContextVar(
+    "docker_endpoint_pool", default=None
+)
+
+
+def get_docker_endpoint_pool() -> DockerEndpointPool | None:
+    """
+    :return: The Docker endpoint pool of the current build, or None if the builder containers
+        run on the Docker daemon of the environment.
+    """
+    return _docker_endpoint_pool.get()
+
+
+@contextmanager
+def use_docker_endpoint_pool(
+    docker_endpoint_pool: DockerEndpointPool | None,
+) -> Iterator[DockerEndpointPool | None]:
+    """
+    Set the Docker endpoint pool of the builds which run in the current context.
+
+    :param docker_endpoint_pool: The Docker endpoint pool. If None, the pool of the current
+        context, if any, is kept.
+    """
+    if docker_endpoint_pool is None:
+        yield get_docker_endpoint_pool()
+        return
+
+    token = _docker_endpoint_pool.set(docker_endpoint_pool)
+    try:
+        yield docker_endpoint_pool
+    finally:
+        _docker_endpoint_pool.reset(token)
+
+
+def put_directory(container: Any, host_path: Path, container_path: str) -> set[str]:
+    """
+    Copy a directory into a container which has not started yet.
+
+    :param container: The container.
+    :param host_path: Path to the directory on the host.
+    :param container_path: Absolute path of the directory in the container.
+    :return: The paths of the copied files and directories, relative to the directory.
+    """
+    container_dir_path = PurePosixPath(container_path)
+    copied_paths: set[str] = set()
+
+    def set_owner(file_info: tarfile.TarInfo) -> tarfile.TarInfo:
+        # The builder containers run as the user of the build, which must own the copied files
+        file_info.uid, file_info.gid = getuid(), getgid()
+        relative_path = PurePosixPath(file_info.name).relative_to(container_dir_path.name)
+        if relative_path.parts:
+            copied_paths.add(str(relative_path))
+
+        return file_info
+
+    with tempfile.TemporaryFile() as archive_file:
+        with tarfile.open(fileobj=archive_file, mode="w") as tar:
+            tar.add(host_path, arcname=container_dir_path.name, filter=set_owner)
+        archive_file.seek(0)
+        container.put_archive(str(container_dir_path.parent), archive_file)
+
+    return copied_paths
+
+
+def get_directory(container: Any, container_path: str, host_path: Path, copied_paths: set[str]):
+    """
+    Copy a directory out of a container, into the directory which was copied into it.
+
+    The files which were copied into the container and were removed by it are removed from
+    the host. Files which were created on the host while the container ran are kept.
+
+    :param container: The container.
+    :param container_path: Absolute path of the directory in the container.
+    :param host_path: Path to the directory on the host.
+    :param copied_paths: The paths which were copied into the container, as returned by
+        put_directory.
+    """
+    chunks, _ = container.get_archive(container_path)
+    with tempfile.TemporaryFile() as archive_file:
+        for chunk in chunks:
+            archive_file.write(chunk)
+        archive_file.seek(0)
+
+        with tarfile.open(fileobj=archive_file, mode="r") as tar:
+            returned_paths = _extract_directory(tar, host_path)
+
+    for removed_path in sorted(copied_paths - returned_paths, reverse=True):
+        _remove_path(host_path / removed_path)
+
+
+def _extract_directory(tar: tarfile.TarFile, host_path: Path) -> set[str]:
+    extracted_paths = set()
+    members = []
+    for member in tar.getmembers():
+        relative_path = PurePosixPath(*PurePosixPath(member.name).parts[1:])
+        if not relative_path.parts or ".." in relative_path.parts:
+            continue
+
+        member.name = str(relative_path)
+        extracted_paths.add(member.name)
+        members.append(member)
+
+    host_path.mkdir(parents=True, exist_ok=True)
+    # The data filter refuses the members which would be extracted outside of the directory, e.g.
+    # through links, or which are special files
+    tar.extractall(host_path, members=members, filter="data")
+
+    return extracted_paths
+
+
+def _remove_path(path: Path):
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.is_dir() and not any(path.iterdir()):
+        path.rmdir()
@@ -0,0 +1,248 @@
+import errno
+import logging
+import os
+import shutil
+import threading
+from collections import Counter
+from enum import Enum
+from fnmatch import fnmatch
+from io import BufferedReader, BufferedWriter
+from pathlib import Path
+from typing import Callable, Final, Iterable, Sequence
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore [assignment]
+
+from .dist_publish_method import DistPublishMethod
+
+logger = logging.getLogger(__name__)
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE: Final = 0x40049409
+UNSUPPORTED_TRANSFER_ERRNOS: Final = frozenset(
+    {
+        errno.EBADF,
+        errno.EINVAL,
+        errno.ENOSYS,
+        errno.ENOTSUP,
+        errno.EOPNOTSUPP,
+        errno.ENOTTY,
+        errno.EXDEV,
+        errno.EPERM,
+    }
+)
+UNSUPPORTED_LINK_ERRNOS: Final = frozenset({errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP})
+
+
+class TransferStrategy(Enum):
+    REFLINK = "reflink"
+    COPY_FILE_RANGE = "copy_file_range"
+    SENDFILE = "sendfile"
+    COPY = "copy"
+    HARDLINK = "hardlink"
+    RENAME = "rename"
+
+
+def copy_file(src: Path, dst: Path) -> TransferStrategy:
+    """
+    Copy a file and its metadata, like shutil.copy2().
+
+    The file contents are cloned with a reflink if the filesystem supports it. Otherwise they are
+    copied in the kernel with copy_file_range() or sendfile(), and as a last resort by reading
+    and writing them.
+
+    :param src: Path to the file to copy.
+    :param dst: Path to the destination file.
+    :return: The strategy which was used to copy the file contents.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        strategy = _copy_file_contents(fsrc, fdst, os.fstat(fsrc.fileno()).st_size)
+    shutil.copystat(src, dst)
+
+    return strategy
+
+
+def _copy_file_contents(fsrc: BufferedReader, fdst: BufferedWriter, size: int) -> TransferStrategy:
+    if size == 0:
+        return TransferStrategy.COPY
+
+    copy_functions: list[tuple[TransferStrategy, Callable[[int, int, int], None]]] = [
+        (TransferStrategy.REFLINK, _reflink),
+        (TransferStrategy.COPY_FILE_RANGE, _copy_file_range),
+        (TransferStrategy.SENDFILE, _sendfile),
+    ]
+    for strategy, copy_function in copy_functions:
+        try:
+            copy_function(fsrc.fileno(), fdst.fileno(), size)
+            return strategy
+        except OSError as err:
+            if err.errno not in UNSUPPORTED_TRANSFER_ERRNOS:
+                raise
+            os.ftruncate(fdst.fileno(), 0)
+
+    shutil.copyfileobj(fsrc, fdst)
+    return TransferStrategy.COPY
+
+
+def _reflink(src_fd: int, dst_fd: int, _: int):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "Reflinks are not supported on this platform")
+
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "copy_file_range() is not supported on this platform")
+
+    offset = 0
+    while offset < size:
+        copied = os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)
+        if copied == 0:
+            break
+        offset += copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int):
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+        if sent == 0:
+            break
+        offset += sent
+
+
+def copy_tree(
+    src: Path, dst: Path, ignore: Callable[[str, list[str]], Iterable[str]] | None = None
+) -> Counter[TransferStrategy]:
+    """
+    Copy a directory tree, like shutil.copytree() with dirs_exist_ok=True, using copy_file()
+    to copy the files.
+
+    :param src: Path to the directory to copy.
+    :param dst: Path to the destination directory.
+    :param ignore: A callable which selects the names to not copy in each directory, like the
+        ignore argument of shutil.copytree().
+    :return: The number of files which were copied with each strategy.
+    :raises shutil.Error: If any of the files could not be copied.
+    """
+    strategies: Counter[TransferStrategy] = Counter()
+
+    def _copy_function(src_file: str, dst_file: str):
+        strategies[copy_file(Path(src_file), Path(dst_file))] += 1
+
+    shutil.copytree(src, dst, ignore=ignore, dirs_exist_ok=True, copy_function=_copy_function)
+
+    return strategies
+
+
+def link_file(src: Path, dst: Path) -> TransferStrategy:
+    """
+    Hard-link a file to its destination, or copy it with copy_file() if it can't be hard-linked.
+
+    :param src: Path to the file to link.
+    :param dst: Path to the destination file. An existing file is replaced.
+    :return: The strategy which was used to link or copy the file.
+    """
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+        return TransferStrategy.HARDLINK
+    except OSError as err:
+        if err.errno not in UNSUPPORTED_LINK_ERRNOS:
+            raise
+
+    return copy_file(src, dst)
+
+
+def link_tree(src: Path, dst: Path, copy_patterns: Sequence[str] = ()) -> Counter[TransferStrategy]:
+    """
+    Hard-link the files of a directory tree into a destination directory, merging it with the
+    destination's existing contents.
+
+    Files whose names match any of the copy patterns are copied with copy_file() instead, so
+    that they can be modified in place without changing the source tree.
+
+    :param src: Path to the directory to link.
+    :param dst: Path to the destination directory.
+    :param copy_patterns: Glob patterns of the names of the files to copy instead of linking.
+    :return: The number of files which were linked or copied with each strategy.
+    :raises shutil.Error: If any of the files could not be linked or copied.
+    """
+    strategies: Counter[TransferStrategy] = Counter()
+
+    def _link_function(src_file: str, dst_file: str):
+        src_file_path = Path(src_file)
+        if any(fnmatch(src_file_path.name, pattern) for pattern in copy_patterns):
+            strategies[copy_file(src_file_path, Path(dst_file))] += 1
+        else:
+            strategies[link_file(src_file_path, Path(dst_file))] += 1
+
+    shutil.copytree(src, dst, symlinks=True, dirs_exist_ok=True, copy_function=_link_function)
+
+    return strategies
+
+
+def publish_file(
+    src: Path, dst: Path, publish_method: DistPublishMethod = DistPublishMethod.COPY
+) -> TransferStrategy:
+    """
+    Publish a file to its destination, replacing any existing file atomically.
+
+    If the source and the destination are on the same filesystem, the file can be hard-linked
+    or moved instead of copied. Otherwise it is copied.
+
+    :param src: Path to the file to publish.
+    :param dst: Path to the published file.
+    :param publish_method: The method to use to publish the file.
+    :return: The strategy which was used to publish the file.
+    """
+    if publish_method != DistPublishMethod.COPY and _on_same_filesystem(src, dst.parent):
+        if publish_method == DistPublishMethod.MOVE:
+            os.replace(src, dst)
+            return TransferStrategy.RENAME
+
+        temporary_dst = get_temporary_path(dst)
+        os.link(src, temporary_dst)
+        os.replace(temporary_dst, dst)
+        return TransferStrategy.HARDLINK
+
+    if publish_method != DistPublishMethod.COPY:
+        logger.info(
+            f"Unable to {publish_method.value} {src} to {dst.parent}: Not on the same filesystem"
+        )
+
+    temporary_dst = get_temporary_path(dst)
+    try:
+        strategy = copy_file(src, temporary_dst)
+        os.replace(temporary_dst, dst)
+    finally:
+        temporary_dst.unlink(missing_ok=True)
+
+    if publish_method == DistPublishMethod.MOVE:
+        src.unlink()
+
+    return strategy
+
+
+def _on_same_filesystem(path: Path, other_path: Path) -> bool:
+    return path.stat().st_dev == other_path.stat().st_dev
+
+
+def get_temporary_path(path: Path) -> Path:
+    """
+    Get a temporary path next to a path, which is unique to the current process and thread, so
+    that concurrent builds don't write to the same temporary path.
+
+    :param path: The path.
+    :return: The temporary path.
+    """
+    return path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+
+def format_transfer_strategies(strategies: Counter[TransferStrategy]) -> str:
+    return ", ".join(
+        f"{strategy.value} ({count} files)" for strategy, count in strategies.most_common()
+    )
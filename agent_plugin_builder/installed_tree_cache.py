@@ -0,0 +1,202 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Any, Final, Sequence
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .file_transfer import TransferStrategy, copy_tree, get_temporary_path, link_tree
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR_NAME: Final = "agent_plugin_builder"
+INSTALLED_TREES_DIR: Final = "installed-trees"
+TREE_KEY_HASH_LENGTH: Final = 16
+# Shared objects are copied instead of linked, since slimming strips them in place
+COPIED_FILE_PATTERNS: Final = ("*.so", "*.so.*")
+
+
+class InstalledPackage(InfectionMonkeyBaseModel):
+    name: str
+    version: str
+    url: str
+    sha256: str | None = None
+
+    @property
+    def filename(self) -> str:
+        return self.url.split("#")[0].split("/")[-1]
+
+    @property
+    def requirement(self) -> str:
+        url = self.url.split("#")[0]
+        if self.sha256 is None:
+            return url
+
+        return f"{url}#sha256={self.sha256}"
+
+    @property
+    def tree_name(self) -> str:
+        if self.sha256 is None:
+            return self.filename
+
+        return f"{self.filename}-{self.sha256[:TREE_KEY_HASH_LENGTH]}"
+
+
+class InstallReport(InfectionMonkeyBaseModel):
+    environment: str
+    packages: tuple[InstalledPackage, ...]
+
+
+def get_default_cache_dir() -> Path:
+    """
+    Get the default cache directory of the plugin builder.
+
+    :return: Path to the cache directory, under $XDG_CACHE_HOME or ~/.cache.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if not cache_home:
+        return Path.home() / ".cache" / CACHE_DIR_NAME
+
+    return Path(cache_home) / CACHE_DIR_NAME
+
+
+def read_install_report(report_file_path: Path) -> InstallReport:
+    """
+    Read the packages which pip would install, and the environment it would install them for,
+    from a pip installation report file.
+
+    :param report_file_path: Path to the report file.
+    :return: The installation report.
+    """
+    with report_file_path.open("r") as f:
+        report = json.load(f)
+
+    environment = report["environment"]
+    packages = tuple(
+        InstalledPackage(
+            name=item["metadata"]["name"],
+            version=item["metadata"]["version"],
+            url=item["download_info"]["url"],
+            sha256=_get_sha256(item["download_info"]),
+        )
+        for item in report["install"]
+    )
+
+    return InstallReport(
+        environment=(
+            f"{environment['sys_platform']}-{environment['implementation_name']}"
+            f"{environment['python_version']}"
+        ),
+        packages=packages,
+    )
+
+
+def _get_sha256(download_info: dict[str, Any]) -> str | None:
+    archive_info = download_info.get("archive_info") or {}
+    hashes = archive_info.get("hashes") or {}
+    if "sha256" in hashes:
+        return hashes["sha256"]
+
+    algorithm, _, value = archive_info.get("hash", "").partition("=")
+    if algorithm == "sha256" and value:
+        return value
+
+    return None
+
+
+def get_tree_set_name(environment: str, pip_install_options: Sequence[str]) -> str:
+    """
+    Get the name of the set of installed trees which share an environment and pip options.
+
+    :param environment: The environment which the packages are installed for.
+    :param pip_install_options: The additional options which are passed to `pip install`.
+    :return: The name of the set of installed trees.
+    """
+    if not pip_install_options:
+        return environment
+
+    options_digest = hashlib.sha256("\0".join(pip_install_options).encode()).hexdigest()
+    return f"{environment}-{options_digest[:TREE_KEY_HASH_LENGTH]}"
+
+
+class InstalledTreeCache:
+    """
+    A cache of installed package trees, keyed by the wheel filename, its hash and the target
+    environment
+
+    Every tree contains the files which `pip install --no-deps -t` installs for one package.
+    Vendor directories are assembled by hard-linking the trees of their packages.
+    """
+
+    def __init__(self, cache_dir_path: Path):
+        self._trees_dir_path = cache_dir_path / INSTALLED_TREES_DIR
+
+    def contains(self, tree_set_name: str, package: InstalledPackage) -> bool:
+        """
+        Check whether the installed tree of a package is in the cache.
+
+        :param tree_set_name: The name of the set of installed trees.
+        :param package: The package.
+        :return: Whether the installed tree of the package is in the cache.
+        """
+        return package.sha256 is not None and self.get_tree_path(tree_set_name, package).is_dir()
+
+    def store(
+        self, tree_set_name: str, package: InstalledPackage, installed_tree_path: Path
+    ) -> Path:
+        """
+        Move the installed tree of a package into the cache.
+
+        Packages without a SHA-256 hash can't be identified reliably, and are not cached.
+
+        :param tree_set_name: The name of the set of installed trees.
+        :param package: The package.
+        :param installed_tree_path: Path to the installed tree of the package.
+        :return: Path to the installed tree, which is in the cache if it was stored.
+        """
+        if package.sha256 is None:
+            return installed_tree_path
+
+        tree_path = self.get_tree_path(tree_set_name, package)
+        tree_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_tree_path = get_temporary_path(tree_path)
+        shutil.rmtree(temporary_tree_path, ignore_errors=True)
+        try:
+            os.rename(installed_tree_path, temporary_tree_path)
+        except OSError:
+            copy_tree(installed_tree_path, temporary_tree_path)
+
+        try:
+            os.rename(temporary_tree_path, tree_path)
+        except OSError:
+            # Another build stored the same tree first
+            shutil.rmtree(temporary_tree_path, ignore_errors=True)
+
+        return tree_path
+
+    def get_tree_path(self, tree_set_name: str, package: InstalledPackage) -> Path:
+        """
+        Get the path of the installed tree of a package in the cache.
+
+        :param tree_set_name: The name of the set of installed trees.
+        :param package: The package.
+        :return: Path to the installed tree of the package in the cache.
+        """
+        return self._trees_dir_path / tree_set_name / package.tree_name
+
+
+def link_installed_tree(
+    installed_tree_path: Path, vendor_dir_path: Path
+) -> Counter[TransferStrategy]:
+    """
+    Link an installed tree into a vendor directory.
+
+    :param installed_tree_path: Path to the installed tree.
+    :param vendor_dir_path: Path to the vendor directory.
+    :return: The number of files which were linked or copied with each strategy.
+    """
+    return link_tree(installed_tree_path, vendor_dir_path, COPIED_FILE_PATTERNS)
@@ -0,0 +1,395 @@
+import logging
+import tomllib
+from pathlib import Path
+from typing import Final, Mapping, Sequence
+
+from monkeytypes import OperatingSystem
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from packaging.markers import Marker
+from packaging.requirements import InvalidRequirement, Requirement
+from packaging.tags import Tag, compatible_tags, cpython_tags
+from packaging.utils import (
+    InvalidWheelFilename,
+    NormalizedName,
+    canonicalize_name,
+    parse_wheel_filename,
+)
+
+logger = logging.getLogger(__name__)
+
+PYTHON_VERSION: Final = (3, 11)
+CPYTHON_ABI: Final = "cp311"
+# The exact glibc version of the Linux builder image is not known without running it. Assuming a
+# recent one errs towards separate vendor directories, which are always correct.
+MANYLINUX_GLIBC_MINOR_MAX: Final = 39
+MANYLINUX_LEGACY_ALIASES: Final = {17: "manylinux2014", 12: "manylinux2010", 5: "manylinux1"}
+LINUX_MARKER_ENVIRONMENT: Final = {
+    "implementation_name": "cpython",
+    "os_name": "posix",
+    "platform_machine": "x86_64",
+    "platform_python_implementation": "CPython",
+    "platform_system": "Linux",
+    "python_version": "3.11",
+    "sys_platform": "linux",
+}
+WINDOWS_MARKER_ENVIRONMENT: Final = {
+    "implementation_name": "cpython",
+    "os_name": "nt",
+    "platform_machine": "AMD64",
+    "platform_python_implementation": "CPython",
+    "platform_system": "Windows",
+    "python_version": "3.11",
+    "sys_platform": "win32",
+}
+# The patch version of the builder images' Python is not known, so markers are evaluated with
+# the lowest and the highest patch versions
+PYTHON_FULL_VERSIONS: Final = ("3.11.0", "3.11.99")
+# Markers which depend on the builder machine, or on the extras which were requested
+UNDETERMINED_MARKER_VARIABLES: Final = ("platform_release", "platform_version", "extra")
+SDIST_SUFFIXES: Final = (".tar.gz", ".zip")
+
+
+class LockedPackage(InfectionMonkeyBaseModel):
+    name: NormalizedName
+    version: str
+    files: tuple[str, ...]
+    hashes: dict[str, str] = {}
+
+
+class LockedFile(InfectionMonkeyBaseModel):
+    name: NormalizedName
+    filename: str
+    sha256: str
+
+
+def detect_common_vendor_dir_from_lock_file(build_dir_path: Path) -> bool | None:
+    """
+    Check if a common vendor directory is possible without running the builder containers.
+
+    The markers of the exported requirements are evaluated for CPython 3.11 on Linux x86_64 and
+    on Windows amd64, and the wheel which pip would choose for each platform is selected from
+    the files which the Poetry lock file lists for every required package. A common vendor
+    directory is possible if the same wheels would be installed on both platforms.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file and the Poetry lock file.
+    :return: True if a common vendor directory is possible, False if it isn't, or None if it
+        can't be determined from the lock file, e.g. if a package has no wheels, or if a marker
+        can't be evaluated.
+    """
+    requirements = _read_requirements(build_dir_path / "requirements.txt")
+    locked_packages = _read_locked_packages(build_dir_path / "poetry.lock")
+    if requirements is None or locked_packages is None:
+        return None
+
+    linux_wheels = _get_installed_wheels(
+        requirements,
+        locked_packages,
+        LINUX_MARKER_ENVIRONMENT,
+        _get_supported_tags(_get_linux_platforms()),
+    )
+    windows_wheels = _get_installed_wheels(
+        requirements,
+        locked_packages,
+        WINDOWS_MARKER_ENVIRONMENT,
+        _get_supported_tags(["win_amd64"]),
+    )
+    if linux_wheels is None or windows_wheels is None:
+        return None
+
+    differing_wheels = sorted(set(linux_wheels.items()) ^ set(windows_wheels.items()))
+    for name, wheel in differing_wheels:
+        logger.debug(f"Platform-specific package {name}: {wheel}")
+
+    return not differing_wheels
+
+
+def select_pure_python_wheels(
+    build_dir_path: Path, operating_system: OperatingSystem
+) -> list[LockedFile]:
+    """
+    Select the required packages which pip would install from pure-Python wheels.
+
+    The wheels are selected like in `detect_common_vendor_dir_from_lock_file`. Packages whose
+    marker can't be evaluated, and packages which pip would install from a platform-specific
+    wheel or from source, are not selected.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file and the Poetry lock file.
+    :param operating_system: The operating system which the packages are installed for.
+    :return: The pure-Python wheels, with their SHA-256 hashes from the lock file.
+    """
+    return [
+        locked_file
+        for locked_file in _select_locked_files(
+            build_dir_path, operating_system, include_undetermined=False
+        )
+        if locked_file.filename.endswith(".whl") and _is_pure_python_wheel(locked_file.filename)
+    ]
+
+
+def select_locked_files(
+    build_dir_path: Path, operating_system: OperatingSystem
+) -> list[LockedFile]:
+    """
+    Select the files which pip would install the required packages from.
+
+    The wheels are selected like in `detect_common_vendor_dir_from_lock_file`. A package which
+    has no supported wheel is installed from its source distribution. Packages whose marker
+    can't be evaluated are selected, since they may be installed.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file and the Poetry lock file.
+    :param operating_system: The operating system which the packages are installed for.
+    :return: The files, with their SHA-256 hashes from the lock file.
+    """
+    return _select_locked_files(build_dir_path, operating_system, include_undetermined=True)
+
+
+def _select_locked_files(
+    build_dir_path: Path, operating_system: OperatingSystem, include_undetermined: bool
+) -> list[LockedFile]:
+    requirements = _read_requirements(build_dir_path / "requirements.txt")
+    locked_packages = _read_locked_packages(build_dir_path / "poetry.lock")
+    if requirements is None or locked_packages is None:
+        return []
+
+    platforms = (
+        ["win_amd64"] if operating_system == OperatingSystem.WINDOWS else _get_linux_platforms()
+    )
+    tag_priorities = {tag: priority for priority, tag in enumerate(_get_supported_tags(platforms))}
+
+    locked_files = []
+    for requirement in requirements:
+        required = is_required(requirement, operating_system)
+        if required is False or (required is None and not include_undetermined):
+            continue
+
+        locked_package = locked_packages.get(
+            (canonicalize_name(requirement.name), str(_get_pinned_version(requirement)))
+        )
+        if locked_package is None:
+            continue
+
+        file = _select_wheel(locked_package.files, tag_priorities) or _select_sdist(
+            locked_package.files
+        )
+        if file is None:
+            continue
+
+        algorithm, _, sha256 = locked_package.hashes.get(file, "").partition(":")
+        if algorithm != "sha256" or not sha256:
+            logger.info(f"File {file} has no SHA-256 hash in the lock file")
+            continue
+
+        locked_files.append(LockedFile(name=locked_package.name, filename=file, sha256=sha256))
+
+    return locked_files
+
+
+def is_required(requirement: Requirement, operating_system: OperatingSystem) -> bool | None:
+    """
+    Check whether a requirement is installed on an operating system, by evaluating its marker.
+
+    :param requirement: The requirement.
+    :param operating_system: The operating system.
+    :return: Whether the requirement is installed, or None if its marker can't be evaluated.
+    """
+    if requirement.marker is None:
+        return True
+
+    marker_environment = (
+        WINDOWS_MARKER_ENVIRONMENT
+        if operating_system == OperatingSystem.WINDOWS
+        else LINUX_MARKER_ENVIRONMENT
+    )
+    return _evaluate_marker(requirement.marker, marker_environment)
+
+
+def parse_requirement(line: str) -> Requirement | None:
+    """
+    Parse a line of an exported requirements file.
+
+    :param line: A line of the requirements file, with its continuations joined.
+    :return: The requirement on the line, or None if the line holds no requirement.
+    :raises InvalidRequirement: If the requirement on the line is invalid.
+    """
+    line = line.split(" --hash")[0].split("#")[0].strip()
+    if not line or line.startswith("-"):
+        return None
+
+    return Requirement(line)
+
+
+def _is_pure_python_wheel(wheel: str) -> bool:
+    _, _, _, wheel_tags = parse_wheel_filename(wheel)
+    return all(tag.abi == "none" and tag.platform == "any" for tag in wheel_tags)
+
+
+def _read_requirements(requirements_file_path: Path) -> list[Requirement] | None:
+    try:
+        requirements_text = requirements_file_path.read_text()
+    except OSError as err:
+        logger.info(f"Unable to read the requirements file: {err}")
+        return None
+
+    requirements = []
+    for line in requirements_text.replace("\\\n", " ").splitlines():
+        try:
+            requirement = parse_requirement(line)
+        except InvalidRequirement as err:
+            logger.info(f"Unable to parse requirement {line}: {err}")
+            return None
+
+        if requirement is None:
+            continue
+
+        if requirement.url is not None or _get_pinned_version(requirement) is None:
+            logger.info(f"Requirement is not pinned to a locked version: {line}")
+            return None
+
+        requirements.append(requirement)
+
+    return requirements
+
+
+def _get_pinned_version(requirement: Requirement) -> str | None:
+    specifiers = list(requirement.specifier)
+    if len(specifiers) != 1 or specifiers[0].operator not in ("==", "==="):
+        return None
+
+    return specifiers[0].version
+
+
+def _read_locked_packages(
+    lock_file_path: Path,
+) -> dict[tuple[NormalizedName, str], LockedPackage] | None:
+    try:
+        with lock_file_path.open("rb") as f:
+            lock_file = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as err:
+        logger.info(f"Unable to read the lock file: {err}")
+        return None
+
+    # Lock files before version 2.0 list the files of the packages in the metadata
+    legacy_files = {
+        canonicalize_name(name): files
+        for name, files in lock_file.get("metadata", {}).get("files", {}).items()
+    }
+    locked_packages = {}
+    for package in lock_file.get("package", []):
+        files = package.get("files") or legacy_files.get(canonicalize_name(package["name"]), [])
+        locked_package = LockedPackage(
+            name=canonicalize_name(package["name"]),
+            version=package["version"],
+            files=tuple(file["file"] for file in files),
+            hashes={file["file"]: file["hash"] for file in files if "hash" in file},
+        )
+        locked_packages[(locked_package.name, locked_package.version)] = locked_package
+
+    return locked_packages
+
+
+def _get_installed_wheels(
+    requirements: Sequence[Requirement],
+    locked_packages: Mapping[tuple[NormalizedName, str], LockedPackage],
+    marker_environment: Mapping[str, str],
+    supported_tags: Sequence[Tag],
+) -> dict[NormalizedName, str] | None:
+    tag_priorities = {tag: priority for priority, tag in enumerate(supported_tags)}
+    installed_wheels = {}
+    for requirement in requirements:
+        if requirement.marker is not None:
+            required = _evaluate_marker(requirement.marker, marker_environment)
+            if required is None:
+                logger.info(f"Unable to evaluate the marker of {requirement}")
+                return None
+            if not required:
+                continue
+
+        name = canonicalize_name(requirement.name)
+        locked_package = locked_packages.get((name, str(_get_pinned_version(requirement))))
+        if locked_package is None:
+            logger.info(f"Package {requirement} is not in the lock file")
+            return None
+
+        wheel = _select_wheel(locked_package.files, tag_priorities)
+        if wheel is None:
+            logger.info(
+                f"Package {name} has no wheel for {marker_environment['sys_platform']}, "
+                "and would be built from source"
+            )
+            return None
+
+        installed_wheels[name] = wheel
+
+    return installed_wheels
+
+
+def _evaluate_marker(marker: Marker, marker_environment: Mapping[str, str]) -> bool | None:
+    if any(variable in str(marker) for variable in UNDETERMINED_MARKER_VARIABLES):
+        return None
+
+    results = {
+        marker.evaluate(
+            {
+                **marker_environment,
+                "python_full_version": python_full_version,
+                "implementation_version": python_full_version,
+            }
+        )
+        for python_full_version in PYTHON_FULL_VERSIONS
+    }
+    if len(results) != 1:
+        return None
+
+    return results.pop()
+
+
+def _select_wheel(files: Sequence[str], tag_priorities: Mapping[Tag, int]) -> str | None:
+    # pip installs the wheel with the most specific supported tag
+    wheel_priorities = {}
+    for file in files:
+        if not file.endswith(".whl"):
+            continue
+
+        try:
+            _, _, _, wheel_tags = parse_wheel_filename(file)
+        except InvalidWheelFilename:
+            continue
+
+        priorities = [tag_priorities[tag] for tag in wheel_tags if tag in tag_priorities]
+        if priorities:
+            wheel_priorities[file] = min(priorities)
+
+    if not wheel_priorities:
+        return None
+
+    return min(wheel_priorities, key=lambda file: (wheel_priorities[file], file))
+
+
+def _select_sdist(files: Sequence[str]) -> str | None:
+    # Gzipped tarballs are the standard format of source distributions, and zip files are legacy
+    sdists = sorted(
+        (file for file in files if file.endswith(SDIST_SUFFIXES)),
+        key=lambda file: (not file.endswith(".tar.gz"), file),
+    )
+    return sdists[0] if sdists else None
+
+
+def _get_supported_tags(platforms: Sequence[str]) -> list[Tag]:
+    return [
+        *cpython_tags(PYTHON_VERSION, abis=[CPYTHON_ABI], platforms=platforms),
+        *compatible_tags(PYTHON_VERSION, interpreter=CPYTHON_ABI, platforms=platforms),
+    ]
+
+
+def _get_linux_platforms() -> list[str]:
+    platforms = []
+    for glibc_minor in range(MANYLINUX_GLIBC_MINOR_MAX, 4, -1):
+        platforms.append(f"manylinux_2_{glibc_minor}_x86_64")
+        if glibc_minor in MANYLINUX_LEGACY_ALIASES:
+            platforms.append(f"{MANYLINUX_LEGACY_ALIASES[glibc_minor]}_x86_64")
+    platforms.append("linux_x86_64")
+
+    return platforms
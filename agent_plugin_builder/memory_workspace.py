@@ -0,0 +1,136 @@
+import errno
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Final
+
+logger = logging.getLogger(__name__)
+
+MEMORY_WORKSPACE_PARENT_DIRS: Final = (Path("/dev/shm"),)
+MEMORY_WORKSPACE_PREFIX: Final = "agent_plugin_builder-"
+MEMINFO_FILE_PATH: Final = Path("/proc/meminfo")
+# The staged plugin code, the source archive and the plugin archive are each at most about the
+# size of the plugin directory. The vendor directories can't be measured before they are
+# generated, so a fixed allowance is reserved for them.
+STAGED_TREE_COPIES: Final = 3
+VENDOR_DIRS_SIZE_ALLOWANCE: Final = 512 * 1024 * 1024
+# Leave the rest of the available memory to the builder containers
+MAX_AVAILABLE_MEMORY_FRACTION: Final = 0.75
+# A failed build is considered to have run out of space if less than this is left free
+OUT_OF_SPACE_THRESHOLD: Final = 16 * 1024 * 1024
+PRESERVED_WORKSPACE_FILE_PATTERNS: Final = ("*.json", "*.txt")
+
+
+def estimate_workspace_size(plugin_dir_path: Path) -> int:
+    """
+    Estimate the space that a build of the plugin needs in its build directory.
+
+    :param plugin_dir_path: Path to the plugin code directory.
+    :return: The estimated size of the build directory, in bytes.
+    """
+    plugin_dir_size = 0
+    for dir_path, _, file_names in os.walk(plugin_dir_path):
+        for file_name in file_names:
+            plugin_dir_size += (Path(dir_path) / file_name).lstat().st_size
+
+    return STAGED_TREE_COPIES * plugin_dir_size + VENDOR_DIRS_SIZE_ALLOWANCE
+
+
+def get_available_memory() -> int | None:
+    """
+    Get the memory available for starting new applications without swapping.
+
+    :return: The available memory in bytes, or None if it can't be determined.
+    """
+    try:
+        with MEMINFO_FILE_PATH.open("r") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                if key == "MemAvailable":
+                    return int(value.split()[0]) * 1024
+    except (OSError, ValueError) as err:
+        logger.debug(f"Unable to read the available memory: {err}")
+
+    return None
+
+
+def create_memory_workspace(estimated_size: int) -> Path | None:
+    """
+    Create a build directory on a memory-backed filesystem.
+
+    :param estimated_size: The estimated size of the build directory, in bytes.
+    :return: Path to the new build directory, or None if no memory-backed filesystem has room
+        for the estimated size.
+    """
+    available_memory = get_available_memory()
+    if available_memory is None:
+        logger.warning("Unable to determine the available memory")
+        return None
+
+    memory_budget = int(available_memory * MAX_AVAILABLE_MEMORY_FRACTION)
+    if estimated_size > memory_budget:
+        logger.warning(
+            f"The build needs approximately {estimated_size} bytes, which is over the "
+            f"memory budget of {memory_budget} bytes"
+        )
+        return None
+
+    for parent_dir_path in MEMORY_WORKSPACE_PARENT_DIRS:
+        if not parent_dir_path.is_dir() or not os.access(parent_dir_path, os.W_OK):
+            continue
+
+        free_space = shutil.disk_usage(parent_dir_path).free
+        if estimated_size > free_space:
+            logger.debug(
+                f"Not enough space for the build in {parent_dir_path}: {free_space} bytes free"
+            )
+            continue
+
+        workspace_path = Path(tempfile.mkdtemp(prefix=MEMORY_WORKSPACE_PREFIX, dir=parent_dir_path))
+        logger.info(f"Created memory workspace: {workspace_path}")
+        return workspace_path
+
+    logger.warning("No memory-backed filesystem with enough space for the build was found")
+    return None
+
+
+def is_out_of_space(err: Exception, workspace_path: Path) -> bool:
+    """
+    Check whether a build failed because its workspace ran out of space.
+
+    :param err: The error which the build raised.
+    :param workspace_path: Path to the workspace of the build.
+    :return: Whether the workspace ran out of space.
+    """
+    if isinstance(err, OSError) and err.errno == errno.ENOSPC:
+        return True
+
+    try:
+        return shutil.disk_usage(workspace_path).free < OUT_OF_SPACE_THRESHOLD
+    except OSError:
+        return False
+
+
+def preserve_workspace_files(workspace_path: Path, build_dir_path: Path):
+    """
+    Copy the requirements file and the build reports from a workspace to the build directory.
+
+    :param workspace_path: Path to the workspace.
+    :param build_dir_path: Path to the build directory.
+    """
+    for pattern in PRESERVED_WORKSPACE_FILE_PATTERNS:
+        for file_path in workspace_path.glob(pattern):
+            if file_path.is_file():
+                shutil.copy2(file_path, build_dir_path / file_path.name)
+
+
+def remove_memory_workspace(workspace_path: Path):
+    """
+    Remove a memory workspace and free the memory it uses.
+
+    :param workspace_path: Path to the memory workspace.
+    """
+    logger.info(f"Removing memory workspace: {workspace_path}")
+    shutil.rmtree(workspace_path, ignore_errors=True)
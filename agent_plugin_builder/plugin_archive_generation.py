@@ -1,14 +1,63 @@
+import asyncio
 import logging
-import shutil
 import tarfile
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+from typing import Callable, Iterator
 
 from monkeytypes import AgentPluginManifest
 
 from .agent_plugin_build_options import AgentPluginBuildOptions, SourceDirName
+from .archive_checksums import (
+    ArchiveChecksums,
+    HashingWriter,
+    PluginArchiveChecksums,
+    add_to_archive,
+    get_checksums_file_path,
+    read_archive_checksums,
+    read_plugin_archive_checksums,
+    write_checksums_file,
+)
+from .archive_size_analysis import analyze_source_archive
+from .build_control import (
+    AsyncBuildStep,
+    BuildControl,
+    BuildStage,
+    BuildStatistics,
+    BuildSteps,
+    build_stage,
+    ensure_build_control,
+    run_build_steps,
+    run_build_steps_async,
+    run_in_thread,
+)
+from .build_journal import get_build_journal
+from .build_result import BuildResult, get_directory_usage
+from .build_workspace import PathLock
+from .builder_images import BuilderImages
+from .bytecode_compilation import BYTECODE_CACHE_DIR, compile_bytecode
+from .dist_publish_method import DistPublishMethod
+from .docker_endpoint_pool import get_docker_endpoint_pool_from_configs, use_docker_endpoint_pool
+from .file_transfer import publish_file
+from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
 from .plugin_manifest import get_plugin_manifest_file_path
 from .plugin_schema_generation import CONFIG_SCHEMA, generate_plugin_config_schema
-from .vendor_dir_generation import generate_vendor_directories
+from .slim_rules import SlimRules
+from .stage_profiling import get_stage_profile
+from .vendor_bundle_compression import VendorBundleCompression
+from .vendor_dir_bundling import bundle_vendor_directories
+from .vendor_dir_generation import (
+    COMMON_VENDOR_DIR,
+    LINUX_VENDOR_DIR,
+    WINDOWS_VENDOR_DIR,
+    generate_requirements_file_async,
+    generate_vendor_directories,
+    install_vendor_directories,
+    resolve_builder_images_for_build,
+    start_requirements_file_step,
+)
+from .vendor_dir_slimming import slim_vendor_directories
 
 logger = logging.getLogger(__name__)
 
@@ -26,57 +75,372 @@ SOURCE = "source"
 def create_agent_plugin_archive(
     agent_plugin_build_options: AgentPluginBuildOptions,
     agent_plugin_manifest: AgentPluginManifest,
-):
+) -> BuildResult:
     """
     Create the Agent Plugin tar archive.
 
     :param agent_plugin_build_options: Agent Plugin build options.
     :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The result of the build.
     """
+    with _use_build_context(agent_plugin_build_options) as build_control:
+        return run_build_steps(
+            _get_build_steps(agent_plugin_build_options, agent_plugin_manifest, build_control)
+        )
 
-    generate_vendor_directories(
-        agent_plugin_build_options,
-        agent_plugin_manifest,
+
+@contextmanager
+def _use_build_context(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> Iterator[BuildControl]:
+    docker_endpoint_pool = None
+    if agent_plugin_build_options.docker_endpoints:
+        docker_endpoint_pool = get_docker_endpoint_pool_from_configs(
+            agent_plugin_build_options.docker_endpoints
+        )
+
+    try:
+        with ensure_build_control() as build_control, use_docker_endpoint_pool(
+            docker_endpoint_pool
+        ):
+            if build_control.profile_stage is None:
+                build_control.profile_stage = get_stage_profile(
+                    agent_plugin_build_options.profile, agent_plugin_build_options.build_dir_path
+                )
+            yield build_control
+    finally:
+        if docker_endpoint_pool is not None:
+            docker_endpoint_pool.close()
+
+
+def _get_build_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    build_control: BuildControl,
+) -> BuildSteps[BuildResult]:
+    builder_images = yield AsyncBuildStep(
+        partial(generate_vendor_directories, agent_plugin_build_options, agent_plugin_manifest),
+        partial(
+            _generate_vendor_directories_async, agent_plugin_build_options, agent_plugin_manifest
+        ),
     )
-    generate_plugin_config_schema(
-        agent_plugin_build_options.build_dir_path,
-        agent_plugin_build_options.source_dir_name,
-        agent_plugin_manifest,
+    for archive_step in _get_archive_steps(
+        agent_plugin_build_options, agent_plugin_manifest, builder_images
+    ):
+        yield archive_step
+
+    return (
+        yield partial(
+            _get_build_result,
+            agent_plugin_build_options,
+            agent_plugin_manifest,
+            builder_images,
+            build_control.statistics,
+        )
+    )
+
+
+def _get_archive_steps(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    builder_images: BuilderImages,
+) -> list[Callable[[], None]]:
+    # The stages which turn the installed vendor directories into the published archive
+    archive_steps: list[Callable[[], None]] = []
+    if agent_plugin_build_options.slim_rules is not None:
+        archive_steps.append(
+            partial(
+                _slim_vendor_directories,
+                agent_plugin_build_options,
+                agent_plugin_build_options.slim_rules,
+                builder_images,
+            )
+        )
+    archive_steps.append(
+        partial(_generate_config_schema, agent_plugin_build_options, agent_plugin_manifest)
+    )
+    if agent_plugin_build_options.precompile_bytecode:
+        archive_steps.append(partial(_compile_bytecode, agent_plugin_build_options, builder_images))
+    if agent_plugin_build_options.vendor_bundle is not None:
+        archive_steps.append(
+            partial(
+                _bundle_vendor_directories,
+                agent_plugin_build_options,
+                agent_plugin_build_options.vendor_bundle,
+            )
+        )
+    archive_steps.append(partial(_create_source_archive, agent_plugin_build_options))
+    if (
+        agent_plugin_build_options.size_report
+        or agent_plugin_build_options.size_budgets is not None
+    ):
+        archive_steps.append(partial(_analyze_source_archive, agent_plugin_build_options))
+    archive_steps.append(
+        partial(_create_plugin_archive, agent_plugin_build_options, agent_plugin_manifest)
+    )
+    archive_steps.append(
+        partial(_publish_plugin_archive, agent_plugin_build_options, agent_plugin_manifest)
+    )
+
+    return archive_steps
+
+
+def _slim_vendor_directories(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    slim_rules: SlimRules,
+    builder_images: BuilderImages,
+):
+    with build_stage(BuildStage.SLIM_VENDOR_DIRECTORIES):
+        slim_vendor_directories(
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            slim_rules,
+            builder_images,
+        )
+
+
+def _generate_config_schema(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    with build_stage(BuildStage.GENERATE_CONFIG_SCHEMA):
+        generate_plugin_config_schema(
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            agent_plugin_manifest,
+        )
+
+
+def _compile_bytecode(
+    agent_plugin_build_options: AgentPluginBuildOptions, builder_images: BuilderImages
+):
+    with build_stage(BuildStage.COMPILE_BYTECODE):
+        compile_bytecode(
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            builder_images,
+        )
+
+
+def _bundle_vendor_directories(
+    agent_plugin_build_options: AgentPluginBuildOptions, compression: VendorBundleCompression
+):
+    with build_stage(BuildStage.BUNDLE_VENDOR_DIRECTORIES):
+        bundle_vendor_directories(
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            compression,
+            include_bytecode=agent_plugin_build_options.precompile_bytecode,
+        )
+
+
+def _create_source_archive(agent_plugin_build_options: AgentPluginBuildOptions):
+    with build_stage(BuildStage.CREATE_SOURCE_ARCHIVE):
+        create_source_archive(
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            include_bytecode=agent_plugin_build_options.precompile_bytecode,
+        )
+
+
+def _analyze_source_archive(agent_plugin_build_options: AgentPluginBuildOptions):
+    with build_stage(BuildStage.ANALYZE_SOURCE_ARCHIVE):
+        analyze_source_archive(
+            agent_plugin_build_options.build_dir_path,
+            _get_source_archive_path(agent_plugin_build_options.build_dir_path),
+            agent_plugin_build_options.size_budgets,
+        )
+
+
+def _create_plugin_archive(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    with build_stage(BuildStage.CREATE_PLUGIN_ARCHIVE):
+        create_plugin_archive(agent_plugin_build_options.build_dir_path, agent_plugin_manifest)
+
+
+def _publish_plugin_archive(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    with build_stage(BuildStage.PUBLISH_PLUGIN_ARCHIVE):
+        _publish_plugin_archive_to_dist(
+            agent_plugin_build_options.build_dir_path
+            / get_plugin_archive_name(agent_plugin_manifest),
+            agent_plugin_build_options.dist_dir_path,
+            agent_plugin_build_options.dist_publish_method,
+        )
+
+
+def _get_build_result(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    builder_images: BuilderImages,
+    build_statistics: BuildStatistics,
+) -> BuildResult:
+    vendor_dir_usage = _get_vendor_dir_usage(
+        agent_plugin_build_options.build_dir_path / agent_plugin_build_options.source_dir_name
+    )
+    source_archive_path = _get_source_archive_path(agent_plugin_build_options.build_dir_path)
+    destination_filepath = agent_plugin_build_options.dist_dir_path / get_plugin_archive_name(
+        agent_plugin_manifest
+    )
+
+    return BuildResult(
+        plugin_archive_path=destination_filepath,
+        plugin_archive_size=destination_filepath.stat().st_size,
+        source_archive_size=source_archive_path.stat().st_size,
+        platform_dependencies=(
+            PlatformDependencyPackagingMethod.COMMON
+            if COMMON_VENDOR_DIR in vendor_dir_usage
+            else PlatformDependencyPackagingMethod.SEPARATE
+        ),
+        vendor_dir_sizes={name: size for name, (size, _) in vendor_dir_usage.items()},
+        vendor_file_counts={name: file_count for name, (_, file_count) in vendor_dir_usage.items()},
+        stage_durations=build_statistics.stage_durations,
+        checksums=read_plugin_archive_checksums(destination_filepath),
+        containers_run=build_statistics.containers_run,
+        installed_tree_cache_hits=build_statistics.cache_hits,
+        installed_tree_cache_misses=build_statistics.cache_misses,
+        resumed_steps=_get_resumed_steps(),
+        builder_images=builder_images,
+    )
+
+
+def _get_resumed_steps() -> tuple[str, ...]:
+    build_journal = get_build_journal()
+    return () if build_journal is None else tuple(build_journal.resumed_steps)
+
+
+def _get_vendor_dir_usage(source_dir_path: Path) -> dict[str, tuple[int, int]]:
+    return {
+        vendor_dir_name: get_directory_usage(source_dir_path / vendor_dir_name)
+        for vendor_dir_name in (COMMON_VENDOR_DIR, LINUX_VENDOR_DIR, WINDOWS_VENDOR_DIR)
+        if (source_dir_path / vendor_dir_name).is_dir()
+    }
+
+
+def _get_source_archive_path(build_dir_path: Path) -> Path:
+    return build_dir_path / f"{SOURCE}.tar.gz"
+
+
+async def create_agent_plugin_archive_async(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> BuildResult:
+    """
+    Create the Agent Plugin tar archive without blocking the event loop.
+
+    The requirements file is generated by an asyncio subprocess while the builder images are
+    resolved. The Docker client and the archive compression are blocking, so every later stage
+    runs as a separate call in a worker thread of the default executor, which is returned to
+    the executor between the stages.
+
+    The Docker SDK can only wait for a container by blocking, so a stage which runs builder
+    containers, like the installation of the vendor directories, holds a worker thread for as
+    long as its containers run.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The result of the build.
+    """
+    with _use_build_context(agent_plugin_build_options) as build_control:
+        return await run_build_steps_async(
+            _get_build_steps(agent_plugin_build_options, agent_plugin_manifest, build_control)
+        )
+
+
+async def _generate_vendor_directories_async(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> BuilderImages:
+    logger.info(
+        f"Generating vendor directories for plugin: {agent_plugin_manifest.name}, "
+        f"dependency_method: {agent_plugin_build_options.platform_dependencies}"
     )
-    create_source_archive(
-        agent_plugin_build_options.build_dir_path, agent_plugin_build_options.source_dir_name
+    builder_images, _ = await asyncio.gather(
+        run_in_thread(
+            resolve_builder_images_for_build, agent_plugin_build_options, agent_plugin_manifest
+        ),
+        _generate_requirements_file_async(agent_plugin_build_options),
     )
-    plugin_archive_path = create_plugin_archive(
-        agent_plugin_build_options.build_dir_path, agent_plugin_manifest
+    await run_in_thread(
+        install_vendor_directories,
+        agent_plugin_build_options,
+        agent_plugin_manifest,
+        builder_images,
     )
-    _copy_plugin_archive_to_dist(plugin_archive_path, agent_plugin_build_options.dist_dir_path)
+
+    return builder_images
+
+
+async def _generate_requirements_file_async(agent_plugin_build_options: AgentPluginBuildOptions):
+    journal_step = start_requirements_file_step(agent_plugin_build_options)
+    if journal_step.resumed:
+        return
+
+    with build_stage(BuildStage.GENERATE_REQUIREMENTS_FILE):
+        await generate_requirements_file_async(
+            agent_plugin_build_options.build_dir_path, agent_plugin_build_options.verify_hashes
+        )
+    journal_step.complete()
 
 
-def _copy_plugin_archive_to_dist(plugin_filepath: Path, dist_dir_path: Path):
+def _publish_plugin_archive_to_dist(
+    plugin_filepath: Path, dist_dir_path: Path, publish_method: DistPublishMethod
+) -> Path:
     if not dist_dir_path.exists():
         logger.info(f"Creating dist directory: {dist_dir_path}")
         dist_dir_path.mkdir(exist_ok=True)
 
     destination_filepath = dist_dir_path / plugin_filepath.name
-    logger.info(f"Copying plugin archive: {plugin_filepath} -> {destination_filepath}")
-    shutil.copy2(plugin_filepath, destination_filepath)
+    checksums_filepath = get_checksums_file_path(plugin_filepath)
+    # Concurrent builds of the same plugin publish the archive and its checksums together
+    with PathLock(destination_filepath):
+        logger.info(f"Publishing plugin archive: {plugin_filepath} -> {destination_filepath}")
+        transfer_strategy = publish_file(plugin_filepath, destination_filepath, publish_method)
+        logger.info(f"Published plugin archive using: {transfer_strategy.value}")
+
+        publish_file(checksums_filepath, dist_dir_path / checksums_filepath.name, publish_method)
+
+    return destination_filepath
 
 
-def create_source_archive(build_dir_path: Path, source_dir_name: SourceDirName) -> Path:
+def create_source_archive(
+    build_dir_path: Path, source_dir_name: SourceDirName, include_bytecode: bool = False
+) -> Path:
     """
     Create the source archive for the plugin.
 
+    The SHA-256 digests of the archive and of its members are computed while the archive is
+    written and are stored in a checksums file next to the archive.
+
     :param build_dir_path: Path to the build directory.
     :param source_dir_name: Name of the plugin source directory.
+    :param include_bytecode: Whether to include the bytecode caches in the archive.
     :return: Path to the source archive.
     """
-    source_archive = build_dir_path / f"{SOURCE}.tar.gz"
+    source_archive_filter = (
+        _source_archive_with_bytecode_filter if include_bytecode else _source_archive_filter
+    )
+    source_archive = _get_source_archive_path(build_dir_path)
     source_build_dir_path = build_dir_path / source_dir_name
 
     logger.info(f"Creating source archive: {source_archive} ")
-    with tarfile.open(str(source_archive), "w:gz") as tar:
-        for item in source_build_dir_path.iterdir():
-            tar.add(item, arcname=item.name, filter=_source_archive_filter)
+    member_digests: dict[str, str] = {}
+    with source_archive.open("wb") as f:
+        writer = HashingWriter(f)
+        with tarfile.open(fileobj=writer, mode="w:gz") as tar:  # type: ignore [arg-type]
+            for item in source_build_dir_path.iterdir():
+                add_to_archive(tar, item, item.name, member_digests, filter=source_archive_filter)
+
+    write_checksums_file(
+        source_archive,
+        ArchiveChecksums(
+            archive_name=source_archive.name, sha256=writer.hexdigest(), members=member_digests
+        ),
+    )
 
     return source_archive
 
@@ -87,6 +451,16 @@ def _source_archive_filter(file_info: tarfile.TarInfo) -> tarfile.TarInfo | None
     return file_info
 
 
+def _source_archive_with_bytecode_filter(file_info: tarfile.TarInfo) -> tarfile.TarInfo | None:
+    if any(
+        exclude in file_info.name
+        for exclude in EXCLUDE_SOURCE_FILES
+        if exclude != BYTECODE_CACHE_DIR
+    ):
+        return None
+    return file_info
+
+
 def create_plugin_archive(
     build_dir_path: Path,
     agent_plugin_manifest: AgentPluginManifest,
@@ -94,29 +468,53 @@ def create_plugin_archive(
     """
     Create the Agent Plugin archive.
 
+    The SHA-256 digests of the archive and of its members are computed while the archive is
+    written and are stored, together with the source archive's checksums, in a checksums file
+    next to the archive.
+
     :param build_dir_path: Path to the build directory.
     :param agent_plugin_manifest: Agent Plugin manifest.
     :return: Path to the plugin archive.
     """
 
-    plugin_archive = build_dir_path / _get_plugin_archive_name(agent_plugin_manifest)
+    plugin_archive = build_dir_path / get_plugin_archive_name(agent_plugin_manifest)
     if plugin_archive.exists():
         logger.info(f"Removing existing plugin archive: {plugin_archive}")
         plugin_archive.unlink()
 
-    source_archive = build_dir_path / f"{SOURCE}.tar.gz"
+    source_archive = _get_source_archive_path(build_dir_path)
     config_schema_file = build_dir_path / CONFIG_SCHEMA
     agent_plugin_manifest_file = get_plugin_manifest_file_path(build_dir_path)
 
     logger.info(f"Creating plugin archive: {plugin_archive}")
-    with tarfile.open(str(plugin_archive), "w") as tar:
-        tar.add(source_archive, arcname=source_archive.name)
-        tar.add(config_schema_file, arcname=config_schema_file.name)
-        tar.add(agent_plugin_manifest_file, arcname=agent_plugin_manifest_file.name)
+    member_digests: dict[str, str] = {}
+    with plugin_archive.open("wb") as f:
+        writer = HashingWriter(f)
+        with tarfile.open(fileobj=writer, mode="w") as tar:  # type: ignore [arg-type]
+            for item in (source_archive, config_schema_file, agent_plugin_manifest_file):
+                add_to_archive(tar, item, item.name, member_digests)
+
+    write_checksums_file(
+        plugin_archive,
+        PluginArchiveChecksums(
+            plugin_archive=ArchiveChecksums(
+                archive_name=plugin_archive.name,
+                sha256=writer.hexdigest(),
+                members=member_digests,
+            ),
+            source_archive=read_archive_checksums(source_archive),
+        ),
+    )
 
     logger.info(f"Plugin archive created: {plugin_archive}")
     return plugin_archive
 
 
-def _get_plugin_archive_name(agent_plugin_manifest: AgentPluginManifest) -> str:
+def get_plugin_archive_name(agent_plugin_manifest: AgentPluginManifest) -> str:
+    """
+    Get the name of the Agent Plugin archive.
+
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The name of the Agent Plugin archive.
+    """
     return f"{agent_plugin_manifest.name}-{agent_plugin_manifest.plugin_type.value.lower()}.tar"
@@ -1,7 +1,11 @@
+import importlib
 import json
 import logging
-from importlib import import_module
+import sys
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 
 from monkeytypes import AgentPluginManifest
 
@@ -12,6 +16,9 @@ logger = logging.getLogger(__name__)
 
 CONFIG_SCHEMA = "config-schema.json"
 
+# sys.path and the module cache are shared by the builds which run in the process
+_import_lock = threading.Lock()
+
 
 def generate_plugin_config_schema(
     build_dir_path: Path, source_dir_name: SourceDirName, agent_plugin_manifest: AgentPluginManifest
@@ -36,14 +43,48 @@ def generate_plugin_config_schema(
 
     config_schema = {"type": "object"}
     if plugin_options_file_path.exists():
-        plugin_options_filename = plugin_options_file_path.stem
-        import sys
-
-        sys.path.append(str(build_dir_path / source_dir_name))
-        options = getattr(import_module(plugin_options_filename), plugin_options_model_name)
-        config_schema = {"properties": options.model_json_schema()["properties"]}
+        with _import_from(plugin_options_file_path.parent):
+            # A module with the same name which was imported from elsewhere is shadowed
+            sys.modules.pop(plugin_options_file_path.stem, None)
+            options_module = importlib.import_module(plugin_options_file_path.stem)
+            options = getattr(options_module, plugin_options_model_name)
+            config_schema = {"properties": options.model_json_schema()["properties"]}
 
     logger.info(f"Generating config-schema for plugin: {agent_plugin_manifest.name}")
     schema_contents = json.dumps(config_schema)
     with plugin_config_schema_file_path.open("w") as f:
         f.write(schema_contents)
+
+
+@contextmanager
+def _import_from(source_dir_path: Path) -> Iterator[None]:
+    """
+    Import the plugin's modules from its source directory, without leaking them to the process.
+
+    The modules which are imported from the source directory are removed from the module cache
+    afterwards, and sys.path is restored, so that the builds of other plugins, or of other
+    versions of the same plugin, don't import them.
+    """
+    source_dir_path = source_dir_path.resolve()
+    with _import_lock:
+        original_path = list(sys.path)
+        original_modules = dict(sys.modules)
+        sys.path.insert(0, str(source_dir_path))
+        importlib.invalidate_caches()
+        try:
+            yield
+        finally:
+            sys.path[:] = original_path
+            for name, module in list(sys.modules.items()):
+                if _is_imported_from(module, source_dir_path):
+                    del sys.modules[name]
+            for name, module in original_modules.items():
+                sys.modules.setdefault(name, module)
+
+
+def _is_imported_from(module: object, source_dir_path: Path) -> bool:
+    module_file = getattr(module, "__file__", None)
+    if module_file is None:
+        return False
+
+    return Path(module_file).is_relative_to(source_dir_path)
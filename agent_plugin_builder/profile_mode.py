@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class ProfileMode(Enum):
+    CPU = "cpu"
+    MEMORY = "memory"
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class PullPolicy(Enum):
+    ALWAYS = "always"
+    MISSING = "missing"
+    NEVER = "never"
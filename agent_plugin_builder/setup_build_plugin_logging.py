@@ -1,14 +1,22 @@
+import atexit
+import json
 import logging
 import logging.handlers
+import queue
 import sys
+import threading
+from enum import Enum
 from pathlib import Path
+from typing import TextIO
 
 AGENT_PLUGIN_BUILDER_LOG_FILENAME = "agent_plugin_builder.log"
+AGENT_PLUGIN_BUILDER_JSONL_LOG_FILENAME = "agent_plugin_builder.log.jsonl"
 CONSOLE_FORMAT = "%(asctime)s - %(message)s"
 FILE_FORMAT = "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(funcName)s() - %(message)s"
 FILE_MAX_BYTES = 10485760
 FILE_ENCODING = "utf8"
 FILE_BACKUP_COUNT = 10
+QUEUE_BATCH_SIZE = 512
 LOG_LEVELS = {
     0: logging.CRITICAL,
     1: logging.ERROR,
@@ -18,50 +26,226 @@ LOG_LEVELS = {
 }
 
 
-def setup_logging(verbosity: int):
+class LogFileFormat(Enum):
+    TEXT = "text"
+    JSONL = "jsonl"
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "filename": record.filename,
+            "lineno": record.lineno,
+            "function": record.funcName,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry)
+
+
+class _BatchFlushMixin:
+    """
+    Defer flushing of a stream handler until the end of a batch of records
+
+    Stream handlers flush their stream after every record they emit. When records are dispatched
+    by the queue listener, the stream is flushed once per batch instead.
+    """
+
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()  # type: ignore [misc]
+
+
+class _BatchFlushStreamHandler(_BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class _BatchFlushRotatingFileHandler(_BatchFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+_STOP_LISTENER = None
+
+
+class _AddHandler:
+    """
+    A queue item which adds a handler to the queue listener
+
+    Handlers are added through the queue so that they only receive records which were logged
+    after they were added, the same as handlers which are attached to a logger directly.
+    """
+
+    def __init__(self, handler: logging.Handler):
+        self.handler = handler
+
+
+class _BatchingQueueListener:
+    """
+    Dispatch log records from a queue to the handlers on a background thread
+
+    Records are drained from the queue in batches of up to QUEUE_BATCH_SIZE records, and the
+    handlers' streams are flushed once per batch.
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue):
+        self._queue = log_queue
+        self._handlers: list[logging.Handler] = []
+        self._thread: threading.Thread | None = None
+
+    def add_handler(self, handler: logging.Handler):
+        self._queue.put(_AddHandler(handler))
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._monitor, name="agent-plugin-builder-logging", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP_LISTENER)
+        self._thread.join()
+        self._thread = None
+
+        for handler in self._handlers:
+            handler.close()
+        self._handlers.clear()
+
+    def _monitor(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < QUEUE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for item in batch:
+                if item is _STOP_LISTENER:
+                    stopping = True
+                elif isinstance(item, _AddHandler):
+                    self._handlers.append(item.handler)
+                else:
+                    self._handle(item)
+
+            self._flush_handlers()
+
+    def _handle(self, record: logging.LogRecord):
+        for handler in self._handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _flush_handlers(self):
+        for handler in self._handlers:
+            if isinstance(handler, _BatchFlushMixin):
+                handler.flush_batch()
+            else:
+                handler.flush()
+
+
+_queue_listener: _BatchingQueueListener | None = None
+
+
+def setup_logging(
+    verbosity: int, queue_logging: bool = False, console_stream: TextIO | None = None
+):
     """
     Set up the logger
 
-    :param data_dir: The data directory
-    :param log_level: A number representing log levels. If lower than 0 or higher than 4,
+    :param verbosity: A number representing log levels. If lower than 0 or higher than 4,
                       it will be set to logging.INFO, else it will be set to the
                       corresponding log level.
+    :param queue_logging: If True, log records are put on a queue and the handlers are run in
+                          batches on a background thread, so that logging does not block the
+                          build threads.
+    :param console_stream: The stream to write the console log to. If None, the standard output
+                           is used.
     """
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
-    _add_console_handler(logger, logging.Formatter(CONSOLE_FORMAT), verbosity)
+    if queue_logging:
+        _start_queue_listener(logger)
+
+    _add_console_handler(
+        logger,
+        logging.Formatter(CONSOLE_FORMAT),
+        verbosity,
+        sys.stdout if console_stream is None else console_stream,
+    )
 
 
-def add_file_handler(log_directory: Path):
+def add_file_handler(log_directory: Path, log_file_format: LogFileFormat = LogFileFormat.TEXT):
     """
     Add a file handler to the logger
 
     :param log_directory: The directory in which to write the log file
+    :param log_file_format: The format of the log file
     """
 
     logger = logging.getLogger()
-    log_file_path = _get_log_file_path(log_directory)
+    log_file_path = _get_log_file_path(log_directory, log_file_format)
     logger.info(f"Writing log file to {log_file_path}")
-    _add_file_handler(logger, logging.Formatter(FILE_FORMAT), log_file_path)
+    _add_file_handler(logger, _get_file_formatter(log_file_format), log_file_path)
 
 
-def _get_log_file_path(data_dir: Path) -> Path:
+def _get_log_file_path(data_dir: Path, log_file_format: LogFileFormat = LogFileFormat.TEXT) -> Path:
+    if log_file_format == LogFileFormat.JSONL:
+        return data_dir / AGENT_PLUGIN_BUILDER_JSONL_LOG_FILENAME
+
     return data_dir / AGENT_PLUGIN_BUILDER_LOG_FILENAME
 
 
+def _get_file_formatter(log_file_format: LogFileFormat) -> logging.Formatter:
+    if log_file_format == LogFileFormat.JSONL:
+        return JsonLinesFormatter()
+
+    return logging.Formatter(FILE_FORMAT)
+
+
+def _start_queue_listener(logger: logging.Logger):
+    global _queue_listener
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_listener = _BatchingQueueListener(log_queue)
+    _queue_listener.start()
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
 def _add_file_handler(logger: logging.Logger, formatter: logging.Formatter, file_path: Path):
-    fh = logging.handlers.RotatingFileHandler(
+    handler_class = (
+        logging.handlers.RotatingFileHandler
+        if _queue_listener is None
+        else _BatchFlushRotatingFileHandler
+    )
+    fh = handler_class(
         file_path, maxBytes=FILE_MAX_BYTES, backupCount=FILE_BACKUP_COUNT, encoding=FILE_ENCODING
     )
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(formatter)
 
-    logger.addHandler(fh)
+    _add_handler(logger, fh)
 
 
-def _add_console_handler(logger: logging.Logger, formatter: logging.Formatter, verbosity: int):
-    ch = logging.StreamHandler(stream=sys.stdout)
+def _add_console_handler(
+    logger: logging.Logger, formatter: logging.Formatter, verbosity: int, stream: TextIO
+):
+    handler_class = logging.StreamHandler if _queue_listener is None else _BatchFlushStreamHandler
+    ch = handler_class(stream=stream)
 
     if verbosity < 0 or verbosity > 5:
         log_level = logging.INFO
@@ -71,11 +255,39 @@ def _add_console_handler(logger: logging.Logger, formatter: logging.Formatter, v
 
     ch.setFormatter(formatter)
 
-    logger.addHandler(ch)
+    _add_handler(logger, ch)
+
+
+def _add_handler(logger: logging.Logger, handler: logging.Handler):
+    if _queue_listener is None:
+        logger.addHandler(handler)
+    else:
+        _queue_listener.add_handler(handler)
+
+
+def shutdown_logging():
+    """
+    Stop the background logging thread, if any, after all queued records have been handled
+    """
+    global _queue_listener
+
+    logger = logging.getLogger()
+    for handler in list(logger.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            logger.removeHandler(handler)
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(shutdown_logging)
 
 
 def reset_logger():
+    shutdown_logging()
+
     logger = logging.getLogger()
 
-    for handler in logger.handlers:
+    for handler in list(logger.handlers):
         logger.removeHandler(handler)
@@ -0,0 +1,39 @@
+from pathlib import Path
+from typing import Annotated
+
+import yaml
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from pydantic import Field, NonNegativeInt
+
+
+class SizeBudgets(InfectionMonkeyBaseModel):
+    max_compressed_bytes: Annotated[
+        NonNegativeInt | None,
+        Field(title="The maximum size of the source archive, in bytes."),
+    ] = None
+    max_uncompressed_bytes: Annotated[
+        NonNegativeInt | None,
+        Field(title="The maximum size of the contents of the source archive, in bytes."),
+    ] = None
+    max_vendor_dir_bytes: Annotated[
+        NonNegativeInt | None,
+        Field(title="The maximum size of the contents of each vendor directory, in bytes."),
+    ] = None
+    max_package_bytes: Annotated[
+        NonNegativeInt | None,
+        Field(title="The maximum size of the contents of each vendored package, in bytes."),
+    ] = None
+
+
+def get_size_budgets(size_budgets_file_path: Path) -> SizeBudgets:
+    """
+    Get the size budgets from a YAML file.
+
+    :param size_budgets_file_path: Path to a YAML file with the size budgets. Budgets which are
+        not specified in the file are not enforced.
+    :raises FileNotFoundError: If the size budgets file does not exist.
+    :raises yaml.YAMLError: If the size budgets file is not a valid YAML file.
+    :return: The size budgets.
+    """
+    with size_budgets_file_path.open("r") as f:
+        return SizeBudgets(**(yaml.safe_load(f) or {}))
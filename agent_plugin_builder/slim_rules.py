@@ -0,0 +1,59 @@
+from pathlib import Path
+from typing import Annotated
+
+import yaml
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+from pydantic import Field
+
+# Singular "test" and "doc" are left out, since they are also the names of runtime packages, like
+# future.backports.test
+DEFAULT_SLIM_REMOVE_PATTERNS = (
+    "tests",
+    "docs",
+    "*.pyi",
+    "*.dist-info/RECORD",
+    "__pycache__",
+    "*.pyc",
+)
+
+
+class SlimRules(InfectionMonkeyBaseModel):
+    remove_patterns: Annotated[
+        tuple[str, ...],
+        Field(
+            title="Patterns of the vendored files and directories to remove.",
+            description="""Patterns are matched against the end of each path relative to the
+            vendor directory, e.g. "tests" matches every directory or file named "tests", and
+            "*.dist-info/RECORD" matches the RECORD file of every installed distribution.
+            """,
+        ),
+    ] = DEFAULT_SLIM_REMOVE_PATTERNS
+    strip_shared_objects: Annotated[
+        bool,
+        Field(
+            title="Whether to strip debug symbols from vendored Linux shared objects.",
+        ),
+    ] = True
+    compile_bytecode: Annotated[
+        bool,
+        Field(
+            title="Whether pip should compile bytecode while installing the dependencies.",
+        ),
+    ] = False
+
+
+def get_slim_rules(slim_rules_file_path: Path | None = None) -> SlimRules:
+    """
+    Get the slim rules from a YAML file, or the default slim rules.
+
+    :param slim_rules_file_path: Path to a YAML file with the slim rules. Rules which are not
+        specified in the file take their default values.
+    :raises FileNotFoundError: If the slim rules file does not exist.
+    :raises yaml.YAMLError: If the slim rules file is not a valid YAML file.
+    :return: The slim rules.
+    """
+    if slim_rules_file_path is None:
+        return SlimRules()
+
+    with slim_rules_file_path.open("r") as f:
+        return SlimRules(**(yaml.safe_load(f) or {}))
@@ -0,0 +1,192 @@
+import cProfile
+import io
+import logging
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Final, Iterator
+
+from .build_control import BuildStage, StageProfile
+from .profile_mode import ProfileMode
+
+logger = logging.getLogger(__name__)
+
+# The stages which run on the host, rather than in the builder containers
+PROFILED_STAGES: Final = (
+    BuildStage.STAGE_PLUGIN_CODE,
+    BuildStage.GENERATE_CONFIG_SCHEMA,
+    BuildStage.BUNDLE_VENDOR_DIRECTORIES,
+    BuildStage.CREATE_SOURCE_ARCHIVE,
+    BuildStage.ANALYZE_SOURCE_ARCHIVE,
+    BuildStage.CREATE_PLUGIN_ARCHIVE,
+    BuildStage.PUBLISH_PLUGIN_ARCHIVE,
+)
+PROFILE_FILE_SUFFIXES: Final = {ProfileMode.CPU: ".pstats", ProfileMode.MEMORY: ".snapshot"}
+PROFILE_SUMMARY_LENGTH: Final = 20
+TRACEMALLOC_FRAMES: Final = 10
+
+
+def get_profile_file_path(
+    build_dir_path: Path, stage: BuildStage, profile_mode: ProfileMode
+) -> Path:
+    """
+    :param build_dir_path: Path to the build directory.
+    :param stage: The profiled build stage.
+    :param profile_mode: What was profiled.
+    :return: Path to the profile of the stage.
+    """
+    return build_dir_path / f"profile_{stage.value}{PROFILE_FILE_SUFFIXES[profile_mode]}"
+
+
+class StageProfiler:
+    """
+    Profiles the build stages which run on the host, and writes a profile of every stage to the
+    build directory
+
+    CPU profiles are written as pstats files, and memory profiles as tracemalloc snapshots. The
+    top entries of every profile are logged.
+    """
+
+    def __init__(self, profile_mode: ProfileMode, build_dir_path: Path):
+        self._profile_mode = profile_mode
+        self._build_dir_path = build_dir_path
+
+    @contextmanager
+    def profile(self, stage: BuildStage) -> Iterator[None]:
+        """
+        Profile a build stage. Stages which run in the builder containers are not profiled.
+
+        :param stage: The build stage.
+        """
+        if stage not in PROFILED_STAGES:
+            yield
+            return
+
+        profile_file_path = get_profile_file_path(self._build_dir_path, stage, self._profile_mode)
+        if self._profile_mode == ProfileMode.CPU:
+            with _profile_cpu(stage, profile_file_path):
+                yield
+        else:
+            with _profile_memory(stage, profile_file_path):
+                yield
+
+
+# Since Python 3.12, only one CPU profiler can be enabled in the process at a time
+_cpu_profiling_lock = threading.Lock()
+
+
+@contextmanager
+def _profile_cpu(stage: BuildStage, profile_file_path: Path) -> Iterator[None]:
+    if not _cpu_profiling_lock.acquire(blocking=False):
+        logger.warning(
+            f"Not profiling stage {stage.value}, since a stage of a concurrent build is profiled"
+        )
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _write_cpu_profile(stage, profile_file_path, profiler)
+    finally:
+        _cpu_profiling_lock.release()
+
+
+def _write_cpu_profile(stage: BuildStage, profile_file_path: Path, profiler: cProfile.Profile):
+    profile_file_path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(profile_file_path)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(
+        PROFILE_SUMMARY_LENGTH
+    )
+    logger.info(f"CPU profile of stage {stage.value}: {profile_file_path}\n{summary.getvalue()}")
+
+
+@contextmanager
+def _profile_memory(stage: BuildStage, profile_file_path: Path) -> Iterator[None]:
+    with _memory_tracing.trace() as concurrently_traced:
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_size = tracemalloc.get_traced_memory()
+            concurrently_traced = concurrently_traced or _memory_tracing.users > 1
+
+    profile_file_path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot.dump(str(profile_file_path))
+
+    top_statistics = snapshot.statistics("lineno")[:PROFILE_SUMMARY_LENGTH]
+    summary = "\n".join(str(statistic) for statistic in top_statistics)
+    concurrency_note = (
+        " (including the allocations of concurrently profiled builds)"
+        if concurrently_traced
+        else ""
+    )
+    logger.info(
+        f"Memory profile of stage {stage.value}: {profile_file_path}\n"
+        f"Peak traced memory{concurrency_note}: {peak_size} bytes\n{summary}"
+    )
+
+
+class _MemoryTracing:
+    """
+    The memory tracing of the profiled stages, which is shared by the concurrent builds
+
+    The allocations are traced by the whole process, so the tracing is started by the first
+    profiled stage and stopped by the last one. Tracing which was started by someone else is
+    left running.
+    """
+
+    def __init__(self):
+        self.users = 0
+        self._started_tracing = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def trace(self) -> Iterator[bool]:
+        """
+        Trace the allocations while a stage is profiled.
+
+        :return: Whether other stages were already traced when the tracing of the stage began.
+        """
+        with self._lock:
+            concurrently_traced = self.users > 0
+            if not concurrently_traced:
+                self._started_tracing = not tracemalloc.is_tracing()
+                if self._started_tracing:
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                tracemalloc.reset_peak()
+            self.users += 1
+
+        try:
+            yield concurrently_traced
+        finally:
+            with self._lock:
+                self.users -= 1
+                if self.users == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+
+
+_memory_tracing = _MemoryTracing()
+
+
+def get_stage_profile(
+    profile_mode: ProfileMode | None, build_dir_path: Path
+) -> StageProfile | None:
+    """
+    :param profile_mode: What to profile, or None if the stages are not profiled.
+    :param build_dir_path: Path to the build directory, which the profiles are written to.
+    :return: A callable which profiles a build stage, or None if the stages are not profiled.
+    """
+    if profile_mode is None:
+        return None
+
+    return StageProfiler(profile_mode, build_dir_path).profile
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class VendorBundleCompression(Enum):
+    STORED = "stored"
+    DEFLATED = "deflated"
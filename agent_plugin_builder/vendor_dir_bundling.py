@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import shutil
+import zipfile
+from pathlib import Path
+from typing import Final
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .agent_plugin_build_options import SourceDirName
+from .bytecode_compilation import AGENT_PYTHON_VERSION, BYTECODE_CACHE_DIR
+from .vendor_bundle_compression import VendorBundleCompression
+from .vendor_dir_slimming import VENDOR_DIR_NAMES
+
+logger = logging.getLogger(__name__)
+
+VENDOR_BUNDLE: Final = "bundle.zip"
+VENDOR_BUNDLE_REPORT_FILE: Final = "vendor_bundle_report.json"
+ZIP_COMPRESSION: Final = {
+    VendorBundleCompression.STORED: zipfile.ZIP_STORED,
+    VendorBundleCompression.DEFLATED: zipfile.ZIP_DEFLATED,
+}
+NATIVE_EXTENSION_SUFFIXES: Final = (".so", ".pyd", ".dll", ".dylib")
+MODULE_SUFFIXES: Final = (".py", ".pyi", ".pyc")
+TYPING_MARKER: Final = "py.typed"
+METADATA_DIR_SUFFIXES: Final = (".dist-info", ".egg-info", ".data")
+# setuptools marks the packages which must not be imported from a zip file in their egg-info
+NOT_ZIP_SAFE_FLAG: Final = "not-zip-safe"
+BYTECODE_SUFFIX: Final = f".cpython-{''.join(map(str, AGENT_PYTHON_VERSION))}.pyc"
+
+NATIVE_EXTENSION: Final = "contains native extensions"
+NOT_ZIP_SAFE: Final = "is marked as not zip-safe"
+DATA_FILES_BY_PATH: Final = "reads data files by the path of its modules"
+NOT_A_MODULE: Final = "is not a Python package or module"
+
+
+class VendorDirBundle(InfectionMonkeyBaseModel):
+    bundled_entries: tuple[str, ...]
+    loose_entries: dict[str, str]
+    file_count_before: int
+    file_count_after: int
+
+
+class VendorBundleReport(InfectionMonkeyBaseModel):
+    vendor_dirs: dict[str, VendorDirBundle]
+
+    @property
+    def removed_file_count(self) -> int:
+        return sum(
+            bundle.file_count_before - bundle.file_count_after
+            for bundle in self.vendor_dirs.values()
+        )
+
+
+def bundle_vendor_directories(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    compression: VendorBundleCompression = VendorBundleCompression.STORED,
+    include_bytecode: bool = False,
+) -> VendorBundleReport:
+    """
+    Bundle the zip-safe pure-Python packages of every vendor directory into a zip file, which
+    the agent can import them from by putting it on `sys.path` after the vendor directory.
+
+    Every top-level package and module of a vendor directory is checked for zip safety. The
+    packages which contain native extensions, which are marked as not zip-safe, or which have
+    data files and use `__file__`, are left as loose files, together with the metadata of all
+    the packages. A report of the bundled and the loose entries, and of the number of files
+    before and after bundling, is written to the build directory.
+
+    :param build_dir_path: Path to the build directory.
+    :param source_dir_name: Name of the plugin source directory.
+    :param compression: How the files are compressed in the zip file.
+    :param include_bytecode: Whether to bundle the compiled bytecode of the modules, which
+        zipimport loads from next to their sources.
+    :return: A report of the bundled vendor directories.
+    """
+    source_dir_path = build_dir_path / source_dir_name
+    vendor_dirs = {}
+    for vendor_dir_name in VENDOR_DIR_NAMES:
+        vendor_dir_path = source_dir_path / vendor_dir_name
+        if vendor_dir_path.is_dir():
+            vendor_dirs[vendor_dir_name] = _bundle_vendor_directory(
+                vendor_dir_path, compression, include_bytecode
+            )
+
+    vendor_bundle_report = VendorBundleReport(vendor_dirs=vendor_dirs)
+    _write_vendor_bundle_report(build_dir_path, vendor_bundle_report)
+
+    return vendor_bundle_report
+
+
+def _bundle_vendor_directory(
+    vendor_dir_path: Path, compression: VendorBundleCompression, include_bytecode: bool
+) -> VendorDirBundle:
+    file_count_before = _count_files(vendor_dir_path)
+    not_zip_safe_names = _get_not_zip_safe_names(vendor_dir_path)
+    bundled_paths = []
+    loose_entries = {}
+    for path in sorted(vendor_dir_path.iterdir()):
+        if path.name in (VENDOR_BUNDLE, BYTECODE_CACHE_DIR) or path.name.endswith(
+            METADATA_DIR_SUFFIXES
+        ):
+            continue
+
+        reason = _get_loose_reason(path, not_zip_safe_names)
+        if reason is None:
+            bundled_paths.append(path)
+        else:
+            logger.debug(f"Not bundling {vendor_dir_path.name}/{path.name}: it {reason}")
+            loose_entries[path.name] = reason
+
+    if bundled_paths:
+        _write_bundle(vendor_dir_path, bundled_paths, compression, include_bytecode)
+        for path in bundled_paths:
+            _remove_bundled_path(path)
+
+    return VendorDirBundle(
+        bundled_entries=tuple(path.name for path in bundled_paths),
+        loose_entries=loose_entries,
+        file_count_before=file_count_before,
+        file_count_after=_count_files(vendor_dir_path),
+    )
+
+
+def _get_not_zip_safe_names(vendor_dir_path: Path) -> set[str]:
+    not_zip_safe_names = set()
+    for egg_info_path in vendor_dir_path.glob("*.egg-info"):
+        if not (egg_info_path / NOT_ZIP_SAFE_FLAG).exists():
+            continue
+
+        top_level_path = egg_info_path / "top_level.txt"
+        if top_level_path.exists():
+            not_zip_safe_names.update(top_level_path.read_text().split())
+
+    return not_zip_safe_names
+
+
+def _get_loose_reason(path: Path, not_zip_safe_names: set[str]) -> str | None:
+    if path.name.split(".")[0] in not_zip_safe_names:
+        return NOT_ZIP_SAFE
+    if path.is_symlink():
+        return NOT_A_MODULE
+    if path.is_dir():
+        return _get_package_loose_reason(path)
+    if path.suffix in NATIVE_EXTENSION_SUFFIXES:
+        return NATIVE_EXTENSION
+
+    return None if path.suffix == ".py" else NOT_A_MODULE
+
+
+def _get_package_loose_reason(package_path: Path) -> str | None:
+    has_modules = False
+    has_data_files = False
+    uses_file_path = False
+    for dir_path, dir_names, file_names in os.walk(package_path):
+        if BYTECODE_CACHE_DIR in dir_names:
+            dir_names.remove(BYTECODE_CACHE_DIR)
+        for file_name in file_names:
+            file_path = Path(dir_path, file_name)
+            if file_path.suffix in NATIVE_EXTENSION_SUFFIXES or ".so." in file_name:
+                return NATIVE_EXTENSION
+            if file_path.suffix == ".py":
+                has_modules = True
+                uses_file_path = uses_file_path or b"__file__" in file_path.read_bytes()
+            elif file_path.suffix not in MODULE_SUFFIXES and file_name != TYPING_MARKER:
+                has_data_files = True
+
+    if not has_modules:
+        return NOT_A_MODULE
+    if has_data_files and uses_file_path:
+        return DATA_FILES_BY_PATH
+
+    return None
+
+
+def _write_bundle(
+    vendor_dir_path: Path,
+    bundled_paths: list[Path],
+    compression: VendorBundleCompression,
+    include_bytecode: bool,
+):
+    bundle_path = vendor_dir_path / VENDOR_BUNDLE
+    logger.info(f"Bundling {len(bundled_paths)} packages and modules into {bundle_path}")
+    # A resumed build appends the packages which weren't bundled before
+    with zipfile.ZipFile(bundle_path, "a", compression=ZIP_COMPRESSION[compression]) as bundle:
+        for file_path, arcname in _get_bundled_files(vendor_dir_path, bundled_paths):
+            if arcname.endswith(".pyc") and not include_bytecode:
+                continue
+            bundle.write(file_path, arcname)
+
+
+def _get_bundled_files(vendor_dir_path: Path, bundled_paths: list[Path]) -> list[tuple[Path, str]]:
+    bundled_files = []
+    for path in bundled_paths:
+        if path.is_file():
+            bundled_files.append((path, path.name))
+            bytecode_path = _get_bytecode_path(path)
+            if bytecode_path.exists():
+                bundled_files.append((bytecode_path, path.with_suffix(".pyc").name))
+            continue
+
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            if Path(dir_path).name == BYTECODE_CACHE_DIR:
+                continue
+            for file_name in sorted(file_names):
+                file_path = Path(dir_path, file_name)
+                arcname = file_path.relative_to(vendor_dir_path).as_posix()
+                bundled_files.append((file_path, arcname))
+                bytecode_path = _get_bytecode_path(file_path)
+                if file_path.suffix == ".py" and bytecode_path.exists():
+                    # zipimport only loads bytecode from next to the source of the module
+                    bundled_files.append((bytecode_path, arcname.removesuffix(".py") + ".pyc"))
+
+    return bundled_files
+
+
+def _get_bytecode_path(module_path: Path) -> Path:
+    return module_path.parent / BYTECODE_CACHE_DIR / f"{module_path.stem}{BYTECODE_SUFFIX}"
+
+
+def _remove_bundled_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path)
+        return
+
+    path.unlink()
+    _get_bytecode_path(path).unlink(missing_ok=True)
+    bytecode_cache_path = path.parent / BYTECODE_CACHE_DIR
+    if bytecode_cache_path.is_dir() and not any(bytecode_cache_path.iterdir()):
+        bytecode_cache_path.rmdir()
+
+
+def _count_files(path: Path) -> int:
+    return sum(len(file_names) for _, _, file_names in os.walk(path))
+
+
+def _write_vendor_bundle_report(build_dir_path: Path, vendor_bundle_report: VendorBundleReport):
+    for vendor_dir_name, bundle in vendor_bundle_report.vendor_dirs.items():
+        logger.info(
+            f"Bundled {len(bundle.bundled_entries)} packages and modules of {vendor_dir_name}, "
+            f"leaving {len(bundle.loose_entries)} loose: {bundle.file_count_before} files "
+            f"reduced to {bundle.file_count_after}"
+        )
+    logger.info(
+        f"Bundled vendor directories: {vendor_bundle_report.removed_file_count} fewer files"
+    )
+
+    with (build_dir_path / VENDOR_BUNDLE_REPORT_FILE).open("w") as f:
+        json.dump(vendor_bundle_report.to_json_dict(), f, indent=2)
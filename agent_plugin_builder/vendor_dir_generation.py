@@ -1,16 +1,67 @@
+import asyncio
 import json
 import logging
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from contextvars import copy_context
+from functools import partial
 from os import getgid, getuid
 from pathlib import Path
 from shlex import quote
-from typing import Final, Sequence
+from typing import Callable, Final, Sequence
 
+from docker.errors import ContainerError, ImageNotFound
 from monkeytypes import AgentPluginManifest, OperatingSystem
+from packaging.utils import canonicalize_name
 
 import docker
 
 from .agent_plugin_build_options import AgentPluginBuildOptions, SourceDirName
+from .artifact_prefetching import (
+    BUILD_WHEELHOUSE_DIR,
+    CONTAINER_WHEELHOUSE_PATH,
+    get_wheelhouse_path,
+    prefetch_artifacts,
+)
+from .autodetect_cache import AutodetectCache, get_autodetect_key
+from .build_control import BuildStage, build_stage, get_build_control
+from .build_journal import JournalStep, start_journal_step, use_build_journal
+from .builder_images import DEFAULT_BUILDER_IMAGES, BuilderImages, resolve_builder_images
+from .docker_endpoint_pool import (
+    BUILDER_CONTAINER_LABEL,
+    DockerEndpoint,
+    get_directory,
+    get_docker_endpoint_pool,
+    is_endpoint_failure,
+    put_directory,
+)
+from .file_transfer import TransferStrategy, format_transfer_strategies
+from .installed_tree_cache import (
+    InstalledPackage,
+    InstalledTreeCache,
+    get_default_cache_dir,
+    get_tree_set_name,
+    link_installed_tree,
+    read_install_report,
+)
+from .lock_file_analysis import detect_common_vendor_dir_from_lock_file
 from .platform_dependency_packaging_method import PlatformDependencyPackagingMethod
+from .wheel_installation import (
+    VerifiedWheel,
+    install_verified_wheels,
+    verify_pure_python_wheels,
+    write_remaining_requirements,
+)
+from .wine_prefix_cache import (
+    WINDOWS_IMAGE_INIT_COMMAND,
+    WINE_PREFIX_CREATE_COMMANDS,
+    WINE_PREFIX_INIT_COMMAND,
+    WINE_PREFIX_MOUNT_PATH,
+    WinePrefixCache,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +72,18 @@ class CommandRunError(Exception):
     pass
 
 
-LINUX_PLUGIN_BUILDER_IMAGE: Final = "infectionmonkey/agent-builder:latest"
-WINDOWS_PLUGIN_BUILDER_IMAGE: Final = "infectionmonkey/plugin-builder:latest"
+COMMON_VENDOR_DIR: Final = "vendor"
+LINUX_VENDOR_DIR: Final = "vendor-linux"
+WINDOWS_VENDOR_DIR: Final = "vendor-windows"
+AUTODETECT_JOURNAL_STEP: Final = "autodetect_platform_dependencies"
+VENDOR_DIR_PROCESSING_JOURNAL_STEP: Final = "vendor_dir_processing"
 LINUX_PACKAGE_LIST_FILE: Final = "linux_packages.json"
 WINDOWS_PACKAGE_LIST_FILE: Final = "windows_packages.json"
+INSTALLED_TREES_STAGING_DIR: Final = ".installed-trees"
+# The common vendor directory is installed here while the Windows requirements are resolved, and
+# is moved to the source directory once the decision is made
+SPECULATIVE_INSTALL_DIR: Final = ".speculative-install"
+PIP_INSTALL_PACKAGE_TREE_COMMAND: Final = "pip install --no-deps -t {tree_path} {requirement}"
 LINUX_VENV_COMMANDS: Final = [
     'export PIP_CACHE_DIR="$(mktemp -d)"',
     'export VENV_DIR="$(mktemp -d)"',
@@ -46,19 +105,39 @@ LINUX_BUILD_VENDOR_DIR_COMMANDS: Final = " && ".join(
         "pip install -r requirements.txt -t {vendor_path}",
     ]
 )
-WINDOWS_IMAGE_INIT_COMMAND: Final = ". /opt/mkuserwineprefix"
+LINUX_STRIP_SHARED_OBJECTS_COMMANDS: Final = (
+    "if command -v strip > /dev/null; "
+    "then find {vendor_paths} -type f \\( -name '*.so' -o -name '*.so.*' \\) "
+    "-exec strip --strip-debug {{}} +; "
+    "else echo 'strip is not available, skipping'; fi"
+)
+# The requirements which are not installed from pure-Python wheels on the host are complete with
+# their dependencies, which must not be resolved again
+LINUX_BUILD_REMAINING_VENDOR_DIR_COMMANDS: Final = " && ".join(
+    [
+        *LINUX_VENV_COMMANDS,
+        "cd /plugin",
+        "pip install --no-deps -r {requirements_file} -t {vendor_path}",
+    ]
+)
+PIP_NO_COMPILE_OPTION: Final = "--no-compile"
+# The Windows commands run after the Wine prefix is initialized
 WINDOWS_BUILD_PACKAGE_LIST_COMMANDS: Final = " && ".join(
     [
-        WINDOWS_IMAGE_INIT_COMMAND,
         "cd /plugin",
         "wine pip install --dry-run -r requirements.txt --report {filename}",
     ]
 )
 WINDOWS_BUILD_VENDOR_DIR_COMMANDS: Final = " && ".join(
     [
-        WINDOWS_IMAGE_INIT_COMMAND,
         "cd /plugin",
-        "wine pip install -r requirements.txt -t {source_dir_name}/vendor-windows",
+        "wine pip install -r requirements.txt -t {source_dir_name}/" + WINDOWS_VENDOR_DIR,
+    ]
+)
+WINDOWS_BUILD_REMAINING_VENDOR_DIR_COMMANDS: Final = " && ".join(
+    [
+        "cd /plugin",
+        "wine pip install --no-deps -r {requirements_file} -t {vendor_path}",
     ]
 )
 
@@ -66,7 +145,7 @@ WINDOWS_BUILD_VENDOR_DIR_COMMANDS: Final = " && ".join(
 def generate_vendor_directories(
     agent_plugin_build_options: AgentPluginBuildOptions,
     agent_plugin_manifest: AgentPluginManifest,
-):
+) -> BuilderImages:
     """
     Generate the vendor directories for the plugin.
 
@@ -74,19 +153,128 @@ def generate_vendor_directories(
     function will try to generate a common vendor directory. If a common vendor directory is not
     possible, it will generate separate vendor directories for each supported operating system.
 
+    The builder images which the build needs are pulled and pinned to their digests while the
+    requirements file is generated.
+
     :param agent_plugin_build_options: Agent Plugin build options.
     :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The builder images which the vendor directories were generated with.
     """
     logger.info(
         f"Generating vendor directories for plugin: {agent_plugin_manifest.name}, "
         f"dependency_method: {agent_plugin_build_options.platform_dependencies}"
     )
-    generate_requirements_file(
-        agent_plugin_build_options.build_dir_path, agent_plugin_build_options.verify_hashes
+    context = copy_context()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="builder-images") as executor:
+        builder_images_future = executor.submit(
+            lambda: context.run(
+                resolve_builder_images_for_build, agent_plugin_build_options, agent_plugin_manifest
+            )
+        )
+        journal_step = start_requirements_file_step(agent_plugin_build_options)
+        if not journal_step.resumed:
+            with build_stage(BuildStage.GENERATE_REQUIREMENTS_FILE):
+                generate_requirements_file(
+                    agent_plugin_build_options.build_dir_path,
+                    agent_plugin_build_options.verify_hashes,
+                )
+            journal_step.complete()
+        builder_images = builder_images_future.result()
+
+    install_vendor_directories(agent_plugin_build_options, agent_plugin_manifest, builder_images)
+
+    return builder_images
+
+
+def start_requirements_file_step(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> JournalStep:
+    """
+    Start the generation of the requirements file in the journal of the build.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :return: The journal step. If it wasn't resumed, the requirements file must be generated.
+    """
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    return start_journal_step(
+        BuildStage.GENERATE_REQUIREMENTS_FILE.value,
+        inputs=[
+            build_dir_path / "pyproject.toml",
+            build_dir_path / "poetry.lock",
+            f"verify_hashes={agent_plugin_build_options.verify_hashes}",
+        ],
+        outputs=[build_dir_path / "requirements.txt"],
     )
+
+
+def resolve_builder_images_for_build(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> BuilderImages:
+    """
+    Make the builder images which the build needs available, and pin them to their digests.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :return: The builder images which the build needs.
+    """
+    with build_stage(BuildStage.RESOLVE_BUILDER_IMAGES):
+        return resolve_builder_images(
+            _get_builder_operating_systems(agent_plugin_build_options, agent_plugin_manifest),
+            agent_plugin_build_options.pull_policy,
+        )
+
+
+def install_vendor_directories(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    builder_images: BuilderImages,
+):
+    """
+    Install the plugin's requirements into its vendor directories.
+
+    The requirements file must already be generated. If the build prefetches the artifacts of
+    the requirements, they are downloaded into the wheelhouse first.
+
+    :param agent_plugin_build_options: Agent Plugin build options.
+    :param agent_plugin_manifest: Agent Plugin manifest.
+    :param builder_images: The builder images to generate the vendor directories with.
+    """
+    wheelhouse_path = get_wheelhouse_path(agent_plugin_build_options)
+    if agent_plugin_build_options.prefetch and wheelhouse_path is not None:
+        with build_stage(BuildStage.PREFETCH_ARTIFACTS):
+            prefetch_artifacts(
+                agent_plugin_build_options.build_dir_path,
+                _get_target_operating_systems(agent_plugin_build_options, agent_plugin_manifest),
+                wheelhouse_path,
+                index_url=agent_plugin_build_options.index_url,
+                max_connections=agent_plugin_build_options.prefetch_connections,
+            )
+
+    with build_stage(BuildStage.INSTALL_VENDOR_DIRECTORIES):
+        _install_vendor_directories(
+            agent_plugin_build_options, agent_plugin_manifest, builder_images
+        )
+
+
+def _install_vendor_directories(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    builder_images: BuilderImages,
+):
+    _journal_vendor_dir_processing(agent_plugin_build_options)
+    pip_install_options = _get_pip_install_options(agent_plugin_build_options)
+    installed_tree_cache = _get_installed_tree_cache(agent_plugin_build_options)
+    wine_prefix_cache = _get_wine_prefix_cache(agent_plugin_build_options)
+    wheelhouse_path = get_wheelhouse_path(agent_plugin_build_options)
     if agent_plugin_build_options.platform_dependencies == PlatformDependencyPackagingMethod.COMMON:
         generate_common_vendor_dir(
-            agent_plugin_build_options.build_dir_path, agent_plugin_build_options.source_dir_name
+            agent_plugin_build_options.build_dir_path,
+            agent_plugin_build_options.source_dir_name,
+            pip_install_options=pip_install_options,
+            builder_images=builder_images,
+            installed_tree_cache=installed_tree_cache,
+            wheelhouse_path=wheelhouse_path,
         )
     elif (
         agent_plugin_build_options.platform_dependencies
@@ -97,38 +285,284 @@ def generate_vendor_directories(
                 agent_plugin_build_options.build_dir_path,
                 agent_plugin_build_options.source_dir_name,
                 os_type,
+                pip_install_options=pip_install_options,
+                builder_images=builder_images,
+                installed_tree_cache=installed_tree_cache,
+                wine_prefix_cache=wine_prefix_cache,
+                wheelhouse_path=wheelhouse_path,
             )
     else:
-        _autodetect_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+        _autodetect_vendor_directories(
+            agent_plugin_build_options,
+            agent_plugin_manifest,
+            pip_install_options,
+            builder_images,
+            installed_tree_cache,
+            wine_prefix_cache,
+            wheelhouse_path,
+        )
+
+
+def _journal_vendor_dir_processing(agent_plugin_build_options: AgentPluginBuildOptions):
+    # The vendor directories are slimmed, compiled and bundled in place after they're installed,
+    # so the options of that processing are journaled before them. A resumed build which changed
+    # the options installs the vendor directories again, rather than processing them twice.
+    journal_step = start_journal_step(
+        VENDOR_DIR_PROCESSING_JOURNAL_STEP,
+        inputs=[
+            agent_plugin_build_options.model_dump_json(
+                include={"slim_rules", "precompile_bytecode", "vendor_bundle"}
+            )
+        ],
+    )
+    if not journal_step.resumed:
+        journal_step.complete()
+
+
+def _get_target_operating_systems(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> list[OperatingSystem]:
+    # A common vendor directory is installed in the Linux builder container
+    if agent_plugin_build_options.platform_dependencies == PlatformDependencyPackagingMethod.COMMON:
+        return [OperatingSystem.LINUX]
+
+    return list(agent_plugin_manifest.supported_operating_systems)
+
+
+def _get_builder_operating_systems(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+) -> set[OperatingSystem]:
+    if agent_plugin_build_options.platform_dependencies == PlatformDependencyPackagingMethod.COMMON:
+        operating_systems = {OperatingSystem.LINUX}
+    else:
+        operating_systems = set(agent_plugin_manifest.supported_operating_systems)
+
+    # Slimming and bytecode compilation run in the Linux builder container
+    if (
+        agent_plugin_build_options.slim_rules is not None
+        or agent_plugin_build_options.precompile_bytecode
+    ):
+        operating_systems.add(OperatingSystem.LINUX)
+
+    return operating_systems
+
+
+def _get_pip_install_options(agent_plugin_build_options: AgentPluginBuildOptions) -> list[str]:
+    pip_install_options = []
+    slim_rules = agent_plugin_build_options.slim_rules
+    if slim_rules is not None and not slim_rules.compile_bytecode:
+        pip_install_options.append(PIP_NO_COMPILE_OPTION)
+
+    return pip_install_options
+
+
+def _get_installed_tree_cache(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> InstalledTreeCache | None:
+    if not agent_plugin_build_options.installed_tree_cache:
+        return None
+
+    cache_dir_path = agent_plugin_build_options.cache_dir_path or get_default_cache_dir()
+    logger.info(f"Using installed tree cache: {cache_dir_path}")
+
+    return InstalledTreeCache(cache_dir_path)
+
+
+def _get_autodetect_cache(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> AutodetectCache | None:
+    if not agent_plugin_build_options.autodetect_cache:
+        return None
+
+    cache_dir_path = agent_plugin_build_options.cache_dir_path or get_default_cache_dir()
+    logger.info(f"Using autodetect decision cache: {cache_dir_path}")
+
+    return AutodetectCache(cache_dir_path)
+
+
+def _get_wine_prefix_cache(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> WinePrefixCache | None:
+    if not agent_plugin_build_options.wine_prefix_cache:
+        return None
+
+    cache_dir_path = agent_plugin_build_options.cache_dir_path or get_default_cache_dir()
+    logger.info(f"Using Wine prefix cache: {cache_dir_path}")
+
+    return WinePrefixCache(cache_dir_path)
 
 
 def _autodetect_vendor_directories(
-    agent_plugin_build_options: AgentPluginBuildOptions, agent_plugin_manifest: AgentPluginManifest
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    pip_install_options: Sequence[str],
+    builder_images: BuilderImages,
+    installed_tree_cache: InstalledTreeCache | None,
+    wine_prefix_cache: WinePrefixCache | None,
+    wheelhouse_path: Path | None,
 ):
-    if len(agent_plugin_manifest.supported_operating_systems) > 1:
-        common_dir_possible = should_use_common_vendor_dir(
-            agent_plugin_build_options.build_dir_path
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    source_dir_name = agent_plugin_build_options.source_dir_name
+    if len(agent_plugin_manifest.supported_operating_systems) == 1:
+        generate_vendor_dirs(
+            build_dir_path,
+            source_dir_name,
+            agent_plugin_manifest.supported_operating_systems[0],
+            pip_install_options=pip_install_options,
+            builder_images=builder_images,
+            installed_tree_cache=installed_tree_cache,
+            wine_prefix_cache=wine_prefix_cache,
+            wheelhouse_path=wheelhouse_path,
         )
-        if common_dir_possible:
+        return
+
+    common_dir_possible = None
+    if agent_plugin_build_options.lock_file_autodetect:
+        common_dir_possible = detect_common_vendor_dir_from_lock_file(build_dir_path)
+        if common_dir_possible is not None:
+            _log_common_vendor_dir_decision(common_dir_possible)
+
+    # Fall back to the builder containers when the lock file is not conclusive
+    speculative_vendor_dir_path = None
+    if common_dir_possible is None:
+        speculative_install = None
+        if agent_plugin_build_options.speculative_install:
+            shutil.rmtree(build_dir_path / SPECULATIVE_INSTALL_DIR, ignore_errors=True)
+            speculative_vendor_dir_path = (
+                build_dir_path / SPECULATIVE_INSTALL_DIR / COMMON_VENDOR_DIR
+            )
+            speculative_install = partial(
+                _install_speculative_vendor_dir,
+                build_dir_path,
+                pip_install_options,
+                builder_images,
+                installed_tree_cache,
+                wheelhouse_path,
+            )
+        common_dir_possible = _should_use_common_vendor_dir(
+            agent_plugin_build_options, builder_images, wine_prefix_cache, speculative_install
+        )
+
+    if common_dir_possible:
+        if not _adopt_speculative_vendor_dir(
+            build_dir_path,
+            source_dir_name,
+            COMMON_VENDOR_DIR,
+            speculative_vendor_dir_path,
+            builder_images,
+            pip_install_options,
+        ):
             generate_common_vendor_dir(
-                agent_plugin_build_options.build_dir_path,
-                agent_plugin_build_options.source_dir_name,
+                build_dir_path,
+                source_dir_name,
+                pip_install_options=pip_install_options,
+                builder_images=builder_images,
+                installed_tree_cache=installed_tree_cache,
+                wheelhouse_path=wheelhouse_path,
             )
-        else:
-            for os_type in agent_plugin_manifest.supported_operating_systems:
-                generate_vendor_dirs(
-                    agent_plugin_build_options.build_dir_path,
-                    agent_plugin_build_options.source_dir_name,
-                    os_type,
-                )
-    else:
+        return
+
+    for os_type in agent_plugin_manifest.supported_operating_systems:
+        if os_type == OperatingSystem.LINUX and _adopt_speculative_vendor_dir(
+            build_dir_path,
+            source_dir_name,
+            LINUX_VENDOR_DIR,
+            speculative_vendor_dir_path,
+            builder_images,
+            pip_install_options,
+        ):
+            continue
+
         generate_vendor_dirs(
-            agent_plugin_build_options.build_dir_path,
-            agent_plugin_build_options.source_dir_name,
-            agent_plugin_manifest.supported_operating_systems[0],
+            build_dir_path,
+            source_dir_name,
+            os_type,
+            pip_install_options=pip_install_options,
+            builder_images=builder_images,
+            installed_tree_cache=installed_tree_cache,
+            wine_prefix_cache=wine_prefix_cache,
+            wheelhouse_path=wheelhouse_path,
         )
 
 
+def _should_use_common_vendor_dir(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    builder_images: BuilderImages,
+    wine_prefix_cache: WinePrefixCache | None,
+    speculative_install: Callable[[], None] | None = None,
+) -> bool:
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    journal_step = start_journal_step(
+        AUTODETECT_JOURNAL_STEP,
+        inputs=[build_dir_path / "requirements.txt", builder_images.linux, builder_images.windows],
+        outputs=[
+            build_dir_path / LINUX_PACKAGE_LIST_FILE,
+            build_dir_path / WINDOWS_PACKAGE_LIST_FILE,
+        ],
+    )
+    if journal_step.resumed:
+        _log_common_vendor_dir_decision(journal_step.result)
+        return journal_step.result
+
+    common_dir_possible = should_use_common_vendor_dir(
+        build_dir_path,
+        builder_images,
+        wine_prefix_cache,
+        _get_autodetect_cache(agent_plugin_build_options),
+        speculative_install,
+    )
+    journal_step.complete(common_dir_possible)
+
+    return common_dir_possible
+
+
+def _install_speculative_vendor_dir(
+    build_dir_path: Path,
+    pip_install_options: Sequence[str],
+    builder_images: BuilderImages,
+    installed_tree_cache: InstalledTreeCache | None,
+    wheelhouse_path: Path | None,
+):
+    logger.info("Installing the common vendor directory while the Windows requirements resolve")
+    # The speculative vendor directory is journaled once it's adopted, under its final name
+    with use_build_journal(None):
+        generate_common_vendor_dir(
+            build_dir_path,
+            SPECULATIVE_INSTALL_DIR,
+            pip_install_options=pip_install_options,
+            builder_images=builder_images,
+            installed_tree_cache=installed_tree_cache,
+            wheelhouse_path=wheelhouse_path,
+        )
+
+
+def _adopt_speculative_vendor_dir(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_name: str,
+    speculative_vendor_dir_path: Path | None,
+    builder_images: BuilderImages,
+    pip_install_options: Sequence[str],
+) -> bool:
+    if speculative_vendor_dir_path is None or not speculative_vendor_dir_path.is_dir():
+        return False
+
+    journal_step = _start_vendor_dir_step(
+        build_dir_path, source_dir_name, vendor_dir_name, builder_images.linux, pip_install_options
+    )
+    if not journal_step.resumed:
+        logger.info(f"Using the speculatively installed vendor directory as {vendor_dir_name}")
+        vendor_dir_path = build_dir_path / source_dir_name / vendor_dir_name
+        vendor_dir_path.parent.mkdir(parents=True, exist_ok=True)
+        speculative_vendor_dir_path.rename(vendor_dir_path)
+        journal_step.complete()
+
+    shutil.rmtree(speculative_vendor_dir_path.parent, ignore_errors=True)
+    return True
+
+
 def generate_requirements_file(build_dir_path: Path, verify_hashes: bool = True):
     """
     Generate the requirements file from the lock file depending on the lock file present.
@@ -139,31 +573,57 @@ def generate_requirements_file(build_dir_path: Path, verify_hashes: bool = True)
     :raises CommandRunError: If the command fails to run.
     """
     logger.info("Generating requirements file")
-    if (build_dir_path / "poetry.lock").exists():
-        command = [
-            "poetry",
-            "export",
-            "-f",
-            "requirements.txt",
-            "-o",
-            "requirements.txt",
-        ]
-        if not verify_hashes:
-            logger.warning(
-                "WARNING: Plugins dependencies are not going to be verified. "
-                "This can allow supply-chain attacks to go unnoticed. A malicious actor "
-                "could slip bad code into the installation via one of unverified dependencies.",
-            )
-            command.append("--without-hashes")
+    command = _get_requirements_export_command(build_dir_path, verify_hashes)
+    return_code = _run_command(build_dir_path, command)
+    _check_requirements_file_generated(build_dir_path, return_code)
 
-        return_code = _run_command(build_dir_path, command)
-        if return_code != 0:
-            logger.error("Requirements file generation failed")
-            raise CommandRunError("Requirements file generation failed")
-    else:
+
+async def generate_requirements_file_async(build_dir_path: Path, verify_hashes: bool = True):
+    """
+    Generate the requirements file from the lock file, without blocking the event loop.
+
+    If the coroutine is cancelled, the `poetry export` process is killed.
+
+    :param build_dir_path: Path to the build directory.
+    :param verify_hashes: Verify plugin's dependency hashes.
+    :raises FileNotFoundError: If the lock or requierements file is not found.
+    :raises CommandRunError: If the command fails to run.
+    """
+    logger.info("Generating requirements file")
+    command = _get_requirements_export_command(build_dir_path, verify_hashes)
+    return_code = await _run_command_async(build_dir_path, command)
+    _check_requirements_file_generated(build_dir_path, return_code)
+
+
+def _get_requirements_export_command(build_dir_path: Path, verify_hashes: bool) -> list[str]:
+    if not (build_dir_path / "poetry.lock").exists():
         logger.warning("Poetry lock file not found")
         raise FileNotFoundError("poetry.lock not found")
 
+    command = [
+        "poetry",
+        "export",
+        "-f",
+        "requirements.txt",
+        "-o",
+        "requirements.txt",
+    ]
+    if not verify_hashes:
+        logger.warning(
+            "WARNING: Plugins dependencies are not going to be verified. "
+            "This can allow supply-chain attacks to go unnoticed. A malicious actor "
+            "could slip bad code into the installation via one of unverified dependencies.",
+        )
+        command.append("--without-hashes")
+
+    return command
+
+
+def _check_requirements_file_generated(build_dir_path: Path, return_code: int):
+    if return_code != 0:
+        logger.error("Requirements file generation failed")
+        raise CommandRunError("Requirements file generation failed")
+
     if (build_dir_path / "requirements.txt").exists():
         logger.info("Requirements file generated")
     else:
@@ -191,8 +651,40 @@ def _run_command(build_dir_path: Path, command: Sequence[str]):
     return process.wait()
 
 
+async def _run_command_async(build_dir_path: Path, command: Sequence[str]) -> int:
+    """
+    Run a command as an asyncio subprocess. The process is killed if the coroutine is cancelled.
+
+    :param build_dir_path: Path to the build directory.
+    :param command: Command to run.
+    """
+    logger.debug(f"Running command: {' '.join(command)}")
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        cwd=str(build_dir_path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    try:
+        async for line in process.stdout:  # type: ignore [union-attr]
+            logger.debug(line.decode("utf-8").strip())
+
+        return await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+
 def generate_common_vendor_dir(
-    build_dir_path: Path, source_dir_name: SourceDirName, vendor_dir_name: str = "vendor"
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_name: str = COMMON_VENDOR_DIR,
+    pip_install_options: Sequence[str] = (),
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+    installed_tree_cache: InstalledTreeCache | None = None,
+    wheelhouse_path: Path | None = None,
 ):
     """
     Generate a common vendor directory by installing the requirements in a Linux container.
@@ -200,18 +692,70 @@ def generate_common_vendor_dir(
     :param build_dir_path: Path to the build directory.
     :param source_dir_name: Name of the source directory.
     :param vendor_dir_name: Name of the vendor directory.
+    :param pip_install_options: Additional options to pass to `pip install`.
+    :param builder_images: The builder images to use.
+    :param installed_tree_cache: If set, the vendor directory is assembled from the cached
+        installed trees of the packages, and only the packages which are missing from the cache
+        are installed.
+    :param wheelhouse_path: If set, the pure-Python wheels which are found in the wheelhouse
+        are installed on the host, and only the other requirements are installed in the
+        container.
     """
-    command = _build_bash_command(
-        LINUX_BUILD_VENDOR_DIR_COMMANDS.format(
-            vendor_path=quote(f"{source_dir_name}/{vendor_dir_name}"),
-        )
+    journal_step = _start_vendor_dir_step(
+        build_dir_path, source_dir_name, vendor_dir_name, builder_images.linux, pip_install_options
     )
-    output = _run_command_in_docker_container(LINUX_PLUGIN_BUILDER_IMAGE, command, build_dir_path)
-    _log_container_output(output, "Common Vendor Directory")
+    if journal_step.resumed:
+        return
+
+    verified_wheels = _verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.LINUX, wheelhouse_path
+    )
+    if installed_tree_cache is not None:
+        _generate_vendor_dir_from_installed_trees(
+            build_dir_path,
+            source_dir_name,
+            vendor_dir_name,
+            OperatingSystem.LINUX,
+            pip_install_options,
+            builder_images,
+            installed_tree_cache,
+            None,
+            verified_wheels,
+        )
+    elif verified_wheels:
+        _install_remaining_requirements(
+            build_dir_path,
+            source_dir_name,
+            vendor_dir_name,
+            OperatingSystem.LINUX,
+            verified_wheels,
+            pip_install_options,
+            builder_images,
+            None,
+        )
+    else:
+        command = _build_bash_command(
+            LINUX_BUILD_VENDOR_DIR_COMMANDS.format(
+                vendor_path=quote(f"{source_dir_name}/{vendor_dir_name}"),
+            )
+            + _format_pip_install_options(pip_install_options)
+        )
+        output = _run_command_in_docker_container(builder_images.linux, command, build_dir_path)
+        _log_container_output(output, "Common Vendor Directory")
+
+    install_verified_wheels(verified_wheels, build_dir_path / source_dir_name / vendor_dir_name)
+    journal_step.complete()
 
 
 def generate_vendor_dirs(
-    build_dir_path: Path, source_dir_name: SourceDirName, operating_system: OperatingSystem
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    operating_system: OperatingSystem,
+    pip_install_options: Sequence[str] = (),
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+    installed_tree_cache: InstalledTreeCache | None = None,
+    wine_prefix_cache: WinePrefixCache | None = None,
+    wheelhouse_path: Path | None = None,
 ):
     """
     Generate the vendor directories for the plugin.
@@ -219,83 +763,666 @@ def generate_vendor_dirs(
     :param build_dir_path: Path to the build directory.
     :param source_dir_name: Name of the source directory.
     :param operating_system: Operating system to generate the vendor directories for.
+    :param pip_install_options: Additional options to pass to `pip install`.
+    :param builder_images: The builder images to use.
+    :param installed_tree_cache: The installed tree cache to assemble the vendor directories
+        from, if any.
+    :param wine_prefix_cache: The cache of the initialized Wine prefix of the Windows builder
+        image, if any.
+    :param wheelhouse_path: The wheelhouse to install the pure-Python wheels from on the host,
+        if any.
     """
     if operating_system == OperatingSystem.LINUX:
-        generate_common_vendor_dir(build_dir_path, source_dir_name, "vendor-linux")
+        generate_common_vendor_dir(
+            build_dir_path,
+            source_dir_name,
+            LINUX_VENDOR_DIR,
+            pip_install_options,
+            builder_images,
+            installed_tree_cache,
+            wheelhouse_path,
+        )
     elif operating_system == OperatingSystem.WINDOWS:
-        generate_windows_vendor_dir(build_dir_path, source_dir_name)
+        generate_windows_vendor_dir(
+            build_dir_path,
+            source_dir_name,
+            pip_install_options,
+            builder_images,
+            installed_tree_cache,
+            wine_prefix_cache,
+            wheelhouse_path,
+        )
     else:
         raise ValueError(f"Unsupported operating system: {operating_system}")
 
 
-def generate_windows_vendor_dir(build_dir_path: Path, source_dir_name: SourceDirName):
+def generate_windows_vendor_dir(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    pip_install_options: Sequence[str] = (),
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+    installed_tree_cache: InstalledTreeCache | None = None,
+    wine_prefix_cache: WinePrefixCache | None = None,
+    wheelhouse_path: Path | None = None,
+):
     """
     Generate the Windows vendor directory by installing the requirements in a Linux Container
     with Wine installed.
 
     :param build_dir_path: Path to the build directory.
+    :param source_dir_name: Name of the source directory.
+    :param pip_install_options: Additional options to pass to `pip install`.
+    :param builder_images: The builder images to use.
+    :param installed_tree_cache: If set, the vendor directory is assembled from the cached
+        installed trees of the packages, and only the packages which are missing from the cache
+        are installed.
+    :param wine_prefix_cache: If set, the container reuses the cached initialized Wine prefix
+        of the Windows builder image, instead of initializing a new one.
+    :param wheelhouse_path: If set, the pure-Python wheels which are found in the wheelhouse
+        are installed on the host, and only the other requirements are installed in the
+        container.
     """
-    command = _build_bash_command(
-        WINDOWS_BUILD_VENDOR_DIR_COMMANDS.format(source_dir_name=quote(source_dir_name))
+    journal_step = _start_vendor_dir_step(
+        build_dir_path,
+        source_dir_name,
+        WINDOWS_VENDOR_DIR,
+        builder_images.windows,
+        pip_install_options,
+    )
+    if journal_step.resumed:
+        return
+
+    verified_wheels = _verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.WINDOWS, wheelhouse_path
+    )
+    if installed_tree_cache is not None:
+        _generate_vendor_dir_from_installed_trees(
+            build_dir_path,
+            source_dir_name,
+            WINDOWS_VENDOR_DIR,
+            OperatingSystem.WINDOWS,
+            pip_install_options,
+            builder_images,
+            installed_tree_cache,
+            wine_prefix_cache,
+            verified_wheels,
+        )
+    elif verified_wheels:
+        _install_remaining_requirements(
+            build_dir_path,
+            source_dir_name,
+            WINDOWS_VENDOR_DIR,
+            OperatingSystem.WINDOWS,
+            verified_wheels,
+            pip_install_options,
+            builder_images,
+            wine_prefix_cache,
+        )
+    else:
+        output = _run_command_in_windows_builder_container(
+            build_dir_path,
+            WINDOWS_BUILD_VENDOR_DIR_COMMANDS.format(source_dir_name=quote(source_dir_name))
+            + _format_pip_install_options(pip_install_options),
+            builder_images,
+            wine_prefix_cache,
+        )
+        _log_container_output(output, "Windows Vendor Directory")
+
+    install_verified_wheels(verified_wheels, build_dir_path / source_dir_name / WINDOWS_VENDOR_DIR)
+    journal_step.complete()
+
+
+def _start_vendor_dir_step(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_name: str,
+    image: str,
+    pip_install_options: Sequence[str],
+) -> JournalStep:
+    return start_journal_step(
+        f"{BuildStage.INSTALL_VENDOR_DIRECTORIES.value}:{vendor_dir_name}",
+        inputs=[build_dir_path / "requirements.txt", image, *pip_install_options],
+        outputs=[build_dir_path / source_dir_name / vendor_dir_name],
+    )
+
+
+def _verify_pure_python_wheels(
+    build_dir_path: Path, operating_system: OperatingSystem, wheelhouse_path: Path | None
+) -> list[VerifiedWheel]:
+    if wheelhouse_path is None:
+        return []
+
+    return verify_pure_python_wheels(build_dir_path, operating_system, wheelhouse_path)
+
+
+def _install_remaining_requirements(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_name: str,
+    operating_system: OperatingSystem,
+    verified_wheels: Sequence[VerifiedWheel],
+    pip_install_options: Sequence[str],
+    builder_images: BuilderImages,
+    wine_prefix_cache: WinePrefixCache | None,
+):
+    requirements_file_path = write_remaining_requirements(
+        build_dir_path, vendor_dir_name, operating_system, verified_wheels
+    )
+    if requirements_file_path is None:
+        return
+
+    install_command = (
+        WINDOWS_BUILD_REMAINING_VENDOR_DIR_COMMANDS
+        if operating_system == OperatingSystem.WINDOWS
+        else LINUX_BUILD_REMAINING_VENDOR_DIR_COMMANDS
+    ).format(
+        requirements_file=quote(requirements_file_path.name),
+        vendor_path=quote(f"{source_dir_name}/{vendor_dir_name}"),
+    ) + _format_pip_install_options(
+        pip_install_options
     )
-    output = _run_command_in_docker_container(WINDOWS_PLUGIN_BUILDER_IMAGE, command, build_dir_path)
-    _log_container_output(output, "Windows Vendor Directory")
+    if operating_system == OperatingSystem.WINDOWS:
+        output = _run_command_in_windows_builder_container(
+            build_dir_path, install_command, builder_images, wine_prefix_cache
+        )
+    else:
+        output = _run_command_in_docker_container(
+            builder_images.linux, _build_bash_command(install_command), build_dir_path
+        )
+    _log_container_output(output, "Remaining Requirements")
+
+
+def _generate_vendor_dir_from_installed_trees(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_name: str,
+    operating_system: OperatingSystem,
+    pip_install_options: Sequence[str],
+    builder_images: BuilderImages,
+    installed_tree_cache: InstalledTreeCache,
+    wine_prefix_cache: WinePrefixCache | None,
+    verified_wheels: Sequence[VerifiedWheel] = (),
+):
+    install_report = read_install_report(
+        _generate_package_list_file(
+            build_dir_path, operating_system, builder_images, wine_prefix_cache
+        )
+    )
+    # The packages which are installed from verified wheels on the host don't need trees
+    host_installed_names = {verified_wheel.name for verified_wheel in verified_wheels}
+    packages = [
+        package
+        for package in install_report.packages
+        if canonicalize_name(package.name) not in host_installed_names
+    ]
+    tree_set_name = get_tree_set_name(install_report.environment, pip_install_options)
+    missing_packages = [
+        package for package in packages if not installed_tree_cache.contains(tree_set_name, package)
+    ]
+    logger.info(
+        f"Found {len(packages) - len(missing_packages)} of "
+        f"{len(packages)} packages in the installed tree cache: {tree_set_name}"
+    )
+    build_control = get_build_control()
+    if build_control is not None:
+        build_control.statistics.record_cache_lookups(
+            hits=len(packages) - len(missing_packages),
+            misses=len(missing_packages),
+        )
+
+    staging_dir_path = build_dir_path / INSTALLED_TREES_STAGING_DIR / vendor_dir_name
+    if missing_packages:
+        _install_package_trees(
+            build_dir_path,
+            staging_dir_path,
+            operating_system,
+            missing_packages,
+            pip_install_options,
+            builder_images,
+            wine_prefix_cache,
+        )
+
+    vendor_dir_path = build_dir_path / source_dir_name / vendor_dir_name
+    vendor_dir_path.mkdir(parents=True, exist_ok=True)
+    transfer_strategies: Counter[TransferStrategy] = Counter()
+    for package in packages:
+        if package in missing_packages:
+            installed_tree_path = installed_tree_cache.store(
+                tree_set_name, package, staging_dir_path / package.tree_name
+            )
+        else:
+            installed_tree_path = installed_tree_cache.get_tree_path(tree_set_name, package)
+
+        transfer_strategies += link_installed_tree(installed_tree_path, vendor_dir_path)
+
+    shutil.rmtree(staging_dir_path, ignore_errors=True)
+    logger.info(
+        f"Assembled vendor directory {vendor_dir_path}: "
+        f"{format_transfer_strategies(transfer_strategies)}"
+    )
+
+
+def _generate_package_list_file(
+    build_dir_path: Path,
+    operating_system: OperatingSystem,
+    builder_images: BuilderImages,
+    wine_prefix_cache: WinePrefixCache | None,
+) -> Path:
+    # The package lists may already have been generated to autodetect the packaging method
+    if operating_system == OperatingSystem.WINDOWS:
+        package_list_file_path = build_dir_path / WINDOWS_PACKAGE_LIST_FILE
+        if not package_list_file_path.exists():
+            output = _run_command_in_windows_builder_container(
+                build_dir_path,
+                WINDOWS_BUILD_PACKAGE_LIST_COMMANDS.format(
+                    filename=quote(package_list_file_path.name)
+                ),
+                builder_images,
+                wine_prefix_cache,
+            )
+            _log_container_output(output, "Windows Requirements")
+    else:
+        package_list_file_path = build_dir_path / LINUX_PACKAGE_LIST_FILE
+        if not package_list_file_path.exists():
+            command = _build_bash_command(
+                LINUX_BUILD_PACKAGE_LIST_COMMANDS.format(
+                    filename=quote(package_list_file_path.name)
+                )
+            )
+            output = _run_command_in_docker_container(builder_images.linux, command, build_dir_path)
+            _log_container_output(output, "Linux Requirements")
+
+    return package_list_file_path
 
 
-def should_use_common_vendor_dir(build_dir_path: Path) -> bool:
+def _install_package_trees(
+    build_dir_path: Path,
+    staging_dir_path: Path,
+    operating_system: OperatingSystem,
+    packages: Sequence[InstalledPackage],
+    pip_install_options: Sequence[str],
+    builder_images: BuilderImages,
+    wine_prefix_cache: WinePrefixCache | None,
+):
+    logger.info(f"Installing {len(packages)} packages which are missing from the cache")
+    install_commands = [
+        PIP_INSTALL_PACKAGE_TREE_COMMAND.format(
+            tree_path=quote(
+                str((staging_dir_path / package.tree_name).relative_to(build_dir_path))
+            ),
+            requirement=quote(package.requirement),
+        )
+        + _format_pip_install_options(pip_install_options)
+        for package in packages
+    ]
+
+    if operating_system == OperatingSystem.WINDOWS:
+        output = _run_command_in_windows_builder_container(
+            build_dir_path,
+            " && ".join(
+                ["cd /plugin", *(f"wine {install_command}" for install_command in install_commands)]
+            ),
+            builder_images,
+            wine_prefix_cache,
+        )
+    else:
+        output = _run_command_in_docker_container(
+            builder_images.linux,
+            _build_bash_command(
+                " && ".join([*LINUX_VENV_COMMANDS, "cd /plugin", *install_commands])
+            ),
+            build_dir_path,
+        )
+    _log_container_output(output, "Installed Trees")
+
+
+def strip_linux_shared_objects(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    vendor_dir_names: Sequence[str],
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+):
+    """
+    Strip debug symbols from the Linux shared objects in the vendor directories, using the
+    Linux builder container.
+
+    :param build_dir_path: Path to the build directory.
+    :param source_dir_name: Name of the source directory.
+    :param vendor_dir_names: Names of the vendor directories which contain Linux shared objects.
+    :param builder_images: The builder images to use.
+    """
+    vendor_paths = " ".join(
+        quote(f"{source_dir_name}/{vendor_dir_name}") for vendor_dir_name in vendor_dir_names
+    )
+    run_command_in_linux_builder_container(
+        build_dir_path,
+        LINUX_STRIP_SHARED_OBJECTS_COMMANDS.format(vendor_paths=vendor_paths),
+        "Strip Shared Objects",
+        builder_images,
+    )
+
+
+def run_command_in_linux_builder_container(
+    build_dir_path: Path,
+    command: str,
+    log_prefix: str = "",
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+) -> str:
+    """
+    Run a bash command in the Linux builder container, in the build directory.
+
+    :param build_dir_path: Path to the build directory.
+    :param command: The bash command to run.
+    :param log_prefix: Prefix of the logged container output.
+    :param builder_images: The builder images to use.
+    :return: Output of the container.
+    """
+    output = _run_command_in_docker_container(
+        builder_images.linux,
+        _build_bash_command(" && ".join(["cd /plugin", command])),
+        build_dir_path,
+    )
+    _log_container_output(output, log_prefix)
+
+    return output.decode("utf-8")
+
+
+def should_use_common_vendor_dir(
+    build_dir_path: Path,
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+    wine_prefix_cache: WinePrefixCache | None = None,
+    autodetect_cache: AutodetectCache | None = None,
+    speculative_install: Callable[[], None] | None = None,
+) -> bool:
     """
     Check if a common vendor directory is possible by comparing the package lists generated
     from a dry run of the requirements installation on Linux and Windows.
 
     :param build_dir_path: Path to the build directory.
+    :param builder_images: The builder images to use.
+    :param wine_prefix_cache: The cache of the initialized Wine prefix of the Windows builder
+        image, if any.
+    :param autodetect_cache: If set, the decision and the package lists are reused if they were
+        already made for the same requirements file and builder images, and are cached
+        otherwise. The decision is only cached if the builder images are pinned to their
+        digests.
+    :param speculative_install: If set, it's run in a thread once the Linux package list is
+        generated, while the Windows package list is generated, e.g. to install the Linux
+        requirements before the decision is made. It isn't run if the decision is cached.
     :return: True if a common vendor directory is possible, False otherwise.
     :raises FileNotFoundError: If the requirements file is not found.
     """
-    if not (build_dir_path / "requirements.txt").exists():
+    requirements_file_path = build_dir_path / "requirements.txt"
+    if not requirements_file_path.exists():
         raise FileNotFoundError("requirements.txt not found in the build directory")
 
+    autodetect_key = None
+    if autodetect_cache is not None:
+        autodetect_key = get_autodetect_key(requirements_file_path, builder_images)
+        decision = None if autodetect_key is None else autodetect_cache.get(autodetect_key)
+        if decision is not None:
+            logger.info(f"Reusing cached autodetect decision: {decision.key}")
+            autodetect_cache.restore_package_lists(decision.key, build_dir_path)
+            _log_common_vendor_dir_decision(decision.common_vendor_dir_possible)
+            return decision.common_vendor_dir_possible
+
     command = _build_bash_command(
         LINUX_BUILD_PACKAGE_LIST_COMMANDS.format(filename=quote(LINUX_PACKAGE_LIST_FILE))
     )
-    output = _run_command_in_docker_container(LINUX_PLUGIN_BUILDER_IMAGE, command, build_dir_path)
+    output = _run_command_in_docker_container(builder_images.linux, command, build_dir_path)
     _log_container_output(output, "Linux Requirements")
 
-    command = _build_bash_command(
-        WINDOWS_BUILD_PACKAGE_LIST_COMMANDS.format(filename=quote(WINDOWS_PACKAGE_LIST_FILE))
-    )
-    output = _run_command_in_docker_container(WINDOWS_PLUGIN_BUILDER_IMAGE, command, build_dir_path)
-    _log_container_output(output, "Windows Requirements")
+    context = copy_context()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative-install") as executor:
+        speculative_install_future = None
+        if speculative_install is not None:
+            install = speculative_install
+            speculative_install_future = executor.submit(lambda: context.run(install))
+        output = _run_command_in_windows_builder_container(
+            build_dir_path,
+            WINDOWS_BUILD_PACKAGE_LIST_COMMANDS.format(filename=quote(WINDOWS_PACKAGE_LIST_FILE)),
+            builder_images,
+            wine_prefix_cache,
+        )
+        _log_container_output(output, "Windows Requirements")
+        if speculative_install_future is not None:
+            speculative_install_future.result()
 
     linux_packages = _load_package_names(build_dir_path / LINUX_PACKAGE_LIST_FILE)
     windows_packages = _load_package_names(build_dir_path / WINDOWS_PACKAGE_LIST_FILE)
 
     response = linux_packages == windows_packages
-    if response:
+    _log_common_vendor_dir_decision(response)
+    if autodetect_cache is not None and autodetect_key is not None:
+        autodetect_cache.store(
+            autodetect_key,
+            requirements_file_path,
+            builder_images,
+            response,
+            [build_dir_path / LINUX_PACKAGE_LIST_FILE, build_dir_path / WINDOWS_PACKAGE_LIST_FILE],
+        )
+
+    return response
+
+
+def _log_common_vendor_dir_decision(common_vendor_dir_possible: bool):
+    if common_vendor_dir_possible:
         logger.info("Common vendor directory is possible")
     else:
         logger.info("Common vendor directory is not possible")
 
-    return response
 
+def _run_command_in_windows_builder_container(
+    build_dir_path: Path,
+    command: str,
+    builder_images: BuilderImages,
+    wine_prefix_cache: WinePrefixCache | None,
+) -> bytes:
+    if wine_prefix_cache is None:
+        return _run_command_in_docker_container(
+            builder_images.windows,
+            _build_bash_command(" && ".join([WINDOWS_IMAGE_INIT_COMMAND, command])),
+            build_dir_path,
+        )
 
-def _run_command_in_docker_container(image: str, command: str, plugin_dir_path: Path) -> bytes:
+    wine_prefix_path = _get_wine_prefix(build_dir_path, builder_images.windows, wine_prefix_cache)
+    return _run_command_in_docker_container(
+        builder_images.windows,
+        _build_bash_command(" && ".join([WINE_PREFIX_INIT_COMMAND, command])),
+        build_dir_path,
+        {str(wine_prefix_path): {"bind": WINE_PREFIX_MOUNT_PATH, "mode": "ro"}},
+    )
+
+
+def _get_wine_prefix(build_dir_path: Path, image: str, wine_prefix_cache: WinePrefixCache) -> Path:
+    image_id = _get_image_id(image)
+
+    def create_wine_prefix(wine_prefix_path: Path):
+        output = _run_command_in_docker_container(
+            image,
+            _build_bash_command(WINE_PREFIX_CREATE_COMMANDS),
+            build_dir_path,
+            {str(wine_prefix_path): {"bind": WINE_PREFIX_MOUNT_PATH, "mode": "rw"}},
+        )
+        _log_container_output(output, "Wine Prefix")
+
+    return wine_prefix_cache.get_wine_prefix(image_id, create_wine_prefix)
+
+
+def _get_image_id(image: str) -> str:
+    docker_endpoint_pool = get_docker_endpoint_pool()
+    if docker_endpoint_pool is None:
+        with closing(docker.from_env()) as client:  # type: ignore [attr-defined]
+            return client.images.get(image).id
+
+    with docker_endpoint_pool.acquire() as endpoint:
+        client = endpoint.get_client()
+        try:
+            return client.images.get(image).id
+        except ImageNotFound:
+            return client.images.pull(image).id
+
+
+def _run_command_in_docker_container(
+    image: str,
+    command: str,
+    plugin_dir_path: Path,
+    extra_volumes: dict[str, dict[str, str]] | None = None,
+) -> bytes:
     """
     Run a container with the plugin directory mounted.
 
+    If the build has a build control, the container is killed when the build is cancelled. If
+    the build has a Docker endpoint pool, the container is placed on the least loaded endpoint,
+    and is run on the next endpoint if the endpoint fails.
+
     :param image: Docker image to run.
     :param command: Command to run in the container.
     :param plugin_dir_path: Path to the plugin directory.
+    :param extra_volumes: Additional volumes to mount in the container.
     :return: Output of the container.
+    :raises BuildCancelledError: If the build was cancelled.
+    :raises DockerEndpointError: If no Docker endpoint is available.
     """
-    client = docker.from_env()  # type: ignore [attr-defined]
-    volumes = {str(plugin_dir_path): {"bind": "/plugin", "mode": "rw"}}
+    volumes = {str(plugin_dir_path): {"bind": "/plugin", "mode": "rw"}, **(extra_volumes or {})}
+    environment = _get_container_environment(plugin_dir_path)
+    docker_endpoint_pool = get_docker_endpoint_pool()
+    if docker_endpoint_pool is None:
+        with closing(docker.from_env()) as client:  # type: ignore [attr-defined]
+            return _run_container(client, image, command, volumes, environment)
 
+    failed_endpoints: list[DockerEndpoint] = []
+    while True:
+        with docker_endpoint_pool.acquire(exclude=failed_endpoints) as endpoint:
+            try:
+                return _run_container(
+                    endpoint.get_client(),
+                    image,
+                    command,
+                    volumes,
+                    environment,
+                    docker_endpoint=endpoint,
+                )
+            except Exception as err:
+                if not is_endpoint_failure(err):
+                    raise
+
+                logger.warning(
+                    f"Unable to run builder container on Docker endpoint {endpoint.name}: {err}"
+                )
+                docker_endpoint_pool.mark_unhealthy(endpoint)
+                failed_endpoints.append(endpoint)
+
+
+def _run_container(
+    client,
+    image: str,
+    command: str,
+    volumes: dict[str, dict[str, str]],
+    environment: dict[str, str] | None = None,
+    docker_endpoint: DockerEndpoint | None = None,
+) -> bytes:
     uid = getuid()
     gid = getgid()
+    environment_options = {"environment": environment} if environment else {}
 
-    return client.containers.run(
-        image, command=command, volumes=volumes, remove=True, user=f"{uid}:{gid}"
-    )
+    build_control = get_build_control()
+    if build_control is None and docker_endpoint is None:
+        return client.containers.run(
+            image,
+            command=command,
+            volumes=volumes,
+            remove=True,
+            user=f"{uid}:{gid}",
+            **environment_options,
+        )
+
+    if build_control is not None:
+        build_control.raise_if_cancelled()
+    if docker_endpoint is None:
+        container = client.containers.create(
+            image, command=command, volumes=volumes, user=f"{uid}:{gid}", **environment_options
+        )
+    else:
+        container = _create_container_on_endpoint(
+            client, docker_endpoint, image, command, volumes, f"{uid}:{gid}", environment_options
+        )
+    start = time.monotonic()
+    try:
+        if build_control is not None:
+            build_control.register_container(container)
+        # Volumes can't be bind-mounted from a remote host, so they are copied in and out
+        copy_volumes = docker_endpoint is not None and not docker_endpoint.is_local
+        copied_volume_paths = _put_volumes(container, volumes) if copy_volumes else {}
+        container.start()
+        exit_status = container.wait()["StatusCode"]
+        if build_control is not None:
+            build_control.raise_if_cancelled()
+        if exit_status != 0:
+            raise ContainerError(
+                container, exit_status, command, image, container.logs(stdout=False, stderr=True)
+            )
+        _get_volumes(container, volumes, copied_volume_paths)
+
+        return container.logs(stdout=True, stderr=False)
+    finally:
+        if build_control is not None:
+            build_control.unregister_container(container)
+            build_control.statistics.record_container_run(image, time.monotonic() - start)
+        container.remove(force=True)
+
+
+def _put_volumes(container, volumes: dict[str, dict[str, str]]) -> dict[str, set[str]]:
+    return {
+        host_path: put_directory(container, Path(host_path), volume["bind"])
+        for host_path, volume in volumes.items()
+    }
+
+
+def _get_volumes(
+    container, volumes: dict[str, dict[str, str]], copied_volume_paths: dict[str, set[str]]
+):
+    for host_path, copied_paths in copied_volume_paths.items():
+        if volumes[host_path]["mode"] == "rw":
+            get_directory(container, volumes[host_path]["bind"], Path(host_path), copied_paths)
+
+
+def _create_container_on_endpoint(
+    client,
+    docker_endpoint: DockerEndpoint,
+    image: str,
+    command: str,
+    volumes: dict[str, dict[str, str]],
+    user: str,
+    environment_options: dict[str, dict[str, str]],
+):
+    container_options = {
+        "command": command,
+        "volumes": volumes if docker_endpoint.is_local else None,
+        "user": user,
+        "labels": {BUILDER_CONTAINER_LABEL: ""},
+        **environment_options,
+    }
+    try:
+        return client.containers.create(image, **container_options)
+    except ImageNotFound:
+        # The builder images are resolved on the local Docker daemon, and the endpoints pull
+        # them when they first run them
+        logger.info(f"Pulling builder image {image} on Docker endpoint {docker_endpoint.name}")
+        client.images.pull(image)
+        return client.containers.create(image, **container_options)
+
+
+def _get_container_environment(plugin_dir_path: Path) -> dict[str, str]:
+    # pip finds the prefetched artifacts in the build directory, and downloads only the others
+    if (plugin_dir_path / BUILD_WHEELHOUSE_DIR).is_dir():
+        return {"PIP_FIND_LINKS": CONTAINER_WHEELHOUSE_PATH}
+
+    return {}
+
+
+def _format_pip_install_options(pip_install_options: Sequence[str]) -> str:
+    return "".join(f" {quote(option)}" for option in pip_install_options)
 
 
 def _build_bash_command(command: str) -> str:
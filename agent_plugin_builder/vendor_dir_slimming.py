@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import shutil
+from pathlib import Path, PurePath
+
+from monkeytypes.base_models import InfectionMonkeyBaseModel
+
+from .agent_plugin_build_options import SourceDirName
+from .builder_images import DEFAULT_BUILDER_IMAGES, BuilderImages
+from .slim_rules import SlimRules
+from .vendor_dir_generation import (
+    COMMON_VENDOR_DIR,
+    LINUX_VENDOR_DIR,
+    WINDOWS_VENDOR_DIR,
+    strip_linux_shared_objects,
+)
+
+logger = logging.getLogger(__name__)
+
+SLIM_REPORT_FILE = "slim_report.json"
+VENDOR_DIR_NAMES = (COMMON_VENDOR_DIR, LINUX_VENDOR_DIR, WINDOWS_VENDOR_DIR)
+LINUX_VENDOR_DIR_NAMES = (COMMON_VENDOR_DIR, LINUX_VENDOR_DIR)
+
+
+class SlimReport(InfectionMonkeyBaseModel):
+    removed_bytes: dict[str, dict[str, int]]
+
+    @property
+    def total_removed_bytes(self) -> int:
+        return sum(sum(packages.values()) for packages in self.removed_bytes.values())
+
+
+def slim_vendor_directories(
+    build_dir_path: Path,
+    source_dir_name: SourceDirName,
+    slim_rules: SlimRules,
+    builder_images: BuilderImages = DEFAULT_BUILDER_IMAGES,
+) -> SlimReport:
+    """
+    Remove the files which are not needed at runtime from the vendor directories, and strip
+    debug symbols from the Linux shared objects.
+
+    A report of the bytes removed from each vendored package is written to the build directory.
+
+    :param build_dir_path: Path to the build directory.
+    :param source_dir_name: Name of the plugin source directory.
+    :param slim_rules: The rules to use to slim the vendor directories.
+    :param builder_images: The builder images to use.
+    :return: A report of the bytes removed from each vendored package, per vendor directory.
+    """
+    source_dir_path = build_dir_path / source_dir_name
+    vendor_dir_paths = [
+        source_dir_path / vendor_dir_name
+        for vendor_dir_name in VENDOR_DIR_NAMES
+        if (source_dir_path / vendor_dir_name).is_dir()
+    ]
+    sizes_before = {path.name: _get_package_sizes(path) for path in vendor_dir_paths}
+
+    for vendor_dir_path in vendor_dir_paths:
+        logger.info(f"Slimming vendor directory: {vendor_dir_path}")
+        _remove_matching_paths(vendor_dir_path, slim_rules.remove_patterns)
+
+    linux_vendor_dir_names = [
+        path.name for path in vendor_dir_paths if path.name in LINUX_VENDOR_DIR_NAMES
+    ]
+    if slim_rules.strip_shared_objects and linux_vendor_dir_names:
+        logger.info("Stripping debug symbols from Linux shared objects")
+        strip_linux_shared_objects(
+            build_dir_path, source_dir_name, linux_vendor_dir_names, builder_images
+        )
+
+    removed_bytes = {}
+    for vendor_dir_path in vendor_dir_paths:
+        sizes_after = _get_package_sizes(vendor_dir_path)
+        removed_bytes[vendor_dir_path.name] = {
+            package: size - sizes_after.get(package, 0)
+            for package, size in sizes_before[vendor_dir_path.name].items()
+            if size != sizes_after.get(package, 0)
+        }
+
+    slim_report = SlimReport(removed_bytes=removed_bytes)
+    _write_slim_report(build_dir_path, slim_report)
+
+    return slim_report
+
+
+def _get_package_sizes(vendor_dir_path: Path) -> dict[str, int]:
+    return {path.name: _get_size(path) for path in vendor_dir_path.iterdir()}
+
+
+def _get_size(path: Path) -> int:
+    if not path.is_dir() or path.is_symlink():
+        return path.lstat().st_size
+
+    size = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            size += (Path(dir_path) / file_name).lstat().st_size
+
+    return size
+
+
+def _remove_matching_paths(vendor_dir_path: Path, remove_patterns: tuple[str, ...]):
+    for dir_path, dir_names, file_names in os.walk(vendor_dir_path):
+        relative_dir_path = PurePath(dir_path).relative_to(vendor_dir_path)
+
+        for dir_name in list(dir_names):
+            if _matches_any(relative_dir_path / dir_name, remove_patterns):
+                logger.debug(f"Removing directory: {Path(dir_path) / dir_name}")
+                shutil.rmtree(Path(dir_path) / dir_name)
+                dir_names.remove(dir_name)
+
+        for file_name in file_names:
+            if _matches_any(relative_dir_path / file_name, remove_patterns):
+                logger.debug(f"Removing file: {Path(dir_path) / file_name}")
+                (Path(dir_path) / file_name).unlink()
+
+
+def _matches_any(relative_path: PurePath, patterns: tuple[str, ...]) -> bool:
+    return any(relative_path.match(pattern) for pattern in patterns)
+
+
+def _write_slim_report(build_dir_path: Path, slim_report: SlimReport):
+    for vendor_dir_name, packages in slim_report.removed_bytes.items():
+        for package, removed_bytes in sorted(packages.items(), key=lambda p: -p[1]):
+            logger.debug(f"Slimmed {vendor_dir_name}/{package}: {removed_bytes} bytes removed")
+    logger.info(f"Slimmed vendor directories: {slim_report.total_removed_bytes} bytes removed")
+
+    with (build_dir_path / SLIM_REPORT_FILE).open("w") as f:
+        json.dump(slim_report.to_json_dict(), f, indent=2)
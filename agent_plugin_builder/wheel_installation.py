@@ -0,0 +1,275 @@
+import base64
+import csv
+import hashlib
+import io
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import Parser
+from pathlib import Path, PurePosixPath
+from typing import Final, Sequence
+
+from monkeytypes import OperatingSystem
+from packaging.requirements import InvalidRequirement
+from packaging.utils import NormalizedName, canonicalize_name
+
+from .lock_file_analysis import (
+    LockedFile,
+    is_required,
+    parse_requirement,
+    select_pure_python_wheels,
+)
+
+logger = logging.getLogger(__name__)
+
+INSTALLER: Final = "agent-plugin-builder"
+PURE_PYTHON_SCHEMES: Final = ("purelib", "platlib")
+REMAINING_REQUIREMENTS_FILE: Final = "requirements-{vendor_dir_name}.txt"
+
+
+class WheelInstallationError(Exception):
+    """Raised when a wheel can't be installed on the host."""
+
+    pass
+
+
+class VerifiedWheel:
+    """
+    A pure-Python wheel from the wheelhouse, which matches its hash in the lock file
+    """
+
+    def __init__(self, name: NormalizedName, filename: str, content: bytes):
+        self.name = name
+        self.filename = filename
+        self._content = content
+        with zipfile.ZipFile(io.BytesIO(content)) as wheel_zip:
+            self._dist_info_dir = _get_dist_info_dir(wheel_zip, filename)
+            self._files = _get_installed_files(wheel_zip, self._dist_info_dir, filename)
+
+    def install(self, target_dir_path: Path):
+        """
+        Install the files which the RECORD of the wheel lists into a target directory, like
+        `pip install --no-deps -t` does.
+
+        Existing files are replaced, and not written to, since they may be hard-linked.
+
+        :param target_dir_path: Path to the target directory.
+        :raises WheelInstallationError: If a file doesn't match its hash in the RECORD.
+        """
+        record_rows = []
+        with zipfile.ZipFile(io.BytesIO(self._content)) as wheel_zip:
+            for member_name, (installed_path, record_hash) in self._files.items():
+                data = wheel_zip.read(member_name)
+                file_hash = _get_record_hash(data)
+                if record_hash.startswith("sha256=") and record_hash != file_hash:
+                    raise WheelInstallationError(
+                        f"{member_name} in {self.filename} doesn't match its hash in the RECORD"
+                    )
+
+                mode = wheel_zip.getinfo(member_name).external_attr >> 16
+                _write_file(target_dir_path / installed_path, data, executable=bool(mode & 0o111))
+                record_rows.append((installed_path, file_hash, str(len(data))))
+
+        installer_data = f"{INSTALLER}\n".encode()
+        installer_path = f"{self._dist_info_dir}/INSTALLER"
+        _write_file(target_dir_path / installer_path, installer_data)
+        record_rows.append(
+            (installer_path, _get_record_hash(installer_data), str(len(installer_data)))
+        )
+        record_rows.append((f"{self._dist_info_dir}/RECORD", "", ""))
+
+        record = io.StringIO()
+        csv.writer(record, lineterminator="\n").writerows(record_rows)
+        _write_file(target_dir_path / self._dist_info_dir / "RECORD", record.getvalue().encode())
+
+
+def verify_pure_python_wheels(
+    build_dir_path: Path, operating_system: OperatingSystem, wheelhouse_path: Path
+) -> list[VerifiedWheel]:
+    """
+    Find the pure-Python wheels of the required packages in a wheelhouse, and verify them.
+
+    Every wheel must match its SHA-256 hash in the lock file, and must only install files into
+    the target directory. The wheels are read and verified in parallel threads. Wheels which are
+    missing from the wheelhouse, or which fail the verification, are left to the builder
+    containers.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file and the Poetry lock file.
+    :param operating_system: The operating system which the packages are installed for.
+    :param wheelhouse_path: Path to the directory which contains the wheels.
+    :return: The verified wheels.
+    """
+    locked_wheels = select_pure_python_wheels(build_dir_path, operating_system)
+    with ThreadPoolExecutor(thread_name_prefix="wheel-verification") as executor:
+        verified_wheels = [
+            verified_wheel
+            for verified_wheel in executor.map(
+                lambda locked_wheel: _verify_wheel(locked_wheel, wheelhouse_path), locked_wheels
+            )
+            if verified_wheel is not None
+        ]
+
+    logger.info(
+        f"Found {len(verified_wheels)} of {len(locked_wheels)} pure-Python wheels for "
+        f"{operating_system.value} in the wheelhouse: {wheelhouse_path}"
+    )
+    return verified_wheels
+
+
+def _verify_wheel(locked_wheel: LockedFile, wheelhouse_path: Path) -> VerifiedWheel | None:
+    wheel_path = wheelhouse_path / locked_wheel.filename
+    try:
+        content = wheel_path.read_bytes()
+    except FileNotFoundError:
+        logger.debug(f"Wheel {locked_wheel.filename} is not in the wheelhouse")
+        return None
+
+    if hashlib.sha256(content).hexdigest() != locked_wheel.sha256:
+        logger.warning(f"Wheel {wheel_path} doesn't match its hash in the lock file, ignoring it")
+        return None
+
+    try:
+        return VerifiedWheel(locked_wheel.name, locked_wheel.filename, content)
+    except (WheelInstallationError, zipfile.BadZipFile) as err:
+        logger.info(f"Unable to install wheel {locked_wheel.filename} on the host: {err}")
+        return None
+
+
+def install_verified_wheels(verified_wheels: Sequence[VerifiedWheel], target_dir_path: Path):
+    """
+    Install verified wheels into a target directory in parallel threads.
+
+    :param verified_wheels: The wheels to install.
+    :param target_dir_path: Path to the target directory.
+    :raises WheelInstallationError: If a wheel is broken.
+    """
+    if not verified_wheels:
+        return
+
+    logger.info(f"Installing {len(verified_wheels)} pure-Python wheels into {target_dir_path}")
+    target_dir_path.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(thread_name_prefix="wheel-installation") as executor:
+        for _ in executor.map(
+            lambda verified_wheel: verified_wheel.install(target_dir_path), verified_wheels
+        ):
+            pass
+
+
+def write_remaining_requirements(
+    build_dir_path: Path,
+    vendor_dir_name: str,
+    operating_system: OperatingSystem,
+    verified_wheels: Sequence[VerifiedWheel],
+) -> Path | None:
+    """
+    Write the requirements which are not installed from verified wheels to a requirements file.
+
+    The options of the exported requirements file, like its index URLs, are kept. Requirements
+    which are not installed on the operating system are left out.
+
+    :param build_dir_path: Path to the build directory, which contains the exported
+        requirements file.
+    :param vendor_dir_name: Name of the vendor directory which the requirements are installed
+        into.
+    :param operating_system: The operating system which the requirements are installed for.
+    :param verified_wheels: The wheels which are installed on the host.
+    :return: Path to the requirements file, or None if no requirements remain.
+    """
+    installed_names = {verified_wheel.name for verified_wheel in verified_wheels}
+    requirements_text = (build_dir_path / "requirements.txt").read_text()
+    lines = []
+    remaining_requirements = 0
+    for line in requirements_text.replace("\\\n", " ").splitlines():
+        try:
+            requirement = parse_requirement(line)
+        except InvalidRequirement:
+            requirement = None
+        if requirement is not None:
+            if canonicalize_name(requirement.name) in installed_names:
+                continue
+            if is_required(requirement, operating_system) is False:
+                continue
+            remaining_requirements += 1
+        lines.append(line)
+
+    if remaining_requirements == 0:
+        logger.info(f"Every requirement of {vendor_dir_name} is installed from pure-Python wheels")
+        return None
+
+    requirements_file_path = build_dir_path / REMAINING_REQUIREMENTS_FILE.format(
+        vendor_dir_name=vendor_dir_name
+    )
+    requirements_file_path.write_text("\n".join(lines) + "\n")
+    logger.info(f"{remaining_requirements} requirements of {vendor_dir_name} remain to install")
+
+    return requirements_file_path
+
+
+def _get_dist_info_dir(wheel_zip: zipfile.ZipFile, filename: str) -> str:
+    dist_info_dirs = {
+        name.split("/")[0]
+        for name in wheel_zip.namelist()
+        if name.split("/")[0].endswith(".dist-info")
+    }
+    if len(dist_info_dirs) != 1:
+        raise WheelInstallationError(f"{filename} must have exactly one .dist-info directory")
+
+    dist_info_dir = dist_info_dirs.pop()
+    try:
+        wheel_metadata = Parser().parsestr(wheel_zip.read(f"{dist_info_dir}/WHEEL").decode())
+    except KeyError:
+        raise WheelInstallationError(f"{filename} has no WHEEL file")
+
+    if wheel_metadata.get("Root-Is-Purelib", "").strip().lower() != "true":
+        raise WheelInstallationError(f"{filename} is not a purelib wheel")
+
+    return dist_info_dir
+
+
+def _get_installed_files(
+    wheel_zip: zipfile.ZipFile, dist_info_dir: str, filename: str
+) -> dict[str, tuple[str, str]]:
+    record_path = f"{dist_info_dir}/RECORD"
+    try:
+        record = wheel_zip.read(record_path).decode()
+    except KeyError:
+        raise WheelInstallationError(f"{filename} has no RECORD file")
+
+    data_dir = dist_info_dir.removesuffix(".dist-info") + ".data"
+    members = set(wheel_zip.namelist())
+    installed_files = {}
+    for row in csv.reader(record.splitlines()):
+        if not row or row[0] == record_path:
+            continue
+
+        path = PurePosixPath(row[0])
+        if path.is_absolute() or ".." in path.parts:
+            raise WheelInstallationError(f"{filename} installs {path} outside the target")
+        if row[0] not in members:
+            raise WheelInstallationError(f"{filename} doesn't contain {path}")
+
+        installed_path = path
+        if path.parts[0] == data_dir:
+            if len(path.parts) < 3 or path.parts[1] not in PURE_PYTHON_SCHEMES:
+                raise WheelInstallationError(f"{filename} installs {path} outside the target")
+            installed_path = PurePosixPath(*path.parts[2:])
+
+        record_hash = row[1] if len(row) > 1 else ""
+        installed_files[row[0]] = (str(installed_path), record_hash)
+
+    return installed_files
+
+
+def _get_record_hash(data: bytes) -> str:
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=")
+    return f"sha256={digest.decode()}"
+
+
+def _write_file(path: Path, data: bytes, executable: bool = False):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.unlink(missing_ok=True)
+    path.write_bytes(data)
+    if executable:
+        os.chmod(path, 0o755)
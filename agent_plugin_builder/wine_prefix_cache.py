@@ -0,0 +1,133 @@
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Final
+
+from .build_workspace import PathLock
+from .file_transfer import get_temporary_path
+
+logger = logging.getLogger(__name__)
+
+
+class WinePrefixError(Exception):
+    """Raised when a Wine prefix fails to be initialized."""
+
+    pass
+
+
+WINE_PREFIXES_DIR: Final = "wine-prefixes"
+WINE_PREFIX_KEY_LENGTH: Final = 16
+WINE_PREFIX_MARKER_FILE: Final = ".agent_plugin_builder_image_id"
+WINE_PREFIX_ENVIRONMENT_FILE: Final = ".environment"
+WINE_PREFIX_REQUIRED_FILES: Final = (
+    "system.reg",
+    "user.reg",
+    "drive_c",
+    WINE_PREFIX_ENVIRONMENT_FILE,
+)
+WINE_PREFIX_MOUNT_PATH: Final = "/wineprefix"
+WINDOWS_IMAGE_INIT_COMMAND: Final = ". /opt/mkuserwineprefix"
+# The prefix is created by the image's own init script, and is copied out after the wineserver
+# has exited and flushed the registry. The environment which the init script exports is saved
+# with the prefix, so that the steps which reuse the prefix run with the same environment.
+WINE_PREFIX_CREATE_COMMANDS: Final = " && ".join(
+    [
+        WINDOWS_IMAGE_INIT_COMMAND,
+        "wineserver -w",
+        f'cp -a "$WINEPREFIX"/. {WINE_PREFIX_MOUNT_PATH}/',
+        f"export -p > {WINE_PREFIX_MOUNT_PATH}/{WINE_PREFIX_ENVIRONMENT_FILE}",
+    ]
+)
+# The cached prefix is mounted read-only and every step runs in its own copy of it, since
+# concurrent wineservers would corrupt a shared prefix
+WINE_PREFIX_INIT_COMMAND: Final = " && ".join(
+    [
+        f". {WINE_PREFIX_MOUNT_PATH}/{WINE_PREFIX_ENVIRONMENT_FILE}",
+        'export WINEPREFIX="$(mktemp -d)"',
+        f'cp -a {WINE_PREFIX_MOUNT_PATH}/. "$WINEPREFIX"/',
+    ]
+)
+
+
+class WinePrefixCache:
+    """
+    A cache of initialized Wine prefixes, keyed by the ID of the Windows builder image which
+    initialized them
+
+    A prefix is created the first time that an image is used, and is reused by every step and
+    every build which uses the same image. A new prefix is created when the image changes.
+    """
+
+    def __init__(self, cache_dir_path: Path):
+        self._prefixes_dir_path = cache_dir_path / WINE_PREFIXES_DIR
+
+    def get_wine_prefix(self, image_id: str, create_wine_prefix: Callable[[Path], None]) -> Path:
+        """
+        Get the initialized Wine prefix of an image, and create it if it is missing or invalid.
+
+        Concurrent builds wait for each other to create the prefix of the same image.
+
+        :param image_id: The ID of the Windows builder image.
+        :param create_wine_prefix: A callable which creates a Wine prefix in the directory which
+            it is given.
+        :return: Path to the initialized Wine prefix.
+        :raises WinePrefixError: If the created Wine prefix is incomplete.
+        """
+        wine_prefix_path = self.get_wine_prefix_path(image_id)
+        self._prefixes_dir_path.mkdir(parents=True, exist_ok=True)
+        with PathLock(wine_prefix_path):
+            if self.is_valid(image_id):
+                logger.info(f"Reusing Wine prefix: {wine_prefix_path}")
+                return wine_prefix_path
+
+            self._create_wine_prefix(image_id, create_wine_prefix)
+
+        return wine_prefix_path
+
+    def get_wine_prefix_path(self, image_id: str) -> Path:
+        """
+        Get the path of the Wine prefix of an image in the cache.
+
+        :param image_id: The ID of the Windows builder image.
+        :return: Path to the Wine prefix of the image.
+        """
+        return self._prefixes_dir_path / image_id.removeprefix("sha256:")[:WINE_PREFIX_KEY_LENGTH]
+
+    def is_valid(self, image_id: str) -> bool:
+        """
+        Check whether the cache has a complete Wine prefix which was initialized by an image.
+
+        :param image_id: The ID of the Windows builder image.
+        :return: Whether the Wine prefix of the image is valid.
+        """
+        wine_prefix_path = self.get_wine_prefix_path(image_id)
+        try:
+            if (wine_prefix_path / WINE_PREFIX_MARKER_FILE).read_text() != image_id:
+                return False
+        except OSError:
+            return False
+
+        return _is_complete(wine_prefix_path)
+
+    def _create_wine_prefix(self, image_id: str, create_wine_prefix: Callable[[Path], None]):
+        wine_prefix_path = self.get_wine_prefix_path(image_id)
+        logger.info(f"Creating Wine prefix: {wine_prefix_path}")
+        temporary_prefix_path = get_temporary_path(wine_prefix_path)
+        shutil.rmtree(temporary_prefix_path, ignore_errors=True)
+        temporary_prefix_path.mkdir()
+        try:
+            create_wine_prefix(temporary_prefix_path)
+            if not _is_complete(temporary_prefix_path):
+                raise WinePrefixError(f"The Wine prefix of image {image_id} is incomplete")
+            (temporary_prefix_path / WINE_PREFIX_MARKER_FILE).write_text(image_id)
+
+            # The prefix is invalid, or was created by a different image with the same key
+            shutil.rmtree(wine_prefix_path, ignore_errors=True)
+            os.rename(temporary_prefix_path, wine_prefix_path)
+        finally:
+            shutil.rmtree(temporary_prefix_path, ignore_errors=True)
+
+
+def _is_complete(wine_prefix_path: Path) -> bool:
+    return all((wine_prefix_path / name).exists() for name in WINE_PREFIX_REQUIRED_FILES)
@@ -0,0 +1,6 @@
+from enum import Enum
+
+
+class WorkspaceType(Enum):
+    DISK = "disk"
+    MEMORY = "memory"
@@ -8,6 +8,8 @@ import pytest
 
 from agent_plugin_builder import AgentPluginBuildOptions, PlatformDependencyPackagingMethod
 from agent_plugin_builder.agent_plugin_build_options import parse_agent_plugin_build_options
+from agent_plugin_builder.size_budgets import SizeBudgets
+from agent_plugin_builder.slim_rules import SlimRules
 
 PLUGIN_DIR = tempfile.mkdtemp(prefix="plugin_dir_path_")
 BUILD_DIR = tempfile.mkdtemp(prefix="build_dir_path_")
@@ -23,6 +25,29 @@ AGENT_PLUGIN_BUILD_OPTIONS_DICT_IN: dict[str, Any] = {
     "source_dir_name": SOURCE_DIR_NAME,
     "platform_dependencies": PLATFORM_DEPENDENCIES,
     "verify_hashes": VERIFY_HASHES,
+    "slim_rules": None,
+    "precompile_bytecode": False,
+    "vendor_bundle": None,
+    "size_report": False,
+    "size_budgets": None,
+    "dist_publish_method": "copy",
+    "workspace": "disk",
+    "isolated_build_dir": False,
+    "resume": False,
+    "force": False,
+    "pull_policy": "missing",
+    "installed_tree_cache": False,
+    "wine_prefix_cache": False,
+    "autodetect_cache": False,
+    "lock_file_autodetect": True,
+    "speculative_install": False,
+    "docker_endpoints": [],
+    "profile": None,
+    "cache_dir_path": None,
+    "wheelhouse_path": None,
+    "prefetch": False,
+    "index_url": None,
+    "prefetch_connections": 8,
 }
 
 AGENT_PLUGIN_BUILD_OPTIONS_DICT_OUT: dict[str, Any] = copy.deepcopy(
@@ -176,6 +201,36 @@ def test_parse_agent_plugin_builder_options():
     )
 
 
+def test_parse_agent_plugin_builder_options__slim():
+    namespace = copy.copy(AGENT_PLUGIN_BUILD_OPTIONS_NAMESPACE)
+    namespace.slim = True
+    namespace.slim_rules_path = None
+
+    agent_plugin_build_options = parse_agent_plugin_build_options(namespace)
+
+    assert agent_plugin_build_options.slim_rules == SlimRules()
+
+
+def test_parse_agent_plugin_builder_options__size_budgets(tmp_path: Path):
+    size_budgets_path = tmp_path / "size_budgets.yaml"
+    size_budgets_path.write_text("max_compressed_bytes: 1024\n")
+    namespace = copy.copy(AGENT_PLUGIN_BUILD_OPTIONS_NAMESPACE)
+    namespace.size_budgets_path = size_budgets_path
+
+    agent_plugin_build_options = parse_agent_plugin_build_options(namespace)
+
+    assert agent_plugin_build_options.size_report
+    assert agent_plugin_build_options.size_budgets == SizeBudgets(max_compressed_bytes=1024)
+
+
 def test_parse_agent_plugin_builder_options__invalid():
     with pytest.raises(ValueError):
         parse_agent_plugin_build_options(INVALID_AGENT_PLUGIN_BUILD_OPTIONS_NAMESPACE)
+
+
+def test_parse_agent_plugin_builder_options__non_build_options():
+    namespace = copy.copy(AGENT_PLUGIN_BUILD_OPTIONS_NAMESPACE)
+    namespace.verbosity = 3
+    namespace.json_summary_path = Path("summary.json")
+
+    assert parse_agent_plugin_build_options(namespace) == AGENT_PLUGIN_BUILD_OPTIONS_OBJECT
@@ -0,0 +1,104 @@
+import json
+import shutil
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.agent_plugin_builder import main
+from agent_plugin_builder.archive_checksums import ArchiveChecksums, PluginArchiveChecksums
+from agent_plugin_builder.archive_size_analysis import SizeBudgetExceededError
+from agent_plugin_builder.build_result import BuildResult
+from agent_plugin_builder.platform_dependency_packaging_method import (
+    PlatformDependencyPackagingMethod,
+)
+from agent_plugin_builder.setup_build_plugin_logging import reset_logger
+
+BUILD_RESULT = BuildResult(
+    plugin_archive_path=Path("dist/Mock-exploiter.tar"),
+    plugin_archive_size=2048,
+    source_archive_size=1024,
+    platform_dependencies=PlatformDependencyPackagingMethod.COMMON,
+    vendor_dir_sizes={"vendor": 4096},
+    vendor_file_counts={"vendor": 12},
+    stage_durations={},
+    checksums=PluginArchiveChecksums(
+        plugin_archive=ArchiveChecksums(
+            archive_name="Mock-exploiter.tar", sha256="0" * 64, members={}
+        )
+    ),
+)
+
+
+@pytest.fixture(autouse=True)
+def restore_logger():
+    yield
+    reset_logger()
+
+
+@pytest.fixture
+def build_args(tmp_path: Path, data_for_tests_dir: Path) -> tuple[list[str], str]:
+    plugin_dir_path = tmp_path / "mock-exploiter"
+    shutil.copytree(data_for_tests_dir / "mock-exploiter", plugin_dir_path)
+
+    return [
+        "build_agent_plugin",
+        "-b",
+        str(tmp_path / "build"),
+        "-d",
+        str(tmp_path / "dist"),
+    ], str(plugin_dir_path)
+
+
+@pytest.fixture
+def mock_build_agent_plugin_archive(monkeypatch) -> MagicMock:
+    mock_build_agent_plugin_archive = MagicMock(return_value=BUILD_RESULT)
+    monkeypatch.setattr(
+        "agent_plugin_builder.agent_plugin_builder.build_agent_plugin_archive",
+        mock_build_agent_plugin_archive,
+    )
+
+    return mock_build_agent_plugin_archive
+
+
+def test_main__json_summary_to_stdout(
+    monkeypatch, capsys, build_args, mock_build_agent_plugin_archive: MagicMock
+):
+    options, plugin_dir_path = build_args
+    monkeypatch.setattr(sys, "argv", [*options, "--json-summary", "-", plugin_dir_path])
+
+    assert main() == 0
+
+    captured = capsys.readouterr()
+    assert json.loads(captured.out) == BUILD_RESULT.to_json_dict()
+    assert "Built plugin archive" in captured.err
+
+
+def test_main__build_failure(
+    monkeypatch, capsys, build_args, mock_build_agent_plugin_archive: MagicMock
+):
+    options, plugin_dir_path = build_args
+    monkeypatch.setattr(sys, "argv", [*options, "--json-summary", "-", plugin_dir_path])
+    mock_build_agent_plugin_archive.side_effect = SizeBudgetExceededError("Over budget")
+
+    assert main() != 0
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "Over budget" in captured.err
+
+
+def test_main__plugin_dir_named_inspect(
+    tmp_path: Path, monkeypatch, build_args, mock_build_agent_plugin_archive: MagicMock
+):
+    options, plugin_dir_path = build_args
+    inspect_dir_path = tmp_path / "inspect"
+    Path(plugin_dir_path).rename(inspect_dir_path)
+    monkeypatch.setattr(sys, "argv", [*options, "inspect"])
+    monkeypatch.chdir(tmp_path)
+
+    assert main() == 0
+
+    build_options = mock_build_agent_plugin_archive.call_args.args[0]
+    assert build_options.plugin_dir_path.resolve() == inspect_dir_path
@@ -0,0 +1,116 @@
+import json
+import sys
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.agent_plugin_archive_inspector import main
+from agent_plugin_builder.archive_inspection import VendoredPackage, inspect_plugin_archive
+
+MANIFEST = b"""
+name: MockExploiter
+plugin_type: Exploiter
+supported_operating_systems:
+  - linux
+  - windows
+target_operating_systems:
+  - linux
+title: Mock Exploiter
+version: 1.2.3
+"""
+CONFIG_SCHEMA = {"type": "object", "properties": {"timeout": {"type": "number"}}}
+
+
+def _write_file(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+@pytest.fixture
+def plugin_archive_path(tmp_path: Path) -> Path:
+    source_dir_path = tmp_path / "source_dir"
+    _write_file(source_dir_path / "plugin.py", b"print('plugin')\n")
+    _write_file(source_dir_path / "vendor" / "requests" / "__init__.py", b"a" * 1000)
+    _write_file(source_dir_path / "vendor" / "requests-2.32.3.dist-info" / "METADATA", b"b" * 100)
+    _write_file(source_dir_path / "vendor" / "requests-2.32.3.dist-info" / "RECORD", b"c" * 100)
+    _write_file(source_dir_path / "vendor-windows" / "pywin32-306.dist-info" / "METADATA", b"d")
+    _write_file(source_dir_path / "vendor-windows" / "win32" / "win32api.pyd", b"e" * 3000)
+
+    build_dir_path = tmp_path / "build"
+    _write_file(build_dir_path / "manifest.yaml", MANIFEST)
+    _write_file(build_dir_path / "config-schema.json", json.dumps(CONFIG_SCHEMA).encode())
+    with tarfile.open(build_dir_path / "source.tar.gz", "w:gz") as tar:
+        for item in source_dir_path.iterdir():
+            tar.add(item, item.name)
+
+    plugin_archive_path = tmp_path / "MockExploiter-exploiter.tar"
+    with tarfile.open(plugin_archive_path, "w") as tar:
+        for name in ("source.tar.gz", "config-schema.json", "manifest.yaml"):
+            tar.add(build_dir_path / name, name)
+
+    return plugin_archive_path
+
+
+def test_inspect_plugin_archive(plugin_archive_path: Path):
+    inspection = inspect_plugin_archive(plugin_archive_path)
+
+    assert inspection.archive_name == plugin_archive_path.name
+    assert inspection.archive_bytes == plugin_archive_path.stat().st_size
+    assert inspection.manifest["version"] == "1.2.3"
+    assert inspection.config_schema == CONFIG_SCHEMA
+    assert inspection.source_file_count == 6
+    assert inspection.source_uncompressed_bytes == 4217
+    assert inspection.vendor_dirs == ("vendor", "vendor-windows")
+    assert inspection.packages == (
+        VendoredPackage(name="requests", version="2.32.3", vendor_dir="vendor"),
+        VendoredPackage(name="pywin32", version="306", vendor_dir="vendor-windows"),
+    )
+    assert inspection.source_members is None
+
+
+def test_inspect_plugin_archive__source_members(plugin_archive_path: Path):
+    inspection = inspect_plugin_archive(plugin_archive_path, include_source_members=True)
+
+    assert inspection.source_members is not None
+    assert "vendor-windows/win32/win32api.pyd" in inspection.source_members
+
+
+def test_inspect_plugin_archive__no_manifest(tmp_path: Path):
+    plugin_archive_path = tmp_path / "plugin.tar"
+    (tmp_path / "source.tar.gz").write_bytes(b"")
+    with tarfile.open(plugin_archive_path, "w") as tar:
+        tar.add(tmp_path / "source.tar.gz", "source.tar.gz")
+
+    with pytest.raises(tarfile.TarError):
+        inspect_plugin_archive(plugin_archive_path)
+
+
+def test_inspect_plugin_archive__empty_file(tmp_path: Path):
+    plugin_archive_path = tmp_path / "plugin.tar"
+    plugin_archive_path.touch()
+
+    with pytest.raises(tarfile.TarError):
+        inspect_plugin_archive(plugin_archive_path)
+
+
+def test_main__several_archives(plugin_archive_path: Path, tmp_path: Path, capsys):
+    invalid_archive_path = tmp_path / "invalid.tar"
+    invalid_archive_path.write_bytes(b"not an archive")
+
+    exit_code = main(
+        [str(plugin_archive_path), str(invalid_archive_path), str(plugin_archive_path)]
+    )
+
+    inspections = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert exit_code == 1
+    assert len(inspections) == 2
+    assert inspections[0]["manifest"]["name"] == "MockExploiter"
+    assert "source_members" not in inspections[0]
+
+
+def test_main__command_line(plugin_archive_path: Path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["inspect_agent_plugin_archive", str(plugin_archive_path)])
+
+    assert main() == 0
+    assert json.loads(capsys.readouterr().out)["packages"][0]["name"] == "requests"
@@ -0,0 +1,144 @@
+import json
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.archive_size_analysis import (
+    DEDUP_SAVINGS,
+    SIZE_REPORT_FILE,
+    SLIM_SAVINGS,
+    SizeBudgetExceededError,
+    analyze_archive,
+    analyze_source_archive,
+    check_size_budgets,
+)
+from agent_plugin_builder.size_budgets import SizeBudgets, get_size_budgets
+
+SOURCE_DIR_NAME = "source_dir"
+
+
+def _write_file(path: Path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+@pytest.fixture
+def source_archive_path(tmp_path: Path) -> Path:
+    source_dir_path = tmp_path / SOURCE_DIR_NAME
+    _write_file(source_dir_path / "plugin.py", b"print('plugin')\n" * 10)
+    _write_file(source_dir_path / "vendor" / "package" / "__init__.py", b"a" * 1000)
+    _write_file(source_dir_path / "vendor" / "package" / "copy.py", b"a" * 1000)
+    _write_file(source_dir_path / "vendor" / "package" / "tests" / "test_package.py", b"b" * 500)
+    _write_file(source_dir_path / "vendor" / "package-1.0.dist-info" / "METADATA", b"c" * 100)
+    _write_file(source_dir_path / "vendor" / "module.py", b"d" * 200)
+    _write_file(source_dir_path / "vendor-windows" / "package" / "core.pyd", b"e" * 3000)
+
+    source_archive_path = tmp_path / "source.tar.gz"
+    with tarfile.open(source_archive_path, "w:gz") as tar:
+        for item in source_dir_path.iterdir():
+            tar.add(item, item.name)
+
+    return source_archive_path
+
+
+def test_analyze_archive(source_archive_path: Path):
+    size_report = analyze_archive(source_archive_path)
+
+    assert size_report.compressed_bytes == source_archive_path.stat().st_size
+    assert size_report.uncompressed_bytes == 5960
+    assert size_report.top_level_entries["vendor"].uncompressed_bytes == 2800
+    assert size_report.top_level_entries["vendor"].file_count == 5
+    assert set(size_report.vendor_dirs) == {"vendor", "vendor-windows"}
+    assert size_report.packages["vendor/package"].uncompressed_bytes == 2600
+    assert size_report.packages["vendor/package"].file_count == 4
+    assert size_report.packages["vendor/module"].uncompressed_bytes == 200
+    assert size_report.packages["vendor-windows/package"].uncompressed_bytes == 3000
+    assert size_report.file_types[".py"].uncompressed_bytes == 2860
+    assert size_report.file_types["(none)"].uncompressed_bytes == 100
+    assert size_report.largest_files[0].path == "vendor-windows/package/core.pyd"
+    assert sum(
+        breakdown.compressed_bytes for breakdown in size_report.top_level_entries.values()
+    ) == pytest.approx(size_report.compressed_bytes, abs=len(size_report.top_level_entries))
+
+
+def test_analyze_archive__estimated_savings(source_archive_path: Path):
+    size_report = analyze_archive(source_archive_path)
+
+    assert size_report.estimated_savings[DEDUP_SAVINGS].uncompressed_bytes == 1000
+    assert size_report.estimated_savings[DEDUP_SAVINGS].file_count == 1
+    assert size_report.estimated_savings[SLIM_SAVINGS].uncompressed_bytes == 500
+    assert size_report.estimated_savings[SLIM_SAVINGS].file_count == 1
+
+
+def test_analyze_archive__largest_file_count(source_archive_path: Path):
+    size_report = analyze_archive(source_archive_path, largest_file_count=2)
+
+    assert [file.path for file in size_report.largest_files] == [
+        "vendor-windows/package/core.pyd",
+        "vendor/package/__init__.py",
+    ]
+
+
+def test_analyze_archive__plugin_archive(tmp_path: Path, source_archive_path: Path):
+    plugin_archive_path = tmp_path / "Plugin-exploiter.tar"
+    with tarfile.open(plugin_archive_path, "w") as tar:
+        tar.add(source_archive_path, source_archive_path.name)
+
+    size_report = analyze_archive(plugin_archive_path)
+
+    assert size_report == analyze_archive(source_archive_path)
+
+
+def test_analyze_source_archive__report_file(tmp_path: Path, source_archive_path: Path):
+    size_report = analyze_source_archive(tmp_path, source_archive_path)
+
+    with (tmp_path / SIZE_REPORT_FILE).open("r") as f:
+        assert json.load(f) == size_report.to_json_dict()
+
+
+def test_analyze_source_archive__budget_exceeded(tmp_path: Path, source_archive_path: Path):
+    with pytest.raises(SizeBudgetExceededError):
+        analyze_source_archive(
+            tmp_path, source_archive_path, SizeBudgets(max_uncompressed_bytes=1000)
+        )
+
+    assert (tmp_path / SIZE_REPORT_FILE).exists()
+
+
+@pytest.mark.parametrize(
+    "size_budgets, exceeded",
+    [
+        (SizeBudgets(), False),
+        (SizeBudgets(max_compressed_bytes=1), True),
+        (SizeBudgets(max_uncompressed_bytes=5960), False),
+        (SizeBudgets(max_uncompressed_bytes=5959), True),
+        (SizeBudgets(max_vendor_dir_bytes=3000), False),
+        (SizeBudgets(max_vendor_dir_bytes=2999), True),
+        (SizeBudgets(max_package_bytes=2999), True),
+    ],
+)
+def test_check_size_budgets(source_archive_path: Path, size_budgets: SizeBudgets, exceeded: bool):
+    size_report = analyze_archive(source_archive_path)
+
+    if exceeded:
+        with pytest.raises(SizeBudgetExceededError):
+            check_size_budgets(size_report, size_budgets)
+    else:
+        check_size_budgets(size_report, size_budgets)
+
+
+def test_get_size_budgets(tmp_path: Path):
+    size_budgets_path = tmp_path / "size_budgets.yaml"
+    size_budgets_path.write_text("max_compressed_bytes: 1024\nmax_package_bytes: 512\n")
+
+    assert get_size_budgets(size_budgets_path) == SizeBudgets(
+        max_compressed_bytes=1024, max_package_bytes=512
+    )
+
+
+def test_get_size_budgets__empty_file(tmp_path: Path):
+    size_budgets_path = tmp_path / "size_budgets.yaml"
+    size_budgets_path.write_text("")
+
+    assert get_size_budgets(size_budgets_path) == SizeBudgets()
@@ -0,0 +1,300 @@
+import base64
+import hashlib
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from monkeytypes import OperatingSystem
+
+from agent_plugin_builder.artifact_prefetching import (
+    BUILD_WHEELHOUSE_DIR,
+    DEFAULT_INDEX_URL,
+    PrefetchError,
+    get_index_urls,
+    prefetch_artifacts,
+)
+
+ARTIFACTS = {
+    "requests": {"requests-2.32.3-py3-none-any.whl": b"requests wheel"},
+    "pyyaml": {
+        "PyYAML-6.0.2-cp311-cp311-manylinux2014_x86_64.whl": b"pyyaml linux wheel",
+        "PyYAML-6.0.2-cp311-cp311-win_amd64.whl": b"pyyaml windows wheel",
+        "PyYAML-6.0.2.tar.gz": b"pyyaml sdist",
+    },
+    "pywin32": {"pywin32-306-cp311-cp311-win_amd64.whl": b"pywin32 wheel"},
+    "legacy": {"legacy-1.0.tar.gz": b"legacy sdist"},
+}
+REQUIREMENTS = (
+    "requests==2.32.3\n"
+    "pyyaml==6.0.2\n"
+    'pywin32==306 ; sys_platform == "win32"\n'
+    "legacy==1.0\n"
+)
+ALL_OPERATING_SYSTEMS = [OperatingSystem.LINUX, OperatingSystem.WINDOWS]
+
+
+def write_index(index_dir_path: Path, artifacts: dict[str, dict[str, bytes]]):
+    for name, files in artifacts.items():
+        page_dir_path = index_dir_path / "simple" / name
+        page_dir_path.mkdir(parents=True)
+        links = "".join(
+            f'<a href="../../packages/{filename}#sha256=0">{filename}</a>\n' for filename in files
+        )
+        (page_dir_path / "index.html").write_text(f"<html><body>\n{links}</body></html>\n")
+
+        packages_dir_path = index_dir_path / "packages"
+        packages_dir_path.mkdir(exist_ok=True)
+        for filename, content in files.items():
+            (packages_dir_path / filename).write_bytes(content)
+
+
+def write_lock_file(build_dir_path: Path, artifacts: dict[str, dict[str, bytes]]):
+    lock_file = ""
+    for name, files in artifacts.items():
+        version = next(iter(files)).split("-")[1].removesuffix(".tar.gz")
+        file_entries = ", ".join(
+            f'{{file = "{filename}", hash = "sha256:{hashlib.sha256(content).hexdigest()}"}}'
+            for filename, content in files.items()
+        )
+        lock_file += f'[[package]]\nname = "{name}"\nversion = "{version}"\n'
+        lock_file += f"files = [{file_entries}]\n\n"
+    (build_dir_path / "poetry.lock").write_text(lock_file)
+
+
+class _IndexRequestHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, *args, connections: set, authorizations: list, **kwargs):
+        self._connections = connections
+        self._authorizations = authorizations
+        super().__init__(*args, **kwargs)
+
+    def handle(self):
+        self._connections.add(self.client_address)
+        super().handle()
+
+    def do_GET(self):
+        self._authorizations.append(self.headers.get("Authorization"))
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def index_dir_path(tmp_path: Path) -> Path:
+    index_dir_path = tmp_path / "index"
+    write_index(index_dir_path, ARTIFACTS)
+
+    return index_dir_path
+
+
+@pytest.fixture
+def index_connections() -> set:
+    return set()
+
+
+@pytest.fixture
+def index_authorizations() -> list:
+    return []
+
+
+@pytest.fixture
+def index_url(
+    index_dir_path: Path, index_connections: set, index_authorizations: list
+) -> Iterator[str]:
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        partial(
+            _IndexRequestHandler,
+            directory=str(index_dir_path),
+            connections=index_connections,
+            authorizations=index_authorizations,
+        ),
+    )
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/simple/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def build_dir_path(tmp_path: Path) -> Path:
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    write_lock_file(build_dir_path, ARTIFACTS)
+    (build_dir_path / "requirements.txt").write_text(REQUIREMENTS)
+
+    return build_dir_path
+
+
+@pytest.fixture
+def wheelhouse_path(tmp_path: Path) -> Path:
+    return tmp_path / "wheelhouse"
+
+
+def test_prefetch_artifacts(
+    build_dir_path: Path, wheelhouse_path: Path, index_url: str, index_connections: set
+):
+    report = prefetch_artifacts(
+        build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path, index_url, max_connections=2
+    )
+
+    expected_filenames = [
+        "requests-2.32.3-py3-none-any.whl",
+        "PyYAML-6.0.2-cp311-cp311-manylinux2014_x86_64.whl",
+        "legacy-1.0.tar.gz",
+        "PyYAML-6.0.2-cp311-cp311-win_amd64.whl",
+        "pywin32-306-cp311-cp311-win_amd64.whl",
+    ]
+    assert list(report.downloaded) == expected_filenames
+    assert report.reused == ()
+    assert report.missing == ()
+    assert report.downloaded_bytes == sum(
+        len(ARTIFACTS[name][filename]) for name in ARTIFACTS for filename in ARTIFACTS[name]
+    ) - len(b"pyyaml sdist")
+    for name, files in ARTIFACTS.items():
+        for filename, content in files.items():
+            if filename in expected_filenames:
+                assert (wheelhouse_path / filename).read_bytes() == content
+                assert (build_dir_path / BUILD_WHEELHOUSE_DIR / filename).read_bytes() == content
+    assert not (wheelhouse_path / "PyYAML-6.0.2.tar.gz").exists()
+    # Requests share the persistent connections of the threads
+    assert len(index_connections) <= 2
+
+
+def test_prefetch_artifacts__linux(build_dir_path: Path, wheelhouse_path: Path, index_url: str):
+    report = prefetch_artifacts(build_dir_path, [OperatingSystem.LINUX], wheelhouse_path, index_url)
+
+    assert sorted(report.downloaded) == [
+        "PyYAML-6.0.2-cp311-cp311-manylinux2014_x86_64.whl",
+        "legacy-1.0.tar.gz",
+        "requests-2.32.3-py3-none-any.whl",
+    ]
+
+
+def test_prefetch_artifacts__reused(build_dir_path: Path, wheelhouse_path: Path, index_url: str):
+    prefetch_artifacts(build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path, index_url)
+    (wheelhouse_path / "legacy-1.0.tar.gz").write_bytes(b"corrupted")
+
+    report = prefetch_artifacts(build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path, index_url)
+
+    assert report.downloaded == ("legacy-1.0.tar.gz",)
+    assert len(report.reused) == 4
+    assert (wheelhouse_path / "legacy-1.0.tar.gz").read_bytes() == b"legacy sdist"
+    assert len(list((build_dir_path / BUILD_WHEELHOUSE_DIR).iterdir())) == 5
+
+
+def test_prefetch_artifacts__hash_mismatch(
+    build_dir_path: Path, wheelhouse_path: Path, index_dir_path: Path, index_url: str
+):
+    (index_dir_path / "packages" / "requests-2.32.3-py3-none-any.whl").write_bytes(b"tampered")
+
+    with pytest.raises(PrefetchError):
+        prefetch_artifacts(build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path, index_url)
+
+    assert not (wheelhouse_path / "requests-2.32.3-py3-none-any.whl").exists()
+    assert not any(path.name.endswith(".tmp") for path in wheelhouse_path.iterdir())
+
+
+def test_prefetch_artifacts__missing(
+    build_dir_path: Path, wheelhouse_path: Path, index_dir_path: Path, index_url: str
+):
+    (index_dir_path / "simple" / "legacy" / "index.html").unlink()
+    (index_dir_path / "simple" / "legacy").rmdir()
+    (index_dir_path / "packages" / "pywin32-306-cp311-cp311-win_amd64.whl").unlink()
+
+    report = prefetch_artifacts(build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path, index_url)
+
+    assert sorted(report.missing) == ["legacy-1.0.tar.gz", "pywin32-306-cp311-cp311-win_amd64.whl"]
+    assert len(report.downloaded) == 3
+
+
+def test_prefetch_artifacts__index_url_credentials(
+    build_dir_path: Path, wheelhouse_path: Path, index_url: str, index_authorizations: list
+):
+    index_url_with_credentials = index_url.replace("://", "://user:p%40ss@")
+
+    report = prefetch_artifacts(
+        build_dir_path, [OperatingSystem.LINUX], wheelhouse_path, index_url_with_credentials
+    )
+
+    assert len(report.downloaded) == 3
+    credentials = base64.b64encode(b"user:p@ss").decode()
+    assert f"Basic {credentials}" in index_authorizations
+
+
+def test_prefetch_artifacts__extra_index_url(
+    build_dir_path: Path, wheelhouse_path: Path, tmp_path: Path, index_url: str
+):
+    extra_index_dir_path = tmp_path / "extra_index"
+    write_index(extra_index_dir_path, {"internal": {"internal-1.0-py3-none-any.whl": b"internal"}})
+    artifacts = {**ARTIFACTS, "internal": {"internal-1.0-py3-none-any.whl": b"internal"}}
+    write_lock_file(build_dir_path, artifacts)
+    (build_dir_path / "requirements.txt").write_text(
+        f"--extra-index-url {(extra_index_dir_path / 'simple').as_uri()}\n"
+        f"{REQUIREMENTS}internal==1.0\n"
+    )
+
+    report = prefetch_artifacts(build_dir_path, [OperatingSystem.LINUX], wheelhouse_path, index_url)
+
+    assert "internal-1.0-py3-none-any.whl" in report.downloaded
+    assert report.missing == ()
+
+
+def test_prefetch_artifacts__file_index(
+    build_dir_path: Path, wheelhouse_path: Path, index_dir_path: Path
+):
+    report = prefetch_artifacts(
+        build_dir_path,
+        ALL_OPERATING_SYSTEMS,
+        wheelhouse_path,
+        (index_dir_path / "simple").as_uri(),
+    )
+
+    assert len(report.downloaded) == 5
+    assert (wheelhouse_path / "legacy-1.0.tar.gz").read_bytes() == b"legacy sdist"
+
+
+def test_prefetch_artifacts__nothing_to_prefetch(build_dir_path: Path, wheelhouse_path: Path):
+    (build_dir_path / "requirements.txt").write_text("")
+    (build_dir_path / BUILD_WHEELHOUSE_DIR).mkdir()
+
+    report = prefetch_artifacts(build_dir_path, ALL_OPERATING_SYSTEMS, wheelhouse_path)
+
+    assert report.downloaded == ()
+    assert not (build_dir_path / BUILD_WHEELHOUSE_DIR).exists()
+
+
+@pytest.mark.parametrize(
+    "requirements, index_url, expected_index_urls",
+    [
+        ("requests==2.32.3\n", None, [DEFAULT_INDEX_URL]),
+        (
+            "--index-url https://mirror.example.com/simple\n"
+            "--extra-index-url=https://internal.example.com/simple\n",
+            None,
+            ["https://mirror.example.com/simple", "https://internal.example.com/simple"],
+        ),
+        (
+            "-i https://mirror.example.com/simple\n",
+            "file:///srv/index",
+            ["file:///srv/index"],
+        ),
+    ],
+)
+def test_get_index_urls(
+    build_dir_path: Path,
+    requirements: str,
+    index_url: str | None,
+    expected_index_urls: list[str],
+):
+    (build_dir_path / "requirements.txt").write_text(requirements)
+
+    assert get_index_urls(build_dir_path, index_url) == expected_index_urls
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.autodetect_cache import AutodetectCache, get_autodetect_key
+from agent_plugin_builder.builder_images import DEFAULT_BUILDER_IMAGES, BuilderImages
+
+PINNED_BUILDER_IMAGES = BuilderImages(
+    linux="infectionmonkey/agent-builder@sha256:" + "1" * 64,
+    windows="sha256:" + "2" * 64,
+)
+
+
+@pytest.fixture
+def requirements_file_path(tmp_path: Path) -> Path:
+    requirements_file_path = tmp_path / "requirements.txt"
+    requirements_file_path.write_text("requests==2.32.3\n")
+
+    return requirements_file_path
+
+
+@pytest.fixture
+def package_list_file_paths(tmp_path: Path) -> list[Path]:
+    package_list_file_paths = [tmp_path / "linux_packages.json", tmp_path / "windows_packages.json"]
+    for package_list_file_path in package_list_file_paths:
+        package_list_file_path.write_text(package_list_file_path.name)
+
+    return package_list_file_paths
+
+
+@pytest.fixture
+def autodetect_cache(tmp_path: Path) -> AutodetectCache:
+    return AutodetectCache(tmp_path / "cache")
+
+
+def test_get_autodetect_key(requirements_file_path: Path):
+    key = get_autodetect_key(requirements_file_path, PINNED_BUILDER_IMAGES)
+
+    assert key is not None
+    assert key == get_autodetect_key(requirements_file_path, PINNED_BUILDER_IMAGES)
+    assert key != get_autodetect_key(
+        requirements_file_path,
+        PINNED_BUILDER_IMAGES.model_copy(update={"windows": "sha256:" + "3" * 64}),
+    )
+
+    requirements_file_path.write_text("requests==2.32.4\n")
+    assert key != get_autodetect_key(requirements_file_path, PINNED_BUILDER_IMAGES)
+
+
+def test_get_autodetect_key__unpinned_images(requirements_file_path: Path):
+    assert get_autodetect_key(requirements_file_path, DEFAULT_BUILDER_IMAGES) is None
+
+
+def test_autodetect_cache__store_and_restore(
+    tmp_path: Path,
+    requirements_file_path: Path,
+    package_list_file_paths: list[Path],
+    autodetect_cache: AutodetectCache,
+):
+    key = get_autodetect_key(requirements_file_path, PINNED_BUILDER_IMAGES)
+    assert key is not None
+    assert autodetect_cache.get(key) is None
+
+    stored_decision = autodetect_cache.store(
+        key, requirements_file_path, PINNED_BUILDER_IMAGES, True, package_list_file_paths
+    )
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    autodetect_cache.restore_package_lists(key, build_dir_path)
+
+    assert autodetect_cache.get(key) == stored_decision
+    assert stored_decision.common_vendor_dir_possible
+    assert sorted(path.name for path in build_dir_path.iterdir()) == [
+        "linux_packages.json",
+        "windows_packages.json",
+    ]
+
+
+def test_autodetect_cache__invalid_decision(
+    requirements_file_path: Path,
+    package_list_file_paths: list[Path],
+    autodetect_cache: AutodetectCache,
+    tmp_path: Path,
+):
+    autodetect_cache.store("key", requirements_file_path, PINNED_BUILDER_IMAGES, True, [])
+    (tmp_path / "cache" / "autodetect" / "key" / "decision.json").write_text("{")
+
+    assert autodetect_cache.get("key") is None
+    assert autodetect_cache.get_decisions() == []
+
+
+def test_autodetect_cache__invalidate_and_clear(
+    requirements_file_path: Path, autodetect_cache: AutodetectCache
+):
+    for key in ("key1", "key2", "key3"):
+        autodetect_cache.store(key, requirements_file_path, PINNED_BUILDER_IMAGES, False, [])
+
+    assert [decision.key for decision in autodetect_cache.get_decisions()] == [
+        "key3",
+        "key2",
+        "key1",
+    ]
+    assert autodetect_cache.invalidate("key2")
+    assert not autodetect_cache.invalidate("key2")
+    assert autodetect_cache.clear() == 2
+    assert autodetect_cache.get_decisions() == []
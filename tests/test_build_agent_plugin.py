@@ -1,10 +1,47 @@
+import asyncio
+import errno
+import hashlib
+import os
 import shutil
-from unittest.mock import MagicMock
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from monkeytypes import AgentPluginManifest
 
-from agent_plugin_builder import AgentPluginBuildOptions, build_agent_plugin_archive
+from agent_plugin_builder import (
+    AgentPluginBuildOptions,
+    BuildProgressEvent,
+    BuildStage,
+    BuildStageStatus,
+    build_agent_plugin_archive,
+    build_agent_plugin_archive_async,
+)
+from agent_plugin_builder.archive_checksums import ArchiveChecksums, PluginArchiveChecksums
+from agent_plugin_builder.build_control import run_in_thread
+from agent_plugin_builder.build_result import BuildResult
+from agent_plugin_builder.builder_images import BuilderImages
+from agent_plugin_builder.platform_dependency_packaging_method import (
+    PlatformDependencyPackagingMethod,
+)
+from agent_plugin_builder.workspace_type import WorkspaceType
+
+BUILD_RESULT = BuildResult(
+    plugin_archive_path=Path("dist/Plugin-exploiter.tar"),
+    plugin_archive_size=2048,
+    source_archive_size=1024,
+    platform_dependencies=PlatformDependencyPackagingMethod.COMMON,
+    vendor_dir_sizes={"vendor": 4096},
+    vendor_file_counts={"vendor": 12},
+    stage_durations={},
+    checksums=PluginArchiveChecksums(
+        plugin_archive=ArchiveChecksums(
+            archive_name="Plugin-exploiter.tar", sha256="0" * 64, members={}
+        )
+    ),
+)
 
 
 def test_build_agent_plugin_archive__plugin_dir_not_found(
@@ -46,7 +83,7 @@ def test_build_agent_plugin_archive__on_build_created(
     agent_plugin_build_options: AgentPluginBuildOptions,
     agent_plugin_manifest: AgentPluginManifest,
 ):
-    mock_create_agent_plugin_archive = MagicMock(return_value=None)
+    mock_create_agent_plugin_archive = MagicMock(return_value=BUILD_RESULT)
     monkeypatch.setattr(
         "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
         mock_create_agent_plugin_archive,
@@ -61,3 +98,494 @@ def test_build_agent_plugin_archive__on_build_created(
     mock_create_agent_plugin_archive.assert_called_once_with(
         agent_plugin_build_options, agent_plugin_manifest
     )
+
+
+def test_build_agent_plugin_archive__isolated_build_dir(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    mock_create_agent_plugin_archive = MagicMock(return_value=BUILD_RESULT)
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        mock_create_agent_plugin_archive,
+    )
+    (agent_plugin_build_options.build_dir_path / "other_build.log").write_text("log")
+    on_build_dir_created = MagicMock()
+    isolated_build_options = agent_plugin_build_options.model_copy(
+        update={"isolated_build_dir": True}
+    )
+
+    build_agent_plugin_archive(
+        isolated_build_options, agent_plugin_manifest, on_build_dir_created=on_build_dir_created
+    )
+
+    isolated_build_dir_path = on_build_dir_created.call_args.args[0]
+    assert isolated_build_dir_path.parent == agent_plugin_build_options.build_dir_path
+    assert (agent_plugin_build_options.build_dir_path / "other_build.log").exists()
+    build_options = mock_create_agent_plugin_archive.call_args.args[0]
+    assert build_options.build_dir_path == isolated_build_dir_path
+
+
+def test_build_agent_plugin_archive__isolated_build_dir_keeps_log_and_reports(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    def create_agent_plugin_archive(options: AgentPluginBuildOptions, _):
+        (options.build_dir_path / "requirements.txt").write_text("")
+        (options.build_dir_path / "size_report.json").write_text("{}")
+        (options.build_dir_path / "source.tar.gz").write_bytes(b"archive")
+        (options.build_dir_path / "src" / "vendor").mkdir(parents=True)
+
+        return BUILD_RESULT
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        create_agent_plugin_archive,
+    )
+    isolated_build_options = agent_plugin_build_options.model_copy(
+        update={"isolated_build_dir": True}
+    )
+
+    def on_build_dir_created(build_dir_path: Path):
+        (build_dir_path / "agent_plugin_builder.log").write_text("log")
+
+    build_agent_plugin_archive(
+        isolated_build_options, agent_plugin_manifest, on_build_dir_created=on_build_dir_created
+    )
+
+    (isolated_build_dir_path,) = [
+        path for path in agent_plugin_build_options.build_dir_path.iterdir() if path.is_dir()
+    ]
+    assert sorted(path.name for path in isolated_build_dir_path.iterdir()) == [
+        "agent_plugin_builder.log",
+        "build-journal.json",
+        "requirements.txt",
+        "size_report.json",
+    ]
+
+
+def test_build_agent_plugin_archive__isolated_build_dir_kept_on_failure(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        MagicMock(side_effect=Exception("Build failed")),
+    )
+    on_build_dir_created = MagicMock()
+    isolated_build_options = agent_plugin_build_options.model_copy(
+        update={"isolated_build_dir": True}
+    )
+
+    with pytest.raises(Exception):
+        build_agent_plugin_archive(
+            isolated_build_options,
+            agent_plugin_manifest,
+            on_build_dir_created=on_build_dir_created,
+        )
+
+    assert on_build_dir_created.call_args.args[0].is_dir()
+
+
+@pytest.mark.parametrize("plugin_changed", [False, True])
+def test_build_agent_plugin_archive__resume(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    plugin_changed: bool,
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        MagicMock(return_value=BUILD_RESULT),
+    )
+    plugin_source_dir_path = (
+        agent_plugin_build_options.plugin_dir_path / agent_plugin_build_options.source_dir_name
+    )
+    plugin_source_dir_path.mkdir()
+    (plugin_source_dir_path / "plugin.py").write_text("plugin")
+    build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+    vendor_dir_path = (
+        agent_plugin_build_options.build_dir_path
+        / agent_plugin_build_options.source_dir_name
+        / "vendor"
+    )
+    vendor_dir_path.mkdir()
+    if plugin_changed:
+        (plugin_source_dir_path / "plugin.py").write_text("changed plugin")
+
+    build_agent_plugin_archive(
+        agent_plugin_build_options.model_copy(update={"resume": True}), agent_plugin_manifest
+    )
+
+    assert vendor_dir_path.exists() != plugin_changed
+
+
+PINNED_BUILDER_IMAGES = BuilderImages(
+    linux="infectionmonkey/agent-builder@sha256:1",
+    windows="infectionmonkey/plugin-builder@sha256:2",
+)
+
+
+def _mock_build(monkeypatch, plugin_archive_content: bytes = b"plugin archive") -> MagicMock:
+    def create_agent_plugin_archive(options: AgentPluginBuildOptions, _) -> BuildResult:
+        plugin_archive_path = options.dist_dir_path / "Plugin-exploiter.tar"
+        plugin_archive_path.write_bytes(plugin_archive_content)
+        checksums = PluginArchiveChecksums(
+            plugin_archive=ArchiveChecksums(
+                archive_name=plugin_archive_path.name,
+                sha256=hashlib.sha256(plugin_archive_content).hexdigest(),
+                members={},
+            )
+        )
+
+        return BUILD_RESULT.model_copy(
+            update={
+                "plugin_archive_path": plugin_archive_path,
+                "checksums": checksums,
+                "containers_run": 2,
+                "builder_images": PINNED_BUILDER_IMAGES,
+            }
+        )
+
+    mock_create_agent_plugin_archive = MagicMock(side_effect=create_agent_plugin_archive)
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        mock_create_agent_plugin_archive,
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_fingerprint.resolve_builder_images_for_build",
+        lambda *_: PINNED_BUILDER_IMAGES,
+    )
+
+    return mock_create_agent_plugin_archive
+
+
+def test_build_agent_plugin_archive__up_to_date(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    mock_create_agent_plugin_archive = _mock_build(monkeypatch)
+    (agent_plugin_build_options.plugin_dir_path / "poetry.lock").write_text("lock")
+    build_result = build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+    # A fresh checkout of the same plugin has other modification times
+    os.utime(agent_plugin_build_options.plugin_dir_path / "poetry.lock", (0, 0))
+
+    up_to_date_build_result = build_agent_plugin_archive(
+        agent_plugin_build_options, agent_plugin_manifest
+    )
+
+    assert mock_create_agent_plugin_archive.call_count == 1
+    assert not build_result.up_to_date
+    assert up_to_date_build_result.up_to_date
+    assert up_to_date_build_result.plugin_archive_path == build_result.plugin_archive_path
+    assert up_to_date_build_result.checksums == build_result.checksums
+    assert up_to_date_build_result.containers_run == 0
+
+
+@pytest.mark.parametrize(
+    "change",
+    ["plugin_code", "lock_file", "manifest", "build_options", "builder_images", "archive"],
+)
+def test_build_agent_plugin_archive__not_up_to_date(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    change: str,
+):
+    mock_create_agent_plugin_archive = _mock_build(monkeypatch)
+    plugin_dir_path = agent_plugin_build_options.plugin_dir_path
+    (plugin_dir_path / "plugin.py").write_text("plugin")
+    (plugin_dir_path / "poetry.lock").write_text("lock")
+    build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+
+    if change == "plugin_code":
+        (plugin_dir_path / "plugin.py").write_text("changed plugin")
+    elif change == "lock_file":
+        (plugin_dir_path / "poetry.lock").write_text("changed lock")
+    elif change == "manifest":
+        agent_plugin_manifest = agent_plugin_manifest.model_copy(update={"version": "1.0.1"})
+    elif change == "build_options":
+        agent_plugin_build_options = agent_plugin_build_options.model_copy(
+            update={"precompile_bytecode": True}
+        )
+    elif change == "builder_images":
+        monkeypatch.setattr(
+            "agent_plugin_builder.build_fingerprint.resolve_builder_images_for_build",
+            lambda *_: PINNED_BUILDER_IMAGES.model_copy(
+                update={"linux": "infectionmonkey/agent-builder@sha256:3"}
+            ),
+        )
+    else:
+        (agent_plugin_build_options.dist_dir_path / "Plugin-exploiter.tar").write_bytes(b"x")
+
+    build_result = build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+
+    assert mock_create_agent_plugin_archive.call_count == 2
+    assert not build_result.up_to_date
+
+
+def test_build_agent_plugin_archive__force(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    mock_create_agent_plugin_archive = _mock_build(monkeypatch)
+    build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+    # The build directory and the options which don't change the archive are not fingerprinted
+    (agent_plugin_build_options.build_dir_path / "build.log").write_text("log")
+    forced_build_options = agent_plugin_build_options.model_copy(update={"force": True})
+
+    build_agent_plugin_archive(forced_build_options, agent_plugin_manifest)
+    build_result = build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+
+    assert mock_create_agent_plugin_archive.call_count == 2
+    assert build_result.up_to_date
+
+
+def test_build_agent_plugin_archive_async__up_to_date(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    _mock_build(monkeypatch)
+    build_agent_plugin_archive(agent_plugin_build_options, agent_plugin_manifest)
+    mock_create_agent_plugin_archive_async = AsyncMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive_async",
+        mock_create_agent_plugin_archive_async,
+    )
+
+    build_result = asyncio.run(
+        build_agent_plugin_archive_async(agent_plugin_build_options, agent_plugin_manifest)
+    )
+
+    assert build_result.up_to_date
+    mock_create_agent_plugin_archive_async.assert_not_called()
+
+
+@pytest.fixture
+def memory_workspace_build_options(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+) -> AgentPluginBuildOptions:
+    return agent_plugin_build_options.model_copy(update={"workspace": WorkspaceType.MEMORY})
+
+
+def test_build_agent_plugin_archive__memory_workspace(
+    monkeypatch,
+    tmp_path: Path,
+    memory_workspace_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    workspace_path = tmp_path / "workspace"
+    workspace_path.mkdir()
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_memory_workspace",
+        lambda _: workspace_path,
+    )
+
+    def create_agent_plugin_archive(options: AgentPluginBuildOptions, _):
+        (options.build_dir_path / "slim_report.json").write_text("{}")
+        (options.build_dir_path / "source.tar.gz").write_bytes(b"archive")
+
+        return BUILD_RESULT
+
+    mock_create_agent_plugin_archive = MagicMock(side_effect=create_agent_plugin_archive)
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        mock_create_agent_plugin_archive,
+    )
+    on_build_dir_created = MagicMock()
+
+    build_agent_plugin_archive(
+        memory_workspace_build_options,
+        agent_plugin_manifest,
+        on_build_dir_created=on_build_dir_created,
+    )
+
+    on_build_dir_created.assert_called_once_with(memory_workspace_build_options.build_dir_path)
+    build_options = mock_create_agent_plugin_archive.call_args.args[0]
+    assert build_options.build_dir_path == workspace_path
+    assert not workspace_path.exists()
+    assert [path.name for path in memory_workspace_build_options.build_dir_path.iterdir()] == [
+        "slim_report.json"
+    ]
+
+
+def test_build_agent_plugin_archive__memory_workspace_over_budget(
+    monkeypatch,
+    memory_workspace_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_memory_workspace", lambda _: None
+    )
+    mock_create_agent_plugin_archive = MagicMock(return_value=BUILD_RESULT)
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        mock_create_agent_plugin_archive,
+    )
+
+    build_agent_plugin_archive(memory_workspace_build_options, agent_plugin_manifest)
+
+    mock_create_agent_plugin_archive.assert_called_once_with(
+        memory_workspace_build_options, agent_plugin_manifest
+    )
+
+
+def test_build_agent_plugin_archive__memory_workspace_spills_to_disk(
+    monkeypatch,
+    tmp_path: Path,
+    memory_workspace_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    workspace_path = tmp_path / "workspace"
+    workspace_path.mkdir()
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_memory_workspace",
+        lambda _: workspace_path,
+    )
+    mock_create_agent_plugin_archive = MagicMock(
+        side_effect=[OSError(errno.ENOSPC, "No space left on device"), BUILD_RESULT]
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        mock_create_agent_plugin_archive,
+    )
+
+    build_agent_plugin_archive(memory_workspace_build_options, agent_plugin_manifest)
+
+    assert mock_create_agent_plugin_archive.call_count == 2
+    build_options = mock_create_agent_plugin_archive.call_args.args[0]
+    assert build_options.build_dir_path == memory_workspace_build_options.build_dir_path
+    assert not workspace_path.exists()
+
+
+def test_build_agent_plugin_archive__memory_workspace_error(
+    monkeypatch,
+    tmp_path: Path,
+    memory_workspace_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    workspace_path = tmp_path / "workspace"
+    workspace_path.mkdir()
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_memory_workspace",
+        lambda _: workspace_path,
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive",
+        MagicMock(side_effect=ValueError),
+    )
+
+    with pytest.raises(ValueError):
+        build_agent_plugin_archive(memory_workspace_build_options, agent_plugin_manifest)
+
+    assert not workspace_path.exists()
+
+
+def test_build_agent_plugin_archive_async__plugin_dir_not_found(
+    agent_plugin_build_options: AgentPluginBuildOptions, agent_plugin_manifest: AgentPluginManifest
+):
+    shutil.rmtree(agent_plugin_build_options.plugin_dir_path)
+
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(
+            build_agent_plugin_archive_async(agent_plugin_build_options, agent_plugin_manifest)
+        )
+
+
+def test_build_agent_plugin_archive_async__progress(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    mock_create_agent_plugin_archive_async = AsyncMock(return_value=BUILD_RESULT)
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive_async",
+        mock_create_agent_plugin_archive_async,
+    )
+    on_build_dir_created = MagicMock()
+    progress_events: list[BuildProgressEvent] = []
+
+    asyncio.run(
+        build_agent_plugin_archive_async(
+            agent_plugin_build_options,
+            agent_plugin_manifest,
+            on_build_dir_created=on_build_dir_created,
+            on_progress=progress_events.append,
+        )
+    )
+
+    on_build_dir_created.assert_called_once_with(agent_plugin_build_options.build_dir_path)
+    mock_create_agent_plugin_archive_async.assert_called_once_with(
+        agent_plugin_build_options, agent_plugin_manifest
+    )
+    assert [(event.stage, event.status) for event in progress_events] == [
+        (BuildStage.STAGE_PLUGIN_CODE, BuildStageStatus.STARTED),
+        (BuildStage.STAGE_PLUGIN_CODE, BuildStageStatus.FINISHED),
+    ]
+
+
+def test_build_agent_plugin_archive_async__more_builds_than_workers(
+    monkeypatch,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    async def create_agent_plugin_archive_async(*_):
+        # The build needs a worker thread while it holds the lock of the build directory
+        await run_in_thread(time.sleep, 0.2)
+        return BUILD_RESULT
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive_async",
+        create_agent_plugin_archive_async,
+    )
+    build_options = agent_plugin_build_options.model_copy(update={"force": True})
+
+    async def run() -> list[BuildResult]:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+        builds = [
+            build_agent_plugin_archive_async(build_options, agent_plugin_manifest) for _ in range(3)
+        ]
+        return await asyncio.wait_for(asyncio.gather(*builds), timeout=10)
+
+    assert asyncio.run(run()) == [BUILD_RESULT] * 3
+
+
+def test_build_agent_plugin_archive_async__memory_workspace_cancelled(
+    monkeypatch,
+    tmp_path: Path,
+    memory_workspace_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    workspace_path = tmp_path / "workspace"
+    workspace_path.mkdir()
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_memory_workspace",
+        lambda _: workspace_path,
+    )
+
+    async def create_agent_plugin_archive_async(*_):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.build_agent_plugin.create_agent_plugin_archive_async",
+        create_agent_plugin_archive_async,
+    )
+
+    async def run():
+        task = asyncio.create_task(
+            build_agent_plugin_archive_async(memory_workspace_build_options, agent_plugin_manifest)
+        )
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert not workspace_path.exists()
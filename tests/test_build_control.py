@@ -0,0 +1,243 @@
+import asyncio
+import threading
+import time
+from functools import partial
+from typing import Callable
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from agent_plugin_builder.build_control import (
+    AsyncBuildStep,
+    BuildCancelledError,
+    BuildControl,
+    BuildProgressEvent,
+    BuildStage,
+    BuildStageStatus,
+    BuildSteps,
+    build_stage,
+    ensure_build_control,
+    get_build_control,
+    run_build_steps,
+    run_build_steps_async,
+    run_in_thread,
+    use_build_control,
+)
+
+
+@pytest.fixture
+def progress_events() -> list[BuildProgressEvent]:
+    return []
+
+
+@pytest.fixture
+def build_control(progress_events: list[BuildProgressEvent]) -> BuildControl:
+    return BuildControl(on_progress=progress_events.append)
+
+
+def test_build_stage__no_build_control():
+    with build_stage(BuildStage.CREATE_PLUGIN_ARCHIVE):
+        pass
+
+    assert get_build_control() is None
+
+
+def test_build_stage__reports_progress(
+    build_control: BuildControl, progress_events: list[BuildProgressEvent]
+):
+    with use_build_control(build_control):
+        with build_stage(BuildStage.CREATE_PLUGIN_ARCHIVE):
+            pass
+
+    assert [(event.stage, event.status) for event in progress_events] == [
+        (BuildStage.CREATE_PLUGIN_ARCHIVE, BuildStageStatus.STARTED),
+        (BuildStage.CREATE_PLUGIN_ARCHIVE, BuildStageStatus.FINISHED),
+    ]
+    assert progress_events[0].elapsed_seconds is None
+    assert progress_events[1].elapsed_seconds is not None
+    assert get_build_control() is None
+
+
+def test_build_stage__reports_failure(
+    build_control: BuildControl, progress_events: list[BuildProgressEvent]
+):
+    with use_build_control(build_control):
+        with pytest.raises(OSError):
+            with build_stage(BuildStage.CREATE_SOURCE_ARCHIVE):
+                raise OSError("Disk full")
+
+    assert progress_events[-1].status == BuildStageStatus.FAILED
+
+
+def test_build_stage__cancelled(
+    build_control: BuildControl, progress_events: list[BuildProgressEvent]
+):
+    build_control.cancel()
+
+    with use_build_control(build_control):
+        with pytest.raises(BuildCancelledError):
+            with build_stage(BuildStage.COMPILE_BYTECODE):
+                pass
+
+    assert progress_events == []
+
+
+def test_build_control__progress_callback_error():
+    build_control = BuildControl(on_progress=MagicMock(side_effect=Exception))
+
+    with use_build_control(build_control):
+        with build_stage(BuildStage.COMPILE_BYTECODE):
+            pass
+
+
+def test_build_control__cancel_kills_containers(build_control: BuildControl):
+    container = MagicMock()
+    unregistered_container = MagicMock()
+    build_control.register_container(container)
+    build_control.register_container(unregistered_container)
+    build_control.unregister_container(unregistered_container)
+
+    build_control.cancel()
+
+    container.kill.assert_called_once()
+    unregistered_container.kill.assert_not_called()
+
+
+def test_build_control__register_container_after_cancel(build_control: BuildControl):
+    container = MagicMock()
+    build_control.cancel()
+
+    with pytest.raises(BuildCancelledError):
+        build_control.register_container(container)
+
+    container.kill.assert_called_once()
+
+
+def test_run_in_thread__build_context(
+    build_control: BuildControl, progress_events: list[BuildProgressEvent]
+):
+    def step() -> BuildControl | None:
+        with build_stage(BuildStage.GENERATE_CONFIG_SCHEMA):
+            return get_build_control()
+
+    async def run() -> BuildControl | None:
+        with use_build_control(build_control):
+            return await run_in_thread(step)
+
+    assert asyncio.run(run()) is build_control
+    assert len(progress_events) == 2
+
+
+def test_run_in_thread__cancelled(build_control: BuildControl):
+    step_started = threading.Event()
+    step_stopped = threading.Event()
+
+    def step():
+        step_started.set()
+        try:
+            while True:
+                with build_stage(BuildStage.CREATE_SOURCE_ARCHIVE):
+                    time.sleep(0.01)
+        finally:
+            step_stopped.set()
+
+    async def run():
+        with use_build_control(build_control):
+            task = asyncio.create_task(run_in_thread(step))
+            await asyncio.to_thread(step_started.wait)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            # The step was waited for, and stopped before its next stage
+            assert step_stopped.is_set()
+
+    asyncio.run(run())
+
+    with pytest.raises(BuildCancelledError):
+        build_control.raise_if_cancelled()
+
+
+def get_build_steps(
+    failing_step: Callable[[], None], async_step: AsyncBuildStep[int]
+) -> BuildSteps[tuple[int, int]]:
+    thread_id = yield threading.get_ident
+    try:
+        yield failing_step
+    except ValueError:
+        pass
+
+    return thread_id, (yield async_step)
+
+
+def test_run_build_steps():
+    async_step = AsyncBuildStep(lambda: 1, AsyncMock(return_value=2))
+
+    build_result = run_build_steps(get_build_steps(MagicMock(side_effect=ValueError), async_step))
+
+    assert build_result == (threading.get_ident(), 1)
+
+
+def test_run_build_steps_async():
+    async_step = AsyncBuildStep(lambda: 1, AsyncMock(return_value=2))
+
+    build_result = asyncio.run(
+        run_build_steps_async(get_build_steps(MagicMock(side_effect=ValueError), async_step))
+    )
+
+    assert build_result[0] != threading.get_ident()
+    assert build_result[1] == 2
+
+
+def test_run_build_steps_async__cancelled(build_control: BuildControl):
+    steps_stopped = threading.Event()
+
+    def get_cancelled_build_steps() -> BuildSteps[None]:
+        try:
+            yield AsyncBuildStep(MagicMock(), partial(asyncio.sleep, 60))
+        finally:
+            steps_stopped.set()
+
+    async def run():
+        with use_build_control(build_control):
+            task = asyncio.create_task(run_build_steps_async(get_cancelled_build_steps()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(run())
+
+    assert steps_stopped.is_set()
+    with pytest.raises(BuildCancelledError):
+        build_control.raise_if_cancelled()
+
+
+def test_build_statistics(build_control: BuildControl):
+    with use_build_control(build_control):
+        for _ in range(2):
+            with build_stage(BuildStage.INSTALL_VENDOR_DIRECTORIES):
+                time.sleep(0.01)
+
+    build_control.statistics.record_container_run("image", 1.5)
+    build_control.statistics.record_cache_lookups(hits=3, misses=1)
+    build_control.statistics.record_cache_lookups(hits=1, misses=0)
+
+    stage_durations = build_control.statistics.stage_durations
+    assert list(stage_durations) == [BuildStage.INSTALL_VENDOR_DIRECTORIES]
+    assert stage_durations[BuildStage.INSTALL_VENDOR_DIRECTORIES] >= 0.02
+    assert build_control.statistics.containers_run == 1
+    assert build_control.statistics.container_durations == {"image": [1.5]}
+    assert build_control.statistics.cache_hits == 4
+    assert build_control.statistics.cache_misses == 1
+
+
+def test_ensure_build_control(build_control: BuildControl):
+    with ensure_build_control() as new_build_control:
+        assert get_build_control() is new_build_control
+
+    assert get_build_control() is None
+
+    with use_build_control(build_control):
+        with ensure_build_control() as current_build_control:
+            assert current_build_control is build_control
@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+from monkeytypes import AgentPluginManifest
+
+from agent_plugin_builder import AgentPluginBuildOptions
+from agent_plugin_builder.build_fingerprint import (
+    find_up_to_date_build,
+    get_build_fingerprint_file_path,
+    get_inputs_fingerprint,
+)
+from agent_plugin_builder.build_workspace import get_lock_file_path
+
+
+@pytest.fixture
+def inputs_fingerprint(
+    agent_plugin_build_options: AgentPluginBuildOptions, agent_plugin_manifest: AgentPluginManifest
+) -> str:
+    (agent_plugin_build_options.plugin_dir_path / "plugin.py").write_text("plugin")
+
+    return get_inputs_fingerprint(agent_plugin_build_options, agent_plugin_manifest)
+
+
+@pytest.mark.parametrize(
+    "unfingerprinted_path",
+    [
+        "build/build.log",
+        "dist/Plugin-exploiter.tar",
+        ".build.lock",
+        "__pycache__/plugin.cpython-311.pyc",
+        ".git/HEAD",
+        "source_dir_name/.DS_Store",
+    ],
+)
+def test_get_inputs_fingerprint__unfingerprinted_files(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    inputs_fingerprint: str,
+    unfingerprinted_path: str,
+):
+    file_path = agent_plugin_build_options.plugin_dir_path / unfingerprinted_path
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text("unfingerprinted")
+
+    assert (
+        get_inputs_fingerprint(agent_plugin_build_options, agent_plugin_manifest)
+        == inputs_fingerprint
+    )
+
+
+def test_get_inputs_fingerprint__external_build_dir(
+    tmp_path: Path,
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    inputs_fingerprint: str,
+):
+    build_options = agent_plugin_build_options.model_copy(
+        update={"build_dir_path": tmp_path / "build", "resume": True, "force": True}
+    )
+    get_lock_file_path(build_options.build_dir_path).write_text("")
+
+    assert get_inputs_fingerprint(build_options, agent_plugin_manifest) == inputs_fingerprint
+
+
+@pytest.mark.parametrize("fingerprint_file_content", ["", "{}", "not json"])
+def test_find_up_to_date_build__invalid_fingerprint(
+    agent_plugin_build_options: AgentPluginBuildOptions,
+    agent_plugin_manifest: AgentPluginManifest,
+    inputs_fingerprint: str,
+    fingerprint_file_content: str,
+):
+    plugin_archive_path = agent_plugin_build_options.dist_dir_path / "Plugin-exploiter.tar"
+    plugin_archive_path.write_bytes(b"plugin archive")
+    get_build_fingerprint_file_path(plugin_archive_path).write_text(fingerprint_file_content)
+
+    assert (
+        find_up_to_date_build(agent_plugin_build_options, agent_plugin_manifest, inputs_fingerprint)
+        is None
+    )
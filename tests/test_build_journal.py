@@ -0,0 +1,131 @@
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.build_journal import (
+    BUILD_JOURNAL_FILE,
+    BuildJournal,
+    get_fingerprint,
+    start_journal_step,
+    use_build_journal,
+)
+
+
+def run_steps(build_dir_path: Path, inputs: list[str], resume: bool = True) -> BuildJournal:
+    build_journal = BuildJournal(build_dir_path, resume=resume)
+    for index, step_input in enumerate(inputs):
+        output_path = build_dir_path / f"output_{index}"
+        journal_step = build_journal.start_step(f"step_{index}", [step_input], [output_path])
+        if not journal_step.resumed:
+            output_path.write_text(step_input)
+            journal_step.complete(result=index)
+
+    return build_journal
+
+
+@pytest.fixture
+def build_dir_path(tmp_path: Path) -> Path:
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    run_steps(build_dir_path, ["a", "b", "c"], resume=False)
+
+    return build_dir_path
+
+
+def test_build_journal__resume(build_dir_path: Path):
+    build_journal = BuildJournal(build_dir_path, resume=True)
+
+    journal_step = build_journal.start_step("step_0", ["a"], [build_dir_path / "output_0"])
+
+    assert journal_step.resumed
+    assert journal_step.result == 0
+    assert build_journal.resumed_steps == ["step_0"]
+
+
+def test_build_journal__invalidated_input(build_dir_path: Path):
+    build_journal = run_steps(build_dir_path, ["a", "changed", "c"])
+
+    assert build_journal.resumed_steps == ["step_0"]
+    assert (build_dir_path / "output_1").read_text() == "changed"
+
+
+def test_build_journal__invalidated_output(build_dir_path: Path):
+    (build_dir_path / "output_2").write_text("modified")
+
+    build_journal = run_steps(build_dir_path, ["a", "b", "c"])
+
+    assert build_journal.resumed_steps == ["step_0", "step_1"]
+    assert (build_dir_path / "output_2").read_text() == "c"
+
+
+def test_build_journal__invalidates_later_steps(build_dir_path: Path):
+    build_journal = BuildJournal(build_dir_path, resume=True)
+    build_journal.start_step("step_0", ["changed"], [build_dir_path / "output_0"])
+
+    assert not (build_dir_path / "output_0").exists()
+    assert not (build_dir_path / "output_1").exists()
+    assert not (build_dir_path / "output_2").exists()
+
+
+def test_build_journal__directory_output(tmp_path: Path):
+    vendor_dir_path = tmp_path / "source" / "vendor"
+    build_journal = BuildJournal(tmp_path)
+    journal_step = build_journal.start_step("install", ["requirements"], [vendor_dir_path])
+    vendor_dir_path.mkdir(parents=True)
+    journal_step.complete()
+    # Later steps modify the directory in place
+    (vendor_dir_path / "package.py").write_text("slimmed")
+
+    journal_step = BuildJournal(tmp_path, resume=True).start_step(
+        "install", ["requirements"], [vendor_dir_path]
+    )
+
+    assert journal_step.resumed
+
+
+def test_build_journal__not_resumed(build_dir_path: Path):
+    build_journal = run_steps(build_dir_path, ["a", "b", "c"], resume=False)
+
+    assert build_journal.resumed_steps == []
+
+
+def test_build_journal__invalid_journal(build_dir_path: Path):
+    (build_dir_path / BUILD_JOURNAL_FILE).write_text("{")
+
+    build_journal = run_steps(build_dir_path, ["a", "b", "c"])
+
+    assert build_journal.resumed_steps == []
+
+
+def test_start_journal_step__no_journal(tmp_path: Path):
+    output_path = tmp_path / "output"
+    output_path.write_text("output")
+
+    journal_step = start_journal_step("step", ["a"], [output_path])
+    journal_step.complete()
+
+    assert not journal_step.resumed
+    assert output_path.exists()
+    assert not (tmp_path / BUILD_JOURNAL_FILE).exists()
+
+
+def test_start_journal_step(build_dir_path: Path):
+    with use_build_journal(BuildJournal(build_dir_path, resume=True)):
+        journal_step = start_journal_step("step_0", ["a"], [build_dir_path / "output_0"])
+
+    assert journal_step.resumed
+
+
+def test_get_fingerprint__excludes_build_dir(tmp_path: Path):
+    plugin_dir_path = tmp_path / "plugin"
+    build_dir_path = plugin_dir_path / "build" / "isolated"
+    build_dir_path.mkdir(parents=True)
+    (plugin_dir_path / "plugin.py").write_text("plugin")
+    fingerprint = get_fingerprint(plugin_dir_path, exclude=[build_dir_path])
+
+    (build_dir_path / "build.log").write_text("log")
+    (plugin_dir_path / "build" / "other.log").write_text("log")
+
+    assert get_fingerprint(plugin_dir_path, exclude=[build_dir_path]) == fingerprint
+    (plugin_dir_path / "plugin.py").write_text("changed plugin")
+    assert get_fingerprint(plugin_dir_path, exclude=[build_dir_path]) != fingerprint
@@ -0,0 +1,140 @@
+from pathlib import Path
+
+import pytest
+from monkeytypes import AgentPluginManifest
+
+from agent_plugin_builder.archive_checksums import ArchiveChecksums, PluginArchiveChecksums
+from agent_plugin_builder.build_control import BuildStage, BuildStatistics
+from agent_plugin_builder.build_metrics import (
+    BUILDS,
+    BuildMetrics,
+    get_build_metrics,
+    write_build_metrics,
+)
+from agent_plugin_builder.build_result import BuildResult
+from agent_plugin_builder.platform_dependency_packaging_method import (
+    PlatformDependencyPackagingMethod,
+)
+
+PLUGIN_LABELS = 'plugin_name="Plugin",plugin_type="Exploiter"'
+
+
+@pytest.fixture
+def build_statistics() -> BuildStatistics:
+    build_statistics = BuildStatistics()
+    build_statistics.record_stage_duration(BuildStage.INSTALL_VENDOR_DIRECTORIES, 42.0)
+    build_statistics.record_container_run("infectionmonkey/agent-builder@sha256:1", 3.0)
+
+    return build_statistics
+
+
+@pytest.fixture
+def build_result() -> BuildResult:
+    return BuildResult(
+        plugin_archive_path=Path("dist/Plugin-exploiter.tar"),
+        plugin_archive_size=2048,
+        source_archive_size=1024,
+        platform_dependencies=PlatformDependencyPackagingMethod.COMMON,
+        vendor_dir_sizes={"vendor": 4096},
+        vendor_file_counts={"vendor": 12},
+        stage_durations={BuildStage.INSTALL_VENDOR_DIRECTORIES: 42.0},
+        checksums=PluginArchiveChecksums(
+            plugin_archive=ArchiveChecksums(
+                archive_name="Plugin-exploiter.tar", sha256="0" * 64, members={}
+            )
+        ),
+    )
+
+
+def test_get_build_metrics(
+    agent_plugin_manifest: AgentPluginManifest,
+    build_statistics: BuildStatistics,
+    build_result: BuildResult,
+):
+    metrics = get_build_metrics(agent_plugin_manifest, build_statistics, build_result).format()
+
+    assert "# TYPE agent_plugin_builder_builds_total counter" in metrics
+    assert f'agent_plugin_builder_builds_total{{{PLUGIN_LABELS},result="success"}} 1' in metrics
+    assert (
+        "agent_plugin_builder_stage_duration_seconds_bucket"
+        f'{{{PLUGIN_LABELS},stage="install_vendor_directories",le="30"}} 0'
+    ) in metrics
+    assert (
+        "agent_plugin_builder_stage_duration_seconds_bucket"
+        f'{{{PLUGIN_LABELS},stage="install_vendor_directories",le="60"}} 1'
+    ) in metrics
+    assert (
+        "agent_plugin_builder_container_duration_seconds_count"
+        f'{{image="infectionmonkey/agent-builder",{PLUGIN_LABELS}}} 1'
+    ) in metrics
+    assert f'agent_plugin_builder_archive_bytes{{archive="plugin",{PLUGIN_LABELS}}} 2048' in metrics
+    assert (
+        f'agent_plugin_builder_vendored_files{{{PLUGIN_LABELS},vendor_dir="vendor"}} 12' in metrics
+    )
+
+
+def test_get_build_metrics__image_repository_labels(
+    agent_plugin_manifest: AgentPluginManifest, build_result: BuildResult
+):
+    build_statistics = BuildStatistics()
+    build_statistics.record_container_run("infectionmonkey/agent-builder@sha256:1", 3.0)
+    build_statistics.record_container_run("infectionmonkey/agent-builder@sha256:2", 3.0)
+    build_statistics.record_container_run("sha256:3", 3.0)
+
+    metrics = get_build_metrics(agent_plugin_manifest, build_statistics, build_result).format()
+
+    assert (
+        "agent_plugin_builder_container_duration_seconds_count"
+        f'{{image="infectionmonkey/agent-builder",{PLUGIN_LABELS}}} 2'
+    ) in metrics
+    assert (
+        "agent_plugin_builder_container_duration_seconds_count"
+        f'{{image="local",{PLUGIN_LABELS}}} 1'
+    ) in metrics
+    assert "sha256" not in metrics
+
+
+def test_get_build_metrics__failure(
+    agent_plugin_manifest: AgentPluginManifest, build_statistics: BuildStatistics
+):
+    metrics = get_build_metrics(agent_plugin_manifest, build_statistics, None).format()
+
+    assert f'agent_plugin_builder_builds_total{{{PLUGIN_LABELS},result="failure"}} 1' in metrics
+    assert "agent_plugin_builder_stage_duration_seconds_count" in metrics
+    assert "agent_plugin_builder_archive_bytes" not in metrics
+
+
+def test_build_metrics__parse():
+    metrics = BuildMetrics()
+    metrics.inc(BUILDS, {"plugin_name": 'quoted "name"\\', "result": "success"})
+
+    assert BuildMetrics.parse(metrics.format()).format() == metrics.format()
+
+
+def test_write_build_metrics__merge(
+    tmp_path: Path,
+    agent_plugin_manifest: AgentPluginManifest,
+    build_statistics: BuildStatistics,
+    build_result: BuildResult,
+):
+    metrics_file_path = tmp_path / "metrics" / "agent_plugin_builder.prom"
+    write_build_metrics(
+        metrics_file_path, get_build_metrics(agent_plugin_manifest, build_statistics, None)
+    )
+    smaller_build_result = build_result.model_copy(update={"plugin_archive_size": 1000})
+    for result in (build_result, smaller_build_result):
+        write_build_metrics(
+            metrics_file_path, get_build_metrics(agent_plugin_manifest, build_statistics, result)
+        )
+
+    metrics = metrics_file_path.read_text()
+    assert f'agent_plugin_builder_builds_total{{{PLUGIN_LABELS},result="failure"}} 1' in metrics
+    assert f'agent_plugin_builder_builds_total{{{PLUGIN_LABELS},result="success"}} 2' in metrics
+    assert (
+        "agent_plugin_builder_stage_duration_seconds_sum"
+        f'{{{PLUGIN_LABELS},stage="install_vendor_directories"}} 126'
+    ) in metrics
+    assert f'agent_plugin_builder_archive_bytes{{archive="plugin",{PLUGIN_LABELS}}} 1000' in metrics
+    assert [
+        path.name for path in metrics_file_path.parent.iterdir() if path.name.startswith(".")
+    ] == []
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+from pathlib import Path
+
+from agent_plugin_builder.build_workspace import (
+    ISOLATED_BUILD_DIR_PREFIX,
+    PathLock,
+    create_isolated_build_dir,
+    get_build_dir_lock,
+    remove_build_intermediates,
+)
+
+
+def _try_acquire(path_lock: PathLock) -> threading.Event:
+    acquired = threading.Event()
+
+    def acquire():
+        with path_lock:
+            acquired.set()
+
+    threading.Thread(target=acquire, daemon=True).start()
+
+    return acquired
+
+
+def test_path_lock__exclusive(tmp_path: Path):
+    path = tmp_path / "build"
+
+    with PathLock(path):
+        acquired = _try_acquire(PathLock(path))
+        assert not acquired.wait(0.2)
+
+    assert acquired.wait(5)
+    assert (tmp_path / ".build.lock").exists()
+
+
+def test_path_lock__shared(tmp_path: Path):
+    path = tmp_path / "build"
+
+    with PathLock(path, shared=True):
+        assert _try_acquire(PathLock(path, shared=True)).wait(5)
+
+        acquired = _try_acquire(PathLock(path))
+        assert not acquired.wait(0.2)
+
+    assert acquired.wait(5)
+
+
+def test_path_lock__removed_path(tmp_path: Path):
+    path = tmp_path / "build"
+    path.mkdir()
+
+    with PathLock(path):
+        path.rmdir()
+        acquired = _try_acquire(PathLock(path))
+        assert not acquired.wait(0.2)
+
+    assert acquired.wait(5)
+
+
+def test_path_lock__acquire_async(tmp_path: Path):
+    path = tmp_path / "build"
+    path_lock = PathLock(path)
+
+    async def run():
+        acquisition = asyncio.create_task(PathLock(path).acquire_async())
+        await asyncio.sleep(0.2)
+        assert not acquisition.done()
+
+        path_lock.release()
+        await asyncio.wait_for(acquisition, timeout=5)
+
+    path_lock.acquire()
+    asyncio.run(run())
+
+
+def test_path_lock__release_not_held(tmp_path: Path):
+    PathLock(tmp_path / "build").release()
+
+
+def test_get_build_dir_lock(tmp_path: Path):
+    assert not get_build_dir_lock(tmp_path, isolated=False).shared
+    assert get_build_dir_lock(tmp_path, isolated=True).shared
+
+
+def test_create_isolated_build_dir(tmp_path: Path):
+    build_dir_path = tmp_path / "build"
+
+    isolated_build_dir_paths = {create_isolated_build_dir(build_dir_path) for _ in range(3)}
+
+    assert len(isolated_build_dir_paths) == 3
+    for isolated_build_dir_path in isolated_build_dir_paths:
+        assert isolated_build_dir_path.parent == build_dir_path
+        assert isolated_build_dir_path.name.startswith(ISOLATED_BUILD_DIR_PREFIX)
+        assert isolated_build_dir_path.is_dir()
+
+
+def test_remove_build_intermediates(tmp_path: Path):
+    kept_files = [
+        "agent_plugin_builder.log",
+        "agent_plugin_builder.log.1",
+        "agent_plugin_builder.log.jsonl",
+        "requirements.txt",
+        "size_report.json",
+        "build-journal.json",
+        "profile_create_source_archive.pstats",
+    ]
+    for file_name in [*kept_files, "source.tar.gz", "Plugin-exploiter.tar", "pyproject.toml"]:
+        (tmp_path / file_name).write_text("")
+    vendor_dir_path = tmp_path / "src" / "vendor"
+    vendor_dir_path.mkdir(parents=True)
+    (vendor_dir_path / "package.py").write_text("")
+
+    remove_build_intermediates(tmp_path)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(kept_files)
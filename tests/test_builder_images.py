@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock
+
+import pytest
+from docker.errors import ImageNotFound
+from monkeytypes import OperatingSystem
+
+from agent_plugin_builder.builder_images import (
+    DEFAULT_BUILDER_IMAGES,
+    LINUX_PLUGIN_BUILDER_IMAGE,
+    WINDOWS_PLUGIN_BUILDER_IMAGE,
+    resolve_builder_images,
+)
+from agent_plugin_builder.pull_policy import PullPolicy
+
+LINUX_DIGEST = "sha256:" + "1" * 64
+WINDOWS_DIGEST = "sha256:" + "2" * 64
+LOCAL_IMAGE_ID = "sha256:" + "3" * 64
+
+
+def _image(repo_digests: list[str]) -> MagicMock:
+    return MagicMock(attrs={"Id": LOCAL_IMAGE_ID, "RepoDigests": repo_digests})
+
+
+LINUX_IMAGE = _image([f"infectionmonkey/agent-builder@{LINUX_DIGEST}"])
+WINDOWS_IMAGE = _image([f"docker.io/infectionmonkey/plugin-builder@{WINDOWS_DIGEST}"])
+IMAGES = {LINUX_PLUGIN_BUILDER_IMAGE: LINUX_IMAGE, WINDOWS_PLUGIN_BUILDER_IMAGE: WINDOWS_IMAGE}
+PULLED_IMAGES = {
+    "infectionmonkey/agent-builder": LINUX_IMAGE,
+    "infectionmonkey/plugin-builder": WINDOWS_IMAGE,
+}
+
+
+@pytest.fixture
+def mock_docker_client(monkeypatch) -> MagicMock:
+    mock_client = MagicMock()
+    mock_client.images.get.side_effect = lambda name: IMAGES[name]
+    mock_client.images.pull.side_effect = lambda repository, tag: PULLED_IMAGES[repository]
+    monkeypatch.setattr("docker.from_env", MagicMock(return_value=mock_client))
+
+    return mock_client
+
+
+def test_resolve_builder_images(mock_docker_client: MagicMock):
+    builder_images = resolve_builder_images(
+        [OperatingSystem.LINUX, OperatingSystem.WINDOWS], PullPolicy.MISSING
+    )
+
+    assert builder_images.linux == f"infectionmonkey/agent-builder@{LINUX_DIGEST}"
+    assert builder_images.windows == f"infectionmonkey/plugin-builder@{WINDOWS_DIGEST}"
+    mock_docker_client.images.pull.assert_not_called()
+
+
+def test_resolve_builder_images__only_required(mock_docker_client: MagicMock):
+    builder_images = resolve_builder_images([OperatingSystem.LINUX], PullPolicy.MISSING)
+
+    assert builder_images.linux == f"infectionmonkey/agent-builder@{LINUX_DIGEST}"
+    assert builder_images.windows == WINDOWS_PLUGIN_BUILDER_IMAGE
+    mock_docker_client.images.get.assert_called_once_with(LINUX_PLUGIN_BUILDER_IMAGE)
+
+
+def test_resolve_builder_images__no_operating_systems(mock_docker_client: MagicMock):
+    assert resolve_builder_images([], PullPolicy.ALWAYS) == DEFAULT_BUILDER_IMAGES
+    mock_docker_client.images.pull.assert_not_called()
+
+
+def test_resolve_builder_images__pull_missing(mock_docker_client: MagicMock):
+    mock_docker_client.images.get.side_effect = ImageNotFound("Not found")
+
+    builder_images = resolve_builder_images([OperatingSystem.WINDOWS], PullPolicy.MISSING)
+
+    assert builder_images.windows == f"infectionmonkey/plugin-builder@{WINDOWS_DIGEST}"
+    mock_docker_client.images.pull.assert_called_once_with(
+        "infectionmonkey/plugin-builder", tag="latest"
+    )
+
+
+def test_resolve_builder_images__pull_always(mock_docker_client: MagicMock):
+    resolve_builder_images([OperatingSystem.LINUX, OperatingSystem.WINDOWS], PullPolicy.ALWAYS)
+
+    assert mock_docker_client.images.pull.call_count == 2
+    mock_docker_client.images.get.assert_not_called()
+
+
+def test_resolve_builder_images__pull_never(mock_docker_client: MagicMock):
+    mock_docker_client.images.get.side_effect = ImageNotFound("Not found")
+
+    with pytest.raises(ImageNotFound):
+        resolve_builder_images([OperatingSystem.LINUX], PullPolicy.NEVER)
+
+    mock_docker_client.images.pull.assert_not_called()
+
+
+def test_resolve_builder_images__local_image(mock_docker_client: MagicMock):
+    mock_docker_client.images.get.side_effect = lambda _: _image([])
+
+    builder_images = resolve_builder_images([OperatingSystem.LINUX], PullPolicy.MISSING)
+
+    assert builder_images.linux == LOCAL_IMAGE_ID
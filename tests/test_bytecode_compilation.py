@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.bytecode_compilation import (
+    BYTECODE_REPORT_FILE,
+    BytecodeCompilationReport,
+    compile_bytecode,
+)
+
+SOURCE_DIR_NAME = "source_dir"
+PYC_FLAGS_UNCHECKED_HASH = 0b01
+
+
+@pytest.fixture
+def build_dir_path(tmpdir: str) -> Path:
+    build_dir_path = Path(tmpdir)
+    source_dir_path = build_dir_path / SOURCE_DIR_NAME
+    (source_dir_path / "vendor" / "package").mkdir(parents=True)
+    (source_dir_path / "plugin.py").write_text("import package\n")
+    (source_dir_path / "vendor" / "package" / "__init__.py").write_text("VALUE = 1\n")
+    (source_dir_path / "__pycache__").mkdir()
+    (source_dir_path / "__pycache__" / "stale.cpython-311.pyc").write_bytes(b"stale")
+
+    return build_dir_path
+
+
+def test_compile_bytecode(build_dir_path: Path):
+    source_dir_path = build_dir_path / SOURCE_DIR_NAME
+
+    report = compile_bytecode(build_dir_path, SOURCE_DIR_NAME)
+
+    bytecode_files = sorted(source_dir_path.rglob("*.pyc"))
+    assert [path.relative_to(source_dir_path).as_posix() for path in bytecode_files] == [
+        "__pycache__/plugin.cpython-311.pyc",
+        "vendor/package/__pycache__/__init__.cpython-311.pyc",
+    ]
+    for bytecode_file in bytecode_files:
+        flags = int.from_bytes(bytecode_file.read_bytes()[4:8], "little")
+        assert flags == PYC_FLAGS_UNCHECKED_HASH
+    assert report.module_count == 2
+    assert report.bytecode_bytes == sum(path.stat().st_size for path in bytecode_files)
+    assert report.compressed_bytecode_bytes > 0
+    assert report.compile_seconds >= 0
+
+
+def test_compile_bytecode__report_file(build_dir_path: Path):
+    report = compile_bytecode(build_dir_path, SOURCE_DIR_NAME)
+
+    assert (
+        BytecodeCompilationReport(**json.loads((build_dir_path / BYTECODE_REPORT_FILE).read_text()))
+        == report
+    )
+
+
+def test_compile_bytecode__in_container(monkeypatch, build_dir_path: Path):
+    monkeypatch.setattr("agent_plugin_builder.bytecode_compilation.AGENT_PYTHON_VERSION", (3, 10))
+    mock_run_command = MagicMock(
+        return_value='{"python_version": [3, 10], "success": true, "compile_seconds": 1.5}\n'
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.bytecode_compilation.run_command_in_linux_builder_container",
+        mock_run_command,
+    )
+
+    report = compile_bytecode(build_dir_path, SOURCE_DIR_NAME)
+
+    mock_run_command.assert_called_once()
+    assert report.compile_seconds == 1.5
+    assert not (build_dir_path / SOURCE_DIR_NAME / "__pycache__").exists()
+
+
+def test_compile_bytecode__python_version_mismatch(monkeypatch, build_dir_path: Path):
+    monkeypatch.setattr("agent_plugin_builder.bytecode_compilation.AGENT_PYTHON_VERSION", (3, 10))
+    monkeypatch.setattr(
+        "agent_plugin_builder.bytecode_compilation.run_command_in_linux_builder_container",
+        MagicMock(
+            return_value='{"python_version": [3, 12], "success": true, "compile_seconds": 1}'
+        ),
+    )
+
+    with pytest.raises(ValueError):
+        compile_bytecode(build_dir_path, SOURCE_DIR_NAME)
@@ -0,0 +1,277 @@
+import io
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from docker.errors import DockerException
+
+from agent_plugin_builder.builder_images import DEFAULT_BUILDER_IMAGES
+from agent_plugin_builder.docker_endpoint_pool import (
+    BUILDER_CONTAINER_LABEL,
+    DockerEndpoint,
+    DockerEndpointConfig,
+    DockerEndpointError,
+    DockerEndpointPool,
+    get_directory,
+    get_docker_endpoint_pool,
+    parse_docker_endpoint_config,
+    use_docker_endpoint_pool,
+)
+from agent_plugin_builder.vendor_dir_generation import run_command_in_linux_builder_container
+
+ContainerCommand = Callable[[Path], None]
+
+
+class FakeContainer:
+    def __init__(self, endpoint: "FakeDockerEndpoint", image: str, **kwargs):
+        self.endpoint = endpoint
+        self.image = image
+        self.kwargs = kwargs
+        self._root = tempfile.TemporaryDirectory()
+        self.root_path = Path(self._root.name)
+
+    def put_archive(self, path: str, data):
+        with tarfile.open(fileobj=data, mode="r") as tar:
+            tar.extractall(self.root_path / path.lstrip("/"))
+
+    def start(self):
+        self.endpoint.running.append(self)
+        self.endpoint.command(self.root_path / "plugin")
+
+    def wait(self) -> dict[str, int]:
+        self.endpoint.running.remove(self)
+        return {"StatusCode": 0}
+
+    def get_archive(self, path: str):
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w") as tar:
+            tar.add(self.root_path / path.lstrip("/"), arcname=Path(path).name)
+
+        return [archive.getvalue()], {}
+
+    def logs(self, stdout: bool = True, stderr: bool = False) -> bytes:
+        return b"output" if stdout else b""
+
+    def remove(self, force: bool = False):
+        self._root.cleanup()
+
+
+class FakeDockerClient:
+    def __init__(self, endpoint: "FakeDockerEndpoint"):
+        self.containers = self
+        self._endpoint = endpoint
+
+    def list(self, filters: dict[str, str]) -> list[FakeContainer]:
+        assert filters["label"] == BUILDER_CONTAINER_LABEL
+        return list(self._endpoint.running)
+
+    def create(self, image: str, **kwargs) -> FakeContainer:
+        container = FakeContainer(self._endpoint, image, **kwargs)
+        self._endpoint.created.append(container)
+
+        return container
+
+    def close(self):
+        self._endpoint.closed_clients += 1
+
+
+class FakeDockerEndpoint(DockerEndpoint):
+    """
+    An endpoint which runs its containers in temporary directories on the local host
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int = 1,
+        is_local: bool = False,
+        command: ContainerCommand = lambda _: None,
+    ):
+        super().__init__(name, capacity, is_local)
+        self.command = command
+        self.healthy = True
+        self.running: list[FakeContainer] = []
+        self.created: list[FakeContainer] = []
+        self.created_clients = 0
+        self.closed_clients = 0
+
+    def create_client(self) -> FakeDockerClient:
+        if not self.healthy:
+            raise DockerException(f"{self.name} is unreachable")
+
+        self.created_clients += 1
+        return FakeDockerClient(self)
+
+
+@pytest.mark.parametrize(
+    "docker_endpoint, expected_config",
+    [
+        ("unix:///var/run/docker.sock", DockerEndpointConfig(host="unix:///var/run/docker.sock")),
+        ("tcp://builder:2376=4", DockerEndpointConfig(host="tcp://builder:2376", capacity=4)),
+        ("ssh://build@builder=2", DockerEndpointConfig(host="ssh://build@builder", capacity=2)),
+        ("farm", DockerEndpointConfig(host="farm")),
+    ],
+)
+def test_parse_docker_endpoint_config(docker_endpoint: str, expected_config: DockerEndpointConfig):
+    assert parse_docker_endpoint_config(docker_endpoint) == expected_config
+
+
+def test_parse_docker_endpoint_config__invalid_capacity():
+    with pytest.raises(ValueError):
+        parse_docker_endpoint_config("tcp://builder:2376=0")
+
+
+def test_docker_endpoint_pool__least_loaded():
+    endpoint_1 = FakeDockerEndpoint("endpoint_1", capacity=2)
+    endpoint_2 = FakeDockerEndpoint("endpoint_2", capacity=1)
+    docker_endpoint_pool = DockerEndpointPool([endpoint_1, endpoint_2])
+
+    with docker_endpoint_pool.acquire() as first_endpoint:
+        with docker_endpoint_pool.acquire() as second_endpoint:
+            with docker_endpoint_pool.acquire() as third_endpoint:
+                assert first_endpoint is endpoint_1
+                assert second_endpoint is endpoint_2
+                assert third_endpoint is endpoint_1
+
+    with docker_endpoint_pool.acquire() as endpoint:
+        assert endpoint is endpoint_1
+
+
+def test_docker_endpoint_pool__counts_containers_of_other_builds():
+    endpoint_1 = FakeDockerEndpoint("endpoint_1", capacity=2)
+    endpoint_2 = FakeDockerEndpoint("endpoint_2", capacity=2)
+    endpoint_1.running.append(FakeContainer(endpoint_1, "image"))
+    docker_endpoint_pool = DockerEndpointPool([endpoint_1, endpoint_2])
+
+    with docker_endpoint_pool.acquire() as endpoint:
+        assert endpoint is endpoint_2
+
+
+def test_docker_endpoint_pool__skips_unhealthy_endpoints():
+    endpoint_1 = FakeDockerEndpoint("endpoint_1")
+    endpoint_2 = FakeDockerEndpoint("endpoint_2")
+    endpoint_1.healthy = False
+    docker_endpoint_pool = DockerEndpointPool([endpoint_1, endpoint_2])
+
+    with docker_endpoint_pool.acquire() as endpoint:
+        assert endpoint is endpoint_2
+
+    # The endpoint is not used again until its cooldown passes
+    endpoint_1.healthy = True
+    with docker_endpoint_pool.acquire() as endpoint:
+        assert endpoint is endpoint_2
+
+
+def test_docker_endpoint_pool__reuses_clients():
+    endpoint = FakeDockerEndpoint("endpoint")
+    docker_endpoint_pool = DockerEndpointPool([endpoint])
+
+    for _ in range(3):
+        with docker_endpoint_pool.acquire():
+            pass
+    docker_endpoint_pool.close()
+
+    assert endpoint.created_clients == 1
+    assert endpoint.closed_clients == 1
+
+
+def test_docker_endpoint_pool__no_healthy_endpoints():
+    endpoint = FakeDockerEndpoint("endpoint")
+    endpoint.healthy = False
+    docker_endpoint_pool = DockerEndpointPool([endpoint])
+
+    with pytest.raises(DockerEndpointError):
+        with docker_endpoint_pool.acquire():
+            pass
+
+
+def test_docker_endpoint_pool__no_endpoints():
+    with pytest.raises(ValueError):
+        DockerEndpointPool([])
+
+
+def test_use_docker_endpoint_pool():
+    docker_endpoint_pool = DockerEndpointPool([FakeDockerEndpoint("endpoint")])
+
+    with use_docker_endpoint_pool(docker_endpoint_pool):
+        assert get_docker_endpoint_pool() is docker_endpoint_pool
+
+        with use_docker_endpoint_pool(None):
+            assert get_docker_endpoint_pool() is docker_endpoint_pool
+
+    assert get_docker_endpoint_pool() is None
+
+
+def test_run_command__remote_endpoint(tmp_path: Path):
+    (tmp_path / "kept.txt").write_text("kept")
+    (tmp_path / "removed.txt").write_text("removed")
+
+    def command(plugin_dir_path: Path):
+        assert (plugin_dir_path / "kept.txt").read_text() == "kept"
+        (plugin_dir_path / "removed.txt").unlink()
+        (plugin_dir_path / "vendor").mkdir()
+        (plugin_dir_path / "vendor" / "package.py").write_text("installed")
+
+    endpoint = FakeDockerEndpoint("endpoint", command=command)
+
+    with use_docker_endpoint_pool(DockerEndpointPool([endpoint])):
+        output = run_command_in_linux_builder_container(
+            tmp_path, "true", builder_images=DEFAULT_BUILDER_IMAGES
+        )
+
+    assert output == "output"
+    assert (tmp_path / "kept.txt").read_text() == "kept"
+    assert not (tmp_path / "removed.txt").exists()
+    assert (tmp_path / "vendor" / "package.py").read_text() == "installed"
+    assert endpoint.created[0].kwargs["volumes"] is None
+    assert BUILDER_CONTAINER_LABEL in endpoint.created[0].kwargs["labels"]
+
+
+def test_run_command__local_endpoint(tmp_path: Path):
+    endpoint = FakeDockerEndpoint("endpoint", is_local=True)
+
+    with use_docker_endpoint_pool(DockerEndpointPool([endpoint])):
+        run_command_in_linux_builder_container(tmp_path, "true")
+
+    assert str(tmp_path) in endpoint.created[0].kwargs["volumes"]
+
+
+def test_run_command__failover(tmp_path: Path):
+    class FailingDockerEndpoint(FakeDockerEndpoint):
+        def create_client(self) -> FakeDockerClient:
+            client = super().create_client()
+            client.create = self._fail  # type: ignore [method-assign]
+
+            return client
+
+        def _fail(self, *_, **__):
+            raise ConnectionError("The connection was reset")
+
+    failing_endpoint = FailingDockerEndpoint("failing_endpoint")
+    endpoint = FakeDockerEndpoint("endpoint", capacity=2)
+    docker_endpoint_pool = DockerEndpointPool([failing_endpoint, endpoint])
+
+    with use_docker_endpoint_pool(docker_endpoint_pool):
+        run_command_in_linux_builder_container(tmp_path, "true")
+
+    assert len(endpoint.created) == 1
+
+
+def test_get_directory__refuses_links_out_of_directory(tmp_path: Path):
+    class LinkingContainer:
+        def get_archive(self, path: str):
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode="w") as tar:
+                link = tarfile.TarInfo("plugin/link")
+                link.type = tarfile.SYMTYPE
+                link.linkname = "/etc/passwd"
+                tar.addfile(link)
+
+            return [archive.getvalue()], {}
+
+    with pytest.raises(tarfile.TarError):
+        get_directory(LinkingContainer(), "/plugin", tmp_path / "plugin", set())
+
+    assert not (tmp_path / "plugin" / "link").is_symlink()
@@ -0,0 +1,153 @@
+import errno
+import os
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.dist_publish_method import DistPublishMethod
+from agent_plugin_builder.file_transfer import TransferStrategy, copy_file, copy_tree, publish_file
+
+FILE_CONTENTS = b"plugin contents" * 1000
+
+
+def _unsupported(*_, **__):
+    raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+
+@pytest.fixture
+def src_file(tmp_path: Path) -> Path:
+    src_file = tmp_path / "src" / "plugin.tar"
+    src_file.parent.mkdir()
+    src_file.write_bytes(FILE_CONTENTS)
+    os.chmod(src_file, 0o640)
+
+    return src_file
+
+
+@pytest.fixture
+def dst_dir(tmp_path: Path) -> Path:
+    dst_dir = tmp_path / "dst"
+    dst_dir.mkdir()
+
+    return dst_dir
+
+
+def test_copy_file(src_file: Path, dst_dir: Path):
+    dst_file = dst_dir / src_file.name
+
+    strategy = copy_file(src_file, dst_file)
+
+    assert strategy in TransferStrategy
+    assert dst_file.read_bytes() == FILE_CONTENTS
+    assert dst_file.stat().st_mode == src_file.stat().st_mode
+    assert dst_file.stat().st_mtime == src_file.stat().st_mtime
+
+
+@pytest.mark.parametrize(
+    "unsupported_functions, expected_strategy",
+    [
+        (["_reflink"], TransferStrategy.COPY_FILE_RANGE),
+        (["_reflink", "_copy_file_range"], TransferStrategy.SENDFILE),
+        (["_reflink", "_copy_file_range", "_sendfile"], TransferStrategy.COPY),
+    ],
+)
+def test_copy_file__fallback(
+    monkeypatch,
+    src_file: Path,
+    dst_dir: Path,
+    unsupported_functions: list[str],
+    expected_strategy: TransferStrategy,
+):
+    for function in unsupported_functions:
+        monkeypatch.setattr(f"agent_plugin_builder.file_transfer.{function}", _unsupported)
+    dst_file = dst_dir / src_file.name
+
+    strategy = copy_file(src_file, dst_file)
+
+    assert strategy == expected_strategy
+    assert dst_file.read_bytes() == FILE_CONTENTS
+
+
+def test_copy_file__partial_copy_is_discarded(monkeypatch, src_file: Path, dst_dir: Path):
+    def partial_copy(src_fd: int, dst_fd: int, _: int):
+        os.write(dst_fd, b"partial")
+        _unsupported()
+
+    monkeypatch.setattr("agent_plugin_builder.file_transfer._reflink", partial_copy)
+    dst_file = dst_dir / src_file.name
+
+    copy_file(src_file, dst_file)
+
+    assert dst_file.read_bytes() == FILE_CONTENTS
+
+
+def test_copy_file__raises_other_errors(monkeypatch, src_file: Path, dst_dir: Path):
+    monkeypatch.setattr(
+        "agent_plugin_builder.file_transfer._reflink",
+        MagicMock(side_effect=OSError(errno.ENOSPC, "No space left on device")),
+    )
+
+    with pytest.raises(OSError):
+        copy_file(src_file, dst_dir / src_file.name)
+
+
+def test_copy_tree(src_file: Path, dst_dir: Path):
+    (src_file.parent / "subdir").mkdir()
+    (src_file.parent / "subdir" / "empty.py").touch()
+
+    strategies = copy_tree(src_file.parent, dst_dir)
+
+    assert sum(strategies.values()) == 2
+    assert (dst_dir / src_file.name).read_bytes() == FILE_CONTENTS
+    assert (dst_dir / "subdir" / "empty.py").exists()
+
+
+def test_publish_file__copy(src_file: Path, dst_dir: Path):
+    dst_file = dst_dir / src_file.name
+    dst_file.write_bytes(b"old contents")
+
+    strategy = publish_file(src_file, dst_file, DistPublishMethod.COPY)
+
+    assert strategy not in (TransferStrategy.HARDLINK, TransferStrategy.RENAME)
+    assert dst_file.read_bytes() == FILE_CONTENTS
+    assert src_file.exists()
+    assert list(dst_dir.iterdir()) == [dst_file]
+
+
+def test_publish_file__hardlink(src_file: Path, dst_dir: Path):
+    dst_file = dst_dir / src_file.name
+    dst_file.write_bytes(b"old contents")
+
+    strategy = publish_file(src_file, dst_file, DistPublishMethod.HARDLINK)
+
+    assert strategy == TransferStrategy.HARDLINK
+    assert dst_file.samefile(src_file)
+    assert list(dst_dir.iterdir()) == [dst_file]
+
+
+def test_publish_file__move(src_file: Path, dst_dir: Path):
+    dst_file = dst_dir / src_file.name
+
+    strategy = publish_file(src_file, dst_file, DistPublishMethod.MOVE)
+
+    assert strategy == TransferStrategy.RENAME
+    assert dst_file.read_bytes() == FILE_CONTENTS
+    assert not src_file.exists()
+
+
+@pytest.mark.parametrize("publish_method", [DistPublishMethod.HARDLINK, DistPublishMethod.MOVE])
+def test_publish_file__different_filesystems(
+    monkeypatch, src_file: Path, dst_dir: Path, publish_method: DistPublishMethod
+):
+    monkeypatch.setattr("agent_plugin_builder.file_transfer._on_same_filesystem", lambda *_: False)
+    dst_file = dst_dir / src_file.name
+
+    strategy = publish_file(src_file, dst_file, publish_method)
+
+    assert strategy not in (TransferStrategy.HARDLINK, TransferStrategy.RENAME)
+    assert dst_file.read_bytes() == FILE_CONTENTS
+    if publish_method == DistPublishMethod.HARDLINK:
+        assert not dst_file.samefile(src_file)
+    else:
+        assert not src_file.exists()
@@ -0,0 +1,158 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.file_transfer import TransferStrategy
+from agent_plugin_builder.installed_tree_cache import (
+    CACHE_DIR_NAME,
+    InstalledPackage,
+    InstalledTreeCache,
+    get_default_cache_dir,
+    get_tree_set_name,
+    link_installed_tree,
+    read_install_report,
+)
+
+SHA256 = "a" * 64
+PACKAGE = InstalledPackage(
+    name="requests",
+    version="2.31.0",
+    url=f"https://files.example.com/requests-2.31.0-py3-none-any.whl#sha256={SHA256}",
+    sha256=SHA256,
+)
+UNHASHED_PACKAGE = InstalledPackage(
+    name="local", version="1.0.0", url="file:///plugin/local-1.0.0.tar.gz"
+)
+INSTALL_REPORT = {
+    "environment": {
+        "sys_platform": "linux",
+        "implementation_name": "cpython",
+        "python_version": "3.11",
+    },
+    "install": [
+        {
+            "metadata": {"name": "requests", "version": "2.31.0"},
+            "download_info": {
+                "url": "https://files.example.com/requests-2.31.0-py3-none-any.whl",
+                "archive_info": {"hash": f"sha256={SHA256}", "hashes": {"sha256": SHA256}},
+            },
+        },
+        {
+            "metadata": {"name": "idna", "version": "3.6"},
+            "download_info": {
+                "url": "https://files.example.com/idna-3.6-py3-none-any.whl",
+                "archive_info": {"hash": f"sha256={'b' * 64}"},
+            },
+        },
+        {
+            "metadata": {"name": "local", "version": "1.0.0"},
+            "download_info": {"url": "file:///plugin/local-1.0.0.tar.gz", "dir_info": {}},
+        },
+    ],
+}
+
+
+def _write_tree(tree_path: Path) -> Path:
+    (tree_path / "requests").mkdir(parents=True)
+    (tree_path / "requests" / "__init__.py").write_text("# requests")
+    (tree_path / "requests" / "_speedups.so").write_bytes(b"\x7fELF")
+    (tree_path / "requests-2.31.0.dist-info").mkdir()
+    (tree_path / "requests-2.31.0.dist-info" / "METADATA").write_text("Name: requests")
+
+    return tree_path
+
+
+@pytest.fixture
+def installed_tree_cache(tmp_path: Path) -> InstalledTreeCache:
+    return InstalledTreeCache(tmp_path / "cache")
+
+
+def test_get_default_cache_dir(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    assert get_default_cache_dir() == tmp_path / CACHE_DIR_NAME
+
+
+def test_get_default_cache_dir__no_xdg_cache_home(monkeypatch):
+    monkeypatch.delenv("XDG_CACHE_HOME", raising=False)
+
+    assert get_default_cache_dir() == Path.home() / ".cache" / CACHE_DIR_NAME
+
+
+def test_read_install_report(tmp_path: Path):
+    report_file_path = tmp_path / "report.json"
+    report_file_path.write_text(json.dumps(INSTALL_REPORT))
+
+    install_report = read_install_report(report_file_path)
+
+    assert install_report.environment == "linux-cpython3.11"
+    assert [package.sha256 for package in install_report.packages] == [SHA256, "b" * 64, None]
+    assert install_report.packages[0].filename == "requests-2.31.0-py3-none-any.whl"
+    assert install_report.packages[0].requirement == PACKAGE.requirement
+
+
+def test_installed_package__tree_name():
+    assert PACKAGE.tree_name == f"requests-2.31.0-py3-none-any.whl-{SHA256[:16]}"
+    assert UNHASHED_PACKAGE.tree_name == "local-1.0.0.tar.gz"
+
+
+def test_get_tree_set_name():
+    assert get_tree_set_name("linux-cpython3.11", []) == "linux-cpython3.11"
+    assert get_tree_set_name("linux-cpython3.11", ["--no-compile"]) != "linux-cpython3.11"
+    assert get_tree_set_name("linux-cpython3.11", ["--no-compile"]).startswith("linux-cpython3.11-")
+
+
+def test_installed_tree_cache__store(tmp_path: Path, installed_tree_cache: InstalledTreeCache):
+    installed_tree_path = _write_tree(tmp_path / "staging" / PACKAGE.tree_name)
+
+    assert not installed_tree_cache.contains("linux", PACKAGE)
+    tree_path = installed_tree_cache.store("linux", PACKAGE, installed_tree_path)
+
+    assert installed_tree_cache.contains("linux", PACKAGE)
+    assert tree_path == installed_tree_cache.get_tree_path("linux", PACKAGE)
+    assert (tree_path / "requests" / "__init__.py").read_text() == "# requests"
+    assert not installed_tree_path.exists()
+    assert not installed_tree_cache.contains("win32", PACKAGE)
+
+
+def test_installed_tree_cache__store_existing(
+    tmp_path: Path, installed_tree_cache: InstalledTreeCache
+):
+    installed_tree_cache.store("linux", PACKAGE, _write_tree(tmp_path / "first"))
+
+    tree_path = installed_tree_cache.store("linux", PACKAGE, _write_tree(tmp_path / "second"))
+
+    assert sorted(path.name for path in tree_path.parent.iterdir()) == [PACKAGE.tree_name]
+
+
+def test_installed_tree_cache__unhashed_package_is_not_stored(
+    tmp_path: Path, installed_tree_cache: InstalledTreeCache
+):
+    installed_tree_path = _write_tree(tmp_path / "staging" / UNHASHED_PACKAGE.tree_name)
+
+    tree_path = installed_tree_cache.store("linux", UNHASHED_PACKAGE, installed_tree_path)
+
+    assert tree_path == installed_tree_path
+    assert not installed_tree_cache.contains("linux", UNHASHED_PACKAGE)
+
+
+def test_link_installed_tree(tmp_path: Path):
+    installed_tree_path = _write_tree(tmp_path / "tree")
+    vendor_dir_path = tmp_path / "vendor"
+    (vendor_dir_path / "idna").mkdir(parents=True)
+
+    strategies = link_installed_tree(installed_tree_path, vendor_dir_path)
+
+    assert strategies[TransferStrategy.HARDLINK] == 2
+    assert sum(strategies.values()) == 3
+    assert (vendor_dir_path / "idna").is_dir()
+    assert os.path.samefile(
+        vendor_dir_path / "requests" / "__init__.py",
+        installed_tree_path / "requests" / "__init__.py",
+    )
+    assert not os.path.samefile(
+        vendor_dir_path / "requests" / "_speedups.so",
+        installed_tree_path / "requests" / "_speedups.so",
+    )
@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.lock_file_analysis import detect_common_vendor_dir_from_lock_file
+
+LOCK_FILE = """
+[[package]]
+name = "requests"
+version = "2.32.3"
+files = [
+    {file = "requests-2.32.3-py3-none-any.whl", hash = "sha256:1"},
+    {file = "requests-2.32.3.tar.gz", hash = "sha256:2"},
+]
+
+[[package]]
+name = "PyYAML"
+version = "6.0.2"
+files = [
+    {file = "PyYAML-6.0.2-cp311-cp311-manylinux2014_x86_64.whl", hash = "sha256:3"},
+    {file = "PyYAML-6.0.2-cp311-cp311-win_amd64.whl", hash = "sha256:4"},
+    {file = "PyYAML-6.0.2-cp312-cp312-win_amd64.whl", hash = "sha256:5"},
+    {file = "pyyaml-6.0.2.tar.gz", hash = "sha256:6"},
+]
+
+[[package]]
+name = "colorama"
+version = "0.4.6"
+files = [
+    {file = "colorama-0.4.6-py2.py3-none-any.whl", hash = "sha256:7"},
+]
+
+[[package]]
+name = "wrapt"
+version = "1.16.0"
+files = [
+    {file = "wrapt-1.16.0-py3-none-any.whl", hash = "sha256:8"},
+    {file = "wrapt-1.16.0-cp311-cp311-musllinux_1_1_x86_64.whl", hash = "sha256:9"},
+]
+
+[[package]]
+name = "pywin32"
+version = "306"
+files = [
+    {file = "pywin32-306-cp311-cp311-win_amd64.whl", hash = "sha256:10"},
+]
+
+[[package]]
+name = "legacy"
+version = "1.0"
+files = [
+    {file = "legacy-1.0.tar.gz", hash = "sha256:11"},
+]
+
+[metadata]
+lock-version = "2.0"
+python-versions = "^3.11"
+"""
+
+
+@pytest.fixture
+def build_dir_path(tmp_path: Path) -> Path:
+    (tmp_path / "poetry.lock").write_text(LOCK_FILE)
+
+    return tmp_path
+
+
+def write_requirements(build_dir_path: Path, *requirements: str):
+    (build_dir_path / "requirements.txt").write_text("\n".join(requirements) + "\n")
+
+
+@pytest.mark.parametrize(
+    "requirements",
+    [
+        ['requests==2.32.3 ; python_version >= "3.8" \\\n    --hash=sha256:1'],
+        ["requests==2.32.3", "wrapt==1.16.0"],
+        ["requests==2.32.3", 'colorama==0.4.6 ; python_full_version >= "3.7.0"'],
+        ["--extra-index-url https://example.com/simple", "Requests==2.32.3"],
+    ],
+)
+def test_detect_common_vendor_dir_from_lock_file__possible(
+    build_dir_path: Path, requirements: list[str]
+):
+    write_requirements(build_dir_path, *requirements)
+
+    assert detect_common_vendor_dir_from_lock_file(build_dir_path) is True
+
+
+@pytest.mark.parametrize(
+    "requirements",
+    [
+        ["requests==2.32.3", "pyyaml==6.0.2"],
+        ["requests==2.32.3", 'colorama==0.4.6 ; sys_platform == "win32"'],
+        ['pywin32==306 ; platform_system == "Windows"'],
+    ],
+)
+def test_detect_common_vendor_dir_from_lock_file__not_possible(
+    build_dir_path: Path, requirements: list[str]
+):
+    write_requirements(build_dir_path, *requirements)
+
+    assert detect_common_vendor_dir_from_lock_file(build_dir_path) is False
+
+
+@pytest.mark.parametrize(
+    "requirements",
+    [
+        ["legacy==1.0"],
+        ["pywin32==306"],
+        ["requests>=2.32.3"],
+        ["requests==2.32.4"],
+        ["requests @ https://example.com/requests-2.32.3-py3-none-any.whl"],
+        ['requests==2.32.3 ; platform_release >= "6.0"'],
+        ['requests==2.32.3 ; python_full_version >= "3.11.4"'],
+        ["not a requirement"],
+    ],
+)
+def test_detect_common_vendor_dir_from_lock_file__undetermined(
+    build_dir_path: Path, requirements: list[str]
+):
+    write_requirements(build_dir_path, *requirements)
+
+    assert detect_common_vendor_dir_from_lock_file(build_dir_path) is None
+
+
+def test_detect_common_vendor_dir_from_lock_file__legacy_lock_file(tmp_path: Path):
+    (tmp_path / "poetry.lock").write_text(
+        """
+[[package]]
+name = "PyYAML"
+version = "6.0.2"
+
+[metadata]
+lock-version = "1.1"
+
+[metadata.files]
+pyyaml = [
+    {file = "PyYAML-6.0.2-cp311-cp311-manylinux_2_17_x86_64.whl", hash = "sha256:3"},
+    {file = "PyYAML-6.0.2-cp311-cp311-win_amd64.whl", hash = "sha256:4"},
+]
+"""
+    )
+    write_requirements(tmp_path, "pyyaml==6.0.2")
+
+    assert detect_common_vendor_dir_from_lock_file(tmp_path) is False
+
+
+def test_detect_common_vendor_dir_from_lock_file__missing_files(tmp_path: Path):
+    assert detect_common_vendor_dir_from_lock_file(tmp_path) is None
+
+    write_requirements(tmp_path, "requests==2.32.3")
+    assert detect_common_vendor_dir_from_lock_file(tmp_path) is None
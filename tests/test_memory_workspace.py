@@ -0,0 +1,137 @@
+import errno
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.memory_workspace import (
+    MEMORY_WORKSPACE_PREFIX,
+    VENDOR_DIRS_SIZE_ALLOWANCE,
+    create_memory_workspace,
+    estimate_workspace_size,
+    get_available_memory,
+    is_out_of_space,
+    preserve_workspace_files,
+    remove_memory_workspace,
+)
+
+GIB = 1024 * 1024 * 1024
+MEMINFO = """MemTotal:       16000000 kB
+MemFree:         1000000 kB
+MemAvailable:    8000000 kB
+"""
+
+
+@pytest.fixture
+def meminfo_file(monkeypatch, tmp_path: Path) -> Path:
+    meminfo_file = tmp_path / "meminfo"
+    meminfo_file.write_text(MEMINFO)
+    monkeypatch.setattr("agent_plugin_builder.memory_workspace.MEMINFO_FILE_PATH", meminfo_file)
+
+    return meminfo_file
+
+
+@pytest.fixture
+def memory_dir(monkeypatch, tmp_path: Path) -> Path:
+    memory_dir = tmp_path / "shm"
+    memory_dir.mkdir()
+    monkeypatch.setattr(
+        "agent_plugin_builder.memory_workspace.MEMORY_WORKSPACE_PARENT_DIRS", (memory_dir,)
+    )
+
+    return memory_dir
+
+
+def test_estimate_workspace_size(tmp_path: Path):
+    (tmp_path / "subdir").mkdir()
+    (tmp_path / "plugin.py").write_bytes(b"a" * 100)
+    (tmp_path / "subdir" / "module.py").write_bytes(b"b" * 50)
+
+    assert estimate_workspace_size(tmp_path) == 3 * 150 + VENDOR_DIRS_SIZE_ALLOWANCE
+
+
+def test_get_available_memory(meminfo_file: Path):
+    assert get_available_memory() == 8000000 * 1024
+
+
+def test_get_available_memory__no_meminfo(meminfo_file: Path):
+    meminfo_file.unlink()
+
+    assert get_available_memory() is None
+
+
+def test_create_memory_workspace(meminfo_file: Path, memory_dir: Path):
+    workspace_path = create_memory_workspace(VENDOR_DIRS_SIZE_ALLOWANCE)
+
+    assert workspace_path is not None
+    assert workspace_path.parent == memory_dir
+    assert workspace_path.name.startswith(MEMORY_WORKSPACE_PREFIX)
+    assert workspace_path.is_dir()
+
+
+def test_create_memory_workspace__over_memory_budget(meminfo_file: Path, memory_dir: Path):
+    assert create_memory_workspace(8 * GIB) is None
+    assert list(memory_dir.iterdir()) == []
+
+
+def test_create_memory_workspace__no_memory_dir(meminfo_file: Path, memory_dir: Path):
+    memory_dir.rmdir()
+
+    assert create_memory_workspace(VENDOR_DIRS_SIZE_ALLOWANCE) is None
+
+
+def test_create_memory_workspace__not_enough_space(
+    monkeypatch, meminfo_file: Path, memory_dir: Path
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.memory_workspace.shutil.disk_usage",
+        lambda _: MagicMock(free=1024),
+    )
+
+    assert create_memory_workspace(VENDOR_DIRS_SIZE_ALLOWANCE) is None
+
+
+@pytest.mark.parametrize(
+    "err, free_space, expected_result",
+    [
+        (OSError(errno.ENOSPC, "No space left on device"), GIB, True),
+        (OSError(errno.EACCES, "Permission denied"), GIB, False),
+        (Exception("Vendor directory generation failed"), 1024, True),
+        (Exception("Vendor directory generation failed"), GIB, False),
+    ],
+)
+def test_is_out_of_space(
+    monkeypatch, tmp_path: Path, err: Exception, free_space: int, expected_result: bool
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.memory_workspace.shutil.disk_usage",
+        lambda _: MagicMock(free=free_space),
+    )
+
+    assert is_out_of_space(err, tmp_path) == expected_result
+
+
+def test_preserve_workspace_files(tmp_path: Path):
+    workspace_path = tmp_path / "workspace"
+    build_dir_path = tmp_path / "build"
+    workspace_path.mkdir()
+    build_dir_path.mkdir()
+    (workspace_path / "requirements.txt").write_text("requests==2.31.0")
+    (workspace_path / "slim_report.json").write_text("{}")
+    (workspace_path / "source.tar.gz").write_bytes(b"archive")
+    (workspace_path / "plugin.py").write_text("")
+
+    preserve_workspace_files(workspace_path, build_dir_path)
+
+    assert sorted(path.name for path in build_dir_path.iterdir()) == [
+        "requirements.txt",
+        "slim_report.json",
+    ]
+
+
+def test_remove_memory_workspace(tmp_path: Path):
+    (tmp_path / "workspace" / "vendor").mkdir(parents=True)
+
+    remove_memory_workspace(tmp_path / "workspace")
+
+    assert not (tmp_path / "workspace").exists()
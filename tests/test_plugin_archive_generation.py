@@ -1,7 +1,9 @@
+import asyncio
+import hashlib
 import shutil
 import tarfile
 from pathlib import Path
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from monkeytypes import AgentPluginManifest, AgentPluginType, OperatingSystem
@@ -10,12 +12,23 @@ from agent_plugin_builder import (
     AgentPluginBuildOptions,
     PlatformDependencyPackagingMethod,
     create_agent_plugin_archive,
+    create_agent_plugin_archive_async,
     create_plugin_archive,
     create_source_archive,
 )
+from agent_plugin_builder.archive_checksums import (
+    get_checksums_file_path,
+    read_archive_checksums,
+    read_plugin_archive_checksums,
+)
+from agent_plugin_builder.archive_size_analysis import SIZE_REPORT_FILE, SizeBudgetExceededError
+from agent_plugin_builder.build_control import BuildStage
+from agent_plugin_builder.builder_images import DEFAULT_BUILDER_IMAGES
 from agent_plugin_builder.plugin_archive_generation import EXCLUDE_SOURCE_FILES, SOURCE
 from agent_plugin_builder.plugin_manifest import MANIFEST
 from agent_plugin_builder.plugin_schema_generation import CONFIG_SCHEMA
+from agent_plugin_builder.size_budgets import SizeBudgets
+from agent_plugin_builder.vendor_bundle_compression import VendorBundleCompression
 
 TEST_SOURCE_DIR_NAME = "test_source_dir"
 TEST_BUILD_DIR_NAME = "test_build_dir"
@@ -120,6 +133,7 @@ def test_create_agent_plugin_archive(
         CONFIG_SCHEMA,
         f"{MANIFEST}.yaml",
     ]
+    assert get_checksums_file_path(plugin_archive_path).exists()
 
 
 @pytest.mark.integration
@@ -138,6 +152,139 @@ def test_create_agent_plugin_archive__dist_dir_created(
     assert agent_plugin_build_options.dist_dir_path.is_dir()
 
 
+def test_create_agent_plugin_archive__build_result(monkeypatch, agent_plugin_build_options_plugin):
+    agent_plugin_build_options = agent_plugin_build_options_plugin(
+        PlatformDependencyPackagingMethod.AUTODETECT
+    )
+    vendor_dir_path = (
+        agent_plugin_build_options.build_dir_path / MOCK_SOURCE_DIR_NAME / "vendor-linux"
+    )
+
+    def generate_vendor_directories(*_):
+        vendor_dir_path.mkdir()
+        (vendor_dir_path / "package.py").write_bytes(b"x" * 10)
+        return DEFAULT_BUILDER_IMAGES
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.generate_vendor_directories",
+        generate_vendor_directories,
+    )
+
+    build_result = create_agent_plugin_archive(
+        agent_plugin_build_options, MOCK_AGENT_PLUGIN_MANIFEST
+    )
+
+    plugin_archive_path = agent_plugin_build_options.dist_dir_path / "Mock-exploiter.tar"
+    source_archive_path = agent_plugin_build_options.build_dir_path / f"{SOURCE}.tar.gz"
+    assert build_result.plugin_archive_path == plugin_archive_path
+    assert build_result.plugin_archive_size == plugin_archive_path.stat().st_size
+    assert build_result.source_archive_size == source_archive_path.stat().st_size
+    assert build_result.platform_dependencies == PlatformDependencyPackagingMethod.SEPARATE
+    assert build_result.vendor_dir_sizes == {"vendor-linux": 10}
+    assert build_result.vendor_file_counts == {"vendor-linux": 1}
+    assert BuildStage.CREATE_PLUGIN_ARCHIVE in build_result.stage_durations
+    assert build_result.checksums == read_plugin_archive_checksums(plugin_archive_path)
+    assert build_result.containers_run == 0
+
+
+def test_create_agent_plugin_archive_async__stages_in_separate_calls(
+    monkeypatch, agent_plugin_build_options_plugin
+):
+    agent_plugin_build_options = agent_plugin_build_options_plugin(
+        PlatformDependencyPackagingMethod.COMMON
+    )
+
+    def resolve_builder_images_for_build(*_):
+        return DEFAULT_BUILDER_IMAGES
+
+    def install_vendor_directories(*_):
+        pass
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.resolve_builder_images_for_build",
+        resolve_builder_images_for_build,
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation._generate_requirements_file_async",
+        AsyncMock(),
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.install_vendor_directories",
+        install_vendor_directories,
+    )
+    blocking_calls = []
+
+    async def run_in_thread(func, *args):
+        blocking_calls.append(getattr(func, "func", func).__name__)
+        return await asyncio.to_thread(func, *args)
+
+    monkeypatch.setattr("agent_plugin_builder.build_control.run_in_thread", run_in_thread)
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.run_in_thread", run_in_thread
+    )
+
+    build_result = asyncio.run(
+        create_agent_plugin_archive_async(agent_plugin_build_options, MOCK_AGENT_PLUGIN_MANIFEST)
+    )
+
+    # The worker thread is returned to the executor between the stages
+    assert blocking_calls == [
+        "resolve_builder_images_for_build",
+        "install_vendor_directories",
+        "_generate_config_schema",
+        "_create_source_archive",
+        "_create_plugin_archive",
+        "_publish_plugin_archive",
+        "_get_build_result",
+    ]
+    assert build_result.plugin_archive_path.exists()
+
+
+def test_create_agent_plugin_archive__vendor_bundle(monkeypatch, agent_plugin_build_options_plugin):
+    agent_plugin_build_options = agent_plugin_build_options_plugin(
+        PlatformDependencyPackagingMethod.COMMON
+    ).model_copy(update={"vendor_bundle": VendorBundleCompression.STORED})
+    vendor_dir_path = agent_plugin_build_options.build_dir_path / MOCK_SOURCE_DIR_NAME / "vendor"
+
+    def generate_vendor_directories(*_):
+        for module_name in ("first", "second", "third"):
+            (vendor_dir_path / module_name).mkdir(parents=True)
+            (vendor_dir_path / module_name / "__init__.py").write_text(module_name)
+        return DEFAULT_BUILDER_IMAGES
+
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.generate_vendor_directories",
+        generate_vendor_directories,
+    )
+
+    build_result = create_agent_plugin_archive(
+        agent_plugin_build_options, MOCK_AGENT_PLUGIN_MANIFEST
+    )
+
+    source_archive_path = agent_plugin_build_options.build_dir_path / f"{SOURCE}.tar.gz"
+    assert "vendor/bundle.zip" in list_tar_contents(source_archive_path)
+    assert build_result.vendor_file_counts == {"vendor": 1}
+    assert BuildStage.BUNDLE_VENDOR_DIRECTORIES in build_result.stage_durations
+
+
+def test_create_agent_plugin_archive__size_budget_exceeded(
+    monkeypatch, agent_plugin_build_options_plugin
+):
+    agent_plugin_build_options = agent_plugin_build_options_plugin(
+        PlatformDependencyPackagingMethod.COMMON
+    ).model_copy(update={"size_budgets": SizeBudgets(max_compressed_bytes=1)})
+    monkeypatch.setattr(
+        "agent_plugin_builder.plugin_archive_generation.generate_vendor_directories",
+        lambda *_: DEFAULT_BUILDER_IMAGES,
+    )
+
+    with pytest.raises(SizeBudgetExceededError):
+        create_agent_plugin_archive(agent_plugin_build_options, MOCK_AGENT_PLUGIN_MANIFEST)
+
+    assert (agent_plugin_build_options.build_dir_path / SIZE_REPORT_FILE).exists()
+    assert not (agent_plugin_build_options.dist_dir_path / "Mock-exploiter.tar").exists()
+
+
 def test_create_agent_plugin_archive__empty_plugin(
     monkeypatch,
     agent_plugin_build_options: AgentPluginBuildOptions,
@@ -167,6 +314,75 @@ def test_create_source_archive(tmpdir: str):
     assert EXCLUDE_SOURCE_FILES not in actual_tar_files
 
 
+def test_create_source_archive__include_bytecode(tmpdir: str):
+    temp_dir = Path(tmpdir)
+    build_dir_path = temp_dir / TEST_BUILD_DIR_NAME
+    source_dir_path = build_dir_path / TEST_SOURCE_DIR_NAME
+    (source_dir_path / "__pycache__").mkdir(parents=True)
+    (source_dir_path / "testfile.py").touch()
+    (source_dir_path / "__pycache__" / "testfile.cpython-311.pyc").touch()
+    (source_dir_path / ".git").touch()
+
+    source_archive_path = create_source_archive(
+        build_dir_path, TEST_SOURCE_DIR_NAME, include_bytecode=True
+    )
+
+    assert sorted(list_tar_contents(source_archive_path)) == [
+        "__pycache__",
+        "__pycache__/testfile.cpython-311.pyc",
+        "testfile.py",
+    ]
+
+
+def test_create_source_archive__checksums(tmpdir: str):
+    temp_dir = Path(tmpdir)
+    build_dir_path = temp_dir / TEST_BUILD_DIR_NAME
+    build_dir_path.mkdir()
+    source_dir_path = build_dir_path / TEST_SOURCE_DIR_NAME
+    (source_dir_path / "vendor").mkdir(parents=True)
+    (source_dir_path / "testfile.py").write_text("print('test')")
+    (source_dir_path / "vendor" / "module.py").write_text("VALUE = 1")
+
+    source_archive_path = create_source_archive(build_dir_path, TEST_SOURCE_DIR_NAME)
+
+    checksums = read_archive_checksums(source_archive_path)
+    assert checksums is not None
+    assert checksums.archive_name == f"{SOURCE}.tar.gz"
+    assert checksums.sha256 == hashlib.sha256(source_archive_path.read_bytes()).hexdigest()
+    with tarfile.open(source_archive_path, "r") as tar:
+        assert checksums.members == {
+            member.name: hashlib.sha256(tar.extractfile(member).read()).hexdigest()  # type: ignore
+            for member in tar.getmembers()
+            if member.isfile()
+        }
+    assert set(checksums.members) == {"testfile.py", "vendor/module.py"}
+
+
+def test_create_plugin_archive__checksums(tmpdir: str, agent_plugin_manifest: AgentPluginManifest):
+    temp_dir = Path(tmpdir)
+    build_dir_path = temp_dir / TEST_BUILD_DIR_NAME
+    (build_dir_path / TEST_SOURCE_DIR_NAME).mkdir(parents=True)
+    (build_dir_path / TEST_SOURCE_DIR_NAME / "testfile.py").write_text("print('test')")
+    (build_dir_path / CONFIG_SCHEMA).write_text('{"type": "object"}')
+    (build_dir_path / f"{MANIFEST}.yml").write_text("name: Plugin")
+    source_archive_path = create_source_archive(build_dir_path, TEST_SOURCE_DIR_NAME)
+
+    plugin_archive_path = create_plugin_archive(build_dir_path, agent_plugin_manifest)
+
+    checksums = read_plugin_archive_checksums(plugin_archive_path)
+    assert checksums.plugin_archive.archive_name == PLUGIN_ARCHIVE_NAME
+    assert (
+        checksums.plugin_archive.sha256
+        == hashlib.sha256(plugin_archive_path.read_bytes()).hexdigest()
+    )
+    assert checksums.plugin_archive.members == {
+        f"{SOURCE}.tar.gz": hashlib.sha256(source_archive_path.read_bytes()).hexdigest(),
+        CONFIG_SCHEMA: hashlib.sha256(b'{"type": "object"}').hexdigest(),
+        f"{MANIFEST}.yml": hashlib.sha256(b"name: Plugin").hexdigest(),
+    }
+    assert checksums.source_archive == read_archive_checksums(source_archive_path)
+
+
 def test_create_plugin_archive(tmpdir: str, agent_plugin_manifest: AgentPluginManifest):
     temp_dir = Path(tmpdir)
     build_dir_path = temp_dir / TEST_BUILD_DIR_NAME
@@ -203,16 +419,23 @@ def test_create_source_archive__os_error(monkeypatch, tmpdir: str):
 
 
 def test_create_plugin_archive__removes_existing_archive(
-    monkeypatch, tmpdir: str, agent_plugin_manifest: AgentPluginManifest
+    tmpdir: str, agent_plugin_manifest: AgentPluginManifest
 ):
-    monkeypatch.setattr(tarfile, "open", MagicMock())
     temp_dir = Path(tmpdir)
     build_dir_path = temp_dir / TEST_BUILD_DIR_NAME
     build_dir_path.mkdir()
-    (build_dir_path / PLUGIN_ARCHIVE_NAME).touch()
+    (build_dir_path / CONFIG_SCHEMA).touch()
+    (build_dir_path / f"{SOURCE}.tar.gz").touch()
+    (build_dir_path / f"{MANIFEST}.yml").touch()
+    (build_dir_path / PLUGIN_ARCHIVE_NAME).write_bytes(b"existing plugin archive")
 
     assert (build_dir_path / PLUGIN_ARCHIVE_NAME).exists()
 
     plugin_archive_path = create_plugin_archive(build_dir_path, agent_plugin_manifest)
 
-    assert not plugin_archive_path.exists()
+    assert tarfile.is_tarfile(plugin_archive_path)
+    assert list_tar_contents(plugin_archive_path) == [
+        f"{SOURCE}.tar.gz",
+        CONFIG_SCHEMA,
+        f"{MANIFEST}.yml",
+    ]
@@ -1,4 +1,5 @@
 import json
+import sys
 from pathlib import Path
 from unittest.mock import MagicMock
 
@@ -61,6 +62,34 @@ def test_generate_plugin_config_schema__from_options(
     assert (build_dir_path / CONFIG_SCHEMA).read_text() == json.dumps(expected_schema)
 
 
+def test_generate_plugin_config_schema__isolated_imports(
+    tmp_path: Path, agent_plugin_manifest: AgentPluginManifest
+):
+    original_path = list(sys.path)
+    build_dir_paths = [tmp_path / "build_1", tmp_path / "build_2"]
+    for timeout, build_dir_path in enumerate(build_dir_paths, start=1):
+        (build_dir_path / "source_dir_name").mkdir(parents=True)
+        (build_dir_path / "source_dir_name" / "plugin_defaults.py").write_text(
+            f"TIMEOUT = {timeout}.0\n"
+        )
+        (build_dir_path / "source_dir_name" / "plugin_options.py").write_text(
+            "from plugin_defaults import TIMEOUT\n"
+            "from pydantic import BaseModel\n\n\n"
+            "class PluginOptions(BaseModel):\n"
+            "    timeout: float = TIMEOUT\n"
+        )
+
+    for build_dir_path in build_dir_paths:
+        generate_plugin_config_schema(build_dir_path, "source_dir_name", agent_plugin_manifest)
+
+    for timeout, build_dir_path in enumerate(build_dir_paths, start=1):
+        config_schema = json.loads((build_dir_path / CONFIG_SCHEMA).read_text())
+        assert config_schema["properties"]["timeout"]["default"] == timeout
+    assert sys.path == original_path
+    assert "plugin_options" not in sys.modules
+    assert "plugin_defaults" not in sys.modules
+
+
 def test_generate_plugin_config_schema__exception(
     monkeypatch, agent_plugin_manifest: AgentPluginManifest
 ):
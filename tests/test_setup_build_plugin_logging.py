@@ -1,4 +1,6 @@
+import json
 import logging
+import logging.handlers
 from pathlib import Path
 
 import pytest
@@ -68,3 +70,59 @@ def test_setup_build_plugin_logging_console_log_default_level(capsys, tmpdir: st
     # Console log level for out of logging scope level occurrences is always info
     # E.x. -vvvvvvvv argument
     assert TEST_STRING not in captured.out
+
+
+def test_setup_build_plugin_logging__queue_logging(tmpdir: str):
+    DATA_DIR = Path(tmpdir)
+    LOG_FILE = DATA_DIR / agent_plugin_builder_logger.AGENT_PLUGIN_BUILDER_LOG_FILENAME
+    TEST_STRINGS = [f"Build plugin logging test (Queue; Record: {i})" for i in range(1000)]
+
+    agent_plugin_builder_logger.setup_logging(4, queue_logging=True)
+    agent_plugin_builder_logger.add_file_handler(DATA_DIR)
+
+    logger = logging.getLogger("TestLogger")
+    for test_string in TEST_STRINGS:
+        logger.debug(test_string)
+    agent_plugin_builder_logger.shutdown_logging()
+
+    log_lines = LOG_FILE.read_text().splitlines()
+    assert len(log_lines) == len(TEST_STRINGS)
+    assert all(test_string in line for test_string, line in zip(TEST_STRINGS, log_lines))
+
+
+def test_setup_build_plugin_logging__queue_logging_console(capsys):
+    TEST_STRING = "Build plugin logging test (Queue; Console)"
+
+    agent_plugin_builder_logger.setup_logging(4, queue_logging=True)
+
+    logger = logging.getLogger("TestLogger")
+    logger.debug(TEST_STRING)
+    agent_plugin_builder_logger.shutdown_logging()
+
+    captured = capsys.readouterr()
+    assert TEST_STRING in captured.out
+    assert not any(
+        isinstance(handler, logging.handlers.QueueHandler)
+        for handler in logging.getLogger().handlers
+    )
+
+
+@pytest.mark.parametrize("queue_logging", [True, False])
+def test_setup_build_plugin_logging__jsonl_file(tmpdir: str, queue_logging: bool):
+    DATA_DIR = Path(tmpdir)
+    LOG_FILE = DATA_DIR / agent_plugin_builder_logger.AGENT_PLUGIN_BUILDER_JSONL_LOG_FILENAME
+    TEST_STRING = "Build plugin logging test (File; Format: jsonl)"
+
+    agent_plugin_builder_logger.setup_logging(4, queue_logging=queue_logging)
+    agent_plugin_builder_logger.add_file_handler(
+        DATA_DIR, agent_plugin_builder_logger.LogFileFormat.JSONL
+    )
+
+    logger = logging.getLogger("TestLogger")
+    logger.debug(TEST_STRING)
+    agent_plugin_builder_logger.shutdown_logging()
+
+    records = [json.loads(line) for line in LOG_FILE.read_text().splitlines()]
+    assert records[-1]["message"] == TEST_STRING
+    assert records[-1]["level"] == "DEBUG"
+    assert records[-1]["logger"] == "TestLogger"
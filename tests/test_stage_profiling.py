@@ -0,0 +1,167 @@
+import logging
+import pstats
+import threading
+import tracemalloc
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.build_control import (
+    BuildControl,
+    BuildStage,
+    build_stage,
+    use_build_control,
+)
+from agent_plugin_builder.profile_mode import ProfileMode
+from agent_plugin_builder.stage_profiling import (
+    StageProfiler,
+    get_profile_file_path,
+    get_stage_profile,
+)
+
+
+def build_strings() -> list[str]:
+    return [str(i) * 10 for i in range(10000)]
+
+
+def test_stage_profiler__cpu(tmp_path: Path, caplog):
+    profiler = StageProfiler(ProfileMode.CPU, tmp_path)
+
+    with caplog.at_level(logging.INFO):
+        with profiler.profile(BuildStage.CREATE_SOURCE_ARCHIVE):
+            build_strings()
+
+    profile_file_path = get_profile_file_path(
+        tmp_path, BuildStage.CREATE_SOURCE_ARCHIVE, ProfileMode.CPU
+    )
+    assert profile_file_path.name == "profile_create_source_archive.pstats"
+    stats_profile = pstats.Stats(str(profile_file_path)).get_stats_profile()
+    assert "build_strings" in stats_profile.func_profiles
+    assert "CPU profile of stage create_source_archive" in caplog.text
+    assert "build_strings" in caplog.text
+
+
+def test_stage_profiler__cpu_concurrent_builds(tmp_path: Path, caplog):
+    first_profiler = StageProfiler(ProfileMode.CPU, tmp_path / "first")
+    second_profiler = StageProfiler(ProfileMode.CPU, tmp_path / "second")
+    second_stage_ended = threading.Event()
+
+    def profile_second_stage():
+        with second_profiler.profile(BuildStage.CREATE_SOURCE_ARCHIVE):
+            build_strings()
+        second_stage_ended.set()
+
+    with caplog.at_level(logging.INFO):
+        with first_profiler.profile(BuildStage.CREATE_SOURCE_ARCHIVE):
+            second_build = threading.Thread(target=profile_second_stage)
+            second_build.start()
+            assert second_stage_ended.wait(5)
+        second_build.join()
+
+    assert get_profile_file_path(
+        tmp_path / "first", BuildStage.CREATE_SOURCE_ARCHIVE, ProfileMode.CPU
+    ).exists()
+    assert not get_profile_file_path(
+        tmp_path / "second", BuildStage.CREATE_SOURCE_ARCHIVE, ProfileMode.CPU
+    ).exists()
+    assert "Not profiling stage create_source_archive" in caplog.text
+
+
+def test_stage_profiler__memory(tmp_path: Path, caplog):
+    profiler = StageProfiler(ProfileMode.MEMORY, tmp_path)
+
+    with caplog.at_level(logging.INFO):
+        with profiler.profile(BuildStage.GENERATE_CONFIG_SCHEMA):
+            strings = build_strings()
+
+    profile_file_path = get_profile_file_path(
+        tmp_path, BuildStage.GENERATE_CONFIG_SCHEMA, ProfileMode.MEMORY
+    )
+    snapshot = tracemalloc.Snapshot.load(str(profile_file_path))
+    assert sum(statistic.size for statistic in snapshot.statistics("filename")) > 0
+    assert "Memory profile of stage generate_config_schema" in caplog.text
+    assert "Peak traced memory" in caplog.text
+    assert not tracemalloc.is_tracing()
+    assert len(strings) == 10000
+
+
+def test_stage_profiler__memory_keeps_tracing(tmp_path: Path):
+    profiler = StageProfiler(ProfileMode.MEMORY, tmp_path)
+
+    tracemalloc.start()
+    try:
+        with profiler.profile(BuildStage.CREATE_PLUGIN_ARCHIVE):
+            build_strings()
+
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_stage_profiler__memory_concurrent_builds(tmp_path: Path):
+    first_profiler = StageProfiler(ProfileMode.MEMORY, tmp_path / "first")
+    second_profiler = StageProfiler(ProfileMode.MEMORY, tmp_path / "second")
+    second_stage_started = threading.Event()
+    first_stage_ended = threading.Event()
+    errors = []
+
+    def profile_second_stage():
+        try:
+            with second_profiler.profile(BuildStage.CREATE_PLUGIN_ARCHIVE):
+                second_stage_started.set()
+                first_stage_ended.wait()
+                # The first build stopped profiling while the second one is still profiled
+                assert tracemalloc.is_tracing()
+                build_strings()
+        except Exception as err:
+            errors.append(err)
+
+    second_build = threading.Thread(target=profile_second_stage)
+    with first_profiler.profile(BuildStage.CREATE_PLUGIN_ARCHIVE):
+        second_build.start()
+        second_stage_started.wait()
+    first_stage_ended.set()
+    second_build.join()
+
+    assert errors == []
+    assert not tracemalloc.is_tracing()
+    for build_dir_path in (tmp_path / "first", tmp_path / "second"):
+        assert get_profile_file_path(
+            build_dir_path, BuildStage.CREATE_PLUGIN_ARCHIVE, ProfileMode.MEMORY
+        ).exists()
+
+
+@pytest.mark.parametrize("profile_mode", list(ProfileMode))
+def test_stage_profiler__container_stages_not_profiled(tmp_path: Path, profile_mode: ProfileMode):
+    profiler = StageProfiler(profile_mode, tmp_path)
+
+    with profiler.profile(BuildStage.INSTALL_VENDOR_DIRECTORIES):
+        build_strings()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stage_profiler__profiles_failed_stages(tmp_path: Path):
+    profiler = StageProfiler(ProfileMode.CPU, tmp_path)
+
+    with pytest.raises(ValueError):
+        with profiler.profile(BuildStage.STAGE_PLUGIN_CODE):
+            raise ValueError("The stage failed")
+
+    assert get_profile_file_path(tmp_path, BuildStage.STAGE_PLUGIN_CODE, ProfileMode.CPU).exists()
+
+
+def test_build_stage__profiled(tmp_path: Path):
+    build_control = BuildControl(profile_stage=get_stage_profile(ProfileMode.CPU, tmp_path))
+
+    with use_build_control(build_control):
+        with build_stage(BuildStage.CREATE_PLUGIN_ARCHIVE):
+            build_strings()
+
+    assert get_profile_file_path(
+        tmp_path, BuildStage.CREATE_PLUGIN_ARCHIVE, ProfileMode.CPU
+    ).exists()
+
+
+def test_get_stage_profile__no_profile(tmp_path: Path):
+    assert get_stage_profile(None, tmp_path) is None
@@ -0,0 +1,144 @@
+import importlib
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from agent_plugin_builder.vendor_bundle_compression import VendorBundleCompression
+from agent_plugin_builder.vendor_dir_bundling import (
+    DATA_FILES_BY_PATH,
+    NATIVE_EXTENSION,
+    NOT_A_MODULE,
+    NOT_ZIP_SAFE,
+    VENDOR_BUNDLE,
+    VENDOR_BUNDLE_REPORT_FILE,
+    bundle_vendor_directories,
+)
+
+SOURCE_DIR_NAME = "source_dir"
+
+
+def _write_file(path: Path, content: str = ""):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+@pytest.fixture
+def build_dir_path(tmp_path: Path) -> Path:
+    vendor_dir_path = tmp_path / SOURCE_DIR_NAME / "vendor"
+    _write_file(vendor_dir_path / "bundled_package" / "__init__.py", "from .module import VALUE")
+    _write_file(vendor_dir_path / "bundled_package" / "module.py", "VALUE = 'bundled'")
+    _write_file(vendor_dir_path / "bundled_package" / "schema.json", "{}")
+    _write_file(vendor_dir_path / "bundled_package" / "__pycache__" / "module.cpython-311.pyc")
+    _write_file(vendor_dir_path / "bundled_package-1.0.dist-info" / "METADATA")
+    _write_file(vendor_dir_path / "bundled_module.py", "VALUE = 'module'")
+    _write_file(vendor_dir_path / "__pycache__" / "bundled_module.cpython-311.pyc")
+    _write_file(vendor_dir_path / "native_package" / "__init__.py")
+    _write_file(vendor_dir_path / "native_package" / "_speedups.cpython-311-x86_64-linux-gnu.so")
+    _write_file(
+        vendor_dir_path / "data_package" / "__init__.py", "import os\nos.path.dirname(__file__)"
+    )
+    _write_file(vendor_dir_path / "data_package" / "cacert.pem")
+    _write_file(vendor_dir_path / "legacy_package" / "__init__.py")
+    _write_file(vendor_dir_path / "legacy_package-1.0.egg-info" / "not-zip-safe")
+    _write_file(
+        vendor_dir_path / "legacy_package-1.0.egg-info" / "top_level.txt", "legacy_package\n"
+    )
+    _write_file(vendor_dir_path / "bin" / "script")
+    _write_file(vendor_dir_path / "distutils-precedence.pth")
+
+    return tmp_path
+
+
+def test_bundle_vendor_directories(build_dir_path: Path):
+    vendor_dir_path = build_dir_path / SOURCE_DIR_NAME / "vendor"
+
+    report = bundle_vendor_directories(build_dir_path, SOURCE_DIR_NAME)
+
+    with zipfile.ZipFile(vendor_dir_path / VENDOR_BUNDLE) as bundle:
+        assert sorted(bundle.namelist()) == [
+            "bundled_module.py",
+            "bundled_package/__init__.py",
+            "bundled_package/module.py",
+            "bundled_package/schema.json",
+        ]
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in bundle.infolist())
+    assert sorted(path.name for path in vendor_dir_path.iterdir()) == [
+        "bin",
+        "bundle.zip",
+        "bundled_package-1.0.dist-info",
+        "data_package",
+        "distutils-precedence.pth",
+        "legacy_package",
+        "legacy_package-1.0.egg-info",
+        "native_package",
+    ]
+    vendor_dir_bundle = report.vendor_dirs["vendor"]
+    assert vendor_dir_bundle.bundled_entries == ("bundled_module.py", "bundled_package")
+    assert vendor_dir_bundle.loose_entries == {
+        "bin": NOT_A_MODULE,
+        "data_package": DATA_FILES_BY_PATH,
+        "distutils-precedence.pth": NOT_A_MODULE,
+        "legacy_package": NOT_ZIP_SAFE,
+        "native_package": NATIVE_EXTENSION,
+    }
+    assert vendor_dir_bundle.file_count_before == 16
+    assert vendor_dir_bundle.file_count_after == 11
+    assert report.removed_file_count == 5
+    assert json.loads((build_dir_path / VENDOR_BUNDLE_REPORT_FILE).read_text()) == (
+        report.to_json_dict()
+    )
+
+
+def test_bundle_vendor_directories__importable(build_dir_path: Path):
+    bundle_path = build_dir_path / SOURCE_DIR_NAME / "vendor" / VENDOR_BUNDLE
+    bundle_vendor_directories(
+        build_dir_path, SOURCE_DIR_NAME, compression=VendorBundleCompression.DEFLATED
+    )
+
+    sys.path.insert(0, str(bundle_path))
+    try:
+        assert importlib.import_module("bundled_package").VALUE == "bundled"
+        assert importlib.import_module("bundled_module").VALUE == "module"
+    finally:
+        sys.path.remove(str(bundle_path))
+        for name in ("bundled_package", "bundled_package.module", "bundled_module"):
+            sys.modules.pop(name, None)
+
+    with zipfile.ZipFile(bundle_path) as bundle:
+        assert all(info.compress_type == zipfile.ZIP_DEFLATED for info in bundle.infolist())
+
+
+def test_bundle_vendor_directories__include_bytecode(build_dir_path: Path):
+    bundle_vendor_directories(build_dir_path, SOURCE_DIR_NAME, include_bytecode=True)
+
+    vendor_dir_path = build_dir_path / SOURCE_DIR_NAME / "vendor"
+    with zipfile.ZipFile(vendor_dir_path / VENDOR_BUNDLE) as bundle:
+        assert "bundled_package/module.pyc" in bundle.namelist()
+        assert "bundled_module.pyc" in bundle.namelist()
+    assert not (vendor_dir_path / "__pycache__").exists()
+
+
+def test_bundle_vendor_directories__bundled_again(build_dir_path: Path):
+    bundle_vendor_directories(build_dir_path, SOURCE_DIR_NAME)
+    _write_file(build_dir_path / SOURCE_DIR_NAME / "vendor" / "new_module.py")
+
+    report = bundle_vendor_directories(build_dir_path, SOURCE_DIR_NAME)
+
+    with zipfile.ZipFile(build_dir_path / SOURCE_DIR_NAME / "vendor" / VENDOR_BUNDLE) as bundle:
+        assert "bundled_module.py" in bundle.namelist()
+        assert "new_module.py" in bundle.namelist()
+    assert report.vendor_dirs["vendor"].bundled_entries == ("new_module.py",)
+
+
+def test_bundle_vendor_directories__nothing_to_bundle(tmp_path: Path):
+    vendor_dir_path = tmp_path / SOURCE_DIR_NAME / "vendor-windows"
+    _write_file(vendor_dir_path / "win32" / "win32api.pyd")
+
+    report = bundle_vendor_directories(tmp_path, SOURCE_DIR_NAME)
+
+    assert not (vendor_dir_path / VENDOR_BUNDLE).exists()
+    assert report.vendor_dirs["vendor-windows"].loose_entries == {"win32": NATIVE_EXTENSION}
+    assert report.removed_file_count == 0
@@ -1,7 +1,15 @@
+import asyncio
+import json
+import re
+import shutil
+import sys
+import threading
 from pathlib import Path
-from unittest.mock import MagicMock
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
+from docker.errors import ContainerError
 from monkeytypes import AgentPluginManifest, OperatingSystem
 
 from agent_plugin_builder import (
@@ -9,17 +17,50 @@ from agent_plugin_builder import (
     PlatformDependencyPackagingMethod,
     generate_common_vendor_dir,
     generate_requirements_file,
+    generate_requirements_file_async,
     generate_vendor_directories,
     generate_vendor_dirs,
     generate_windows_vendor_dir,
     should_use_common_vendor_dir,
 )
+from agent_plugin_builder.artifact_prefetching import (
+    BUILD_WHEELHOUSE_DIR,
+    CONTAINER_WHEELHOUSE_PATH,
+    WHEELHOUSE_DIR,
+)
+from agent_plugin_builder.autodetect_cache import AutodetectCache
+from agent_plugin_builder.build_control import BuildCancelledError, BuildControl, use_build_control
+from agent_plugin_builder.build_journal import BuildJournal, use_build_journal
+from agent_plugin_builder.builder_images import (
+    DEFAULT_BUILDER_IMAGES,
+    LINUX_PLUGIN_BUILDER_IMAGE,
+    WINDOWS_PLUGIN_BUILDER_IMAGE,
+    BuilderImages,
+)
+from agent_plugin_builder.installed_tree_cache import InstalledTreeCache
+from agent_plugin_builder.slim_rules import SlimRules
+from agent_plugin_builder.vendor_bundle_compression import VendorBundleCompression
 from agent_plugin_builder.vendor_dir_generation import (
+    COMMON_VENDOR_DIR,
+    INSTALLED_TREES_STAGING_DIR,
     LINUX_BUILD_VENDOR_DIR_COMMANDS,
-    LINUX_PLUGIN_BUILDER_IMAGE,
+    LINUX_PACKAGE_LIST_FILE,
+    LINUX_VENDOR_DIR,
+    PIP_NO_COMPILE_OPTION,
+    SPECULATIVE_INSTALL_DIR,
     WINDOWS_BUILD_VENDOR_DIR_COMMANDS,
-    WINDOWS_PLUGIN_BUILDER_IMAGE,
+    WINDOWS_IMAGE_INIT_COMMAND,
+    WINDOWS_PACKAGE_LIST_FILE,
+    WINDOWS_VENDOR_DIR,
     CommandRunError,
+    run_command_in_linux_builder_container,
+)
+from agent_plugin_builder.wine_prefix_cache import (
+    WINE_PREFIX_CREATE_COMMANDS,
+    WINE_PREFIX_INIT_COMMAND,
+    WINE_PREFIX_MOUNT_PATH,
+    WINE_PREFIX_REQUIRED_FILES,
+    WinePrefixCache,
 )
 
 # Sample package lists
@@ -56,6 +97,17 @@ def get_agent_plugin_build_options(tmpdir):
     return make_agent_plugin_build_options
 
 
+@pytest.fixture(autouse=True)
+def mock_resolve_builder_images(monkeypatch) -> MagicMock:
+    mock_resolve_builder_images = MagicMock(return_value=DEFAULT_BUILDER_IMAGES)
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.resolve_builder_images",
+        mock_resolve_builder_images,
+    )
+
+    return mock_resolve_builder_images
+
+
 @pytest.fixture
 def mock_docker(monkeypatch):
     mock_container = MagicMock()
@@ -156,6 +208,10 @@ def test_generate_vendor_directories__common_dependencies(
     mock_generate_common_vendor_dir.assert_called_with(
         agent_plugin_build_options.build_dir_path,
         agent_plugin_build_options.source_dir_name,
+        pip_install_options=[],
+        builder_images=DEFAULT_BUILDER_IMAGES,
+        installed_tree_cache=None,
+        wheelhouse_path=None,
     )
 
 
@@ -198,7 +254,7 @@ def test_generate_vendor_directories_autodetect_common_deps(
     )
     monkeypatch.setattr(
         "agent_plugin_builder.vendor_dir_generation.should_use_common_vendor_dir",
-        lambda _: True,
+        lambda *_: True,
     )
     mock_generate_common_vendor_dir = MagicMock()
     monkeypatch.setattr(
@@ -217,6 +273,10 @@ def test_generate_vendor_directories_autodetect_common_deps(
     mock_generate_common_vendor_dir.assert_called_with(
         agent_plugin_build_options.build_dir_path,
         agent_plugin_build_options.source_dir_name,
+        pip_install_options=[],
+        builder_images=DEFAULT_BUILDER_IMAGES,
+        installed_tree_cache=None,
+        wheelhouse_path=None,
     )
 
 
@@ -230,7 +290,7 @@ def test_generate_vendor_directories_autodetect_separate_deps(
     )
     monkeypatch.setattr(
         "agent_plugin_builder.vendor_dir_generation.should_use_common_vendor_dir",
-        lambda _: False,
+        lambda *_: False,
     )
     mock_generate_vendor_dirs = MagicMock()
     monkeypatch.setattr(
@@ -253,6 +313,262 @@ def test_generate_vendor_directories_autodetect_separate_deps(
         assert call[0][2] in [OperatingSystem.WINDOWS, OperatingSystem.LINUX]
 
 
+def test_generate_vendor_directories_autodetect__lock_file(
+    monkeypatch, get_agent_plugin_build_options, agent_plugin_manifest: AgentPluginManifest
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.detect_common_vendor_dir_from_lock_file",
+        lambda *_: True,
+    )
+    mock_should_use_common_vendor_dir = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.should_use_common_vendor_dir",
+        mock_should_use_common_vendor_dir,
+    )
+    mock_generate_common_vendor_dir = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_common_vendor_dir",
+        mock_generate_common_vendor_dir,
+    )
+
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.AUTODETECT
+    )
+    generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    mock_should_use_common_vendor_dir.assert_not_called()
+    mock_generate_common_vendor_dir.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "lock_file_autodetect, lock_file_decision",
+    [(True, None), (False, True)],
+)
+def test_generate_vendor_directories_autodetect__lock_file_fallback(
+    monkeypatch,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+    lock_file_autodetect: bool,
+    lock_file_decision: bool | None,
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.detect_common_vendor_dir_from_lock_file",
+        lambda *_: lock_file_decision,
+    )
+    mock_should_use_common_vendor_dir = MagicMock(return_value=False)
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.should_use_common_vendor_dir",
+        mock_should_use_common_vendor_dir,
+    )
+    mock_generate_vendor_dirs = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_vendor_dirs",
+        mock_generate_vendor_dirs,
+    )
+
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.AUTODETECT
+    ).model_copy(update={"lock_file_autodetect": lock_file_autodetect})
+    generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    mock_should_use_common_vendor_dir.assert_called_once()
+    assert mock_generate_vendor_dirs.call_count == 2
+
+
+def test_generate_vendor_directories__resume(
+    monkeypatch, get_agent_plugin_build_options, agent_plugin_manifest: AgentPluginManifest
+):
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.AUTODETECT
+    )
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    source_dir_path = build_dir_path / agent_plugin_build_options.source_dir_name
+
+    def generate_requirements_file(build_dir_path: Path, _):
+        (build_dir_path / "requirements.txt").write_text("requests==2.32.3\n")
+
+    def should_use_common_vendor_dir(build_dir_path: Path, *_):
+        (build_dir_path / LINUX_PACKAGE_LIST_FILE).write_text("{}")
+        (build_dir_path / WINDOWS_PACKAGE_LIST_FILE).write_text("{}")
+        return False
+
+    def install_linux_vendor_dir(*_):
+        (source_dir_path / LINUX_VENDOR_DIR).mkdir(parents=True)
+        return b""
+
+    def install_windows_vendor_dir(*_):
+        (source_dir_path / WINDOWS_VENDOR_DIR).mkdir(parents=True)
+        return b""
+
+    mock_generate_requirements_file = MagicMock(side_effect=generate_requirements_file)
+    mock_should_use_common_vendor_dir = MagicMock(side_effect=should_use_common_vendor_dir)
+    mock_run_linux_container = MagicMock(side_effect=install_linux_vendor_dir)
+    mock_run_windows_container = MagicMock(
+        side_effect=[ContainerError(None, 137, "wine", "image", b"OOM"), install_windows_vendor_dir]
+    )
+    for name, mock in [
+        ("generate_requirements_file", mock_generate_requirements_file),
+        ("should_use_common_vendor_dir", mock_should_use_common_vendor_dir),
+        ("_run_command_in_docker_container", mock_run_linux_container),
+        ("_run_command_in_windows_builder_container", mock_run_windows_container),
+    ]:
+        monkeypatch.setattr(f"agent_plugin_builder.vendor_dir_generation.{name}", mock)
+    agent_plugin_manifest = agent_plugin_manifest.model_copy(
+        update={"supported_operating_systems": (OperatingSystem.LINUX, OperatingSystem.WINDOWS)}
+    )
+
+    with use_build_journal(BuildJournal(build_dir_path)):
+        with pytest.raises(ContainerError):
+            generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+    mock_run_windows_container.side_effect = install_windows_vendor_dir
+    build_journal = BuildJournal(build_dir_path, resume=True)
+    with use_build_journal(build_journal):
+        generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    assert build_journal.resumed_steps == [
+        "generate_requirements_file",
+        "vendor_dir_processing",
+        "autodetect_platform_dependencies",
+        f"install_vendor_directories:{LINUX_VENDOR_DIR}",
+    ]
+    assert mock_generate_requirements_file.call_count == 1
+    assert mock_should_use_common_vendor_dir.call_count == 1
+    assert mock_run_linux_container.call_count == 1
+    assert mock_run_windows_container.call_count == 2
+    assert (source_dir_path / WINDOWS_VENDOR_DIR).is_dir()
+
+
+@pytest.mark.parametrize(
+    "processing_options",
+    [
+        {"slim_rules": SlimRules()},
+        {"precompile_bytecode": True},
+        {"vendor_bundle": VendorBundleCompression.DEFLATED},
+    ],
+)
+def test_generate_vendor_directories__resume_changed_processing(
+    monkeypatch,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+    processing_options: dict[str, Any],
+):
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.COMMON
+    )
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    source_dir_path = build_dir_path / agent_plugin_build_options.source_dir_name
+
+    def generate_requirements_file(build_dir_path: Path, _):
+        (build_dir_path / "requirements.txt").write_text("requests==2.32.3\n")
+
+    def install_common_vendor_dir(*_):
+        (source_dir_path / COMMON_VENDOR_DIR).mkdir(parents=True)
+        return b""
+
+    mock_run_linux_container = MagicMock(side_effect=install_common_vendor_dir)
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file",
+        generate_requirements_file,
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation._run_command_in_docker_container",
+        mock_run_linux_container,
+    )
+
+    with use_build_journal(BuildJournal(build_dir_path)):
+        generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+    build_journal = BuildJournal(build_dir_path, resume=True)
+    with use_build_journal(build_journal):
+        generate_vendor_directories(
+            agent_plugin_build_options.model_copy(update=processing_options),
+            agent_plugin_manifest,
+        )
+
+    # The vendor directory was processed with the previous options, so it's installed again
+    assert build_journal.resumed_steps == ["generate_requirements_file"]
+    assert mock_run_linux_container.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "windows_packages, expected_vendor_dirs",
+    [
+        (WINDOWS_PACKAGES_SAME, [COMMON_VENDOR_DIR]),
+        (WINDOWS_PACKAGES_DIFF, [LINUX_VENDOR_DIR, WINDOWS_VENDOR_DIR]),
+    ],
+)
+def test_generate_vendor_directories__speculative_install(
+    monkeypatch,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+    windows_packages: set[str],
+    expected_vendor_dirs: list[str],
+):
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.AUTODETECT
+    ).model_copy(update={"speculative_install": True, "lock_file_autodetect": False})
+    build_dir_path = agent_plugin_build_options.build_dir_path
+    source_dir_path = build_dir_path / agent_plugin_build_options.source_dir_name
+    linux_install_started = threading.Event()
+
+    def run_linux_container(image: str, command: str, build_dir_path: Path, *_):
+        if "--dry-run" in command:
+            (build_dir_path / LINUX_PACKAGE_LIST_FILE).write_text("{}")
+        else:
+            linux_install_started.set()
+            vendor_path = re.search(r"-t ([\w./-]+)", command).group(1)  # type: ignore [union-attr]
+            (build_dir_path / vendor_path).mkdir(parents=True)
+            (build_dir_path / vendor_path / "package1.py").write_text("")
+        return b""
+
+    def run_windows_container(build_dir_path: Path, command: str, *_):
+        if "--dry-run" in command:
+            # The Linux requirements are installed while the Windows requirements resolve
+            assert linux_install_started.wait(timeout=10)
+            (build_dir_path / WINDOWS_PACKAGE_LIST_FILE).write_text("{}")
+        else:
+            (source_dir_path / WINDOWS_VENDOR_DIR).mkdir(parents=True)
+        return b""
+
+    def generate_requirements_file(build_dir_path: Path, _):
+        (build_dir_path / "requirements.txt").write_text("package1==1.0\n")
+
+    mock_run_linux_container = MagicMock(side_effect=run_linux_container)
+    for name, mock in [
+        ("generate_requirements_file", generate_requirements_file),
+        (
+            "_load_package_names",
+            lambda file_path: (
+                LINUX_PACKAGES if file_path.name == LINUX_PACKAGE_LIST_FILE else windows_packages
+            ),
+        ),
+        ("_run_command_in_docker_container", mock_run_linux_container),
+        ("_run_command_in_windows_builder_container", run_windows_container),
+    ]:
+        monkeypatch.setattr(f"agent_plugin_builder.vendor_dir_generation.{name}", mock)
+    agent_plugin_manifest = agent_plugin_manifest.model_copy(
+        update={"supported_operating_systems": (OperatingSystem.LINUX, OperatingSystem.WINDOWS)}
+    )
+
+    with use_build_journal(BuildJournal(build_dir_path)):
+        generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    assert sorted(path.name for path in source_dir_path.iterdir()) == expected_vendor_dirs
+    assert (source_dir_path / expected_vendor_dirs[0] / "package1.py").exists()
+    assert not (build_dir_path / SPECULATIVE_INSTALL_DIR).exists()
+    # The speculative installation is the only Linux installation
+    assert mock_run_linux_container.call_count == 2
+    build_journal = BuildJournal(build_dir_path, resume=True)
+    with use_build_journal(build_journal):
+        generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+    assert f"install_vendor_directories:{expected_vendor_dirs[0]}" in build_journal.resumed_steps
+
+
 def test_generate_vendor_directories_autodetect_one_supported(
     monkeypatch, get_agent_plugin_build_options, agent_plugin_manifest: AgentPluginManifest
 ):
@@ -274,7 +590,7 @@ def test_generate_vendor_directories_autodetect_one_supported(
     )
     monkeypatch.setattr(
         "agent_plugin_builder.vendor_dir_generation.should_use_common_vendor_dir",
-        lambda _: False,
+        lambda *_: False,
     )
     mock_generate_vendor_dirs = MagicMock()
     monkeypatch.setattr(
@@ -391,6 +707,101 @@ def test_generate_requirements_file_command_error(monkeypatch, mock_run_command)
         generate_requirements_file(BUILD_DIR_PATH, verify_hashes=True)
 
 
+def test_generate_requirements_file_async(monkeypatch):
+    mock_run_command_async = AsyncMock(return_value=0)
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation._run_command_async", mock_run_command_async
+    )
+    monkeypatch.setattr(Path, "exists", lambda _: True)
+
+    asyncio.run(generate_requirements_file_async(BUILD_DIR_PATH, verify_hashes=True))
+
+    mock_run_command_async.assert_called_once_with(
+        BUILD_DIR_PATH,
+        ["poetry", "export", "-f", "requirements.txt", "-o", "requirements.txt"],
+    )
+
+
+def test_generate_requirements_file_async__command_error(monkeypatch):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation._run_command_async", AsyncMock(return_value=1)
+    )
+    monkeypatch.setattr(Path, "exists", lambda path: path.name == "poetry.lock")
+
+    with pytest.raises(CommandRunError):
+        asyncio.run(generate_requirements_file_async(BUILD_DIR_PATH, verify_hashes=True))
+
+
+def test_generate_requirements_file_async__cancelled(monkeypatch, tmp_path: Path):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation._get_requirements_export_command",
+        lambda *_: [sys.executable, "-c", "import time; time.sleep(60)"],
+    )
+
+    async def run():
+        task = asyncio.create_task(generate_requirements_file_async(tmp_path))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(task, timeout=10)
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def mock_builder_container(monkeypatch) -> MagicMock:
+    mock_container = MagicMock()
+    mock_container.wait.return_value = {"StatusCode": 0}
+    mock_container.logs.return_value = b"output"
+    mock_client = MagicMock()
+    mock_client.containers.create.return_value = mock_container
+    monkeypatch.setattr("docker.from_env", MagicMock(return_value=mock_client))
+
+    return mock_container
+
+
+def test_run_command_in_linux_builder_container__build_control(
+    mock_builder_container: MagicMock,
+):
+    build_control = BuildControl()
+    with use_build_control(build_control):
+        output = run_command_in_linux_builder_container(BUILD_DIR_PATH, "true")
+
+    assert output == "output"
+    assert build_control.statistics.containers_run == 1
+    mock_builder_container.start.assert_called_once()
+    mock_builder_container.remove.assert_called_once_with(force=True)
+
+
+def test_run_command_in_linux_builder_container__build_control_error(
+    mock_builder_container: MagicMock,
+):
+    mock_builder_container.wait.return_value = {"StatusCode": 1}
+
+    with use_build_control(BuildControl()):
+        with pytest.raises(ContainerError):
+            run_command_in_linux_builder_container(BUILD_DIR_PATH, "false")
+
+    mock_builder_container.remove.assert_called_once_with(force=True)
+
+
+def test_run_command_in_linux_builder_container__cancelled(mock_builder_container: MagicMock):
+    build_control = BuildControl()
+
+    def wait():
+        build_control.cancel()
+        return {"StatusCode": 137}
+
+    mock_builder_container.wait.side_effect = wait
+
+    with use_build_control(build_control):
+        with pytest.raises(BuildCancelledError):
+            run_command_in_linux_builder_container(BUILD_DIR_PATH, "sleep 60")
+
+    mock_builder_container.kill.assert_called_once()
+    mock_builder_container.remove.assert_called_once_with(force=True)
+
+
 @pytest.mark.integration
 def test_generate_common_vendor_dir_integration(write_requirements_file):
     build_dir_path = write_requirements_file("requirements_common_possible.txt")
@@ -425,6 +836,87 @@ def test_generate_common_vendor_dir(monkeypatch, mock_docker, vendor_dir_name: s
     )
 
 
+def test_generate_common_vendor_dir__pip_install_options(monkeypatch, mock_docker):
+    generate_common_vendor_dir(
+        BUILD_DIR_PATH, "source_dir", pip_install_options=[PIP_NO_COMPILE_OPTION]
+    )
+
+    command = mock_docker.return_value.containers.run.call_args.kwargs["command"]
+    assert command.endswith(f"-t source_dir/vendor {PIP_NO_COMPILE_OPTION}'")
+
+
+def test_generate_vendor_directories__slim(
+    monkeypatch, get_agent_plugin_build_options, agent_plugin_manifest: AgentPluginManifest
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    mock_generate_common_vendor_dir = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_common_vendor_dir",
+        mock_generate_common_vendor_dir,
+    )
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.COMMON
+    ).model_copy(update={"slim_rules": SlimRules()})
+
+    generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    assert mock_generate_common_vendor_dir.call_args.kwargs["pip_install_options"] == [
+        PIP_NO_COMPILE_OPTION
+    ]
+
+
+def test_generate_vendor_directories__prefetch(
+    monkeypatch,
+    tmp_path: Path,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    mock_generate_vendor_dirs = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_vendor_dirs",
+        mock_generate_vendor_dirs,
+    )
+    mock_prefetch_artifacts = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.prefetch_artifacts", mock_prefetch_artifacts
+    )
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.SEPARATE
+    ).model_copy(
+        update={
+            "prefetch": True,
+            "cache_dir_path": tmp_path / "cache",
+            "index_url": "https://example.com/simple/",
+        }
+    )
+
+    generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    wheelhouse_path = tmp_path / "cache" / WHEELHOUSE_DIR
+    mock_prefetch_artifacts.assert_called_once_with(
+        agent_plugin_build_options.build_dir_path,
+        list(agent_plugin_manifest.supported_operating_systems),
+        wheelhouse_path,
+        index_url="https://example.com/simple/",
+        max_connections=agent_plugin_build_options.prefetch_connections,
+    )
+    assert mock_generate_vendor_dirs.call_args.kwargs["wheelhouse_path"] == wheelhouse_path
+
+
+def test_generate_common_vendor_dir__prefetched_artifacts(tmp_path: Path, mock_docker):
+    (tmp_path / BUILD_WHEELHOUSE_DIR).mkdir()
+
+    generate_common_vendor_dir(tmp_path, "source_dir")
+
+    environment = mock_docker.return_value.containers.run.call_args.kwargs["environment"]
+    assert environment == {"PIP_FIND_LINKS": CONTAINER_WHEELHOUSE_PATH}
+
+
 def test_generate_vendor_dirs(monkeypatch):
     source_dir_name = "source_dir"
     mock_generate_linux_vendor_dir = MagicMock()
@@ -474,7 +966,8 @@ def test_generate_windows_vendor_dir(monkeypatch, mock_docker):
         WINDOWS_PLUGIN_BUILDER_IMAGE,
         command=(
             "/bin/bash -l -c "
-            f"'{WINDOWS_BUILD_VENDOR_DIR_COMMANDS.format(source_dir_name=f'{source_dir_name}')}'"
+            f"'{WINDOWS_IMAGE_INIT_COMMAND} && "
+            f"{WINDOWS_BUILD_VENDOR_DIR_COMMANDS.format(source_dir_name=f'{source_dir_name}')}'"
         ),
         volumes={str(BUILD_DIR_PATH): {"bind": "/plugin", "mode": "rw"}},
         remove=True,
@@ -482,6 +975,41 @@ def test_generate_windows_vendor_dir(monkeypatch, mock_docker):
     )
 
 
+def test_generate_windows_vendor_dir__wine_prefix_cache(tmp_path: Path, mock_docker):
+    mock_docker.return_value.images.get.return_value.id = "sha256:" + "1" * 64
+    mock_run = mock_docker.return_value.containers.run
+
+    def run(image, command, volumes, **kwargs):
+        if WINE_PREFIX_CREATE_COMMANDS in command:
+            wine_prefix_path = next(
+                Path(path)
+                for path, volume in volumes.items()
+                if volume["mode"] == "rw" and volume["bind"] == WINE_PREFIX_MOUNT_PATH
+            )
+            for name in WINE_PREFIX_REQUIRED_FILES:
+                (wine_prefix_path / name).touch()
+
+        return b""
+
+    mock_run.side_effect = run
+    wine_prefix_cache = WinePrefixCache(tmp_path / "cache")
+
+    for _ in range(2):
+        generate_windows_vendor_dir(
+            BUILD_DIR_PATH, "source_dir", wine_prefix_cache=wine_prefix_cache
+        )
+
+    commands = [call.kwargs["command"] for call in mock_run.call_args_list]
+    assert len(commands) == 3
+    assert WINE_PREFIX_CREATE_COMMANDS in commands[0]
+    for command in commands[1:]:
+        assert WINE_PREFIX_INIT_COMMAND in command
+        assert WINDOWS_IMAGE_INIT_COMMAND not in command
+    assert mock_run.call_args.kwargs["volumes"][
+        str(wine_prefix_cache.get_wine_prefix_path("sha256:" + "1" * 64))
+    ] == {"bind": WINE_PREFIX_MOUNT_PATH, "mode": "ro"}
+
+
 @pytest.mark.integration
 def test_should_use_common_vendor_dir__not_possible(write_requirements_file):
     build_dir_path = write_requirements_file("requirements_common_not_possible.txt")
@@ -522,3 +1050,223 @@ def test_should_use_common_vendor_dir_diff_packages(
     result = should_use_common_vendor_dir(BUILD_DIR_PATH)
 
     assert result is False
+
+
+def test_should_use_common_vendor_dir__autodetect_cache(monkeypatch, tmp_path: Path, mock_docker):
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation._load_package_names",
+        lambda file_path: (
+            LINUX_PACKAGES if file_path.name == LINUX_PACKAGE_LIST_FILE else WINDOWS_PACKAGES_DIFF
+        ),
+    )
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    (build_dir_path / "requirements.txt").write_text("requests==2.32.3\n")
+    for package_list_file in (LINUX_PACKAGE_LIST_FILE, WINDOWS_PACKAGE_LIST_FILE):
+        (build_dir_path / package_list_file).write_text("{}")
+    builder_images = BuilderImages(
+        linux=f"{LINUX_PLUGIN_BUILDER_IMAGE}@sha256:{'1' * 64}",
+        windows=f"{WINDOWS_PLUGIN_BUILDER_IMAGE}@sha256:{'2' * 64}",
+    )
+    autodetect_cache = AutodetectCache(tmp_path / "cache")
+
+    first_result = should_use_common_vendor_dir(
+        build_dir_path, builder_images, autodetect_cache=autodetect_cache
+    )
+    for package_list_file in (LINUX_PACKAGE_LIST_FILE, WINDOWS_PACKAGE_LIST_FILE):
+        (build_dir_path / package_list_file).unlink()
+    second_result = should_use_common_vendor_dir(
+        build_dir_path, builder_images, autodetect_cache=autodetect_cache
+    )
+
+    assert first_result is False
+    assert second_result is False
+    assert mock_docker.return_value.containers.run.call_count == 2
+    assert (build_dir_path / LINUX_PACKAGE_LIST_FILE).exists()
+    assert (build_dir_path / WINDOWS_PACKAGE_LIST_FILE).exists()
+
+
+@pytest.mark.parametrize(
+    "platform_dependencies, expected_operating_systems",
+    [
+        (PlatformDependencyPackagingMethod.COMMON, {OperatingSystem.LINUX}),
+        (
+            PlatformDependencyPackagingMethod.SEPARATE,
+            {OperatingSystem.LINUX, OperatingSystem.WINDOWS},
+        ),
+    ],
+)
+def test_generate_vendor_directories__resolves_builder_images(
+    monkeypatch,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+    mock_resolve_builder_images: MagicMock,
+    platform_dependencies: PlatformDependencyPackagingMethod,
+    expected_operating_systems: set[OperatingSystem],
+):
+    builder_images = BuilderImages(linux="linux@sha256:1", windows="windows@sha256:2")
+    mock_resolve_builder_images.return_value = builder_images
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    mock_generate_vendor_dirs = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_vendor_dirs",
+        mock_generate_vendor_dirs,
+    )
+    mock_generate_common_vendor_dir = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_common_vendor_dir",
+        mock_generate_common_vendor_dir,
+    )
+    agent_plugin_build_options = get_agent_plugin_build_options(platform_dependencies)
+
+    used_builder_images = generate_vendor_directories(
+        agent_plugin_build_options, agent_plugin_manifest
+    )
+
+    assert used_builder_images == builder_images
+    mock_resolve_builder_images.assert_called_once_with(
+        expected_operating_systems, agent_plugin_build_options.pull_policy
+    )
+    for call in (
+        mock_generate_vendor_dirs.call_args_list + mock_generate_common_vendor_dir.call_args_list
+    ):
+        assert call.kwargs["builder_images"] == builder_images
+
+
+def test_generate_vendor_directories__slim_needs_linux_builder_image(
+    monkeypatch,
+    get_agent_plugin_build_options,
+    agent_plugin_manifest: AgentPluginManifest,
+    mock_resolve_builder_images: MagicMock,
+):
+    agent_plugin_manifest = agent_plugin_manifest.model_copy(
+        update={"supported_operating_systems": (OperatingSystem.WINDOWS,)}
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_requirements_file", MagicMock()
+    )
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.generate_vendor_dirs", MagicMock()
+    )
+    agent_plugin_build_options = get_agent_plugin_build_options(
+        PlatformDependencyPackagingMethod.SEPARATE
+    ).model_copy(update={"slim_rules": SlimRules()})
+
+    generate_vendor_directories(agent_plugin_build_options, agent_plugin_manifest)
+
+    mock_resolve_builder_images.assert_called_once_with(
+        {OperatingSystem.LINUX, OperatingSystem.WINDOWS}, agent_plugin_build_options.pull_policy
+    )
+
+
+def test_generate_windows_vendor_dir__builder_images(mock_docker):
+    builder_images = BuilderImages(windows="windows@sha256:2")
+
+    generate_windows_vendor_dir(BUILD_DIR_PATH, "source_dir_name", builder_images=builder_images)
+
+    assert mock_docker.return_value.containers.run.call_args.args[0] == "windows@sha256:2"
+
+
+def _fake_installed_tree_container(package_list: dict):
+    def run(image: str, command: str, volumes: dict, **_) -> bytes:
+        build_dir_path = Path(next(iter(volumes)))
+        if "--dry-run" in command:
+            (build_dir_path / LINUX_PACKAGE_LIST_FILE).write_text(json.dumps(package_list))
+
+        for tree_path in re.findall(r"-t (\S+) ", command):
+            package_name = tree_path.split("/")[-1].split("-")[0]
+            (build_dir_path / tree_path / package_name).mkdir(parents=True)
+            (build_dir_path / tree_path / package_name / "__init__.py").write_text(package_name)
+
+        return b""
+
+    return run
+
+
+def test_generate_common_vendor_dir__installed_tree_cache(tmp_path: Path, mock_docker):
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    package_list: dict[str, Any] = {
+        "environment": {
+            "sys_platform": "linux",
+            "implementation_name": "cpython",
+            "python_version": "3.11",
+        },
+        "install": [
+            {
+                "metadata": {"name": name, "version": "1.0"},
+                "download_info": {
+                    "url": f"https://files.example.com/{name}-1.0-py3-none-any.whl",
+                    "archive_info": {"hashes": {"sha256": sha256}},
+                },
+            }
+            for name, sha256 in (("requests", "a" * 64), ("idna", "b" * 64))
+        ],
+    }
+    mock_run = mock_docker.return_value.containers.run
+    mock_run.side_effect = _fake_installed_tree_container(package_list)
+    installed_tree_cache = InstalledTreeCache(tmp_path / "cache")
+
+    generate_common_vendor_dir(
+        build_dir_path, "source_dir_name", installed_tree_cache=installed_tree_cache
+    )
+    first_install_command = mock_run.call_args.kwargs["command"]
+    shutil.rmtree(build_dir_path / "source_dir_name")
+    package_list["install"][0]["download_info"]["archive_info"]["hashes"]["sha256"] = "c" * 64
+    (build_dir_path / LINUX_PACKAGE_LIST_FILE).unlink()
+    generate_common_vendor_dir(
+        build_dir_path, "source_dir_name", installed_tree_cache=installed_tree_cache
+    )
+    second_install_command = mock_run.call_args.kwargs["command"]
+
+    vendor_dir_path = build_dir_path / "source_dir_name" / "vendor"
+    assert (vendor_dir_path / "requests" / "__init__.py").read_text() == "requests"
+    assert (vendor_dir_path / "idna" / "__init__.py").read_text() == "idna"
+    assert "idna" in first_install_command and "requests" in first_install_command
+    assert "idna" not in second_install_command and "requests" in second_install_command
+    assert not (build_dir_path / INSTALLED_TREES_STAGING_DIR / "vendor").exists()
+
+
+@pytest.mark.parametrize(
+    "verified_names, expected_container_runs", [(["requests"], 1), (["requests", "pyyaml"], 0)]
+)
+def test_generate_common_vendor_dir__wheelhouse(
+    monkeypatch,
+    tmp_path: Path,
+    mock_docker,
+    verified_names: list[str],
+    expected_container_runs: int,
+):
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    (build_dir_path / "requirements.txt").write_text("requests==2.32.3\npyyaml==6.0.2\n")
+    verified_wheels = []
+    for verified_name in verified_names:
+        verified_wheel = MagicMock()
+        verified_wheel.name = verified_name
+        verified_wheels.append(verified_wheel)
+    mock_verify_pure_python_wheels = MagicMock(return_value=verified_wheels)
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.verify_pure_python_wheels",
+        mock_verify_pure_python_wheels,
+    )
+    mock_install_verified_wheels = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_generation.install_verified_wheels",
+        mock_install_verified_wheels,
+    )
+
+    generate_common_vendor_dir(build_dir_path, "source_dir_name", wheelhouse_path=tmp_path / "wh")
+
+    mock_verify_pure_python_wheels.assert_called_once_with(
+        build_dir_path, OperatingSystem.LINUX, tmp_path / "wh"
+    )
+    mock_install_verified_wheels.assert_called_once_with(
+        verified_wheels, build_dir_path / "source_dir_name" / "vendor"
+    )
+    container_runs = mock_docker.return_value.containers.run.call_args_list
+    assert len(container_runs) == expected_container_runs
+    for container_run in container_runs:
+        assert "pip install --no-deps -r requirements-vendor.txt" in container_run.kwargs["command"]
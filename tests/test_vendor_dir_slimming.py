@@ -0,0 +1,133 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.builder_images import DEFAULT_BUILDER_IMAGES
+from agent_plugin_builder.slim_rules import SlimRules, get_slim_rules
+from agent_plugin_builder.vendor_dir_slimming import SLIM_REPORT_FILE, slim_vendor_directories
+
+SOURCE_DIR_NAME = "source_dir"
+
+
+@pytest.fixture
+def mock_strip_linux_shared_objects(monkeypatch) -> MagicMock:
+    mock_strip = MagicMock()
+    monkeypatch.setattr(
+        "agent_plugin_builder.vendor_dir_slimming.strip_linux_shared_objects", mock_strip
+    )
+
+    return mock_strip
+
+
+def _write_file(path: Path, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"0" * size)
+
+
+@pytest.fixture
+def build_dir_path(tmpdir: str) -> Path:
+    build_dir_path = Path(tmpdir)
+    vendor_dir_path = build_dir_path / SOURCE_DIR_NAME / "vendor-linux"
+    _write_file(vendor_dir_path / "package" / "__init__.py", 100)
+    _write_file(vendor_dir_path / "package" / "__init__.pyi", 10)
+    _write_file(vendor_dir_path / "package" / "tests" / "test_package.py", 1000)
+    _write_file(vendor_dir_path / "package" / "__pycache__" / "__init__.cpython-311.pyc", 50)
+    _write_file(vendor_dir_path / "package-1.0.dist-info" / "RECORD", 20)
+    _write_file(vendor_dir_path / "package-1.0.dist-info" / "METADATA", 30)
+    _write_file(vendor_dir_path / "module.py", 40)
+    _write_file(build_dir_path / SOURCE_DIR_NAME / "vendor-windows" / "docs" / "index.rst", 5)
+    _write_file(build_dir_path / SOURCE_DIR_NAME / "tests" / "test_plugin.py", 5)
+
+    return build_dir_path
+
+
+def test_slim_vendor_directories(build_dir_path: Path, mock_strip_linux_shared_objects):
+    vendor_dir_path = build_dir_path / SOURCE_DIR_NAME / "vendor-linux"
+
+    slim_report = slim_vendor_directories(build_dir_path, SOURCE_DIR_NAME, SlimRules())
+
+    assert sorted(
+        str(path.relative_to(vendor_dir_path)) for path in vendor_dir_path.rglob("*")
+    ) == [
+        "module.py",
+        "package",
+        "package-1.0.dist-info",
+        "package-1.0.dist-info/METADATA",
+        "package/__init__.py",
+    ]
+    assert not (build_dir_path / SOURCE_DIR_NAME / "vendor-windows" / "docs").exists()
+    assert (build_dir_path / SOURCE_DIR_NAME / "tests" / "test_plugin.py").exists()
+    assert slim_report.removed_bytes == {
+        "vendor-linux": {"package": 1060, "package-1.0.dist-info": 20},
+        "vendor-windows": {"docs": 5},
+    }
+    assert slim_report.total_removed_bytes == 1085
+
+
+def test_slim_vendor_directories__keeps_runtime_packages(
+    build_dir_path: Path, mock_strip_linux_shared_objects
+):
+    runtime_package_path = (
+        build_dir_path / SOURCE_DIR_NAME / "vendor-linux" / "future" / "backports" / "test"
+    )
+    _write_file(runtime_package_path / "__init__.py", 10)
+    _write_file(runtime_package_path / "support.py", 10)
+
+    slim_vendor_directories(build_dir_path, SOURCE_DIR_NAME, SlimRules())
+
+    assert (runtime_package_path / "support.py").exists()
+
+
+def test_slim_vendor_directories__report_file(
+    build_dir_path: Path, mock_strip_linux_shared_objects
+):
+    slim_report = slim_vendor_directories(build_dir_path, SOURCE_DIR_NAME, SlimRules())
+
+    assert json.loads((build_dir_path / SLIM_REPORT_FILE).read_text()) == (
+        slim_report.to_json_dict()
+    )
+
+
+def test_slim_vendor_directories__strip_linux_vendor_dirs(
+    build_dir_path: Path, mock_strip_linux_shared_objects
+):
+    slim_vendor_directories(build_dir_path, SOURCE_DIR_NAME, SlimRules())
+
+    mock_strip_linux_shared_objects.assert_called_once_with(
+        build_dir_path, SOURCE_DIR_NAME, ["vendor-linux"], DEFAULT_BUILDER_IMAGES
+    )
+
+
+def test_slim_vendor_directories__no_strip(build_dir_path: Path, mock_strip_linux_shared_objects):
+    slim_vendor_directories(build_dir_path, SOURCE_DIR_NAME, SlimRules(strip_shared_objects=False))
+
+    mock_strip_linux_shared_objects.assert_not_called()
+
+
+def test_slim_vendor_directories__custom_patterns(
+    build_dir_path: Path, mock_strip_linux_shared_objects
+):
+    vendor_dir_path = build_dir_path / SOURCE_DIR_NAME / "vendor-linux"
+
+    slim_report = slim_vendor_directories(
+        build_dir_path, SOURCE_DIR_NAME, SlimRules(remove_patterns=("module.py",))
+    )
+
+    assert not (vendor_dir_path / "module.py").exists()
+    assert (vendor_dir_path / "package" / "tests").exists()
+    assert slim_report.removed_bytes["vendor-linux"] == {"module.py": 40}
+
+
+def test_get_slim_rules__default():
+    assert get_slim_rules() == SlimRules()
+
+
+def test_get_slim_rules__from_file(tmpdir: str):
+    slim_rules_file_path = Path(tmpdir) / "slim.yaml"
+    slim_rules_file_path.write_text("remove_patterns:\n  - tests\nstrip_shared_objects: false\n")
+
+    assert get_slim_rules(slim_rules_file_path) == SlimRules(
+        remove_patterns=("tests",), strip_shared_objects=False
+    )
@@ -0,0 +1,247 @@
+import base64
+import hashlib
+import zipfile
+from pathlib import Path
+
+import pytest
+from monkeytypes import OperatingSystem
+
+from agent_plugin_builder.wheel_installation import (
+    INSTALLER,
+    WheelInstallationError,
+    install_verified_wheels,
+    verify_pure_python_wheels,
+    write_remaining_requirements,
+)
+
+WHEEL_METADATA = "Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n"
+
+
+def _record_hash(data: bytes) -> str:
+    return "sha256=" + base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+
+
+def build_wheel(
+    wheelhouse_path: Path,
+    filename: str,
+    files: dict[str, bytes],
+    unrecorded_files: dict[str, bytes] | None = None,
+    record_hashes: dict[str, str] | None = None,
+) -> str:
+    name, version = filename.split("-")[:2]
+    dist_info_dir = f"{name}-{version}.dist-info"
+    files = {**files, f"{dist_info_dir}/WHEEL": WHEEL_METADATA.encode()}
+    record_lines = [
+        f"{path},{(record_hashes or {}).get(path, _record_hash(data))},{len(data)}"
+        for path, data in files.items()
+    ]
+    record_lines.append(f"{dist_info_dir}/RECORD,,")
+
+    wheelhouse_path.mkdir(parents=True, exist_ok=True)
+    with zipfile.ZipFile(wheelhouse_path / filename, "w") as wheel_zip:
+        for path, data in {**files, **(unrecorded_files or {})}.items():
+            wheel_zip.writestr(path, data)
+        wheel_zip.writestr(f"{dist_info_dir}/RECORD", "\n".join(record_lines) + "\n")
+
+    return hashlib.sha256((wheelhouse_path / filename).read_bytes()).hexdigest()
+
+
+def write_lock_file(build_dir_path: Path, packages: dict[tuple[str, str], dict[str, str]]):
+    lock_file = ""
+    for (name, version), files in packages.items():
+        file_entries = ", ".join(
+            f'{{file = "{file}", hash = "sha256:{file_hash}"}}' for file, file_hash in files.items()
+        )
+        lock_file += f'[[package]]\nname = "{name}"\nversion = "{version}"\n'
+        lock_file += f"files = [{file_entries}]\n\n"
+    (build_dir_path / "poetry.lock").write_text(lock_file)
+
+
+@pytest.fixture
+def wheelhouse_path(tmp_path: Path) -> Path:
+    return tmp_path / "wheelhouse"
+
+
+@pytest.fixture
+def build_dir_path(tmp_path: Path, wheelhouse_path: Path) -> Path:
+    build_dir_path = tmp_path / "build"
+    build_dir_path.mkdir()
+    requests_hash = build_wheel(
+        wheelhouse_path,
+        "requests-2.32.3-py3-none-any.whl",
+        {
+            "requests/__init__.py": b"requests",
+            "requests-2.32.3.data/purelib/requests_extra.py": b"extra",
+        },
+        unrecorded_files={"requests/unrecorded.py": b"unrecorded"},
+    )
+    colorama_hash = build_wheel(
+        wheelhouse_path, "colorama-0.4.6-py2.py3-none-any.whl", {"colorama/__init__.py": b"c"}
+    )
+    write_lock_file(
+        build_dir_path,
+        {
+            ("requests", "2.32.3"): {
+                "requests-2.32.3-py3-none-any.whl": requests_hash,
+                "requests-2.32.3.tar.gz": "1",
+            },
+            ("colorama", "0.4.6"): {"colorama-0.4.6-py2.py3-none-any.whl": colorama_hash},
+            ("pyyaml", "6.0.2"): {
+                "PyYAML-6.0.2-cp311-cp311-manylinux2014_x86_64.whl": "2",
+                "PyYAML-6.0.2-cp311-cp311-win_amd64.whl": "3",
+            },
+            ("pywin32", "306"): {"pywin32-306-cp311-cp311-win_amd64.whl": "4"},
+        },
+    )
+    (build_dir_path / "requirements.txt").write_text(
+        "--extra-index-url https://example.com/simple\n"
+        "requests==2.32.3 \\\n    --hash=sha256:1\n"
+        "colorama==0.4.6\n"
+        "pyyaml==6.0.2\n"
+        'pywin32==306 ; sys_platform == "win32"\n'
+    )
+
+    return build_dir_path
+
+
+def test_verify_pure_python_wheels(build_dir_path: Path, wheelhouse_path: Path, tmp_path: Path):
+    vendor_dir_path = tmp_path / "vendor"
+
+    verified_wheels = verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.LINUX, wheelhouse_path
+    )
+    install_verified_wheels(verified_wheels, vendor_dir_path)
+
+    assert {verified_wheel.name for verified_wheel in verified_wheels} == {"requests", "colorama"}
+    assert (vendor_dir_path / "requests" / "__init__.py").read_bytes() == b"requests"
+    assert (vendor_dir_path / "requests_extra.py").read_bytes() == b"extra"
+    assert not (vendor_dir_path / "requests" / "unrecorded.py").exists()
+    assert not (vendor_dir_path / "requests-2.32.3.data").exists()
+    assert (vendor_dir_path / "colorama" / "__init__.py").exists()
+    dist_info_path = vendor_dir_path / "requests-2.32.3.dist-info"
+    assert (dist_info_path / "INSTALLER").read_text() == f"{INSTALLER}\n"
+    record = (dist_info_path / "RECORD").read_text()
+    assert "requests_extra.py," in record
+    assert "requests-2.32.3.dist-info/INSTALLER," in record
+
+
+def test_verify_pure_python_wheels__replaces_linked_files(
+    build_dir_path: Path, wheelhouse_path: Path, tmp_path: Path
+):
+    vendor_dir_path = tmp_path / "vendor"
+    cached_file_path = tmp_path / "cached.py"
+    cached_file_path.write_bytes(b"cached")
+    (vendor_dir_path / "requests").mkdir(parents=True)
+    (vendor_dir_path / "requests" / "__init__.py").hardlink_to(cached_file_path)
+
+    install_verified_wheels(
+        verify_pure_python_wheels(build_dir_path, OperatingSystem.LINUX, wheelhouse_path),
+        vendor_dir_path,
+    )
+
+    assert (vendor_dir_path / "requests" / "__init__.py").read_bytes() == b"requests"
+    assert cached_file_path.read_bytes() == b"cached"
+
+
+def test_verify_pure_python_wheels__hash_mismatch(build_dir_path: Path, wheelhouse_path: Path):
+    build_wheel(wheelhouse_path, "colorama-0.4.6-py2.py3-none-any.whl", {"colorama/x.py": b"x"})
+
+    verified_wheels = verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.LINUX, wheelhouse_path
+    )
+
+    assert [verified_wheel.name for verified_wheel in verified_wheels] == ["requests"]
+
+
+def test_verify_pure_python_wheels__missing_wheel(build_dir_path: Path, wheelhouse_path: Path):
+    (wheelhouse_path / "requests-2.32.3-py3-none-any.whl").unlink()
+
+    verified_wheels = verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.WINDOWS, wheelhouse_path
+    )
+
+    assert [verified_wheel.name for verified_wheel in verified_wheels] == ["colorama"]
+
+
+@pytest.mark.parametrize(
+    "files",
+    [
+        {"colorama-0.4.6.data/scripts/colorama": b"script"},
+        {"../colorama.py": b"outside"},
+        {"/colorama.py": b"absolute"},
+    ],
+)
+def test_verify_pure_python_wheels__outside_target(
+    build_dir_path: Path, wheelhouse_path: Path, files: dict[str, bytes]
+):
+    colorama_hash = build_wheel(wheelhouse_path, "colorama-0.4.6-py2.py3-none-any.whl", files)
+    write_lock_file(
+        build_dir_path,
+        {("colorama", "0.4.6"): {"colorama-0.4.6-py2.py3-none-any.whl": colorama_hash}},
+    )
+    (build_dir_path / "requirements.txt").write_text("colorama==0.4.6\n")
+
+    assert verify_pure_python_wheels(build_dir_path, OperatingSystem.LINUX, wheelhouse_path) == []
+
+
+def test_install_verified_wheels__record_hash_mismatch(
+    build_dir_path: Path, wheelhouse_path: Path, tmp_path: Path
+):
+    colorama_hash = build_wheel(
+        wheelhouse_path,
+        "colorama-0.4.6-py2.py3-none-any.whl",
+        {"colorama/__init__.py": b"c"},
+        record_hashes={"colorama/__init__.py": _record_hash(b"other")},
+    )
+    write_lock_file(
+        build_dir_path,
+        {("colorama", "0.4.6"): {"colorama-0.4.6-py2.py3-none-any.whl": colorama_hash}},
+    )
+    verified_wheels = verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.LINUX, wheelhouse_path
+    )
+
+    with pytest.raises(WheelInstallationError):
+        install_verified_wheels(verified_wheels, tmp_path / "vendor")
+
+
+@pytest.mark.parametrize(
+    "operating_system, expected_requirements",
+    [
+        (OperatingSystem.LINUX, ["pyyaml==6.0.2"]),
+        (OperatingSystem.WINDOWS, ["pyyaml==6.0.2", 'pywin32==306 ; sys_platform == "win32"']),
+    ],
+)
+def test_write_remaining_requirements(
+    build_dir_path: Path,
+    wheelhouse_path: Path,
+    operating_system: OperatingSystem,
+    expected_requirements: list[str],
+):
+    verified_wheels = verify_pure_python_wheels(build_dir_path, operating_system, wheelhouse_path)
+
+    requirements_file_path = write_remaining_requirements(
+        build_dir_path, "vendor", operating_system, verified_wheels
+    )
+
+    assert requirements_file_path == build_dir_path / "requirements-vendor.txt"
+    assert requirements_file_path.read_text().splitlines() == [
+        "--extra-index-url https://example.com/simple",
+        *expected_requirements,
+    ]
+
+
+def test_write_remaining_requirements__none_remain(build_dir_path: Path, wheelhouse_path: Path):
+    (build_dir_path / "requirements.txt").write_text(
+        'requests==2.32.3\ncolorama==0.4.6\npywin32==306 ; sys_platform == "win32"\n'
+    )
+    verified_wheels = verify_pure_python_wheels(
+        build_dir_path, OperatingSystem.LINUX, wheelhouse_path
+    )
+
+    assert (
+        write_remaining_requirements(
+            build_dir_path, "vendor", OperatingSystem.LINUX, verified_wheels
+        )
+        is None
+    )
@@ -0,0 +1,89 @@
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+
+from agent_plugin_builder.wine_prefix_cache import (
+    WINE_PREFIX_REQUIRED_FILES,
+    WinePrefixCache,
+    WinePrefixError,
+)
+
+IMAGE_ID = "sha256:" + "1" * 64
+OTHER_IMAGE_ID = "sha256:" + "2" * 64
+
+
+def _create_wine_prefix(wine_prefix_path: Path):
+    for name in WINE_PREFIX_REQUIRED_FILES:
+        (wine_prefix_path / name).write_text(name)
+
+
+@pytest.fixture
+def wine_prefix_cache(tmp_path: Path) -> WinePrefixCache:
+    return WinePrefixCache(tmp_path / "cache")
+
+
+def test_get_wine_prefix__created(wine_prefix_cache: WinePrefixCache):
+    wine_prefix_path = wine_prefix_cache.get_wine_prefix(IMAGE_ID, _create_wine_prefix)
+
+    assert wine_prefix_path == wine_prefix_cache.get_wine_prefix_path(IMAGE_ID)
+    assert wine_prefix_cache.is_valid(IMAGE_ID)
+    assert [path.name for path in wine_prefix_path.parent.iterdir() if path.is_dir()] == [
+        wine_prefix_path.name
+    ]
+
+
+def test_get_wine_prefix__reused(wine_prefix_cache: WinePrefixCache):
+    create_wine_prefix = MagicMock(side_effect=_create_wine_prefix)
+
+    wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+    wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+
+    create_wine_prefix.assert_called_once()
+
+
+def test_get_wine_prefix__image_changed(wine_prefix_cache: WinePrefixCache):
+    create_wine_prefix = MagicMock(side_effect=_create_wine_prefix)
+
+    wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+    wine_prefix_cache.get_wine_prefix(OTHER_IMAGE_ID, create_wine_prefix)
+
+    assert create_wine_prefix.call_count == 2
+    assert wine_prefix_cache.is_valid(IMAGE_ID)
+    assert wine_prefix_cache.is_valid(OTHER_IMAGE_ID)
+
+
+def test_get_wine_prefix__invalid_prefix_recreated(wine_prefix_cache: WinePrefixCache):
+    create_wine_prefix = MagicMock(side_effect=_create_wine_prefix)
+    wine_prefix_path = wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+    (wine_prefix_path / "system.reg").unlink()
+
+    assert not wine_prefix_cache.is_valid(IMAGE_ID)
+
+    wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+
+    assert create_wine_prefix.call_count == 2
+    assert (wine_prefix_path / "system.reg").exists()
+
+
+def test_get_wine_prefix__incomplete(wine_prefix_cache: WinePrefixCache):
+    with pytest.raises(WinePrefixError):
+        wine_prefix_cache.get_wine_prefix(IMAGE_ID, lambda _: None)
+
+    assert not wine_prefix_cache.is_valid(IMAGE_ID)
+    assert not [
+        path
+        for path in wine_prefix_cache.get_wine_prefix_path(IMAGE_ID).parent.iterdir()
+        if path.is_dir()
+    ]
+
+
+def test_get_wine_prefix__create_failed(wine_prefix_cache: WinePrefixCache):
+    def create_wine_prefix(wine_prefix_path: Path):
+        _create_wine_prefix(wine_prefix_path)
+        raise RuntimeError("Container failed")
+
+    with pytest.raises(RuntimeError):
+        wine_prefix_cache.get_wine_prefix(IMAGE_ID, create_wine_prefix)
+
+    assert not wine_prefix_cache.is_valid(IMAGE_ID)
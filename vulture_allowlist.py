@@ -1,3 +1,32 @@
+from requests import Session
+
 from agent_plugin_builder.agent_plugin_builder_arguments import CustomArgumentsFormatter
+from agent_plugin_builder.archive_checksums import ArchiveChecksums
+from agent_plugin_builder.archive_inspection import _MappedMemberReader
+from agent_plugin_builder.archive_size_analysis import SizeReport
+from agent_plugin_builder.artifact_prefetching import _LinkParser
+from agent_plugin_builder.build_agent_plugin import build_agent_plugin_archive_async
+from agent_plugin_builder.build_control import BuildProgressEvent
+from agent_plugin_builder.build_journal import JournalEntry
+from agent_plugin_builder.build_result import BuildResult
+from agent_plugin_builder.installed_tree_cache import InstalledPackage
 
 CustomArgumentsFormatter._get_help_string
+
+ArchiveChecksums.archive_name
+ArchiveChecksums.members
+InstalledPackage.version
+BuildProgressEvent.status
+BuildProgressEvent.elapsed_seconds
+BuildResult.source_archive_size
+BuildResult.vendor_dir_sizes
+BuildResult.installed_tree_cache_hits
+BuildResult.installed_tree_cache_misses
+JournalEntry.completed_at
+SizeReport.file_types
+_MappedMemberReader.readable
+_MappedMemberReader.readinto
+_LinkParser.handle_starttag
+Session.max_redirects
+
+build_agent_plugin_archive_async